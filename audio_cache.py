@@ -0,0 +1,356 @@
+"""
+Content-addressed, size-bounded disk cache for synthesized audio.
+
+Shared by the TTS service and brain_service, which both import it from the
+repository root.
+
+Entries are keyed by ``make_key(provider, voice, language, model, text)``.
+The text is Unicode-normalized and its whitespace collapsed, so the same
+phrase always maps to the same file. Files are evicted least-recently-used
+once the total size passes ``max_bytes``. The access time is stored as the
+file mtime, so the order survives restarts.
+
+Concurrent requests for a key that is not cached yet share one synthesis.
+A background task drains the provider stream into a temporary file and an
+in-memory chunk list. Every caller, including the first, streams from that
+list as chunks arrive. If a client disconnects, the synthesis still
+finishes and gets cached. The entry is cached only when the stream
+completes without an error.
+
+``range_response`` serves a cached file with single-range ``Range`` support.
+The pinned Starlette FileResponse does not handle ranges.
+``file_response`` adds conditional GET on top (ETag, If-None-Match,
+If-Modified-Since and If-Range).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import unicodedata
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import Response, StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_BYTES = 64 * 1024
+
+MEDIA_TYPE_EXTENSIONS = {
+    "audio/wav": ".wav",
+    "audio/x-wav": ".wav",
+    "audio/wave": ".wav",
+    "audio/mpeg": ".mp3",
+    "audio/ogg": ".ogg",
+    "audio/opus": ".opus",
+    "audio/webm": ".webm",
+    "audio/flac": ".flac",
+}
+EXTENSION_MEDIA_TYPES = {".wav": "audio/wav", ".mp3": "audio/mpeg", ".m4a": "audio/mp4", ".ogg": "audio/ogg", ".opus": "audio/opus", ".webm": "audio/webm", ".flac": "audio/flac"}
+
+# Returns the media type and the audio byte stream of one synthesis.
+Producer = Callable[[], Awaitable[Tuple[str, AsyncIterator[bytes]]]]
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def make_key(provider: str, voice: Optional[str], language: Optional[str], model: Optional[str], text: str) -> str:
+    payload = json.dumps(
+        [provider or "", voice or "", (language or "").lower(), model or "", normalize_text(text)],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def media_type_for(path: Path) -> str:
+    return EXTENSION_MEDIA_TYPES.get(path.suffix.lower(), "application/octet-stream")
+
+
+class _InFlight:
+    """One running synthesis whose chunks are shared by every waiting caller."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.media_type: Optional[str] = None
+        self.started = asyncio.Event()  # media type is known (or production failed)
+        self.changed = asyncio.Condition()
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.task: Optional[asyncio.Task] = None
+
+    async def publish(self, chunk: Optional[bytes] = None, done: bool = False):
+        async with self.changed:
+            if chunk:
+                self.chunks.append(chunk)
+            self.done = self.done or done
+            self.changed.notify_all()
+
+    async def iter_chunks(self) -> AsyncIterator[bytes]:
+        index = 0
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: index < len(self.chunks) or self.done)
+                pending = self.chunks[index:]
+                finished = self.done
+            for chunk in pending:
+                yield chunk
+            index += len(pending)
+            if finished and index >= len(self.chunks):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class AudioCache:
+    def __init__(self, directory, max_bytes: int = 512 * 1024 * 1024, enabled: bool = True):
+        self.directory = Path(directory)
+        self.max_bytes = int(max_bytes)
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, Tuple[Path, int]]" = OrderedDict()  # oldest first
+        self._total_bytes = 0
+        self._inflight: Dict[str, _InFlight] = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "errors": 0}
+        if enabled:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._load()
+
+    def _load(self):
+        """Rebuild the LRU index from the files on disk, least recently used first."""
+        files = []
+        for path in self.directory.glob("*/*"):
+            if path.is_file() and not path.name.endswith(".tmp"):
+                stat = path.stat()
+                files.append((stat.st_mtime, path.stem, path, stat.st_size))
+            elif path.name.endswith(".tmp"):
+                path.unlink(missing_ok=True)  # left over from an interrupted synthesis
+        for _, key, path, size in sorted(files):
+            self._entries[key] = (path, size)
+            self._total_bytes += size
+        self._evict()
+
+    def _path(self, key: str, media_type: str) -> Path:
+        return self.directory / key[:2] / f"{key}{MEDIA_TYPE_EXTENSIONS.get(media_type.split(';')[0].strip(), '.bin')}"
+
+    def get(self, key: str) -> Optional[Path]:
+        """Path of a cached entry (marked as recently used), or None."""
+        entry = self._entries.get(key) if self.enabled else None
+        if entry is None:
+            return None
+        path, _ = entry
+        if not path.exists():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def _drop(self, key: str):
+        path, size = self._entries.pop(key)
+        self._total_bytes -= size
+        try:
+            path.unlink(missing_ok=True)
+        except OSError as e:  # still open by a reader on Windows; _load picks it up again later
+            logger.warning("Audio cache: could not remove %s: %s", path.name, e)
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            self._drop(key)
+            self.stats["evictions"] += 1
+
+    def _add(self, key: str, path: Path, size: int):
+        if key in self._entries:
+            self._total_bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (path, size)
+        self._total_bytes += size
+        self._evict()
+
+    async def _produce(self, key: str, flight: _InFlight, produce: Producer):
+        tmp_path: Optional[Path] = None
+        handle = None
+        try:
+            media_type, body = await produce()
+            flight.media_type = media_type
+            flight.started.set()
+            path = self._path(key, media_type)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            handle = open(tmp_path, "wb")
+            size = 0
+            async for chunk in body:
+                if not chunk:
+                    continue
+                handle.write(chunk)
+                size += len(chunk)
+                await flight.publish(chunk)
+            handle.close()
+            handle = None
+            if size:
+                os.replace(tmp_path, path)
+                tmp_path = None
+                self._add(key, path, size)
+        except Exception as e:
+            self.stats["errors"] += 1
+            flight.error = e
+            logger.warning("Audio cache: synthesis for %s failed: %s", key[:12], e)
+        finally:
+            if handle is not None:
+                handle.close()
+            if tmp_path is not None:
+                tmp_path.unlink(missing_ok=True)
+            flight.started.set()
+            self._inflight.pop(key, None)
+            await flight.publish(done=True)
+
+    async def open(self, key: str, produce: Producer) -> Tuple[str, AsyncIterator[bytes], bool]:
+        """
+        Stream the audio for `key`: from disk when cached, otherwise from a shared synthesis.
+        Returns (media_type, chunks, hit).
+        """
+        path = self.get(key)
+        if path is not None:
+            self.stats["hits"] += 1
+            return media_type_for(path), iter_file(path), True
+        if not self.enabled:
+            media_type, body = await produce()
+            return media_type, body, False
+
+        flight = self._inflight.get(key)
+        if flight is None:
+            self.stats["misses"] += 1
+            flight = self._inflight[key] = _InFlight()
+            flight.task = asyncio.create_task(self._produce(key, flight, produce))
+        else:
+            self.stats["coalesced"] += 1
+        await flight.started.wait()
+        if flight.media_type is None:
+            raise flight.error or RuntimeError("Audio synthesis failed")
+        return flight.media_type, flight.iter_chunks(), False
+
+    async def fetch(self, key: str, produce: Producer) -> Path:
+        """Make sure `key` is cached and return its path (waits for the whole synthesis)."""
+        path = self.get(key)
+        if path is not None:
+            self.stats["hits"] += 1
+            return path
+        _, chunks, _ = await self.open(key, produce)
+        async for _ in chunks:
+            pass
+        path = self.get(key)
+        if path is None:
+            raise RuntimeError("Synthesized audio was empty")
+        return path
+
+    async def respond(self, key: str, produce: Producer, range_header: Optional[str] = None) -> StreamingResponse:
+        """HTTP response for `key`: the cached file (Range-capable) on a hit, the shared synthesis stream on a miss."""
+        path = self.get(key) if self.enabled else None
+        headers = {"X-Audio-Cache-Key": key}
+        if path is not None:
+            self.stats["hits"] += 1
+            return range_response(path, media_type_for(path), range_header, headers={**headers, "X-Audio-Cache": "hit"})
+        media_type, chunks, _ = await self.open(key, produce)
+        return StreamingResponse(chunks, media_type=media_type, headers={**headers, "X-Audio-Cache": "miss"})
+
+    def metrics(self) -> Dict[str, object]:
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "in_flight": len(self._inflight),
+            "hit_ratio": self.stats["hits"] / lookups if lookups else 0.0,
+        }
+
+
+async def iter_file(path: Path, start: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+    remaining = path.stat().st_size - start if length is None else length
+    with open(path, "rb") as f:
+        f.seek(start)
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(READ_CHUNK_BYTES, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """(start, end) inclusive for a single `bytes=` range, None to serve the whole file."""
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None  # multi-range or malformed: ignore, as RFC 9110 allows
+    first, last = match.groups()
+    if first:
+        start, end = int(first), int(last) if last else size - 1
+    else:
+        start, end = max(size - int(last), 0), size - 1
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size - 1)
+
+
+def range_response(path: Path, media_type: str, range_header: Optional[str] = None, headers: Optional[Dict[str, str]] = None) -> StreamingResponse:
+    """Stream a file, honouring a single-range Range header (206 + Content-Range)."""
+    size = path.stat().st_size
+    byte_range = parse_range(range_header, size)
+    response_headers = {"Accept-Ranges": "bytes", **(headers or {})}
+    if byte_range is None:
+        response_headers["Content-Length"] = str(size)
+        return StreamingResponse(iter_file(path), media_type=media_type, headers=response_headers)
+    start, end = byte_range
+    response_headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response_headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(iter_file(path, start, end - start + 1), status_code=206, media_type=media_type, headers=response_headers)
+
+
+def file_etag(path: Path) -> str:
+    """Strong validator from size and mtime; changes whenever the file is replaced."""
+    stat = path.stat()
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    return any(tag.strip() in ("*", etag, f"W/{etag}") for tag in header.split(","))
+
+
+def file_response(path: Path, media_type: str, request_headers: Mapping[str, str], headers: Optional[Dict[str, str]] = None) -> Response:
+    """`range_response` with conditional GET: 304 for a fresh client copy, Range ignored when If-Range is stale."""
+    stat = path.stat()
+    etag = file_etag(path)
+    response_headers = {"ETag": etag, "Last-Modified": formatdate(stat.st_mtime, usegmt=True), **(headers or {})}
+
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match:
+        not_modified = _etag_matches(if_none_match, etag)
+    else:
+        not_modified = False
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                not_modified = int(stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                pass
+    if not_modified:
+        return Response(status_code=304, headers=response_headers)
+
+    range_header = request_headers.get("range")
+    if_range = request_headers.get("if-range")
+    if range_header and if_range and if_range.strip() != etag and if_range.strip() != response_headers["Last-Modified"]:
+        range_header = None  # the client's partial copy is outdated: send the whole file
+    return range_response(path, media_type, range_header, headers=response_headers)
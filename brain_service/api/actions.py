@@ -6,12 +6,13 @@ from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
 
-from core.dependencies import get_http_client, get_lexicon_service, get_translation_service
+from core.dependencies import get_http_client, get_lexicon_service, get_translation_service, get_settings
 from models.actions_models import TranslateRequest, ExplainTermRequest
 
 # Assuming these functions will be moved to a service layer later
 from config.prompts import get_prompt
 from core.llm_config import get_llm_for_task, LLMConfigError
+from utils.streaming import coalesce_ndjson
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -20,16 +21,16 @@ router = APIRouter()
 @router.post("/translate")
 async def translate_handler(
     request: TranslateRequest, 
-    translation_service = Depends(get_translation_service)
+    translation_service = Depends(get_translation_service),
+    settings = Depends(get_settings)
 ):
     """Translate a text reference using TranslationService."""
-    
-    async def serialize_to_ndjson():
-        async for chunk in translation_service.translate_text_reference(request.tref):
-            yield json.dumps(chunk, ensure_ascii=False) + '\n'
-    
     return StreamingResponse(
-        serialize_to_ndjson(),
+        coalesce_ndjson(
+            translation_service.translate_text_reference(request.tref),
+            window_ms=settings.STREAM_COALESCE_MS,
+            max_bytes=settings.STREAM_COALESCE_BYTES,
+        ),
         media_type="application/x-ndjson"
     )
 
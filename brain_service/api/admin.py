@@ -4,7 +4,7 @@ from fastapi import APIRouter, HTTPException, Response, status, Depends
 
 # Imports from the new model location
 from models.admin_models import PersonalityFull, PersonalityPublic, PromptUpdateRequest
-from core.dependencies import require_admin_token
+from core.dependencies import require_admin_token, get_summary_scheduler
 
 # Imports from the existing config modules (assuming they are in PYTHONPATH)
 from config import get_config, update_config
@@ -42,6 +42,13 @@ async def update_config_handler(settings: Dict[str, Any], _: str = Depends(requi
         logger.error(f"Failed to update configuration: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/metrics/summary")
+async def get_summary_metrics_handler(
+    _: str = Depends(require_admin_token),
+    summary_scheduler = Depends(get_summary_scheduler)
+):
+    return summary_scheduler.metrics()
+
 @router.get("/prompts")
 async def list_prompts_handler(_: str = Depends(require_admin_token)):
     return list_prompts()
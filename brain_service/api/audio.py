@@ -1,24 +1,47 @@
 """
 Audio API endpoints for TTS message handling
 """
-import os
 import uuid
-import shutil
 import time
-from pathlib import Path
-from typing import Optional
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends
-from fastapi.responses import FileResponse
+from typing import AsyncIterator, Optional
+import httpx
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends, Request
 from pydantic import BaseModel
 
+from api.tts import _tts_base_url
+from core.dependencies import get_audio_cache, get_audio_store
+from services.audio_store import AudioStore, AudioTooLargeError
+from audio_cache import AudioCache, file_response, make_key, media_type_for
+
 # from services.chat_service import ChatService
 # from core.dependencies import get_chat_service
 
 router = APIRouter(prefix="/audio", tags=["audio"])
 
-# Audio storage directory
-AUDIO_STORAGE_DIR = Path("audio_storage")
-AUDIO_STORAGE_DIR.mkdir(exist_ok=True)
+
+def _tts_producer(request: "AudioMessageRequest"):
+    """Producer for the audio cache: streams /tts/synthesize from the TTS service."""
+    async def produce():
+        client = httpx.AsyncClient(timeout=60)
+        payload = {"text": request.text, "language": request.language, "voiceId": request.voice_id}
+        resp = await client.send(client.build_request("POST", f"{_tts_base_url()}/tts/synthesize", json=payload), stream=True)
+        if resp.status_code >= 400:
+            await resp.aread()
+            await resp.aclose()
+            await client.aclose()
+            raise RuntimeError(f"TTS service returned {resp.status_code}: {resp.text[:200]}")
+
+        async def body():
+            try:
+                async for chunk in resp.aiter_bytes():
+                    yield chunk
+            finally:
+                await resp.aclose()
+                await client.aclose()
+
+        return resp.headers.get("content-type", "audio/wav"), body()
+
+    return produce
 
 class BaseResponse(BaseModel):
     success: bool
@@ -41,34 +64,35 @@ class AudioMessageResponse(BaseModel):
     provider: str
     voice_id: Optional[str] = None
 
+async def _iter_upload(file: UploadFile) -> AsyncIterator[bytes]:
+    while chunk := await file.read(AudioStore.CHUNK_BYTES):
+        yield chunk
+
+
+def _file_info(chat_id: str, meta: dict) -> dict:
+    return {**meta, "url": f"/api/audio/{chat_id}/{meta['filename']}"}
+
+
 @router.post("/synthesize", response_model=AudioMessageResponse)
 async def synthesize_audio_message(
-    request: AudioMessageRequest
+    request: AudioMessageRequest,
+    store: AudioStore = Depends(get_audio_store),
+    audio_cache: AudioCache = Depends(get_audio_cache),
 ):
     """
     Synthesize audio from text and save as message in chat
     """
     try:
-        # Generate unique audio file ID
         audio_id = str(uuid.uuid4())
-        audio_filename = f"{audio_id}.wav"
-        audio_path = AUDIO_STORAGE_DIR / audio_filename
-        
-        # Create chat-specific directory
-        chat_dir = AUDIO_STORAGE_DIR / request.chat_id
-        chat_dir.mkdir(exist_ok=True)
-        
-        # Move audio file to chat directory
-        final_audio_path = chat_dir / audio_filename
-        
-        # TODO: Call TTS service to generate audio
-        # For now, create a placeholder file
-        with open(final_audio_path, 'wb') as f:
-            f.write(b'placeholder audio data')
-        
-        # Calculate file size
-        file_size = final_audio_path.stat().st_size
-        
+
+        # Repeated phrases are synthesized once; concurrent identical requests share one synthesis.
+        key = make_key(request.provider, request.voice_id, request.language, None, request.text)
+        cached_path = await audio_cache.fetch(key, _tts_producer(request))
+
+        # The message keeps its own copy of the cached audio, which survives cache eviction.
+        meta = await store.import_file(request.chat_id, cached_path, audio_id)
+        audio_filename = meta["filename"]
+
         # Create audio message in chat
         audio_message = {
             "id": audio_id,
@@ -79,8 +103,9 @@ async def synthesize_audio_message(
                 "audioUrl": f"/api/audio/{request.chat_id}/{audio_filename}",
                 "provider": request.provider,
                 "voiceId": request.voice_id,
-                "format": "wav",
-                "size": file_size,
+                "format": meta["format"],
+                "size": meta["size"],
+                "duration": meta["duration"],
             },
             "timestamp": int(time.time() * 1000),
         }
@@ -93,125 +118,134 @@ async def synthesize_audio_message(
             id=audio_id,
             chat_id=request.chat_id,
             audio_url=f"/api/audio/{request.chat_id}/{audio_filename}",
-            size=file_size,
+            duration=meta["duration"],
+            size=meta["size"],
             provider=request.provider,
             voice_id=request.voice_id,
         )
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to synthesize audio: {str(e)}")
 
+@router.get("/{chat_id}/list")
+async def list_chat_audio_files(chat_id: str, store: AudioStore = Depends(get_audio_store)):
+    """
+    List all audio files for a chat (from the metadata index)
+    """
+    try:
+        files = await store.list(chat_id)
+        return {"files": [_file_info(chat_id, meta) for meta in files]}
+        
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to list audio files: {str(e)}")
+
 @router.get("/{chat_id}/{filename}")
-async def get_audio_file(chat_id: str, filename: str):
+async def get_audio_file(chat_id: str, filename: str, http_request: Request, store: AudioStore = Depends(get_audio_store)):
     """
-    Serve audio files
+    Serve audio files (Range requests for seeking, ETag/Last-Modified revalidation)
     """
     try:
-        audio_path = AUDIO_STORAGE_DIR / chat_id / filename
+        audio_path = await store.resolve(chat_id, filename)
         
-        if not audio_path.exists():
+        if audio_path is None:
             raise HTTPException(status_code=404, detail="Audio file not found")
         
-        # Determine media type based on file extension
-        media_type = "audio/wav"
-        if filename.endswith('.mp3'):
-            media_type = "audio/mpeg"
-        elif filename.endswith('.ogg'):
-            media_type = "audio/ogg"
-        
-        return FileResponse(
-            path=str(audio_path),
-            media_type=media_type,
-            filename=filename
+        return file_response(
+            audio_path,
+            media_type_for(audio_path),
+            http_request.headers,
+            headers={
+                "Content-Disposition": f'inline; filename="{audio_path.name}"',
+                # The file behind a URL changes once when it is transcoded, so revalidate instead of caching blindly
+                "Cache-Control": "private, no-cache",
+            },
         )
         
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to serve audio file: {str(e)}")
 
 @router.delete("/{chat_id}/{filename}")
-async def delete_audio_file(chat_id: str, filename: str):
+async def delete_audio_file(chat_id: str, filename: str, store: AudioStore = Depends(get_audio_store)):
     """
     Delete audio file
     """
     try:
-        audio_path = AUDIO_STORAGE_DIR / chat_id / filename
-        
-        if not audio_path.exists():
+        if not await store.delete(chat_id, filename):
             raise HTTPException(status_code=404, detail="Audio file not found")
         
-        audio_path.unlink()
-        
         return BaseResponse(success=True, message="Audio file deleted")
         
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete audio file: {str(e)}")
 
-@router.get("/{chat_id}/list")
-async def list_chat_audio_files(chat_id: str):
-    """
-    List all audio files for a chat
-    """
-    try:
-        chat_dir = AUDIO_STORAGE_DIR / chat_id
-        
-        if not chat_dir.exists():
-            return {"files": []}
-        
-        files = []
-        for file_path in chat_dir.iterdir():
-            if file_path.is_file():
-                files.append({
-                    "filename": file_path.name,
-                    "size": file_path.stat().st_size,
-                    "created": file_path.stat().st_ctime,
-                })
-        
-        return {"files": files}
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to list audio files: {str(e)}")
-
 @router.post("/upload")
 async def upload_audio_file(
     chat_id: str = Form(...),
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    store: AudioStore = Depends(get_audio_store),
 ):
     """
-    Upload audio file for a chat
+    Upload audio file for a chat (multipart form)
     """
     try:
         # Validate file type
         if not file.content_type.startswith('audio/'):
             raise HTTPException(status_code=400, detail="File must be an audio file")
         
-        # Generate unique filename
-        file_id = str(uuid.uuid4())
-        file_extension = file.filename.split('.')[-1] if '.' in file.filename else 'wav'
-        audio_filename = f"{file_id}.{file_extension}"
+        extension = store.extension_for(file.filename, file.content_type)
+        meta = await store.save_stream(chat_id, _iter_upload(file), extension)
         
-        # Create chat directory
-        chat_dir = AUDIO_STORAGE_DIR / chat_id
-        chat_dir.mkdir(exist_ok=True)
+        return _file_info(chat_id, meta)
         
-        # Save file
-        audio_path = chat_dir / audio_filename
-        with open(audio_path, 'wb') as f:
-            shutil.copyfileobj(file.file, f)
-        
-        file_size = audio_path.stat().st_size
+    except HTTPException:
+        raise
+    except AudioTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to upload audio file: {str(e)}")
+
+@router.post("/{chat_id}/stream")
+async def upload_audio_stream(
+    chat_id: str,
+    http_request: Request,
+    filename: Optional[str] = None,
+    store: AudioStore = Depends(get_audio_store),
+):
+    """
+    Upload audio as a raw request body (Content-Type: audio/*), written to disk as it arrives
+    """
+    try:
+        content_type = http_request.headers.get("content-type", "")
+        if not content_type.startswith('audio/'):
+            raise HTTPException(status_code=400, detail="Body must be audio (Content-Type: audio/*)")
+        content_length = http_request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > store.max_upload_bytes:
+            raise HTTPException(status_code=413, detail=f"Audio exceeds {store.max_upload_bytes} bytes")
+
+        extension = store.extension_for(filename, content_type)
+        meta = await store.save_stream(chat_id, http_request.stream(), extension)
         
-        return {
-            "id": file_id,
-            "filename": audio_filename,
-            "size": file_size,
-            "url": f"/api/audio/{chat_id}/{audio_filename}",
-        }
+        return _file_info(chat_id, meta)
         
     except HTTPException:
         raise
+    except AudioTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to upload audio file: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to upload audio stream: {str(e)}")
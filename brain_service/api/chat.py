@@ -6,12 +6,13 @@ from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-from core.dependencies import get_chat_service, get_session_service, get_redis_client
+from core.dependencies import get_chat_service, get_session_service, get_redis_client, get_settings, get_summary_scheduler
 from core.rate_limiting import rate_limit_dependency
 from services.chat_service import ChatService
 from services.session_service import SessionService
 from services.study.stream_router import select_today_unit
 from services.study.tz_utils import now_in_tz, resolve_timezone, seconds_until_next_midnight, next_midnight
+from utils.streaming import coalesce_ndjson
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -28,16 +29,24 @@ class ChatRequest(BaseModel):
 async def chat_stream_handler(
     request: ChatRequest, 
     chat_service: ChatService = Depends(get_chat_service),
+    settings = Depends(get_settings),
+    summary_scheduler = Depends(get_summary_scheduler),
     _: bool = Depends(rate_limit_dependency(limit=5))  # Stricter limit for LLM endpoints
 ):
     """Stream chat response with LLM and tool integration."""
     return StreamingResponse(
-        chat_service.process_chat_stream(
-            text=request.text,
-            user_id=request.user_id,
-            session_id=request.session_id,
-            agent_id=request.agent_id
-        ), 
+        coalesce_ndjson(
+            summary_scheduler.interactive(
+                chat_service.process_chat_stream(
+                    text=request.text,
+                    user_id=request.user_id,
+                    session_id=request.session_id,
+                    agent_id=request.agent_id
+                )
+            ),
+            window_ms=settings.STREAM_COALESCE_MS,
+            max_bytes=settings.STREAM_COALESCE_BYTES,
+        ),
         media_type="application/x-ndjson"
     )
 
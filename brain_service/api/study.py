@@ -7,9 +7,10 @@ from models.study_models import (
     StudyStateResponse, StudyNavigateRequest, StudyWorkbenchSetRequest, 
     StudyChatSetFocusRequest, StudyChatRequest
 )
-from core.dependencies import get_study_service, get_lexicon_service
+from core.dependencies import get_study_service, get_lexicon_service, get_settings, get_summary_scheduler
 from services.study_service import StudyService
 from services.lexicon_service import LexiconService
+from utils.streaming import coalesce_ndjson
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -96,7 +97,9 @@ async def study_resolve_handler(
 @router.post("/chat")
 async def study_chat_handler(
     request: StudyChatRequest, 
-    study_service: StudyService = Depends(get_study_service)
+    study_service: StudyService = Depends(get_study_service),
+    settings = Depends(get_settings),
+    summary_scheduler = Depends(get_summary_scheduler)
 ):
     """Process a study chat request with streaming response."""
     from fastapi.responses import StreamingResponse
@@ -106,7 +109,11 @@ async def study_chat_handler(
             yield chunk
     
     return StreamingResponse(
-        generate(),
+        coalesce_ndjson(
+            summary_scheduler.interactive(generate()),
+            window_ms=settings.STREAM_COALESCE_MS,
+            max_bytes=settings.STREAM_COALESCE_BYTES,
+        ),
         media_type="text/plain",
         headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
     )
@@ -122,7 +129,9 @@ async def study_chat_set_focus_handler(
 @router.post("/chat/stream")
 async def study_chat_stream_handler(
     request: StudyChatRequest, 
-    study_service: StudyService = Depends(get_study_service)
+    study_service: StudyService = Depends(get_study_service),
+    settings = Depends(get_settings),
+    summary_scheduler = Depends(get_summary_scheduler)
 ):
     """Stream study chat response with context-aware agent selection."""
     async def generate():
@@ -130,7 +139,11 @@ async def study_chat_stream_handler(
             yield chunk
     
     return StreamingResponse(
-        generate(), 
+        coalesce_ndjson(
+            summary_scheduler.interactive(generate()),
+            window_ms=settings.STREAM_COALESCE_MS,
+            max_bytes=settings.STREAM_COALESCE_BYTES,
+        ),
         media_type="application/x-ndjson"
     )
 
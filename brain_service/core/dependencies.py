@@ -7,6 +7,10 @@ def get_redis_client(request: Request) -> redis.Redis:
         raise HTTPException(status_code=503, detail="Redis client is not available.")
     return request.app.state.redis_client
 
+def get_settings(request: Request):
+    """Dependency to get the Settings instance loaded at startup."""
+    return request.app.state.settings
+
 def get_http_client(request: Request):
     """Dependency to get the HTTPX client from the application state."""
     return request.app.state.http_client
@@ -27,6 +31,10 @@ def get_memory_service(request: Request):
     """Dependency to get the MemoryService instance."""
     return request.app.state.memory_service
 
+def get_summary_scheduler(request: Request):
+    """Dependency to get the SummaryScheduler instance."""
+    return request.app.state.summary_scheduler
+
 def get_chat_service(request: Request):
     """Dependency to get the ChatService instance."""
     return request.app.state.chat_service
@@ -55,6 +63,14 @@ def get_navigation_service(request: Request):
     """Dependency to get the NavigationService instance."""
     return request.app.state.navigation_service
 
+def get_audio_store(request: Request):
+    """Dependency to get the AudioStore instance."""
+    return request.app.state.audio_store
+
+def get_audio_cache(request: Request):
+    """Dependency to get the AudioCache instance."""
+    return request.app.state.audio_cache
+
 
 def require_admin_token(x_admin_token: str = Header(None)):
     """Dependency to require admin token for protected endpoints."""
@@ -46,6 +46,12 @@ class Settings(BaseSettings):
                     self.SEFARIA_API_URL = sefaria_config.get('api_url', 'http://localhost:8000/api/')
                     self.SEFARIA_API_KEY = sefaria_config.get('api_key', None)
                     self.SEFARIA_CACHE_TTL = sefaria_config.get('cache_ttl_seconds', 60)
+
+                # Load NDJSON streaming settings
+                if 'streaming' in brain_config:
+                    streaming_config = brain_config['streaming']
+                    self.STREAM_COALESCE_MS = streaming_config.get('coalesce_window_ms', 15.0)
+                    self.STREAM_COALESCE_BYTES = streaming_config.get('coalesce_max_bytes', 512)
             
             # Load Redis URL from services
             if 'services' in config:
@@ -78,6 +84,8 @@ class Settings(BaseSettings):
         self.RATE_LIMIT_DEFAULT = 10
         self.RATE_LIMIT_WINDOW = 60
         self.RATE_LIMIT_LLM = 5
+        self.STREAM_COALESCE_MS = 15.0
+        self.STREAM_COALESCE_BYTES = 512
         self.LOG_LEVEL = "INFO"
         self.LOG_JSON = False
         self.SEFARIA_MCP_URL = "http://sefaria.org:8088/sse"
@@ -92,6 +100,8 @@ class Settings(BaseSettings):
     LLM_MODEL: str = "gpt-4o-mini"
     
     STREAM_FORMAT: str = "ndjson"
+    STREAM_COALESCE_MS: float = 15.0   # window for merging llm_chunk frames (0 disables)
+    STREAM_COALESCE_BYTES: int = 512   # flush merged chunks once this much text is pending
     MAX_TOOL_STEPS: int = 3
 
     STM_TTL_SEC: int = 86400
@@ -114,3 +124,13 @@ class Settings(BaseSettings):
     LOG_JSON: bool = False
     SEFARIA_MCP_URL: str = "http://sefaria.org:8088/sse"
     SEFARIA_MCP_TIMEOUT_SEC: int = 30
+
+    # Audio message storage
+    AUDIO_STORAGE_DIR: str = "audio_storage"
+    AUDIO_TRANSCODE_OPUS: bool = True  # needs ffmpeg on PATH
+    AUDIO_OPUS_BITRATE: str = "32k"
+    AUDIO_TRANSCODE_CONCURRENCY: int = 1
+    AUDIO_UPLOAD_MAX_MB: int = 50
+    # Synthesized audio, shared by every message with the same text and voice
+    AUDIO_CACHE_DIR: str = "audio_cache"
+    AUDIO_CACHE_MAX_MB: int = 512
@@ -12,6 +12,8 @@ from services.sefaria_index_service import SefariaIndexService
 from services.sefaria_mcp_service import SefariaMCPService
 from services.memory_service import MemoryService
 from services.summary_service import SummaryService
+from services.summary_scheduler import SummaryScheduler
+from services.stm_update_queue import STMUpdateQueue
 from services.llm_service import LLMService
 from services.chat_service import ChatService
 from services.study import fetch_study_config, register_study_config_listener
@@ -22,6 +24,8 @@ from services.session_service import SessionService
 from services.translation_service import TranslationService
 from services.wiki_service import WikiService
 from services.navigation_service import NavigationService
+from services.audio_store import AudioStore
+from audio_cache import AudioCache
 from domain.chat.tools import ToolRegistry
 from .rate_limiting import setup_rate_limiter
 import sys
@@ -141,16 +145,30 @@ async def lifespan(app: FastAPI):
         config=config
     )
 
+    # Summary scheduler (yields to interactive traffic, limits per-provider summary calls)
+    app.state.summary_scheduler = SummaryScheduler(config=config)
+    await app.state.summary_scheduler.start()
+
     # Instantiate summary service
     app.state.summary_service = SummaryService(
         llm_service=app.state.llm_service,
         config=config,
-        redis_client=app.state.redis_client
+        redis_client=app.state.redis_client,
+        scheduler=app.state.summary_scheduler
     )
 
     # Update memory service with summary service
     app.state.memory_service.summary_service = app.state.summary_service
 
+    # Background STM/summary updates (keeps the LLM summary call off the request path)
+    app.state.stm_update_queue = STMUpdateQueue(
+        redis_client=app.state.redis_client,
+        memory_service=app.state.memory_service,
+        config=config
+    )
+    app.state.memory_service.update_queue = app.state.stm_update_queue
+    await app.state.stm_update_queue.start()
+
     # Update translation service with sefaria and LLM services
     app.state.translation_service.sefaria_service = app.state.sefaria_service
     app.state.translation_service.llm_service = app.state.llm_service
@@ -194,6 +212,17 @@ async def lifespan(app: FastAPI):
         sefaria_service=app.state.sefaria_service
     )
 
+    # Audio message storage (metadata index in Redis, background Opus transcoding)
+    app.state.audio_store = AudioStore(
+        settings.AUDIO_STORAGE_DIR,
+        redis_client=app.state.redis_client,
+        transcode=settings.AUDIO_TRANSCODE_OPUS,
+        opus_bitrate=settings.AUDIO_OPUS_BITRATE,
+        max_upload_bytes=settings.AUDIO_UPLOAD_MAX_MB * 1024 * 1024,
+        transcode_concurrency=settings.AUDIO_TRANSCODE_CONCURRENCY,
+    )
+    app.state.audio_cache = AudioCache(settings.AUDIO_CACHE_DIR, max_bytes=settings.AUDIO_CACHE_MAX_MB * 1024 * 1024)
+
 
     # Register Sefaria tools
     sefaria_get_text_schema = {
@@ -615,6 +644,15 @@ async def lifespan(app: FastAPI):
     if hasattr(app.state, 'config_service'):
         await app.state.config_service.stop_listening()
     
+    if hasattr(app.state, 'stm_update_queue'):
+        await app.state.stm_update_queue.stop()
+
+    if hasattr(app.state, 'summary_scheduler'):
+        await app.state.summary_scheduler.stop()
+
+    if hasattr(app.state, 'audio_store'):
+        await app.state.audio_store.aclose()
+
     if getattr(app.state, "sefaria_mcp_service", None):
         await app.state.sefaria_mcp_service.close()
     await app.state.http_client.aclose()
@@ -0,0 +1,298 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+import wave
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+import redis.asyncio as redis
+
+from audio_cache import MEDIA_TYPE_EXTENSIONS, media_type_for
+
+logger = logging.getLogger(__name__)
+
+
+class AudioTooLargeError(Exception):
+    """Raised when a streamed upload exceeds the configured size limit."""
+
+
+class AudioStore:
+    """
+    Disk storage for chat audio messages with a per-chat metadata index in Redis.
+
+    Files live under ``<root>/<chat_id>/<audio_id>.<ext>``. Uploads are streamed
+    to a temporary file in fixed-size chunks and moved into place when complete,
+    so a request never holds a whole file in memory. The metadata of each file
+    (format, media type, size, duration, creation time) goes into the hash
+    ``audio:index:<chat_id>``. Listing a chat reads that hash instead of
+    scanning the directory. A chat stored before the index existed is scanned
+    once and then indexed. Without Redis, listing falls back to the scan.
+
+    When ffmpeg is available, new files are transcoded to Opus (Ogg) in the
+    background, with at most ``transcode_concurrency`` jobs at a time. The
+    smaller file replaces the original under the same audio id, so URLs
+    already handed out still resolve through the index.
+    """
+
+    INDEX_PREFIX = "audio:index"
+    CHUNK_BYTES = 64 * 1024
+    COMPACT_FORMATS = {"ogg", "opus", "webm"}
+
+    _SAFE_PART = re.compile(r"^[A-Za-z0-9_\-][A-Za-z0-9_.\-]*$")
+
+    def __init__(
+        self,
+        root,
+        redis_client: Optional[redis.Redis] = None,
+        *,
+        transcode: bool = True,
+        opus_bitrate: str = "32k",
+        max_upload_bytes: int = 50 * 1024 * 1024,
+        transcode_concurrency: int = 1,
+    ):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.redis_client = redis_client
+        self.ffmpeg = shutil.which("ffmpeg") if transcode else None
+        self.ffprobe = shutil.which("ffprobe")
+        self.opus_bitrate = opus_bitrate
+        self.max_upload_bytes = int(max_upload_bytes)
+        self._transcode_slots = asyncio.Semaphore(max(int(transcode_concurrency), 1))
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _index_key(self, chat_id: str) -> str:
+        return f"{self.INDEX_PREFIX}:{chat_id}"
+
+    def _chat_dir(self, chat_id: str) -> Path:
+        if not self._SAFE_PART.match(chat_id or ""):
+            raise ValueError(f"Invalid chat id: {chat_id!r}")
+        return self.root / chat_id
+
+    def _file_path(self, chat_id: str, filename: str) -> Path:
+        if not self._SAFE_PART.match(filename or ""):
+            raise ValueError(f"Invalid audio filename: {filename!r}")
+        return self._chat_dir(chat_id) / filename
+
+    @staticmethod
+    def extension_for(filename: Optional[str], media_type: Optional[str]) -> str:
+        """File extension (without dot) from the client filename, else from the media type."""
+        if filename and "." in filename:
+            extension = filename.rsplit(".", 1)[-1].lower()
+            if extension.isalnum() and len(extension) <= 5:
+                return extension
+        mapped = MEDIA_TYPE_EXTENSIONS.get((media_type or "").split(";")[0].strip())
+        return mapped.lstrip(".") if mapped else "wav"
+
+    # --- metadata ---------------------------------------------------------------
+
+    @staticmethod
+    def _wav_duration(path: Path) -> Optional[float]:
+        try:
+            with wave.open(str(path), "rb") as wav:
+                return round(wav.getnframes() / float(wav.getframerate()), 3)
+        except (wave.Error, EOFError, OSError, ZeroDivisionError):
+            return None
+
+    async def _probe_duration(self, path: Path) -> Optional[float]:
+        if path.suffix.lower() == ".wav":
+            return await asyncio.to_thread(self._wav_duration, path)
+        if not self.ffprobe:
+            return None
+        process = await asyncio.create_subprocess_exec(
+            self.ffprobe, "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", str(path),
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+        )
+        stdout, _ = await process.communicate()
+        try:
+            return round(float(stdout.decode().strip()), 3)
+        except ValueError:
+            return None
+
+    async def _describe(self, audio_id: str, path: Path, **extra: Any) -> Dict[str, Any]:
+        stat = path.stat()
+        return {
+            "id": audio_id,
+            "filename": path.name,
+            "format": path.suffix.lstrip(".").lower(),
+            "media_type": media_type_for(path),
+            "size": stat.st_size,
+            "duration": await self._probe_duration(path),
+            "created": stat.st_mtime,
+            **extra,
+        }
+
+    async def _index(self, chat_id: str, meta: Dict[str, Any]) -> None:
+        if not self.redis_client:
+            return
+        try:
+            await self.redis_client.hset(self._index_key(chat_id), meta["id"], json.dumps(meta))
+        except Exception as e:
+            logger.warning("Failed to index audio %s/%s: %s", chat_id, meta["id"], e)
+
+    async def _lookup(self, chat_id: str, audio_id: str) -> Optional[Dict[str, Any]]:
+        if not self.redis_client:
+            return None
+        try:
+            raw = await self.redis_client.hget(self._index_key(chat_id), audio_id)
+        except Exception as e:
+            logger.warning("Audio index lookup failed for %s/%s: %s", chat_id, audio_id, e)
+            return None
+        return json.loads(raw) if raw else None
+
+    async def _scan(self, chat_id: str) -> List[Dict[str, Any]]:
+        chat_dir = self._chat_dir(chat_id)
+        if not chat_dir.is_dir():
+            return []
+        entries = []
+        for path in chat_dir.iterdir():
+            if path.is_file() and not path.name.endswith(".tmp"):
+                entries.append(await self._describe(path.stem, path))
+        return entries
+
+    async def list(self, chat_id: str) -> List[Dict[str, Any]]:
+        """Metadata of every audio file in a chat, oldest first."""
+        entries: Optional[List[Dict[str, Any]]] = None
+        if self.redis_client:
+            try:
+                raw = await self.redis_client.hgetall(self._index_key(chat_id))
+                entries = [json.loads(value) for value in raw.values()]
+            except Exception as e:
+                logger.warning("Audio index read failed for %s, scanning directory: %s", chat_id, e)
+        if not entries:
+            entries = await self._scan(chat_id)
+            for meta in entries:  # backfill chats stored before the index existed
+                await self._index(chat_id, meta)
+        return sorted(entries, key=lambda meta: meta.get("created") or 0)
+
+    # --- files --------------------------------------------------------------------
+
+    async def save_stream(self, chat_id: str, chunks: AsyncIterator[bytes], extension: str = "wav") -> Dict[str, Any]:
+        """Write an audio stream chunk by chunk; raises AudioTooLargeError past max_upload_bytes."""
+        chat_dir = self._chat_dir(chat_id)
+        chat_dir.mkdir(parents=True, exist_ok=True)
+        audio_id = str(uuid.uuid4())
+        path = self._file_path(chat_id, f"{audio_id}.{extension}")
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        size = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_upload_bytes:
+                        raise AudioTooLargeError(f"Audio exceeds {self.max_upload_bytes} bytes")
+                    await asyncio.to_thread(f.write, chunk)
+            os.replace(tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        return await self._add(chat_id, audio_id, path)
+
+    async def import_file(self, chat_id: str, source: Path, audio_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Store a copy of an existing file (e.g. cached synthesis).
+
+        Not a hard link: the audio cache touches its files' mtime on every hit,
+        which on a shared inode would change the message's ETag and Last-Modified.
+        """
+        chat_dir = self._chat_dir(chat_id)
+        chat_dir.mkdir(parents=True, exist_ok=True)
+        audio_id = audio_id or str(uuid.uuid4())
+        path = self._file_path(chat_id, f"{audio_id}{source.suffix}")
+        await asyncio.to_thread(shutil.copyfile, source, path)
+        return await self._add(chat_id, audio_id, path)
+
+    async def _add(self, chat_id: str, audio_id: str, path: Path) -> Dict[str, Any]:
+        meta = await self._describe(audio_id, path)
+        await self._index(chat_id, meta)
+        if self.ffmpeg and meta["format"] not in self.COMPACT_FORMATS:
+            task = asyncio.create_task(self._transcode(chat_id, meta), name=f"audio-transcode-{audio_id}")
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return meta
+
+    async def resolve(self, chat_id: str, filename: str) -> Optional[Path]:
+        """
+        Path for a requested filename. A file that has since been transcoded is
+        found by its audio id, so old URLs keep working.
+        """
+        path = self._file_path(chat_id, filename)
+        if path.is_file():
+            return path
+        audio_id = path.stem
+        meta = await self._lookup(chat_id, audio_id)
+        if meta:
+            current = self._file_path(chat_id, meta["filename"])
+            if current.is_file():
+                return current
+        return next((p for p in path.parent.glob(f"{audio_id}.*") if not p.name.endswith(".tmp")), None)
+
+    async def delete(self, chat_id: str, filename: str) -> bool:
+        path = self._file_path(chat_id, filename)
+        removed = False
+        for candidate in path.parent.glob(f"{path.stem}.*"):
+            candidate.unlink(missing_ok=True)
+            removed = True
+        if self.redis_client:
+            try:
+                removed = bool(await self.redis_client.hdel(self._index_key(chat_id), path.stem)) or removed
+            except Exception as e:
+                logger.warning("Failed to remove %s/%s from the audio index: %s", chat_id, path.stem, e)
+        return removed
+
+    # --- transcoding ----------------------------------------------------------------
+
+    async def _transcode(self, chat_id: str, meta: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        source = self._file_path(chat_id, meta["filename"])
+        target = source.with_suffix(".ogg")
+        tmp_path = target.with_name(f"{target.name}.tmp")
+        async with self._transcode_slots:
+            started = time.monotonic()
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    self.ffmpeg, "-nostdin", "-v", "error", "-y", "-i", str(source),
+                    "-vn", "-c:a", "libopus", "-b:a", self.opus_bitrate, "-application", "voip",
+                    "-f", "ogg", str(tmp_path),
+                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+                )
+                _, stderr = await process.communicate()
+                if process.returncode != 0 or not tmp_path.exists():
+                    logger.warning("Opus transcode of %s failed: %s", source.name, stderr.decode(errors="replace")[-300:])
+                    return None
+                if tmp_path.stat().st_size >= meta["size"] or not source.exists():
+                    return None  # no gain, or deleted meanwhile
+                os.replace(tmp_path, target)
+                transcoded = await self._describe(meta["id"], target, transcoded_from=meta["format"])
+                if transcoded["duration"] is None:
+                    transcoded["duration"] = meta.get("duration")
+                await self._index(chat_id, transcoded)
+                try:
+                    source.unlink()
+                except OSError as e:  # still being served on Windows; resolve() prefers the index entry anyway
+                    logger.warning("Could not remove %s after transcoding: %s", source.name, e)
+                logger.info(
+                    "Transcoded %s to Opus: %d -> %d bytes in %.2fs",
+                    source.name, meta["size"], transcoded["size"], time.monotonic() - started,
+                )
+                return transcoded
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Opus transcode of %s failed: %s", source.name, e)
+                return None
+            finally:
+                tmp_path.unlink(missing_ok=True)
+
+    async def wait_idle(self) -> None:
+        """Wait for pending background transcodes."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def aclose(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*list(self._tasks), return_exceptions=True)
+        self._tasks.clear()
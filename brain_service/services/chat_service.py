@@ -10,6 +10,7 @@ from models.chat_models import Session
 from domain.chat.tools import ToolRegistry
 from core.dependencies import get_memory_service
 from .block_stream_service import BlockStreamService
+from .request_context import ChatTurnContext, load_chat_context
 from core.llm_config import get_llm_for_task, LLMConfigError, get_tooling_config
 from config import personalities as personality_service
 
@@ -53,27 +54,35 @@ class ChatService:
     async def get_llm_response_stream(
         self, 
         messages: List[Dict[str, Any]], 
-        session_id: str
-    ) -> AsyncGenerator[str, None]:
+        session_id: str,
+        context: Optional[ChatTurnContext] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
         """
         Generate LLM response stream with tool support and STM integration.
         
         Args:
             messages: List of message dictionaries
             session_id: Session ID for STM integration
+            context: Prefetched turn context (STM and LLM config); loaded on demand if None
             
         Yields:
-            JSON strings with streaming events
+            Streaming event dictionaries, encoded once by the NDJSON writer
         """
-        try:
-            client, model, reasoning_params, caps = get_llm_for_task("CHAT")
-        except LLMConfigError as e:
-            yield json.dumps({"type": "error", "data": {"message": f"LLM not configured: {e}"}}) + '\n'
-            return
+        if context is not None:
+            if context.llm is None:
+                yield {"type": "error", "data": {"message": f"LLM not configured: {context.llm_error}"}}
+                return
+            client, model, reasoning_params, caps = context.llm
+        else:
+            try:
+                client, model, reasoning_params, caps = get_llm_for_task("CHAT")
+            except LLMConfigError as e:
+                yield {"type": "error", "data": {"message": f"LLM not configured: {e}"}}
+                return
 
         # Integrate STM if available
         if self.memory_service:
-            stm_data = await self.memory_service.get_stm(session_id)
+            stm_data = context.stm if context is not None else await self.memory_service.get_stm(session_id)
             if stm_data:
                 # Use the new format_stm_for_prompt method
                 stm_context = self.memory_service.format_stm_for_prompt(stm_data)
@@ -127,7 +136,7 @@ class ChatService:
                         )
                         continue
                     full_reply_content += delta.content
-                    yield json.dumps({"type": "llm_chunk", "data": delta.content}) + '\n'
+                    yield {"type": "llm_chunk", "data": delta.content}
                 if delta and delta.tool_calls:
                     for tc in delta.tool_calls:
                         builder = tool_call_builders[tc.index]
@@ -168,8 +177,8 @@ class ChatService:
                         "I was unable to generate a helpful answer after consulting available tools. "
                         "Please rephrase the question or try again."
                     )
-                    yield json.dumps({"type": "llm_chunk", "data": fallback_message}) + '\n'
-                    yield json.dumps({"type": "end", "data": "Stream finished"}) + '\n'
+                    yield {"type": "llm_chunk", "data": fallback_message}
+                    yield {"type": "end", "data": "Stream finished"}
                     return
                 
                 # Check if the response is a JSON document (doc.v1 format)
@@ -179,13 +188,13 @@ class ChatService:
                     if parsed_content is None:
                         # No valid JSON found, send as text
                         logger.debug(f"No valid JSON found in response, sending as text. Length: {len(full_reply_content)}")
-                        yield json.dumps({"type": "full_response", "data": full_reply_content}) + '\n'
+                        yield {"type": "full_response", "data": full_reply_content}
                         return
                     if isinstance(parsed_content, dict):
                         # Check for direct doc.v1 format with blocks
                         if ((parsed_content.get("type") == "doc.v1" and "blocks" in parsed_content) or
                             ("blocks" in parsed_content and isinstance(parsed_content["blocks"], list))):
-                            yield json.dumps({"type": "doc_v1", "data": parsed_content}) + '\n'
+                            yield {"type": "doc_v1", "data": parsed_content}
                         # Check for direct doc.v1 format with content (LLM streaming format)
                         elif (parsed_content.get("version") == "doc.v1" and 
                               "content" in parsed_content and isinstance(parsed_content["content"], list)):
@@ -198,13 +207,13 @@ class ChatService:
                                 }
                                 # Validate the structure
                                 if self._validate_doc_v1_structure(doc_v1_data):
-                                    yield json.dumps({"type": "doc_v1", "data": doc_v1_data}) + '\n'
+                                    yield {"type": "doc_v1", "data": doc_v1_data}
                                 else:
                                     logger.warning("Invalid doc.v1 structure, sending as text")
-                                    yield json.dumps({"type": "full_response", "data": full_reply_content}) + '\n'
+                                    yield {"type": "full_response", "data": full_reply_content}
                             except Exception as e:
                                 logger.error(f"Error processing doc.v1 content: {e}")
-                                yield json.dumps({"type": "full_response", "data": full_reply_content}) + '\n'
+                                yield {"type": "full_response", "data": full_reply_content}
                         # Check for wrapped doc format with content
                         elif ("doc" in parsed_content and isinstance(parsed_content["doc"], dict) and
                               "content" in parsed_content["doc"] and isinstance(parsed_content["doc"]["content"], list)):
@@ -216,14 +225,14 @@ class ChatService:
                             }
                             if "version" in doc_data:
                                 doc_v1_data["version"] = doc_data["version"]
-                            yield json.dumps({"type": "doc_v1", "data": doc_v1_data}) + '\n'
+                            yield {"type": "doc_v1", "data": doc_v1_data}
                         else:
-                            yield json.dumps({"type": "full_response", "data": full_reply_content}) + '\n'
+                            yield {"type": "full_response", "data": full_reply_content}
                     else:
-                        yield json.dumps({"type": "full_response", "data": full_reply_content}) + '\n'
+                        yield {"type": "full_response", "data": full_reply_content}
                 except (json.JSONDecodeError, TypeError):
                     # Not JSON, send as regular text response
-                    yield json.dumps({"type": "full_response", "data": full_reply_content}) + '\n'
+                    yield {"type": "full_response", "data": full_reply_content}
                 return
 
             full_tool_calls = sorted(tool_call_builders.values(), key=lambda x: x.get('index', 0))
@@ -236,7 +245,7 @@ class ChatService:
                     result = await self.tool_registry.call(function_name, **function_args)
                     # Fix: Safe serialization for tool_result
                     safe_result = json.dumps(result, default=str)
-                    yield json.dumps({"type": "tool_result", "data": json.loads(safe_result)}) + '\n'
+                    yield {"type": "tool_result", "data": json.loads(safe_result)}
                     messages.append({
                         "tool_call_id": tool_call["id"], 
                         "role": "tool", 
@@ -246,7 +255,7 @@ class ChatService:
                 except Exception as e:
                     error_message = f"Error calling tool {function_name}: {e}"
                     logger.error(error_message, exc_info=True)
-                    yield json.dumps({"type": "error", "data": {"message": error_message}}) + '\n'
+                    yield {"type": "error", "data": {"message": error_message}}
                     messages.append({
                         "tool_call_id": tool_call["id"], 
                         "role": "tool", 
@@ -262,7 +271,7 @@ class ChatService:
         user_id: str, 
         session_id: Optional[str] = None, 
         agent_id: Optional[str] = None
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[Dict[str, Any], None]:
         """
         Process a chat stream request.
         
@@ -273,16 +282,18 @@ class ChatService:
             agent_id: Optional agent ID
             
         Yields:
-            JSON strings with streaming events
+            Streaming event dictionaries, encoded once by the NDJSON writer
         """
         logger.info(f"--- New General Chat Request ---")
         
-        # Get or create session
-        session = await self.get_session_from_redis(
+        # Get or create session, prefetching STM and LLM config concurrently
+        context = await load_chat_context(
+            self,
             session_id or str(uuid.uuid4()), 
             user_id, 
             agent_id or "default"
         )
+        session = context.session
         
         # Add user message to session
         session.add_message(role="user", content=text)
@@ -298,26 +309,22 @@ class ChatService:
         full_response = ""
         final_message = None  # Fix: Track what to save in history
         
-        async for chunk in self.get_llm_response_stream(prompt_messages, session.persistent_session_id):
-            yield chunk
-            try:
-                event = json.loads(chunk)
-                if event.get("type") == "llm_chunk":
-                    full_response += event.get("data", "")
-                elif event.get("type") == "doc_v1":
-                    # Fix: Store doc.v1 for final message
-                    final_message = {
-                        "content": json.dumps(event.get("data", {})),
-                        "content_type": "doc.v1"
-                    }
-                elif event.get("type") == "full_response":
-                    # Fix: Store full response for final message
-                    final_message = {
-                        "content": event.get("data", ""),
-                        "content_type": "text.v1"
-                    }
-            except json.JSONDecodeError:
-                pass
+        async for event in self.get_llm_response_stream(prompt_messages, session.persistent_session_id, context=context):
+            yield event
+            if event.get("type") == "llm_chunk":
+                full_response += event.get("data", "")
+            elif event.get("type") == "doc_v1":
+                # Fix: Store doc.v1 for final message
+                final_message = {
+                    "content": json.dumps(event.get("data", {})),
+                    "content_type": "doc.v1"
+                }
+            elif event.get("type") == "full_response":
+                # Fix: Store full response for final message
+                final_message = {
+                    "content": event.get("data", ""),
+                    "content_type": "text.v1"
+                }
 
         # Add assistant response to session
         if final_message:
@@ -339,20 +346,20 @@ class ChatService:
             # Prepare recent messages for STM update
             recent_messages = [m.model_dump() for m in session.short_term_memory[-10:]]  # Last 10 messages
             
-            # Use consider_update_stm which handles all the logic
-            updated = await self.memory_service.consider_update_stm(
+            # Queue the STM update for the background worker (falls back to inline update)
+            updated = await self.memory_service.schedule_stm_update(
                 session.persistent_session_id, recent_messages
             )
             
             if updated:
-                logger.info("STM updated after chat stream completion", extra={
+                logger.info("STM update scheduled after chat stream completion", extra={
                     "session_id": session.persistent_session_id,
                     "message_count": len(recent_messages),
                     "token_count": sum(len(str(msg.get("content", ""))) for msg in recent_messages) // 4
                 })
 
         # End stream
-        yield json.dumps({"type": "end", "data": "Stream finished"}) + '\n'
+        yield {"type": "end", "data": "Stream finished"}
 
     async def get_all_chats(self) -> List[Dict[str, Any]]:
         """
@@ -502,7 +509,8 @@ class ChatService:
     async def get_llm_response_stream_with_blocks(
         self, 
         messages: List[Dict[str, Any]], 
-        session_id: str
+        session_id: str,
+        context: Optional[ChatTurnContext] = None
     ) -> AsyncGenerator[str, None]:
         """
         Generate LLM response stream with block-by-block streaming.
@@ -510,19 +518,26 @@ class ChatService:
         Args:
             messages: List of message dictionaries
             session_id: Session ID for STM integration
+            context: Prefetched turn context (STM and LLM config); loaded on demand if None
             
         Yields:
             JSON strings with streaming events (including block events)
         """
-        try:
-            client, model, reasoning_params, caps = get_llm_for_task("CHAT")
-        except LLMConfigError as e:
-            yield json.dumps({"type": "error", "data": {"message": f"LLM not configured: {e}"}}) + '\n'
-            return
+        if context is not None:
+            if context.llm is None:
+                yield json.dumps({"type": "error", "data": {"message": f"LLM not configured: {context.llm_error}"}}) + '\n'
+                return
+            client, model, reasoning_params, caps = context.llm
+        else:
+            try:
+                client, model, reasoning_params, caps = get_llm_for_task("CHAT")
+            except LLMConfigError as e:
+                yield json.dumps({"type": "error", "data": {"message": f"LLM not configured: {e}"}}) + '\n'
+                return
 
         # Integrate STM if available
         if self.memory_service:
-            stm_data = await self.memory_service.get_stm(session_id)
+            stm_data = context.stm if context is not None else await self.memory_service.get_stm(session_id)
             if stm_data:
                 # Use the new format_stm_for_prompt method
                 stm_context = self.memory_service.format_stm_for_prompt(stm_data)
@@ -692,12 +707,14 @@ class ChatService:
         """
         logger.info(f"--- New Block Streaming Chat Request ---")
         
-        # Get or create session
-        session = await self.get_session_from_redis(
+        # Get or create session, prefetching STM and LLM config concurrently
+        context = await load_chat_context(
+            self,
             session_id or str(uuid.uuid4()), 
             user_id, 
             agent_id or "default"
         )
+        session = context.session
         
         # Add user message to session
         session.add_message(role="user", content=text)
@@ -715,7 +732,7 @@ class ChatService:
         block_doc = {"version": "1.0", "blocks": []}  # Fix: Aggregate blocks into doc
         block_ids = {}  # Fix: Track block_ids for stable keys
         
-        async for chunk in self.get_llm_response_stream_with_blocks(prompt_messages, session.persistent_session_id):
+        async for chunk in self.get_llm_response_stream_with_blocks(prompt_messages, session.persistent_session_id, context=context):
             yield chunk
             try:
                 event = json.loads(chunk)
@@ -783,12 +800,12 @@ class ChatService:
             # Prepare recent messages for STM update
             recent_messages = [m.model_dump() for m in session.short_term_memory[-10:]]  # Last 10 messages
             
-            # Use consider_update_stm which handles all the logic
-            updated = await self.memory_service.consider_update_stm(
+            # Queue the STM update for the background worker (falls back to inline update)
+            updated = await self.memory_service.schedule_stm_update(
                 session.persistent_session_id, recent_messages
             )
             if updated:
-                logger.info("STM updated after block streaming chat completion")
+                logger.info("STM update scheduled after block streaming chat completion")
 
 
     def _text_to_async_generator(self, text: str) -> AsyncGenerator[str, None]:
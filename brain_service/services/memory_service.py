@@ -3,11 +3,122 @@ import time
 import logging
 import hashlib
 import re
+from functools import lru_cache
 from typing import Dict, Any, List, Optional, Tuple
 import redis.asyncio as redis
 
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional, pure-Python fallback below
+    np = None
+
 logger = logging.getLogger(__name__)
 
+if np is not None:
+    _BIT_SHIFTS = np.arange(64, dtype=np.uint64)
+    _BIT_WEIGHTS = np.left_shift(np.uint64(1), _BIT_SHIFTS)
+
+
+@lru_cache(maxsize=65536)
+def _bigram_hash(gram: str) -> int:
+    """64-bit blake2b hash of a character bigram (cached: bigrams repeat heavily)."""
+    return int.from_bytes(hashlib.blake2b(gram.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def _popcount64(values: "np.ndarray") -> "np.ndarray":
+    """Per-element bit count of a uint64 array."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return np.unpackbits(values.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+
+
+class _SimHashIndex:
+    """
+    Near-duplicate lookup over 64-bit SimHash signatures.
+    
+    With NumPy, signatures live in a contiguous uint64 array and a lookup is a
+    single vectorized XOR + popcount scan. Without NumPy, the signature is
+    split into ``threshold + 1`` LSH bands; by pigeonhole two signatures within
+    ``threshold`` bits agree on at least one band, so bucket candidates always
+    contain every true near-duplicate.
+    
+    Either way ``find`` returns exactly what a full pairwise scan would: the
+    lowest position whose *current* signature is within the threshold.
+    """
+    
+    def __init__(self, threshold: int):
+        self.threshold = threshold
+        self.size = 0
+        self.vectorized = np is not None
+        if self.vectorized:
+            self.sigs = np.zeros(64, dtype=np.uint64)
+            return
+        
+        self.sigs_list: List[int] = []
+        self.buckets: Dict[Tuple[int, int], List[int]] = {}
+        self.bands: List[Tuple[int, int]] = []
+        n_bands = threshold + 1
+        if 0 < n_bands <= 64:
+            shift = 0
+            for band in range(n_bands):
+                width = 64 // n_bands + (1 if band < 64 % n_bands else 0)
+                self.bands.append((shift, (1 << width) - 1))
+                shift += width
+    
+    def _band_keys(self, sig: int):
+        return [(band, (sig >> shift) & mask) for band, (shift, mask) in enumerate(self.bands)]
+    
+    def add(self, sig: int) -> int:
+        """Append a signature and return its position."""
+        position = self.size
+        self.size += 1
+        if self.vectorized:
+            if position == len(self.sigs):
+                self.sigs = np.concatenate([self.sigs, np.zeros(len(self.sigs), dtype=np.uint64)])
+            self.sigs[position] = sig
+            return position
+        
+        self.sigs_list.append(sig)
+        for key in self._band_keys(sig):
+            self.buckets.setdefault(key, []).append(position)
+        return position
+    
+    def replace(self, position: int, sig: int) -> None:
+        """Point an existing position at a new signature."""
+        if self.vectorized:
+            self.sigs[position] = sig
+            return
+        
+        self.sigs_list[position] = sig
+        for key in self._band_keys(sig):
+            bucket = self.buckets.setdefault(key, [])
+            if position not in bucket:
+                bucket.append(position)
+    
+    def find(self, sig: int) -> Optional[int]:
+        """Return the lowest position within ``threshold`` bits of ``sig``, if any."""
+        if self.size == 0:
+            return None
+        
+        if self.vectorized:
+            distances = _popcount64(self.sigs[:self.size] ^ np.uint64(sig))
+            hits = np.flatnonzero(distances <= self.threshold)
+            return int(hits[0]) if hits.size else None
+        
+        if self.bands:
+            candidates = set()
+            for key in self._band_keys(sig):
+                candidates.update(self.buckets.get(key, ()))
+            ordered = sorted(candidates)
+        else:
+            ordered = range(self.size)
+        for position in ordered:
+            # Stale bucket entries are filtered out here by the current signature
+            if (sig ^ self.sigs_list[position]).bit_count() <= self.threshold:
+                return position
+        return None
+
+
 class MemoryService:
     """
     Enhanced Short-Term Memory (STM) service with structured slots, hysteresis triggers,
@@ -41,11 +152,12 @@ class MemoryService:
     # Regex for Sefaria references
     TREF_RE = re.compile(r"[A-Z][a-zA-Z]+(?:\s[0-9]+[ab])?[:\s]\d+(?::\d+)?")
     
-    def __init__(self, redis_client: redis.Redis, ttl_sec: int = DEFAULT_TTL_SEC, config: Optional[Dict[str, Any]] = None, summary_service=None):
+    def __init__(self, redis_client: redis.Redis, ttl_sec: int = DEFAULT_TTL_SEC, config: Optional[Dict[str, Any]] = None, summary_service=None, update_queue=None):
         self.redis_client = redis_client
         self.ttl = ttl_sec
         self.config = config or {}
         self.summary_service = summary_service
+        self.update_queue = update_queue
         
         # Load configuration with defaults
         self.enabled = self.config.get("stm", {}).get("enabled", True)
@@ -138,6 +250,24 @@ class MemoryService:
         
         return False
     
+    async def schedule_stm_update(self, session_id: str, last_messages: List[Dict[str, Any]]) -> bool:
+        """
+        Hand an STM update to the background worker queue.
+        
+        Falls back to an inline ``consider_update_stm`` when no queue is attached
+        or enqueueing fails.
+        
+        Returns:
+            True if the update was queued or STM was updated inline
+        """
+        if not self.enabled:
+            return False
+        
+        if self.update_queue and await self.update_queue.enqueue(session_id, last_messages):
+            return True
+        
+        return await self.consider_update_stm(session_id, last_messages)
+    
     async def should_update_stm(
         self,
         session_id: str,
@@ -241,14 +371,22 @@ class MemoryService:
         """
         Generate 64-bit SimHash for text deduplication.
         
-        Uses bigrams and bit counting for semantic similarity detection.
+        Uses bigrams and bit counting for semantic similarity detection. The
+        per-bit vote is computed on a NumPy array of bigram hashes when NumPy
+        is available; signatures are identical to the pure-Python path.
         """
         text = text.lower()
         grams = [text[i:i+2] for i in range(len(text)-1)]
-        bit_counts = [0] * 64
         
+        if np is not None:
+            hashes = np.fromiter((_bigram_hash(g) for g in grams), dtype=np.uint64, count=len(grams))
+            ones = ((hashes[:, None] >> _BIT_SHIFTS) & np.uint64(1)).sum(axis=0, dtype=np.int64)
+            # bit_count[b] = ones - zeros >= 0  <=>  2 * ones >= n
+            return int(_BIT_WEIGHTS[2 * ones >= len(grams)].sum(dtype=np.uint64))
+        
+        bit_counts = [0] * 64
         for g in grams:
-            h = int(hashlib.blake2b(g.encode('utf-8'), digest_size=8).hexdigest(), 16)
+            h = _bigram_hash(g)
             for b in range(64):
                 bit_counts[b] += (1 if (h >> b) & 1 else -1)
         
@@ -642,13 +780,15 @@ class MemoryService:
         return unique_refs
     
     def _merge_structured_items(self, existing: List[Dict[str, Any]], new: List[Dict[str, Any]], threshold: int) -> List[Dict[str, Any]]:
-        """Merge structured items using SimHash deduplication."""
+        """Merge structured items using SimHash deduplication (indexed near-duplicate lookup)."""
         result = []
+        index = _SimHashIndex(threshold)
         
         # Add existing items
         for item in existing:
             if "sig" not in item:
                 item["sig"] = self._simhash64(item.get("text", ""))
+            index.add(item["sig"])
             result.append(item)
         
         # Add new items, checking for duplicates
@@ -656,17 +796,16 @@ class MemoryService:
             if "sig" not in new_item:
                 new_item["sig"] = self._simhash64(new_item.get("text", ""))
             
-            # Check if similar item already exists
-            is_duplicate = False
-            for existing_item in result:
-                if self._hamming_distance(new_item["sig"], existing_item["sig"]) <= threshold:
-                    # Update existing item with higher score and newer timestamp
-                    if new_item.get("score", 0) > existing_item.get("score", 0):
-                        existing_item.update(new_item)
-                    is_duplicate = True
-                    break
-            
-            if not is_duplicate:
+            # Check if similar item already exists (first match in merge order)
+            position = index.find(new_item["sig"])
+            if position is not None:
+                existing_item = result[position]
+                # Update existing item with higher score and newer timestamp
+                if new_item.get("score", 0) > existing_item.get("score", 0):
+                    existing_item.update(new_item)
+                    index.replace(position, existing_item["sig"])
+            else:
+                index.add(new_item["sig"])
                 result.append(new_item)
         
         # Sort by score and recency
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.llm_config import get_llm_for_task, LLMConfigError
+
+logger = logging.getLogger(__name__)
+
+LLMHandle = Tuple[Any, str, Dict[str, Any], List[str]]
+
+
+@dataclass
+class TurnContext:
+    """State read once at the start of a chat or study turn."""
+
+    session_id: str
+    stm: Optional[Dict[str, Any]] = None
+    llm: Optional[LLMHandle] = None
+    llm_error: Optional[str] = None
+    load_ms: float = 0.0
+
+
+@dataclass
+class ChatTurnContext(TurnContext):
+    session: Any = None
+
+
+@dataclass
+class StudyTurnContext(TurnContext):
+    snapshot: Any = None
+    # Chat history as of the start of the turn; None if it was not prefetched.
+    history: Optional[List[Dict[str, Any]]] = None
+    # Text of panel_id, prefetched once the snapshot is known.
+    panel_id: Optional[str] = None
+    panel_text: Optional[Dict[str, Any]] = None
+
+
+def _resolve_llm(task: str) -> Tuple[Optional[LLMHandle], Optional[str]]:
+    try:
+        return get_llm_for_task(task), None
+    except LLMConfigError as e:
+        return None, str(e)
+
+
+async def _none() -> None:
+    return None
+
+
+async def load_chat_context(chat_service, session_id: str, user_id: str, agent_id: str) -> ChatTurnContext:
+    """
+    Load session, STM and LLM config for a chat turn.
+
+    The session and STM reads are independent Redis round trips, so they are
+    issued concurrently; the (in-process) LLM config lookup runs while they
+    are in flight.
+    """
+    start = time.perf_counter()
+    memory_service = chat_service.memory_service
+
+    session_task = asyncio.ensure_future(chat_service.get_session_from_redis(session_id, user_id, agent_id))
+    stm_task = asyncio.ensure_future(memory_service.get_stm(session_id) if memory_service else _none())
+    llm, llm_error = _resolve_llm("CHAT")
+    session, stm = await asyncio.gather(session_task, stm_task)
+
+    # A stored session may carry a different persistent id than the one requested.
+    if memory_service and session.persistent_session_id != session_id:
+        stm = await memory_service.get_stm(session.persistent_session_id)
+
+    context = ChatTurnContext(
+        session_id=session.persistent_session_id,
+        session=session,
+        stm=stm,
+        llm=llm,
+        llm_error=llm_error,
+        load_ms=(time.perf_counter() - start) * 1000,
+    )
+    logger.debug("Chat turn context loaded", extra={
+        "session_id": context.session_id,
+        "has_stm": stm is not None,
+        "load_ms": context.load_ms
+    })
+    return context
+
+
+async def load_study_context(study_service, session_id: str, selected_panel_id: Optional[str] = None) -> StudyTurnContext:
+    """
+    Load the study snapshot, STM, chat history and LLM config for a study turn concurrently.
+
+    The selected panel's text needs the snapshot to know its ref, so it is
+    fetched as soon as the snapshot arrives, while the STM and history reads
+    are still in flight. The history is only read when there is a memory
+    service, since it is only used for the STM update after the reply.
+    """
+    from .study_state import get_current_snapshot
+
+    start = time.perf_counter()
+    memory_service = study_service.memory_service
+
+    snapshot_task = asyncio.ensure_future(get_current_snapshot(session_id, study_service.redis_client))
+    stm_task = asyncio.ensure_future(memory_service.get_stm(session_id) if memory_service else _none())
+    history_task = asyncio.ensure_future(study_service._get_study_chat_history(session_id) if memory_service else _none())
+
+    async def panel_text() -> Optional[Dict[str, Any]]:
+        snapshot = await snapshot_task
+        if snapshot is None or not selected_panel_id:
+            return None
+        return await study_service._get_selected_panel_text(selected_panel_id, snapshot)
+
+    llm, llm_error = _resolve_llm("STUDY")
+    snapshot, stm, history, text = await asyncio.gather(snapshot_task, stm_task, history_task, panel_text())
+
+    context = StudyTurnContext(
+        session_id=session_id,
+        snapshot=snapshot,
+        stm=stm,
+        history=history,
+        panel_id=selected_panel_id,
+        panel_text=text,
+        llm=llm,
+        llm_error=llm_error,
+        load_ms=(time.perf_counter() - start) * 1000,
+    )
+    logger.debug("Study turn context loaded", extra={
+        "session_id": session_id,
+        "has_snapshot": snapshot is not None,
+        "has_stm": stm is not None,
+        "has_panel_text": text is not None,
+        "load_ms": context.load_ms
+    })
+    return context
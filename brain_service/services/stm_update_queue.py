@@ -0,0 +1,261 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+
+class STMUpdateQueue:
+    """
+    Redis-backed work queue for STM/summary updates.
+
+    Chat and study streams enqueue the recent messages of a session instead of
+    awaiting ``MemoryService.consider_update_stm`` (and the LLM summary call behind
+    it) before emitting ``end``. A pool of worker tasks drains the queue.
+
+    Updates are coalesced per session: the payload key holds only the latest
+    message window, and a session id sits in the ready list at most once until a
+    worker picks it up. A per-session lock keeps two workers (possibly in
+    different processes) from updating the same STM concurrently.
+
+    Workers take session ids with BLMOVE into a processing list and remove them
+    from it (ack) together with the pending marker. A worker that is cancelled or
+    fails before the ack puts the id back on the ready list. Ids left behind by a
+    crashed process are moved back on the next ``start``.
+    """
+
+    DEFAULT_QUEUE_KEY = "stm:queue"
+    DEFAULT_CONCURRENCY = 2
+    DEFAULT_PAYLOAD_TTL_SEC = 3600
+    DEFAULT_LOCK_TTL_SEC = 120
+    DEFAULT_POLL_TIMEOUT_SEC = 1
+    LOCKED_RETRY_DELAY_SEC = 0.5
+
+    # Store the latest payload and push the session id only if it is not already pending.
+    _ENQUEUE_SCRIPT = """
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+if redis.call('SADD', KEYS[2], ARGV[3]) == 1 then
+    redis.call('RPUSH', KEYS[3], ARGV[3])
+    return 1
+end
+return 0
+"""
+
+    def __init__(self, redis_client: redis.Redis, memory_service, config: Optional[Dict[str, Any]] = None):
+        self.redis_client = redis_client
+        self.memory_service = memory_service
+        self.config = config or {}
+
+        worker_config = self.config.get("stm", {}).get("worker", {})
+        self.enabled = worker_config.get("enabled", True)
+        self.concurrency = max(int(worker_config.get("concurrency", self.DEFAULT_CONCURRENCY)), 1)
+        self.queue_key = worker_config.get("queue_key", self.DEFAULT_QUEUE_KEY)
+        self.payload_ttl = worker_config.get("payload_ttl_sec", self.DEFAULT_PAYLOAD_TTL_SEC)
+        self.lock_ttl = worker_config.get("lock_ttl_sec", self.DEFAULT_LOCK_TTL_SEC)
+        self.poll_timeout = worker_config.get("poll_timeout_sec", self.DEFAULT_POLL_TIMEOUT_SEC)
+
+        self._workers: List[asyncio.Task] = []
+        self.stats = {"enqueued": 0, "coalesced": 0, "processed": 0, "updated": 0, "failed": 0}
+
+    def _payload_key(self, session_id: str) -> str:
+        return f"{self.queue_key}:payload:{session_id}"
+
+    def _pending_key(self) -> str:
+        return f"{self.queue_key}:pending"
+
+    def _processing_key(self) -> str:
+        return f"{self.queue_key}:processing"
+
+    def _lock_key(self, session_id: str) -> str:
+        return f"{self.queue_key}:lock:{session_id}"
+
+    async def enqueue(self, session_id: str, last_messages: List[Dict[str, Any]]) -> bool:
+        """
+        Schedule an STM update for a session.
+
+        Args:
+            session_id: Session identifier
+            last_messages: Recent messages to feed into the update
+
+        Returns:
+            True if the update was queued (or merged into a pending one)
+        """
+        if not self.redis_client or not self.enabled:
+            return False
+
+        payload = json.dumps(
+            {"messages": last_messages, "ts": time.time()},
+            ensure_ascii=False,
+            default=str,
+        )
+        try:
+            added = await self.redis_client.eval(
+                self._ENQUEUE_SCRIPT,
+                3,
+                self._payload_key(session_id),
+                self._pending_key(),
+                self.queue_key,
+                payload,
+                self.payload_ttl,
+                session_id,
+            )
+            if added:
+                self.stats["enqueued"] += 1
+            else:
+                self.stats["coalesced"] += 1
+            logger.debug("STM update queued", extra={
+                "session_id": session_id,
+                "coalesced": not added,
+                "message_count": len(last_messages)
+            })
+            return True
+        except Exception as e:
+            logger.error("Failed to enqueue STM update", extra={
+                "session_id": session_id,
+                "error": str(e)
+            })
+            return False
+
+    async def start(self) -> None:
+        """Start the worker pool."""
+        if self._workers or not self.redis_client or not self.enabled:
+            return
+        await self._recover()
+        self._workers = [
+            asyncio.create_task(self._worker_loop(i), name=f"stm-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+        logger.info("STM update workers started", extra={
+            "concurrency": self.concurrency,
+            "queue": self.queue_key
+        })
+
+    async def stop(self) -> None:
+        """Stop the worker pool. Queued updates stay in Redis for the next start."""
+        workers, self._workers = self._workers, []
+        for task in workers:
+            task.cancel()
+        for task in workers:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if workers:
+            logger.info("STM update workers stopped", extra={"stats": dict(self.stats)})
+
+    async def _recover(self) -> None:
+        """
+        Put ids left in the processing list by a crashed worker back on the ready list.
+
+        Ids another live process is working on right now may be moved too; processing
+        them again is harmless, since their payload is already consumed.
+        """
+        try:
+            stranded = await self.redis_client.llen(self._processing_key())
+            for _ in range(stranded):
+                if not await self.redis_client.lmove(self._processing_key(), self.queue_key, "RIGHT", "LEFT"):
+                    break
+            if stranded:
+                logger.info("Requeued stranded STM updates", extra={"count": stranded})
+        except Exception as e:
+            logger.error("Failed to recover stranded STM updates", extra={"error": str(e)})
+
+    async def _requeue(self, session_id: str) -> None:
+        pipe = self.redis_client.pipeline()
+        pipe.lrem(self._processing_key(), 1, session_id)
+        pipe.rpush(self.queue_key, session_id)
+        await pipe.execute()
+
+    async def _worker_loop(self, worker_id: int) -> None:
+        while True:
+            try:
+                session_id = await self.redis_client.blmove(
+                    self.queue_key, self._processing_key(), self.poll_timeout, "LEFT", "RIGHT"
+                )
+                if not session_id:
+                    continue
+                if isinstance(session_id, bytes):
+                    session_id = session_id.decode("utf-8")
+                await self.process(session_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("STM worker iteration failed", extra={
+                    "worker_id": worker_id,
+                    "error": str(e)
+                })
+                await asyncio.sleep(self.poll_timeout)
+
+    async def process(self, session_id: str) -> bool:
+        """
+        Run the pending STM update for a session.
+
+        Returns:
+            True if STM was updated
+        """
+        token = uuid.uuid4().hex
+        lock_key = self._lock_key(session_id)
+        locked = acked = False
+        try:
+            if not await self.redis_client.set(lock_key, token, nx=True, ex=self.lock_ttl):
+                # Another worker is updating this session; retry once it is done.
+                await asyncio.sleep(self.LOCKED_RETRY_DELAY_SEC)
+                await self._requeue(session_id)
+                acked = True
+                return False
+            locked = True
+
+            pipe = self.redis_client.pipeline()
+            pipe.getdel(self._payload_key(session_id))
+            pipe.srem(self._pending_key(), session_id)
+            pipe.lrem(self._processing_key(), 1, session_id)
+            raw = (await pipe.execute())[0]
+            acked = True
+            if not raw:
+                return False
+
+            payload = json.loads(raw)
+            messages = payload.get("messages") or []
+            start_time = time.time()
+            updated = await self.memory_service.consider_update_stm(session_id, messages)
+            self.stats["processed"] += 1
+            if updated:
+                self.stats["updated"] += 1
+                logger.info("STM updated by background worker", extra={
+                    "session_id": session_id,
+                    "message_count": len(messages),
+                    "queue_wait_ms": (start_time - payload.get("ts", start_time)) * 1000,
+                    "latency_ms": (time.time() - start_time) * 1000
+                })
+            return bool(updated)
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error("Background STM update failed", extra={
+                "session_id": session_id,
+                "error": str(e)
+            })
+            return False
+        finally:
+            if not acked:
+                # Cancelled or failed before the ack: the id is still pending, so it must stay queued.
+                try:
+                    await self._requeue(session_id)
+                except Exception as e:
+                    logger.error("Failed to requeue STM update", extra={
+                        "session_id": session_id,
+                        "error": str(e)
+                    })
+            if locked:
+                try:
+                    current = await self.redis_client.get(lock_key)
+                    if isinstance(current, bytes):
+                        current = current.decode("utf-8")
+                    if current == token:
+                        await self.redis_client.delete(lock_key)
+                except Exception:
+                    pass
@@ -25,6 +25,7 @@ from .study_state import (
     move_cursor, update_local_chat, StudySnapshot, TextDisplay, Bookshelf, BookshelfItem
 )
 from .study_utils import get_text_with_window, get_bookshelf_for
+from .request_context import StudyTurnContext, load_study_context
 
 logger = logging.getLogger(__name__)
 
@@ -656,7 +657,7 @@ class StudyService:
     async def process_study_chat_stream(
         self, 
         request: StudyChatRequest
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[Dict[str, Any], None]:
         """
         Process a study chat stream request with context-aware agent selection.
         
@@ -664,39 +665,44 @@ class StudyService:
             request: Study chat request with session and message info
             
         Yields:
-            JSON strings with streaming events
+            Streaming event dictionaries, encoded once by the NDJSON writer
         """
         logger.info(f"--- New Study Chat Request ---")
         
-        # Get current study state
-        current_snapshot = await get_current_snapshot(request.session_id, self.redis_client)
+        # Get current study state, prefetching STM and LLM config concurrently
+        context = await load_study_context(self, request.session_id, request.selected_panel_id)
+        current_snapshot = context.snapshot
         if not current_snapshot:
-            yield json.dumps({"type": "error", "data": {"message": "No study state found"}}) + '\n'
+            yield {"type": "error", "data": {"message": "No study state found"}}
             return
 
         # Determine agent mode based on selected panel
         if request.selected_panel_id:
             # "Iyun" mode - focused explanation of selected panel
             logger.info(f"Study mode: IYUN (selected panel: {request.selected_panel_id})")
-            async for chunk in self._run_iyun_mode(request, current_snapshot):
+            async for chunk in self._run_iyun_mode(request, current_snapshot, context):
                 yield chunk
         else:
             # "Girsa" mode - general study with tools
             logger.info("Study mode: GIRSA (no panel selected)")
-            async for chunk in self._run_girsa_mode(request, current_snapshot):
+            async for chunk in self._run_girsa_mode(request, current_snapshot, context):
                 yield chunk
 
     async def _run_iyun_mode(
         self, 
         request: StudyChatRequest, 
-        snapshot: StudySnapshot
-    ) -> AsyncGenerator[str, None]:
+        snapshot: StudySnapshot,
+        context: Optional[StudyTurnContext] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
         """Run Iyun mode - focused explanation of selected panel text."""
         try:
-            # Get the selected panel text
-            panel_text = await self._get_selected_panel_text(request.selected_panel_id, snapshot)
+            # Get the selected panel text (prefetched with the turn context)
+            if context is not None and context.panel_id == request.selected_panel_id:
+                panel_text = context.panel_text
+            else:
+                panel_text = await self._get_selected_panel_text(request.selected_panel_id, snapshot)
             if not panel_text:
-                yield json.dumps({"type": "error", "data": {"message": f"No text found for panel: {request.selected_panel_id}"}}) + '\n'
+                yield {"type": "error", "data": {"message": f"No text found for panel: {request.selected_panel_id}"}}
                 return
 
             # Get system prompt for panel explainer
@@ -712,7 +718,7 @@ class StudyService:
             # Get STM context and inject into system prompt
             stm_context = ""
             if self.memory_service:
-                stm = await self.memory_service.get_stm(request.session_id)
+                stm = context.stm if context is not None else await self.memory_service.get_stm(request.session_id)
                 if stm:
                     stm_context = self.memory_service.format_stm_for_prompt(stm)
             
@@ -732,21 +738,17 @@ class StudyService:
             full_response = ""
             final_doc_v1 = None
             
-            async for chunk in self._stream_llm_response(messages, request.session_id):
-                yield chunk
-                try:
-                    event = json.loads(chunk)
-                    if event.get("type") == "llm_chunk":
-                        chunk_data = event.get("data", {})
-                        if isinstance(chunk_data, dict):
-                            full_response += chunk_data.get("content", "")
-                        else:
-                            full_response += str(chunk_data)
-                    elif event.get("type") == "doc_v1":
-                        # Store the final doc.v1 for saving
-                        final_doc_v1 = event.get("data", {})
-                except json.JSONDecodeError:
-                    pass
+            async for event in self._stream_llm_response(messages, request.session_id, context):
+                yield event
+                if event.get("type") == "llm_chunk":
+                    chunk_data = event.get("data", {})
+                    if isinstance(chunk_data, dict):
+                        full_response += chunk_data.get("content", "")
+                    else:
+                        full_response += str(chunk_data)
+                elif event.get("type") == "doc_v1":
+                    # Store the final doc.v1 for saving
+                    final_doc_v1 = event.get("data", {})
             
             # Save messages to chat history
             logger.info(f"Full response length: {len(full_response)}, has doc_v1: {final_doc_v1 is not None}")
@@ -779,7 +781,8 @@ class StudyService:
             # Update STM after response (write-after-final)
             if self.memory_service and (final_doc_v1 or full_response.strip()):
                 # Build recent history for STM update (reuse stored chat history)
-                recent_history = await self._get_study_chat_history(request.session_id)
+                assistant_content = json.dumps(final_doc_v1, ensure_ascii=False) if final_doc_v1 else full_response.strip()
+                recent_history = await self._history_after_turn(request, context, assistant_content)
                 session_messages: List[Dict[str, Any]] = []
                 if recent_history:
                     for entry in recent_history[-10:]:
@@ -795,19 +798,18 @@ class StudyService:
                             }
                         )
                 else:
-                    assistant_content = json.dumps(final_doc_v1, ensure_ascii=False) if final_doc_v1 else full_response.strip()
                     session_messages = [
                         {"role": "user", "content": request.text},
                         {"role": "assistant", "content": assistant_content}
                     ]
 
-                # Use consider_update_stm which handles all the logic
-                updated = await self.memory_service.consider_update_stm(
+                # Queue the STM update for the background worker (falls back to inline update)
+                updated = await self.memory_service.schedule_stm_update(
                     request.session_id, session_messages
                 )
 
                 if updated:
-                    logger.info("STM updated after panel explainer", extra={
+                    logger.info("STM update scheduled after panel explainer", extra={
                         "session_id": request.session_id,
                         "message_count": len(session_messages),
                         "token_count": sum(len(str(msg.get("content", ""))) for msg in session_messages) // 4
@@ -815,13 +817,14 @@ class StudyService:
 
         except Exception as e:
             logger.error(f"Error in panel explainer agent: {e}", exc_info=True)
-            yield json.dumps({"type": "error", "data": {"message": str(e)}}) + '\n'
+            yield {"type": "error", "data": {"message": str(e)}}
 
     async def _run_girsa_mode(
         self, 
         request: StudyChatRequest, 
-        snapshot: StudySnapshot
-    ) -> AsyncGenerator[str, None]:
+        snapshot: StudySnapshot,
+        context: Optional[StudyTurnContext] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
         """Run Girsa mode - general study with tools and broader context."""
         try:
             # Get personality configuration
@@ -866,17 +869,17 @@ class StudyService:
             
             # Build comprehensive context message
             if context_parts:
-                context = f"""Current Study Session Context:
+                study_context = f"""Current Study Session Context:
 {chr(10).join(context_parts)}
 
 You can see what texts are currently open in the study interface. You have access to tools to research and explore these texts further. Use your tools to provide comprehensive responses."""
             else:
-                context = "No texts currently loaded in the study interface. You have access to research tools to help with any study questions."
+                study_context = "No texts currently loaded in the study interface. You have access to research tools to help with any study questions."
 
             # Get STM context and inject into system prompt
             stm_context = ""
             if self.memory_service:
-                stm = await self.memory_service.get_stm(request.session_id)
+                stm = context.stm if context is not None else await self.memory_service.get_stm(request.session_id)
                 if stm:
                     stm_context = self.memory_service.format_stm_for_prompt(stm)
             
@@ -912,28 +915,24 @@ You can see what texts are currently open in the study interface. You have acces
             
             messages = [
                 {"role": "system", "content": system_content},
-                {"role": "user", "content": f"Study context:\n{context}\n\nUser question: {request.text}"}
+                {"role": "user", "content": f"Study context:\n{study_context}\n\nUser question: {request.text}"}
             ]
 
             # Stream LLM response with tools
             full_response = ""
             final_doc_v1 = None
             
-            async for chunk in self._stream_llm_response(messages, request.session_id):
-                yield chunk
-                try:
-                    event = json.loads(chunk)
-                    if event.get("type") == "llm_chunk":
-                        chunk_data = event.get("data", {})
-                        if isinstance(chunk_data, dict):
-                            full_response += chunk_data.get("content", "")
-                        else:
-                            full_response += str(chunk_data)
-                    elif event.get("type") == "doc_v1":
-                        # Store the final doc.v1 for saving
-                        final_doc_v1 = event.get("data", {})
-                except json.JSONDecodeError:
-                    pass
+            async for event in self._stream_llm_response(messages, request.session_id, context):
+                yield event
+                if event.get("type") == "llm_chunk":
+                    chunk_data = event.get("data", {})
+                    if isinstance(chunk_data, dict):
+                        full_response += chunk_data.get("content", "")
+                    else:
+                        full_response += str(chunk_data)
+                elif event.get("type") == "doc_v1":
+                    # Store the final doc.v1 for saving
+                    final_doc_v1 = event.get("data", {})
             
             # Save messages to chat history
             logger.info(f"Full response length: {len(full_response)}, has doc_v1: {final_doc_v1 is not None}")
@@ -966,7 +965,8 @@ You can see what texts are currently open in the study interface. You have acces
             # Update STM after response (write-after-final)
             if self.memory_service and (final_doc_v1 or full_response.strip()):
                 # Build recent history for STM update (reuse stored chat history)
-                recent_history = await self._get_study_chat_history(request.session_id)
+                assistant_content = json.dumps(final_doc_v1, ensure_ascii=False) if final_doc_v1 else full_response.strip()
+                recent_history = await self._history_after_turn(request, context, assistant_content)
                 session_messages: List[Dict[str, Any]] = []
                 if recent_history:
                     for entry in recent_history[-10:]:
@@ -981,19 +981,18 @@ You can see what texts are currently open in the study interface. You have acces
                             }
                         )
                 else:
-                    assistant_content = json.dumps(final_doc_v1, ensure_ascii=False) if final_doc_v1 else full_response.strip()
                     session_messages = [
                         {"role": "user", "content": request.text},
                         {"role": "assistant", "content": assistant_content}
                     ]
 
-                # Use consider_update_stm which handles all the logic
-                updated = await self.memory_service.consider_update_stm(
+                # Queue the STM update for the background worker (falls back to inline update)
+                updated = await self.memory_service.schedule_stm_update(
                     request.session_id, session_messages
                 )
 
                 if updated:
-                    logger.info("STM updated after general chavruta", extra={
+                    logger.info("STM update scheduled after general chavruta", extra={
                         "session_id": request.session_id,
                         "message_count": len(session_messages),
                         "token_count": sum(len(str(msg.get("content", ""))) for msg in session_messages) // 4
@@ -1001,7 +1000,7 @@ You can see what texts are currently open in the study interface. You have acces
 
         except Exception as e:
             logger.error(f"Error in general chavruta agent: {e}", exc_info=True)
-            yield json.dumps({"type": "error", "data": {"message": str(e)}}) + '\n'
+            yield {"type": "error", "data": {"message": str(e)}}
 
     async def _get_focused_text(self, snapshot: StudySnapshot) -> Optional[str]:
         """Get the focused text from the current snapshot."""
@@ -1046,19 +1045,24 @@ You can see what texts are currently open in the study interface. You have acces
     async def _stream_llm_response(
         self, 
         messages: List[Dict[str, Any]], 
-        session_id: str
-    ) -> AsyncGenerator[str, None]:
+        session_id: str,
+        context: Optional[StudyTurnContext] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
         """Stream LLM response with tool support."""
         logger.info(f"Starting LLM response stream for session {session_id}")
         logger.info(f"Messages to LLM: {len(messages)} messages")
         
-        try:
-            client, model, reasoning_params, caps = get_llm_for_task("STUDY")
+        if context is not None and context.llm is not None:
+            client, model, reasoning_params, caps = context.llm
             logger.info(f"LLM configured: {model}")
-        except LLMConfigError as e:
-            logger.error(f"LLM not configured: {e}")
-            yield json.dumps({"type": "error", "data": {"message": f"LLM not configured: {e}"}}) + '\n'
-            return
+        else:
+            try:
+                client, model, reasoning_params, caps = get_llm_for_task("STUDY")
+                logger.info(f"LLM configured: {model}")
+            except LLMConfigError as e:
+                logger.error(f"LLM not configured: {e}")
+                yield {"type": "error", "data": {"message": f"LLM not configured: {e}"}}
+                return
 
         tools = self.tool_registry.get_tool_schemas()
         api_params = {**reasoning_params, "model": model, "messages": messages, "stream": True}
@@ -1081,7 +1085,7 @@ You can see what texts are currently open in the study interface. You have acces
                 if delta and delta.content:
                     full_reply_content += delta.content
                     #logger.info(f"LLM chunk {chunk_count}: {delta.content[:50]}...")
-                    yield json.dumps({"type": "llm_chunk", "data": delta.content}) + '\n'
+                    yield {"type": "llm_chunk", "data": delta.content}
                 if delta and delta.tool_calls:
                     for tc in delta.tool_calls:
                         builder = tool_call_builders[tc.index]
@@ -1097,7 +1101,7 @@ You can see what texts are currently open in the study interface. You have acces
                 # If we already sent chunks, don't send doc_v1 - let the accumulated text be the final result
                 if chunk_count > 0:
                     # We already streamed the content as chunks, no need to send doc_v1
-                    yield json.dumps({"type": "end", "data": "Stream finished"}) + '\n'
+                    yield {"type": "end", "data": "Stream finished"}
                     return
                 
                 # Check if the response is a JSON document (doc.v1 format)
@@ -1107,7 +1111,7 @@ You can see what texts are currently open in the study interface. You have acces
                         # Check for direct doc.v1 format with blocks
                         if ((parsed_content.get("type") == "doc.v1" and "blocks" in parsed_content) or
                             ("blocks" in parsed_content and isinstance(parsed_content["blocks"], list))):
-                            yield json.dumps({"type": "doc_v1", "data": parsed_content}) + '\n'
+                            yield {"type": "doc_v1", "data": parsed_content}
                         # Check for direct doc.v1 format with content (LLM streaming format)
                         elif (parsed_content.get("version") == "doc.v1" and 
                               "content" in parsed_content and isinstance(parsed_content["content"], list)):
@@ -1118,14 +1122,14 @@ You can see what texts are currently open in the study interface. You have acces
                             }
                             if "version" in parsed_content:
                                 doc_v1_data["version"] = parsed_content["version"]
-                            yield json.dumps({"type": "doc_v1", "data": doc_v1_data}) + '\n'
+                            yield {"type": "doc_v1", "data": doc_v1_data}
                         else:
-                            yield json.dumps({"type": "full_response", "data": full_reply_content}) + '\n'
+                            yield {"type": "full_response", "data": full_reply_content}
                     else:
-                        yield json.dumps({"type": "full_response", "data": full_reply_content}) + '\n'
+                        yield {"type": "full_response", "data": full_reply_content}
                 except (json.JSONDecodeError, TypeError):
                     # Not JSON, send as regular text response
-                    yield json.dumps({"type": "full_response", "data": full_reply_content}) + '\n'
+                    yield {"type": "full_response", "data": full_reply_content}
                 return
 
             full_tool_calls = list(tool_call_builders.values())
@@ -1156,7 +1160,7 @@ You can see what texts are currently open in the study interface. You have acces
                             f"Invalid tool arguments for {function_name}: {raw_args} ({exc})"
                         )
                         logger.error(error_message, exc_info=True)
-                        yield json.dumps({"type": "error", "data": {"message": error_message}}) + '\n'
+                        yield {"type": "error", "data": {"message": error_message}}
                         messages.append({
                             "tool_call_id": tool_call["id"],
                             "role": "tool",
@@ -1167,7 +1171,7 @@ You can see what texts are currently open in the study interface. You have acces
                 except Exception as exc:
                     error_message = f"Error parsing arguments for tool {function_name}: {exc}"
                     logger.error(error_message, exc_info=True)
-                    yield json.dumps({"type": "error", "data": {"message": error_message}}) + '\n'
+                    yield {"type": "error", "data": {"message": error_message}}
                     messages.append({
                         "tool_call_id": tool_call["id"],
                         "role": "tool",
@@ -1178,7 +1182,7 @@ You can see what texts are currently open in the study interface. You have acces
 
                 try:
                     result = await self.tool_registry.call(function_name, session_id=session_id, **function_args)
-                    yield json.dumps({"type": "tool_result", "data": result}) + '\n'
+                    yield {"type": "tool_result", "data": result}
                     messages.append({
                         "tool_call_id": tool_call["id"], 
                         "role": "tool", 
@@ -1188,7 +1192,7 @@ You can see what texts are currently open in the study interface. You have acces
                 except Exception as e:
                     error_message = f"Error calling tool {function_name}: {e}"
                     logger.error(error_message, exc_info=True)
-                    yield json.dumps({"type": "error", "data": {"message": error_message}}) + '\n'
+                    yield {"type": "error", "data": {"message": error_message}}
                     messages.append({
                         "tool_call_id": tool_call["id"], 
                         "role": "tool", 
@@ -1199,7 +1203,7 @@ You can see what texts are currently open in the study interface. You have acces
             api_params["messages"] = messages
 
         # End stream
-        yield json.dumps({"type": "end", "data": "Stream finished"}) + '\n'
+        yield {"type": "end", "data": "Stream finished"}
     
     async def _save_study_chat_messages(
         self, session_id: str, user_message: str,
@@ -1277,6 +1281,17 @@ You can see what texts are currently open in the study interface. You have acces
             logger.error(f"Failed to get chat history for session {session_id}: {e}", exc_info=True)
             return []
                 
+    async def _history_after_turn(
+        self, request: StudyChatRequest, context: Optional[StudyTurnContext], assistant_content: str
+    ) -> List[Dict[str, Any]]:
+        """Chat history including the turn just saved, from the prefetched history when there is one."""
+        if context is None or context.history is None:
+            return await self._get_study_chat_history(request.session_id)
+        return context.history + [
+            {"role": "user", "content": request.text},
+            {"role": "assistant", "content": assistant_content},
+        ]
+
     async def _get_selected_panel_text(self, panel_id: str, snapshot: StudySnapshot) -> Optional[Dict[str, Any]]:
         """
         Get text content for the selected panel.
@@ -0,0 +1,370 @@
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# True while code runs inside an ``interactive()`` stream, e.g. an inline STM update a chat stream awaits.
+_interactive_scope = contextvars.ContextVar("summary_interactive_scope", default=False)
+
+
+class SummaryQueueFull(RuntimeError):
+    """Raised when the scheduler cannot accept another session."""
+
+
+class _SummaryJob:
+    __slots__ = ("session_id", "provider", "runner", "futures", "enqueued_at", "submissions", "urgent")
+
+    def __init__(self, session_id: str, provider: str, runner: Callable[[], Awaitable[Any]]):
+        self.session_id = session_id
+        self.provider = provider
+        self.runner = runner
+        self.futures: List[asyncio.Future] = []
+        self.enqueued_at = time.monotonic()
+        self.submissions = 0
+        self.urgent = False  # awaited by an interactive stream; never held back for interactive traffic
+
+
+class SummaryScheduler:
+    """
+    Background scheduler for LLM summary calls.
+
+    ``SummaryService.summarize`` hands its LLM call to the scheduler instead of
+    issuing it directly, which gives three properties under load:
+
+    * Superseded work is dropped: a session has at most one pending summary.
+      A newer request replaces the pending runner (its messages are a superset)
+      and every waiter receives the result of the newest one.
+    * Interactive traffic goes first: while chat/study streams are active the
+      dispatcher holds background summaries back, up to ``max_defer_sec``.
+      A summary submitted from inside an interactive stream (the inline STM
+      update fallback) or with ``urgent=True`` is not deferred, since that
+      stream is waiting on it; it also ends a deferral already in progress.
+    * Provider quota is respected: pending jobs are released in batches, never
+      exceeding ``max_concurrency`` in-flight calls (or ``rate_per_min``) per
+      provider. Jobs stay pending, and therefore supersedable, until a slot frees.
+    """
+
+    DEFAULT_BATCH_SIZE = 8
+    DEFAULT_BATCH_WINDOW_MS = 50
+    DEFAULT_MAX_CONCURRENCY = 2
+    DEFAULT_INTERACTIVE_THRESHOLD = 1
+    DEFAULT_MAX_DEFER_SEC = 10.0
+    DEFAULT_MAX_PENDING = 1000
+    WAIT_SAMPLES = 512
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or {}
+
+        scheduler_config = self.config.get("stm", {}).get("summary", {}).get("scheduler", {})
+        self.enabled = scheduler_config.get("enabled", True)
+        self.batch_size = max(int(scheduler_config.get("batch_size", self.DEFAULT_BATCH_SIZE)), 1)
+        self.batch_window = max(float(scheduler_config.get("batch_window_ms", self.DEFAULT_BATCH_WINDOW_MS)), 0.0) / 1000
+        self.max_concurrency = max(int(scheduler_config.get("max_concurrency", self.DEFAULT_MAX_CONCURRENCY)), 1)
+        self.provider_limits = dict(scheduler_config.get("provider_limits", {}))
+        self.rate_per_min = float(scheduler_config.get("rate_per_min", 0) or 0)
+        self.interactive_threshold = max(int(scheduler_config.get("interactive_threshold", self.DEFAULT_INTERACTIVE_THRESHOLD)), 1)
+        self.max_defer_sec = float(scheduler_config.get("max_defer_sec", self.DEFAULT_MAX_DEFER_SEC))
+        self.max_pending = max(int(scheduler_config.get("max_pending", self.DEFAULT_MAX_PENDING)), 1)
+
+        self._pending: "OrderedDict[str, _SummaryJob]" = OrderedDict()
+        self._in_flight: Dict[str, int] = {}
+        self._next_slot: Dict[str, float] = {}
+        self._tasks: set = set()
+        self._interactive = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._interactive_idle: Optional[asyncio.Event] = None
+        self._urgent_arrived: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._waits_ms: Deque[float] = deque(maxlen=self.WAIT_SAMPLES)
+        self.stats = {
+            "submitted": 0,
+            "superseded": 0,
+            "dispatched": 0,
+            "completed": 0,
+            "failed": 0,
+            "deferred": 0,
+            "rejected": 0,
+        }
+
+    # --- Lifecycle ---
+
+    async def start(self) -> None:
+        """Start the dispatcher task."""
+        if self._dispatcher or not self.enabled:
+            return
+        self._wakeup = asyncio.Event()
+        self._interactive_idle = asyncio.Event()
+        self._urgent_arrived = asyncio.Event()
+        if self._interactive < self.interactive_threshold:
+            self._interactive_idle.set()
+        self._dispatcher = asyncio.create_task(self._dispatch_loop(), name="summary-scheduler")
+        logger.info("Summary scheduler started", extra={
+            "batch_size": self.batch_size,
+            "max_concurrency": self.max_concurrency,
+            "provider_limits": self.provider_limits
+        })
+
+    async def stop(self) -> None:
+        """Stop dispatching, cancel in-flight calls and fail pending waiters."""
+        dispatcher, self._dispatcher = self._dispatcher, None
+        if dispatcher is None:
+            return
+        dispatcher.cancel()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        for task in [dispatcher, *tasks]:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        while self._pending:
+            _, job = self._pending.popitem(last=False)
+            for future in job.futures:
+                if not future.done():
+                    future.cancel()
+        logger.info("Summary scheduler stopped", extra={"stats": dict(self.stats)})
+
+    @property
+    def running(self) -> bool:
+        return self._dispatcher is not None
+
+    # --- Interactive traffic ---
+
+    def begin_interactive(self) -> None:
+        self._interactive += 1
+        if self._interactive_idle and self._interactive >= self.interactive_threshold:
+            self._interactive_idle.clear()
+
+    def end_interactive(self) -> None:
+        self._interactive = max(self._interactive - 1, 0)
+        if self._interactive_idle and self._interactive < self.interactive_threshold:
+            self._interactive_idle.set()
+
+    async def interactive(self, source: AsyncIterator[Any]) -> AsyncIterator[Any]:
+        """
+        Re-yield an interactive response stream while it counts as active traffic.
+
+        Args:
+            source: Chat or study event stream
+
+        Yields:
+            Items of ``source`` unchanged
+        """
+        self.begin_interactive()
+        previous = _interactive_scope.get()
+        _interactive_scope.set(True)
+        try:
+            async for item in source:
+                yield item
+        finally:
+            _interactive_scope.set(previous)
+            self.end_interactive()
+
+    # --- Submission ---
+
+    async def submit(self, session_id: str, provider: str, runner: Callable[[], Awaitable[Any]], urgent: bool = False) -> Any:
+        """
+        Schedule a summary call for a session and wait for its result.
+
+        Args:
+            session_id: Session identifier (the coalescing key)
+            provider: LLM provider used for concurrency limits
+            runner: Coroutine factory performing the LLM call
+            urgent: An interactive stream awaits the result; implied inside ``interactive()``
+
+        Returns:
+            Result of the newest runner submitted for this session
+        """
+        if not self.running:
+            return await runner()
+
+        self.stats["submitted"] += 1
+        job = self._pending.get(session_id)
+        if job is not None:
+            # Newer messages supersede the pending request; keep its queue position.
+            job.runner = runner
+            job.provider = provider
+            self.stats["superseded"] += 1
+        else:
+            if len(self._pending) >= self.max_pending:
+                self.stats["rejected"] += 1
+                raise SummaryQueueFull(f"summary queue is full ({self.max_pending} sessions pending)")
+            job = _SummaryJob(session_id, provider, runner)
+            self._pending[session_id] = job
+
+        job.submissions += 1
+        job.urgent = job.urgent or urgent or _interactive_scope.get()
+        future = asyncio.get_running_loop().create_future()
+        job.futures.append(future)
+        if job.urgent:
+            self._urgent_arrived.set()
+        self._wakeup.set()
+        return await future
+
+    # --- Dispatching ---
+
+    def _limit_for(self, provider: str) -> int:
+        return max(int(self.provider_limits.get(provider, self.max_concurrency)), 1)
+
+    def _has_capacity(self, provider: str, now: float) -> bool:
+        if self._in_flight.get(provider, 0) >= self._limit_for(provider):
+            return False
+        return now >= self._next_slot.get(provider, 0.0)
+
+    def _take_batch(self) -> List[_SummaryJob]:
+        now = time.monotonic()
+        batch: List[_SummaryJob] = []
+        claimed: Dict[str, int] = {}
+        # Urgent jobs first, otherwise in queue order.
+        for session_id, job in sorted(self._pending.items(), key=lambda item: not item[1].urgent):
+            if len(batch) >= self.batch_size:
+                break
+            provider = job.provider
+            if claimed.get(provider, 0) + self._in_flight.get(provider, 0) >= self._limit_for(provider):
+                continue
+            if claimed.get(provider) and self.rate_per_min > 0:
+                continue
+            if now < self._next_slot.get(provider, 0.0):
+                continue
+            claimed[provider] = claimed.get(provider, 0) + 1
+            del self._pending[session_id]
+            batch.append(job)
+        return batch
+
+    def _next_wake_in(self) -> Optional[float]:
+        """Seconds until a rate-limited provider with pending work gets a slot."""
+        now = time.monotonic()
+        delays = [
+            self._next_slot.get(job.provider, 0.0) - now
+            for job in self._pending.values()
+            if self._in_flight.get(job.provider, 0) < self._limit_for(job.provider)
+        ]
+        delays = [d for d in delays if d > 0]
+        return min(delays) if delays else None
+
+    async def _dispatch_loop(self) -> None:
+        while True:
+            try:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                if not self._pending:
+                    continue
+
+                if self.batch_window:
+                    await asyncio.sleep(self.batch_window)
+                await self._yield_to_interactive()
+
+                for job in self._take_batch():
+                    self._launch(job)
+
+                if self._pending:
+                    delay = self._next_wake_in()
+                    if delay is not None:
+                        asyncio.get_running_loop().call_later(delay, self._wakeup.set)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Summary scheduler iteration failed", extra={"error": str(e)})
+                await asyncio.sleep(0.1)
+
+    async def _yield_to_interactive(self) -> None:
+        """Hold background jobs back until interactive traffic ends, max_defer_sec passes or an urgent job arrives."""
+        self._urgent_arrived.clear()  # re-checked below, so an earlier urgent submit is not lost
+        if self._interactive_idle.is_set() or not self._pending:
+            return
+        if any(job.urgent for job in self._pending.values()):
+            return
+        oldest = next(iter(self._pending.values())).enqueued_at
+        remaining = self.max_defer_sec - (time.monotonic() - oldest)
+        if remaining <= 0:
+            return
+        self.stats["deferred"] += 1
+        waiters = [
+            asyncio.ensure_future(self._interactive_idle.wait()),
+            asyncio.ensure_future(self._urgent_arrived.wait()),
+        ]
+        try:
+            await asyncio.wait(waiters, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+
+    def _launch(self, job: _SummaryJob) -> None:
+        provider = job.provider
+        self._in_flight[provider] = self._in_flight.get(provider, 0) + 1
+        if self.rate_per_min > 0:
+            self._next_slot[provider] = time.monotonic() + 60.0 / self.rate_per_min
+        wait_ms = (time.monotonic() - job.enqueued_at) * 1000
+        self._waits_ms.append(wait_ms)
+        self.stats["dispatched"] += 1
+
+        task = asyncio.create_task(self._run(job, wait_ms))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: _SummaryJob, wait_ms: float) -> None:
+        try:
+            result = await job.runner()
+        except asyncio.CancelledError:
+            for future in job.futures:
+                if not future.done():
+                    future.cancel()
+            raise
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error("Scheduled summary failed", extra={
+                "session_id": job.session_id,
+                "provider": job.provider,
+                "error": str(e)
+            })
+            for future in job.futures:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            self.stats["completed"] += 1
+            for future in job.futures:
+                if not future.done():
+                    future.set_result(result)
+            logger.debug("Scheduled summary completed", extra={
+                "session_id": job.session_id,
+                "provider": job.provider,
+                "submissions": job.submissions,
+                "queue_wait_ms": wait_ms
+            })
+        finally:
+            self._in_flight[job.provider] = max(self._in_flight.get(job.provider, 1) - 1, 0)
+            if self._wakeup:
+                self._wakeup.set()
+
+    # --- Metrics ---
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth, wait-time and throughput counters."""
+        waits = sorted(self._waits_ms)
+        now = time.monotonic()
+
+        def percentile(q: float) -> float:
+            if not waits:
+                return 0.0
+            return waits[min(int(q * len(waits)), len(waits) - 1)]
+
+        return {
+            "queue_depth": len(self._pending),
+            "oldest_pending_ms": (
+                (now - next(iter(self._pending.values())).enqueued_at) * 1000 if self._pending else 0.0
+            ),
+            "in_flight": {provider: count for provider, count in self._in_flight.items() if count},
+            "interactive_active": self._interactive,
+            "wait_ms": {
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": waits[-1] if waits else 0.0,
+                "samples": len(waits),
+            },
+            **self.stats,
+        }
@@ -17,10 +17,11 @@ class SummaryService:
     with configurable quality/cost trade-offs.
     """
     
-    def __init__(self, llm_service, config: Optional[Dict[str, Any]] = None, redis_client=None):
+    def __init__(self, llm_service, config: Optional[Dict[str, Any]] = None, redis_client=None, scheduler=None):
         self.llm_service = llm_service
         self.config = config or {}
         self.redis = redis_client
+        self.scheduler = scheduler
         
         # Load STM summary configuration
         stm_summary_config = self.config.get("stm", {}).get("summary", {})
@@ -49,6 +50,7 @@ class SummaryService:
         self.retries = llm_summary_config.get("retries", 2)
         self.backoff_ms = llm_summary_config.get("backoff_ms", 400)
         self.response_format_json = llm_summary_config.get("response_format_json", True)
+        self.provider = self._provider_for_model(self.model)
         
         # Load system prompt from prompts system
         try:
@@ -116,10 +118,19 @@ class SummaryService:
   {"version":"1.0","bullets":[...], "refs":[...]}
 НЕ добавляйте комментарии, пояснения, Markdown — только JSON."""
     
+    def _provider_for_model(self, model: str) -> str:
+        """Provider name used for scheduler limits ("openrouter/x-ai/..." -> "openrouter")."""
+        if isinstance(model, str) and "/" in model:
+            return model.split("/", 1)[0]
+        return self.config.get("llm", {}).get("provider", "default")
+    
     async def summarize(self, session_id: str, last_messages: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
         Summarize recent messages using LLM.
         
+        When a scheduler is attached the LLM call is queued behind interactive
+        traffic and coalesced with newer requests for the same session.
+        
         Args:
             session_id: Session identifier
             last_messages: Recent messages to summarize
@@ -130,6 +141,24 @@ class SummaryService:
         if not self.enabled:
             return self._generate_fallback_summary(last_messages)
         
+        if self.scheduler is None:
+            return await self._summarize_now(session_id, last_messages)
+        
+        try:
+            return await self.scheduler.submit(
+                session_id,
+                self.provider,
+                lambda: self._summarize_now(session_id, last_messages)
+            )
+        except Exception as e:
+            logger.error("Summary scheduling failed, using fallback", extra={
+                "session_id": session_id,
+                "error": str(e)
+            })
+            return self._generate_fallback_summary(last_messages)
+    
+    async def _summarize_now(self, session_id: str, last_messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Run the LLM summary call for a session immediately."""
         start_time = time.time()
         
         try:
@@ -0,0 +1,124 @@
+import asyncio
+import os
+
+import pytest
+from fastapi import HTTPException
+
+from audio_cache import AudioCache, file_etag, file_response, make_key, parse_range
+
+
+def _producer(chunks, calls, media_type="audio/wav", delay=0.0, fail_after=None):
+    async def produce():
+        calls.append(1)
+
+        async def body():
+            for i, chunk in enumerate(chunks):
+                if fail_after is not None and i == fail_after:
+                    raise RuntimeError("provider dropped the stream")
+                if delay:
+                    await asyncio.sleep(delay)
+                yield chunk
+
+        return media_type, body()
+
+    return produce
+
+
+async def _read(chunks):
+    return b"".join([chunk async for chunk in chunks])
+
+
+def test_make_key_normalizes_text_but_not_voice():
+    base = make_key("xtts", "anna", "ru", None, "Привет,  мир!")
+    assert make_key("xtts", "anna", "RU", None, " Привет, мир!\n") == base
+    assert make_key("xtts", "boris", "ru", None, "Привет, мир!") != base
+    assert make_key("elevenlabs", "anna", "ru", None, "Привет, мир!") != base
+
+
+@pytest.mark.asyncio
+async def test_miss_then_hit_serves_file(tmp_path):
+    cache = AudioCache(tmp_path)
+    calls = []
+    produce = _producer([b"RIFF", b"data"], calls)
+
+    media_type, chunks, hit = await cache.open("k1", produce)
+    assert (media_type, hit) == ("audio/wav", False)
+    assert await _read(chunks) == b"RIFFdata"
+
+    media_type, chunks, hit = await cache.open("k1", produce)
+    assert (media_type, hit) == ("audio/wav", True)
+    assert await _read(chunks) == b"RIFFdata"
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_synthesis(tmp_path):
+    cache = AudioCache(tmp_path)
+    calls = []
+    produce = _producer([b"a", b"b", b"c"], calls, delay=0.01)
+
+    async def request():
+        _, chunks, _ = await cache.open("k1", produce)
+        return await _read(chunks)
+
+    results = await asyncio.gather(*(request() for _ in range(5)))
+    assert results == [b"abc"] * 5
+    assert len(calls) == 1
+    assert cache.metrics()["coalesced"] == 4
+
+
+@pytest.mark.asyncio
+async def test_failed_synthesis_is_not_cached(tmp_path):
+    cache = AudioCache(tmp_path)
+    calls = []
+    _, chunks, _ = await cache.open("k1", _producer([b"a", b"b"], calls, fail_after=1))
+    with pytest.raises(RuntimeError):
+        await _read(chunks)
+    assert cache.get("k1") is None
+    assert not list(tmp_path.glob("*/*"))
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction_keeps_recently_used(tmp_path):
+    cache = AudioCache(tmp_path, max_bytes=10)
+    for key in ("a", "b"):
+        await cache.fetch(key, _producer([b"12345"], []))
+    cache.get("a")  # b is now least recently used
+    await cache.fetch("c", _producer([b"12345"], []))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.metrics()["bytes"] == 10
+
+
+@pytest.mark.asyncio
+async def test_index_is_rebuilt_from_disk(tmp_path):
+    cache = AudioCache(tmp_path)
+    path = await cache.fetch("k1", _producer([b"abc"], [], media_type="audio/mpeg"))
+    assert path.suffix == ".mp3"
+    reloaded = AudioCache(tmp_path)
+    assert reloaded.get("k1") == path
+    assert reloaded.metrics()["bytes"] == 3
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=50-500", 100) == (50, 99)
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    with pytest.raises(HTTPException) as exc:
+        parse_range("bytes=100-", 100)
+    assert exc.value.status_code == 416
+
+
+def test_file_response_conditional_get(tmp_path):
+    path = tmp_path / "a.wav"
+    path.write_bytes(b"0123456789")
+    etag = file_etag(path)
+
+    assert file_response(path, "audio/wav", {"if-none-match": etag}).status_code == 304
+    assert file_response(path, "audio/wav", {"range": "bytes=0-3", "if-range": etag}).status_code == 206
+    # A stale If-Range means the client's partial copy is outdated: full body instead of a range
+    stale = file_response(path, "audio/wav", {"range": "bytes=0-3", "if-range": '"0-0"'})
+    assert stale.status_code == 200 and stale.headers["content-length"] == "10"
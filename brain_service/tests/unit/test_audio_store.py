@@ -0,0 +1,133 @@
+import io
+import json
+import os
+import wave
+
+import pytest
+
+from audio_cache import AudioCache, file_etag
+from brain_service.services.audio_store import AudioStore, AudioTooLargeError
+
+
+class FakeRedis:
+    def __init__(self) -> None:
+        self.hashes = {}
+
+    async def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+        return 1
+
+    async def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    async def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    async def hdel(self, key, field):
+        return 1 if self.hashes.get(key, {}).pop(field, None) is not None else 0
+
+
+def _wav_bytes(seconds=0.5, rate=16000):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(b"\x00\x00" * int(seconds * rate))
+    return buf.getvalue()
+
+
+async def _chunks(data, size=1000):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AudioStore(tmp_path, redis_client=FakeRedis(), transcode=False)
+
+
+@pytest.mark.asyncio
+async def test_save_stream_writes_file_and_indexes_metadata(store):
+    meta = await store.save_stream("chat1", _chunks(_wav_bytes()), "wav")
+
+    path = store.root / "chat1" / meta["filename"]
+    assert path.read_bytes() == _wav_bytes()
+    assert (meta["format"], meta["media_type"], meta["duration"]) == ("wav", "audio/wav", 0.5)
+    indexed = json.loads(store.redis_client.hashes["audio:index:chat1"][meta["id"]])
+    assert indexed["size"] == path.stat().st_size
+
+
+@pytest.mark.asyncio
+async def test_list_reads_index_instead_of_directory(store):
+    meta = await store.save_stream("chat1", _chunks(b"abc"), "mp3")
+    (store.root / "chat1" / "stray.mp3").write_bytes(b"x")  # not indexed, so not listed
+
+    assert [entry["id"] for entry in await store.list("chat1")] == [meta["id"]]
+
+
+@pytest.mark.asyncio
+async def test_list_backfills_index_for_legacy_chat(store):
+    chat_dir = store.root / "old-chat"
+    chat_dir.mkdir()
+    (chat_dir / "legacy.wav").write_bytes(_wav_bytes(1.0))
+
+    files = await store.list("old-chat")
+    assert [(f["id"], f["duration"]) for f in files] == [("legacy", 1.0)]
+    assert "legacy" in store.redis_client.hashes["audio:index:old-chat"]
+
+
+@pytest.mark.asyncio
+async def test_upload_over_limit_is_rejected_without_leftovers(tmp_path):
+    store = AudioStore(tmp_path, redis_client=FakeRedis(), transcode=False, max_upload_bytes=1500)
+    with pytest.raises(AudioTooLargeError):
+        await store.save_stream("chat1", _chunks(b"a" * 3000), "wav")
+    assert not list((tmp_path / "chat1").iterdir())
+
+
+@pytest.mark.asyncio
+async def test_old_url_resolves_to_transcoded_file(store):
+    meta = await store.save_stream("chat1", _chunks(b"abc"), "wav")
+    # What the background transcode leaves behind: a new file under the same id
+    (store.root / "chat1" / meta["filename"]).unlink()
+    (store.root / "chat1" / f"{meta['id']}.ogg").write_bytes(b"ogg")
+    await store.redis_client.hset("audio:index:chat1", meta["id"], json.dumps({**meta, "filename": f"{meta['id']}.ogg"}))
+
+    path = await store.resolve("chat1", meta["filename"])
+    assert path.name == f"{meta['id']}.ogg"
+
+
+@pytest.mark.asyncio
+async def test_delete_removes_file_and_index_entry(store):
+    meta = await store.save_stream("chat1", _chunks(b"abc"), "wav")
+    assert await store.delete("chat1", meta["filename"])
+    assert await store.resolve("chat1", meta["filename"]) is None
+    assert await store.list("chat1") == []
+    assert not await store.delete("chat1", meta["filename"])
+
+
+@pytest.mark.asyncio
+async def test_path_traversal_is_rejected(store):
+    with pytest.raises(ValueError):
+        await store.resolve("..", "passwd")
+    with pytest.raises(ValueError):
+        await store.save_stream("chat/../x", _chunks(b"abc"), "wav")
+
+
+@pytest.mark.asyncio
+async def test_imported_file_keeps_its_etag_when_the_cache_is_hit(store, tmp_path):
+    cache = AudioCache(tmp_path / "cache")
+
+    async def produce():
+        return "audio/wav", _chunks(_wav_bytes())
+
+    cached = await cache.fetch("k" * 64, produce)
+    os.utime(cached, (0, 0))  # synthesized long ago
+    meta = await store.import_file("chat1", cached, "msg1")
+    path = store.root / "chat1" / meta["filename"]
+    etag = file_etag(path)
+
+    assert cache.get("k" * 64) == cached  # a hit moves the cached file's mtime to now
+
+    assert file_etag(path) == etag
+    assert path.read_bytes() == _wav_bytes()
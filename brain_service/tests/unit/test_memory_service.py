@@ -2,6 +2,7 @@ import pytest
 import json
 import time
 from unittest.mock import AsyncMock, Mock
+from brain_service.services import memory_service as memory_module
 from brain_service.services.memory_service import MemoryService
 
 
@@ -159,25 +160,59 @@ class TestMemoryService:
         assert result is False
 
 
+def _reference_simhash64(text):
+    """Bit-by-bit SimHash as originally implemented, for parity checks."""
+    import hashlib
+    text = text.lower()
+    bit_counts = [0] * 64
+    for i in range(len(text) - 1):
+        h = int(hashlib.blake2b(text[i:i+2].encode('utf-8'), digest_size=8).hexdigest(), 16)
+        for b in range(64):
+            bit_counts[b] += 1 if (h >> b) & 1 else -1
+    return sum(1 << b for b, c in enumerate(bit_counts) if c >= 0)
 
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+class TestSimHashDedup:
+    """Test cases for SimHash signatures and near-duplicate merging."""
+    
+    @pytest.fixture
+    def memory_service(self):
+        return MemoryService(redis_client=None)
+    
+    @pytest.fixture(params=["numpy", "pure_python"])
+    def backend(self, request, monkeypatch):
+        if request.param == "pure_python":
+            monkeypatch.setattr(memory_module, "np", None)
+        return request.param
+    
+    @pytest.mark.parametrize("text", ["", "a", "Rashi explains the verse", "שבת היא יום מנוחה"])
+    def test_simhash_matches_reference(self, memory_service, backend, text):
+        assert memory_service._simhash64(text) == _reference_simhash64(text)
+    
+    def test_merge_deduplicates_near_duplicates(self, memory_service, backend):
+        existing = [{"text": "Shabbat is the day of rest in the Torah", "score": 1.0, "ts": 1}]
+        new = [
+            {"text": "Shabbat is the day of rest in the Torah.", "score": 2.0, "ts": 2},
+            {"text": "Hillel and Shammai disagree about the lamps", "score": 1.0, "ts": 3},
+        ]
+        
+        merged = memory_service._merge_structured_items(existing, new, threshold=6)
+        
+        assert [item["text"] for item in merged] == [
+            "Shabbat is the day of rest in the Torah.",
+            "Hillel and Shammai disagree about the lamps",
+        ]
+    
+    def test_merge_keeps_first_match_after_update(self, memory_service, backend):
+        base = {"text": "x", "score": 1.0, "ts": 1, "sig": 0b0}
+        other = {"text": "y", "score": 1.0, "ts": 2, "sig": (1 << 64) - 1}
+        new = [
+            {"text": "x2", "score": 5.0, "ts": 3, "sig": 0b111},     # replaces base, moves its signature
+            {"text": "x3", "score": 0.5, "ts": 4, "sig": 0b111111},  # within 3 bits of the updated base only
+        ]
+        
+        merged = memory_service._merge_structured_items([base, other], new, threshold=3)
+        
+        assert len(merged) == 2
+        assert merged[0]["text"] == "x2"
 
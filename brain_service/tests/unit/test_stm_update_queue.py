@@ -0,0 +1,170 @@
+import asyncio
+import json
+
+import pytest
+from unittest.mock import AsyncMock, Mock
+
+from brain_service.services.memory_service import MemoryService
+from brain_service.services.stm_update_queue import STMUpdateQueue
+
+
+class TestSTMUpdateQueue:
+    """Test cases for STMUpdateQueue."""
+
+    @pytest.fixture
+    def mock_redis(self):
+        """Mock Redis client."""
+        redis_mock = AsyncMock()
+        redis_mock.eval = AsyncMock(return_value=1)
+        redis_mock.set = AsyncMock(return_value=True)
+        redis_mock.get = AsyncMock(return_value=None)
+        redis_mock.rpush = AsyncMock(return_value=1)
+        pipeline = Mock()
+        pipeline.execute = AsyncMock(return_value=[None, 0, 1])
+        redis_mock.pipeline = Mock(return_value=pipeline)
+        return redis_mock
+
+    @pytest.fixture
+    def memory_service(self):
+        service = Mock()
+        service.consider_update_stm = AsyncMock(return_value=True)
+        return service
+
+    @pytest.fixture
+    def queue(self, mock_redis, memory_service):
+        return STMUpdateQueue(redis_client=mock_redis, memory_service=memory_service)
+
+    @pytest.mark.asyncio
+    async def test_enqueue_new_and_coalesced(self, queue, mock_redis):
+        messages = [{"role": "user", "content": "Hello"}]
+
+        assert await queue.enqueue("s1", messages) is True
+        mock_redis.eval.return_value = 0
+        assert await queue.enqueue("s1", messages) is True
+
+        args = mock_redis.eval.call_args.args
+        assert args[2:5] == ("stm:queue:payload:s1", "stm:queue:pending", "stm:queue")
+        assert json.loads(args[5])["messages"] == messages
+        assert queue.stats["enqueued"] == 1
+        assert queue.stats["coalesced"] == 1
+
+    @pytest.mark.asyncio
+    async def test_enqueue_without_redis(self, memory_service):
+        queue = STMUpdateQueue(redis_client=None, memory_service=memory_service)
+        assert await queue.enqueue("s1", []) is False
+
+    @pytest.mark.asyncio
+    async def test_process_runs_latest_payload(self, queue, mock_redis, memory_service):
+        messages = [{"role": "assistant", "content": "Answer"}]
+        mock_redis.pipeline.return_value.execute.return_value = [
+            json.dumps({"messages": messages, "ts": 0}),
+            1,
+            1,
+        ]
+
+        assert await queue.process("s1") is True
+        memory_service.consider_update_stm.assert_awaited_once_with("s1", messages)
+        assert queue.stats["updated"] == 1
+
+    @pytest.mark.asyncio
+    async def test_process_requeues_when_session_locked(self, queue, mock_redis, memory_service, monkeypatch):
+        mock_redis.set.return_value = None
+        monkeypatch.setattr(STMUpdateQueue, "LOCKED_RETRY_DELAY_SEC", 0)
+
+        assert await queue.process("s1") is False
+        pipeline = mock_redis.pipeline.return_value
+        pipeline.lrem.assert_called_once_with("stm:queue:processing", 1, "s1")
+        pipeline.rpush.assert_called_once_with("stm:queue", "s1")
+        memory_service.consider_update_stm.assert_not_awaited()
+
+
+class TestSTMUpdateQueueDelivery:
+    """A session popped by a worker must never be left pending without being queued."""
+
+    @pytest.fixture
+    def redis_client(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        return fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    @pytest.fixture
+    def memory_service(self):
+        service = Mock()
+        service.consider_update_stm = AsyncMock(return_value=True)
+        return service
+
+    @pytest.fixture
+    def queue(self, redis_client, memory_service):
+        return STMUpdateQueue(redis_client=redis_client, memory_service=memory_service)
+
+    async def _take(self, queue, redis_client):
+        return await redis_client.blmove(queue.queue_key, queue._processing_key(), 1, "LEFT", "RIGHT")
+
+    @pytest.mark.asyncio
+    async def test_cancel_during_locked_retry_keeps_session_queued(self, queue, redis_client, monkeypatch):
+        monkeypatch.setattr(STMUpdateQueue, "LOCKED_RETRY_DELAY_SEC", 10)
+        await queue.enqueue("s1", [{"role": "user", "content": "Hi"}])
+        await redis_client.set(queue._lock_key("s1"), "other-worker")
+        assert await self._take(queue, redis_client) == "s1"
+
+        task = asyncio.create_task(queue.process("s1"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        assert await redis_client.lrange(queue.queue_key, 0, -1) == ["s1"]
+        assert await redis_client.llen(queue._processing_key()) == 0
+        assert await redis_client.sismember(queue._pending_key(), "s1")
+        assert await redis_client.get(queue._lock_key("s1")) == "other-worker"
+
+    @pytest.mark.asyncio
+    async def test_error_before_ack_requeues_session(self, queue, redis_client, monkeypatch):
+        await queue.enqueue("s1", [{"role": "user", "content": "Hi"}])
+        assert await self._take(queue, redis_client) == "s1"
+        monkeypatch.setattr(redis_client, "set", AsyncMock(side_effect=ConnectionError("redis hiccup")))
+
+        assert await queue.process("s1") is False
+
+        assert await redis_client.lrange(queue.queue_key, 0, -1) == ["s1"]
+        assert await redis_client.llen(queue._processing_key()) == 0
+
+    @pytest.mark.asyncio
+    async def test_update_failure_lets_session_be_queued_again(self, queue, redis_client, memory_service):
+        memory_service.consider_update_stm.side_effect = RuntimeError("LLM down")
+        await queue.enqueue("s1", [{"role": "user", "content": "Hi"}])
+        assert await self._take(queue, redis_client) == "s1"
+
+        assert await queue.process("s1") is False
+
+        assert not await redis_client.sismember(queue._pending_key(), "s1")
+        assert await redis_client.llen(queue._processing_key()) == 0
+        await queue.enqueue("s1", [{"role": "user", "content": "Again"}])
+        assert await redis_client.lrange(queue.queue_key, 0, -1) == ["s1"]
+        assert queue.stats["enqueued"] == 2
+
+    @pytest.mark.asyncio
+    async def test_recover_requeues_sessions_of_crashed_worker(self, queue, redis_client, memory_service):
+        await queue.enqueue("s1", [{"role": "user", "content": "Hi"}])
+        assert await self._take(queue, redis_client) == "s1"  # the worker holding it died here
+
+        await queue._recover()  # run by start() before the workers begin
+
+        assert await redis_client.lrange(queue.queue_key, 0, -1) == ["s1"]
+        assert await redis_client.llen(queue._processing_key()) == 0
+        assert await self._take(queue, redis_client) == "s1"
+        assert await queue.process("s1") is True
+        memory_service.consider_update_stm.assert_awaited_once()
+        assert not await redis_client.sismember(queue._pending_key(), "s1")
+
+
+@pytest.mark.asyncio
+async def test_schedule_stm_update_falls_back_to_inline_update():
+    service = MemoryService(redis_client=None)
+    service.consider_update_stm = AsyncMock(return_value=False)
+    service.update_queue = Mock()
+    service.update_queue.enqueue = AsyncMock(return_value=False)
+
+    await service.schedule_stm_update("s1", [{"role": "user", "content": "Hi"}])
+
+    service.update_queue.enqueue.assert_awaited_once()
+    service.consider_update_stm.assert_awaited_once()
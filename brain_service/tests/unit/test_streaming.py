@@ -0,0 +1,144 @@
+import asyncio
+import json
+
+import pytest
+
+from brain_service.utils.streaming import NDJSONStreamWriter, coalesce_ndjson, dumps_event
+
+
+def _line(event_type, data=None):
+    payload = {"type": event_type}
+    if data is not None:
+        payload["data"] = data
+    return json.dumps(payload) + '\n'
+
+
+async def _source(items, delay=0.0):
+    for item in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield item
+
+
+async def _collect(stream):
+    frames = []
+    async for frame in stream:
+        if isinstance(frame, bytes):
+            frame = frame.decode("utf-8")
+        frames.append(json.loads(frame))
+    return frames
+
+
+def test_dumps_event_is_ndjson_line():
+    frame = dumps_event({"type": "llm_chunk", "data": "שלום"})
+    assert frame.endswith(b"\n")
+    assert json.loads(frame) == {"type": "llm_chunk", "data": "שלום"}
+
+
+@pytest.mark.asyncio
+async def test_first_chunk_is_sent_alone_and_rest_merged():
+    items = [_line("llm_chunk", c) for c in ["He", "llo", ", ", "world"]] + [_line("end")]
+    frames = await _collect(coalesce_ndjson(_source(items), window_ms=1000, max_bytes=4096))
+
+    assert frames[0] == {"type": "llm_chunk", "data": "He"}
+    assert frames[1] == {"type": "llm_chunk", "data": "llo, world"}
+    assert frames[2] == {"type": "end"}
+
+
+@pytest.mark.asyncio
+async def test_non_chunk_event_flushes_buffer_in_order():
+    items = [
+        _line("llm_chunk", "a"),
+        _line("llm_chunk", "b"),
+        _line("llm_chunk", "c"),
+        _line("tool_result", {"ok": True}),
+        _line("llm_chunk", "d"),
+    ]
+    frames = await _collect(coalesce_ndjson(_source(items), window_ms=1000, max_bytes=4096))
+
+    assert [f["type"] for f in frames] == ["llm_chunk", "llm_chunk", "tool_result", "llm_chunk"]
+    assert frames[1]["data"] == "bc"
+    assert frames[2]["data"] == {"ok": True}
+    assert frames[3]["data"] == "d"
+
+
+@pytest.mark.asyncio
+async def test_byte_limit_forces_flush():
+    items = [_line("llm_chunk", "x" * 10) for _ in range(7)]
+    writer = NDJSONStreamWriter(window_ms=1000, max_bytes=25)
+    frames = await _collect(writer.stream(_source(items)))
+
+    assert [len(f["data"]) for f in frames] == [10, 30, 30]
+    assert writer.frames_in == 7
+    assert writer.frames_out == 3
+
+
+@pytest.mark.asyncio
+async def test_time_window_flushes_when_source_stalls():
+    async def slow_source():
+        yield _line("llm_chunk", "a")
+        yield _line("llm_chunk", "b")
+        await asyncio.sleep(0.1)
+        yield _line("llm_chunk", "c")
+
+    frames = await _collect(coalesce_ndjson(slow_source(), window_ms=5, max_bytes=4096))
+
+    assert [f["data"] for f in frames] == ["a", "b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_dict_events_and_disabled_window():
+    items = [{"type": "llm_chunk", "data": "a"}, {"type": "llm_chunk", "data": "b"}, {"type": "end"}]
+    frames = await _collect(coalesce_ndjson(_source(items), window_ms=0))
+
+    assert frames == items
+
+
+@pytest.mark.asyncio
+async def test_source_error_is_propagated_after_flush():
+    async def failing_source():
+        yield _line("llm_chunk", "a")
+        yield _line("llm_chunk", "b")
+        raise RuntimeError("boom")
+
+    frames = []
+    with pytest.raises(RuntimeError, match="boom"):
+        async for frame in coalesce_ndjson(failing_source(), window_ms=1000):
+            frames.append(json.loads(frame))
+
+    assert [f["data"] for f in frames] == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_dict_chunks_are_merged_without_parsing(monkeypatch):
+    def no_parse(line):
+        raise AssertionError("dict events must not be re-parsed")
+
+    monkeypatch.setattr("brain_service.utils.streaming._loads", no_parse)
+    items = [{"type": "llm_chunk", "data": c} for c in ["a", "b", "c"]] + [{"type": "end", "data": "Stream finished"}]
+    frames = await _collect(coalesce_ndjson(_source(items), window_ms=1000, max_bytes=4096))
+
+    assert frames == [
+        {"type": "llm_chunk", "data": "a"},
+        {"type": "llm_chunk", "data": "bc"},
+        {"type": "end", "data": "Stream finished"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_slow_client_stops_pulling_the_source():
+    pulled = 0
+
+    async def fast_source():
+        nonlocal pulled
+        for i in range(1000):
+            pulled += 1
+            yield {"type": "tool_result", "data": i}
+
+    stream = coalesce_ndjson(fast_source(), window_ms=1000, max_queued=8)
+    await stream.__anext__()
+    # The client is not reading; the pump may only fill the queue.
+    await asyncio.sleep(0.05)
+
+    assert pulled <= 8 + 2
+    await stream.aclose()
@@ -0,0 +1,199 @@
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, Mock
+
+from brain_service.services.summary_scheduler import SummaryQueueFull, SummaryScheduler
+from brain_service.services.summary_service import SummaryService
+
+
+def _config(**overrides):
+    scheduler = {"batch_window_ms": 0, "max_concurrency": 2, "max_defer_sec": 5}
+    scheduler.update(overrides)
+    return {"stm": {"summary": {"scheduler": scheduler}}}
+
+
+class TestSummaryScheduler:
+    """Test cases for SummaryScheduler."""
+
+    @pytest.mark.asyncio
+    async def test_runs_inline_when_not_started(self):
+        scheduler = SummaryScheduler(config=_config())
+        runner = AsyncMock(return_value="ok")
+
+        assert await scheduler.submit("s1", "openai", runner) == "ok"
+        assert scheduler.stats["submitted"] == 0
+
+    @pytest.mark.asyncio
+    async def test_pending_request_is_superseded(self):
+        scheduler = SummaryScheduler(config=_config())
+        await scheduler.start()
+        calls = []
+
+        def make_runner(tag):
+            async def runner():
+                calls.append(tag)
+                return tag
+            return runner
+
+        scheduler.begin_interactive()  # hold the dispatcher so both requests stay pending
+        first = asyncio.create_task(scheduler.submit("s1", "openai", make_runner("old")))
+        second = asyncio.create_task(scheduler.submit("s1", "openai", make_runner("new")))
+        await asyncio.sleep(0.01)
+        assert scheduler.metrics()["queue_depth"] == 1
+        scheduler.end_interactive()
+
+        assert await asyncio.gather(first, second) == ["new", "new"]
+        await scheduler.stop()
+        assert calls == ["new"]
+        assert scheduler.stats["superseded"] == 1
+        assert scheduler.stats["dispatched"] == 1
+
+    @pytest.mark.asyncio
+    async def test_per_provider_concurrency_limit(self):
+        scheduler = SummaryScheduler(config=_config(provider_limits={"openrouter": 1}))
+        await scheduler.start()
+        active = {"openrouter": 0, "openai": 0}
+        peak = {"openrouter": 0, "openai": 0}
+
+        def make_runner(provider):
+            async def runner():
+                active[provider] += 1
+                peak[provider] = max(peak[provider], active[provider])
+                await asyncio.sleep(0.01)
+                active[provider] -= 1
+                return provider
+            return runner
+
+        try:
+            jobs = [
+                scheduler.submit(f"s{i}", provider, make_runner(provider))
+                for i, provider in enumerate(["openrouter", "openai"] * 4)
+            ]
+            await asyncio.gather(*jobs)
+        finally:
+            await scheduler.stop()
+
+        assert peak == {"openrouter": 1, "openai": 2}
+        assert scheduler.stats["completed"] == 8
+
+    @pytest.mark.asyncio
+    async def test_interactive_stream_defers_summaries(self):
+        scheduler = SummaryScheduler(config=_config())
+        await scheduler.start()
+        runner = AsyncMock(return_value="done")
+        release = asyncio.Event()
+
+        async def chat_stream():
+            yield "chunk"
+            await release.wait()
+            yield "end"
+
+        consumer = asyncio.create_task(_drain(scheduler.interactive(chat_stream())))
+        await asyncio.sleep(0)
+        job = asyncio.create_task(scheduler.submit("s1", "openai", runner))
+        await asyncio.sleep(0.02)
+        runner.assert_not_awaited()
+        assert scheduler.metrics()["interactive_active"] == 1
+
+        release.set()
+        assert await consumer == ["chunk", "end"]
+        assert await job == "done"
+        await scheduler.stop()
+        assert scheduler.stats["deferred"] >= 1
+        assert scheduler.metrics()["wait_ms"]["samples"] == 1
+
+    @pytest.mark.asyncio
+    async def test_summary_awaited_by_interactive_stream_is_not_deferred(self):
+        scheduler = SummaryScheduler(config=_config())
+        await scheduler.start()
+        runner = AsyncMock(return_value="summary")
+        release = asyncio.Event()
+
+        async def other_chat():
+            yield "chunk"
+            await release.wait()
+
+        async def chat_with_inline_stm_update():
+            yield "chunk"
+            # Inline STM update fallback: the stream awaits its own summary before "end".
+            yield await scheduler.submit("s1", "openai", runner)
+            yield "end"
+
+        other = asyncio.create_task(_drain(scheduler.interactive(other_chat())))
+        await asyncio.sleep(0)
+        try:
+            items = await asyncio.wait_for(_drain(scheduler.interactive(chat_with_inline_stm_update())), timeout=1)
+        finally:
+            release.set()
+            await other
+            await scheduler.stop()
+
+        assert items == ["chunk", "summary", "end"]
+        assert scheduler.stats["deferred"] == 0
+
+    @pytest.mark.asyncio
+    async def test_urgent_submit_ends_a_deferral_in_progress(self):
+        scheduler = SummaryScheduler(config=_config(max_defer_sec=3, max_concurrency=1))
+        await scheduler.start()
+        background = AsyncMock(return_value="background")
+        inline = AsyncMock(return_value="inline")
+        scheduler.begin_interactive()
+        try:
+            deferred = asyncio.create_task(scheduler.submit("s1", "openai", background))
+            await asyncio.sleep(0.02)
+            assert scheduler.stats["deferred"] == 1  # the dispatcher is already holding s1 back
+
+            started = asyncio.get_running_loop().time()
+            assert await asyncio.wait_for(scheduler.submit("s2", "openai", inline, urgent=True), timeout=1) == "inline"
+            assert asyncio.get_running_loop().time() - started < 0.5
+            background.assert_not_awaited()  # still held back for the active stream
+
+            scheduler.end_interactive()
+            assert await asyncio.wait_for(deferred, timeout=1) == "background"
+        finally:
+            await scheduler.stop()
+
+    @pytest.mark.asyncio
+    async def test_runner_error_propagates_and_queue_limit(self):
+        scheduler = SummaryScheduler(config=_config(max_pending=1))
+        await scheduler.start()
+        try:
+            with pytest.raises(RuntimeError, match="boom"):
+                await scheduler.submit("s1", "openai", AsyncMock(side_effect=RuntimeError("boom")))
+
+            scheduler.begin_interactive()
+            pending = asyncio.create_task(scheduler.submit("s1", "openai", AsyncMock(return_value=1)))
+            await asyncio.sleep(0)
+            with pytest.raises(SummaryQueueFull):
+                await scheduler.submit("s2", "openai", AsyncMock(return_value=2))
+            scheduler.end_interactive()
+            assert await pending == 1
+        finally:
+            await scheduler.stop()
+
+        assert scheduler.stats["failed"] == 1
+        assert scheduler.stats["rejected"] == 1
+
+
+async def _drain(stream):
+    return [item async for item in stream]
+
+
+@pytest.mark.asyncio
+async def test_summary_service_routes_through_scheduler():
+    async def submit(session_id, provider, runner):
+        return await runner()
+
+    scheduler = Mock()
+    scheduler.submit = AsyncMock(side_effect=submit)
+    llm_service = Mock()
+    llm_service.summarize = AsyncMock(return_value={"bullets": ["Talked about Berakhot 2a"], "refs": []})
+    config = {"llm": {"tasks": {"summary": {"model": "openrouter/x-ai/grok-4-fast:free"}}}}
+    service = SummaryService(llm_service, config=config, scheduler=scheduler)
+
+    result = await service.summarize("s1", [{"role": "user", "content": "Hello"}])
+
+    assert scheduler.submit.call_args.args[:2] == ("s1", "openrouter")
+    assert result["bullets"][0] == "Talked about Berakhot 2a"
+    assert result["meta"]["method"] == "llm"
@@ -0,0 +1,214 @@
+"""
+NDJSON streaming helpers shared by the chat, study and translation endpoints.
+
+LLM providers emit one tiny delta per token; forwarding each of them as its own
+NDJSON frame makes JSON encoding, ASGI sends and client-side parsing dominate
+the cost of a reply for fast local models. ``NDJSONStreamWriter`` sits between
+a service generator and ``StreamingResponse`` and merges consecutive
+``llm_chunk`` events that arrive within a short time/byte window.
+"""
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW_MS = 15.0
+DEFAULT_MAX_BYTES = 512
+# Events read ahead of the client. When it is full the source is not pulled
+# again, so a slow client slows the LLM stream instead of growing the buffer.
+DEFAULT_MAX_QUEUED = 64
+
+_CHUNK_TYPE = "llm_chunk"
+_CHUNK_PREFIXES = ('{"type": "llm_chunk"', '{"type":"llm_chunk"')
+
+StreamItem = Union[str, bytes, Dict[str, Any]]
+
+
+def dumps_event(event: Dict[str, Any]) -> bytes:
+    """Encode a streaming event as a single NDJSON frame."""
+    if orjson is not None:
+        return orjson.dumps(event, default=str, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(event, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+
+def _loads(line: str) -> Any:
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+
+class _SourceFailure:
+    __slots__ = ("exc",)
+
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+_SOURCE_DONE = object()
+
+
+class NDJSONStreamWriter:
+    """
+    Coalesce ``llm_chunk`` events of an NDJSON event stream.
+
+    The first chunk of a reply is always written immediately so time-to-first-byte
+    is unaffected. Subsequent chunks are buffered until ``window_ms`` elapses or
+    ``max_bytes`` of text is pending, and any other event (tool results, errors,
+    ``end``...) flushes the buffer before being forwarded unchanged.
+
+    Services should yield event dictionaries, which are encoded once here. NDJSON
+    lines are still accepted, at the cost of parsing each ``llm_chunk`` line.
+    At most ``max_queued`` events are read ahead of the client.
+    """
+
+    def __init__(self, window_ms: float = DEFAULT_WINDOW_MS, max_bytes: int = DEFAULT_MAX_BYTES, max_queued: int = DEFAULT_MAX_QUEUED):
+        self.window_sec = max(float(window_ms), 0.0) / 1000.0
+        self.max_bytes = max(int(max_bytes), 1)
+        self.max_queued = max(int(max_queued), 1)
+        self.frames_in = 0
+        self.frames_out = 0
+
+    def _chunk_text(self, item: StreamItem) -> Optional[str]:
+        """Return the text of an ``llm_chunk`` event, or None for any other event."""
+        if isinstance(item, dict):
+            if item.get("type") == _CHUNK_TYPE and isinstance(item.get("data"), str):
+                return item["data"]
+            return None
+        if isinstance(item, bytes):
+            item = item.decode("utf-8")
+        if not item.startswith(_CHUNK_PREFIXES):
+            return None
+        try:
+            event = _loads(item)
+        except ValueError:
+            return None
+        if isinstance(event, dict) and set(event) == {"type", "data"} and isinstance(event["data"], str):
+            return event["data"]
+        return None
+
+    def _encode(self, item: StreamItem) -> Union[str, bytes]:
+        self.frames_out += 1
+        if isinstance(item, dict):
+            return dumps_event(item)
+        return item
+
+    def _encode_chunk(self, parts: List[str]) -> bytes:
+        self.frames_out += 1
+        return dumps_event({"type": _CHUNK_TYPE, "data": "".join(parts)})
+
+    async def stream(self, source: AsyncIterator[StreamItem]) -> AsyncIterator[Union[str, bytes]]:
+        """
+        Re-emit ``source`` with consecutive chunks merged.
+
+        Args:
+            source: Async iterator of NDJSON lines or event dictionaries
+
+        Yields:
+            NDJSON frames ready to be passed to ``StreamingResponse``
+        """
+        if self.window_sec <= 0:
+            async for item in source:
+                self.frames_in += 1
+                yield self._encode(item)
+            return
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queued)
+
+        async def pump() -> None:
+            try:
+                async for item in source:
+                    await queue.put(item)
+            except Exception as exc:
+                await queue.put(_SourceFailure(exc))
+                return
+            await queue.put(_SOURCE_DONE)
+
+        pump_task = asyncio.create_task(pump())
+        pending: List[str] = []
+        pending_bytes = 0
+        deadline = 0.0
+        first_chunk_sent = False
+
+        try:
+            while True:
+                if not pending:
+                    item = await queue.get()
+                else:
+                    try:
+                        item = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        timeout = deadline - loop.time()
+                        try:
+                            item = await asyncio.wait_for(queue.get(), timeout=max(timeout, 0.0))
+                        except asyncio.TimeoutError:
+                            yield self._encode_chunk(pending)
+                            pending, pending_bytes = [], 0
+                            continue
+
+                if item is _SOURCE_DONE:
+                    break
+                if isinstance(item, _SourceFailure):
+                    if pending:
+                        yield self._encode_chunk(pending)
+                        pending, pending_bytes = [], 0
+                    raise item.exc
+
+                self.frames_in += 1
+                text = self._chunk_text(item)
+                if text is None:
+                    if pending:
+                        yield self._encode_chunk(pending)
+                        pending, pending_bytes = [], 0
+                    yield self._encode(item)
+                    continue
+
+                if not first_chunk_sent:
+                    first_chunk_sent = True
+                    yield self._encode_chunk([text])
+                    continue
+
+                if not pending:
+                    deadline = loop.time() + self.window_sec
+                pending.append(text)
+                pending_bytes += len(text.encode("utf-8"))
+                if pending_bytes >= self.max_bytes:
+                    yield self._encode_chunk(pending)
+                    pending, pending_bytes = [], 0
+
+            if pending:
+                yield self._encode_chunk(pending)
+        finally:
+            if not pump_task.done():
+                pump_task.cancel()
+                try:
+                    await pump_task
+                except asyncio.CancelledError:
+                    pass
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                try:
+                    await aclose()
+                except Exception:
+                    logger.debug("Failed to close upstream stream", exc_info=True)
+            logger.debug(
+                "NDJSON stream finished",
+                extra={"frames_in": self.frames_in, "frames_out": self.frames_out},
+            )
+
+
+def coalesce_ndjson(
+    source: AsyncIterator[StreamItem],
+    window_ms: float = DEFAULT_WINDOW_MS,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+    max_queued: int = DEFAULT_MAX_QUEUED,
+) -> AsyncIterator[Union[str, bytes]]:
+    """Shortcut for ``NDJSONStreamWriter(window_ms, max_bytes, max_queued).stream(source)``."""
+    return NDJSONStreamWriter(window_ms=window_ms, max_bytes=max_bytes, max_queued=max_queued).stream(source)
@@ -30,7 +30,7 @@ def get_console_handler(level: str = logging.INFO) -> logging.Handler:
             show_level=True,
             show_path=False,
             show_time=True,
-            omit_repetition=True
+            omit_repeated_times=True
         )
     else:
         handler = logging.StreamHandler(sys.stdout)
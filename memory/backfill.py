@@ -1,6 +1,10 @@
 import asyncio
+import json
 import logging
 import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
 import pandas as pd
 import uuid
 from qdrant_client import QdrantClient, models as qdrant_models
@@ -22,61 +26,203 @@ KOYZAH_DIR = os.path.join(os.path.dirname(__file__), '..', 'koyzah')
 # Namespace for generating UUIDs
 UUID_NAMESPACE = uuid.UUID('f81d4fae-7dec-11d0-a765-00a0c91e6bf6')
 
+class BackfillProgress:
+    """Progress of the current (or last) backfill run, exposed by GET /graph/backfill."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.status = "idle"
+        self.step: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.files: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def running(self) -> bool:
+        return self.status == "running"
+
+    def file(self, name: str) -> Dict[str, Any]:
+        return self.files.setdefault(name, {"status": "pending", "rows_done": 0, "rows_total": None, "rows_per_sec": 0.0})
+
+    def snapshot(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        return {
+            "status": self.status,
+            "step": self.step,
+            "elapsed_seconds": round(end - self.started_at, 1) if self.started_at else 0.0,
+            "error": self.error,
+            "files": {name: dict(state) for name, state in self.files.items()},
+        }
+
+
+backfill_progress = BackfillProgress()
+
+
+def _checkpoint_path() -> str:
+    return settings.backfill_checkpoint_path or os.path.join(KOYZAH_DIR, '.backfill_checkpoint.json')
+
+
+def _load_checkpoints() -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(_checkpoint_path(), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable backfill checkpoint: {e}")
+        return {}
+
+
+def _save_checkpoints(checkpoints: Dict[str, Dict[str, Any]]):
+    path = _checkpoint_path()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoints, f)
+    os.replace(tmp_path, path)
+
+
+def reset_checkpoints():
+    try:
+        os.remove(_checkpoint_path())
+    except FileNotFoundError:
+        pass
+
+
+def _count_rows(file_path: str) -> int:
+    """Data rows in a CSV, counted by parsing so quoted newlines are handled."""
+    return sum(len(chunk) for chunk in pd.read_csv(file_path, chunksize=settings.backfill_batch_size, usecols=[0]))
+
+
+async def _import_csv(
+    file_name: str,
+    label: str,
+    query: str,
+    prepare: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+):
+    """
+    Stream a CSV into Neo4j as UNWIND batches of backfill_batch_size rows.
+
+    Up to backfill_concurrency batches run at once. The per-file checkpoint
+    records how many CSV rows are done, and it only advances over a
+    contiguous prefix of finished batches. A restarted backfill therefore
+    skips exactly what was committed. If a file's size or mtime changed, it
+    is imported from the start. Batches are idempotent MERGEs, so rows
+    replayed after a crash are harmless.
+    """
+    file_path = os.path.join(KOYZAH_DIR, file_name)
+    state = backfill_progress.file(file_name)
+    if not os.path.exists(file_path):
+        state["status"] = "missing"
+        return
+    backfill_progress.step = label
+    logger.info(f"Importing {label} from {file_name}...")
+
+    stat = os.stat(file_path)
+    signature = {"size": stat.st_size, "mtime": stat.st_mtime}
+    checkpoints = _load_checkpoints()
+    checkpoint = checkpoints.get(file_name) or {}
+    if {k: checkpoint.get(k) for k in signature} != signature:
+        checkpoint = {**signature, "rows_done": 0, "completed": False}
+    start_row = checkpoint["rows_done"]
+
+    state.update(status="running", rows_done=start_row, rows_total=await asyncio.to_thread(_count_rows, file_path))
+    if checkpoint.get("completed"):
+        state["status"] = "skipped"
+        logger.info(f"Skipping {file_name}: already imported ({start_row} rows).")
+        return
+
+    batch_size = max(settings.backfill_batch_size, 1)
+    semaphore = asyncio.Semaphore(max(settings.backfill_concurrency, 1))
+    finished: Dict[int, int] = {}  # batch start row -> batch end row
+    next_row = start_row
+    started = time.perf_counter()
+    imported = 0
+
+    def advance():
+        nonlocal next_row
+        while next_row in finished:
+            next_row = finished.pop(next_row)
+        checkpoint["rows_done"] = next_row
+        checkpoints[file_name] = checkpoint
+        _save_checkpoints(checkpoints)
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        state.update(rows_done=next_row, rows_per_sec=round((next_row - start_row) / elapsed, 1))
+
+    async def run_batch(first_row: int, last_row: int, rows: List[Dict[str, Any]]):
+        try:
+            if rows:
+                await graph_db_client.run_query(query, {'rows': rows})
+            finished[first_row] = last_row
+            advance()
+        finally:
+            semaphore.release()
+
+    reader = pd.read_csv(file_path, chunksize=batch_size, skiprows=range(1, start_row + 1))
+    tasks: List[asyncio.Task] = []
+    row = start_row
+    try:
+        while True:
+            chunk = await asyncio.to_thread(next, reader, None)
+            if chunk is None:
+                break
+            first_row, row = row, row + len(chunk)
+            if prepare is not None:
+                chunk = prepare(chunk)
+            imported += len(chunk)
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(run_batch(first_row, row, chunk.to_dict('records'))))
+            # Surface a failed batch before queueing more work behind it.
+            failed = [t for t in tasks if t.done() and t.exception() is not None]
+            if failed:
+                raise failed[0].exception()
+            tasks = [t for t in tasks if not t.done()]
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        state["status"] = "failed"
+        raise
+    finally:
+        reader.close()
+
+    checkpoint["completed"] = True
+    advance()
+    state["status"] = "completed"
+    logger.info(f"Imported {imported} {label} in {time.perf_counter() - started:.1f}s ({state['rows_per_sec']} rows/sec).")
+
 async def import_sessions():
-    logger.info("Importing sessions...")
-    file_path = os.path.join(KOYZAH_DIR, 'session_summaries.csv')
-    if not os.path.exists(file_path): return
-    df = pd.read_csv(file_path)
     query = """UNWIND $rows AS row MERGE (s:Session {session_id: row.session_id}) SET s.start_ts = row.start_ts, s.end_ts = row.end_ts"""
-    await graph_db_client.run_query(query, {'rows': df.to_dict('records')})
-    logger.info(f"Imported {len(df)} sessions.")
+    await _import_csv('session_summaries.csv', "sessions", query)
 
 async def import_utterances():
-    logger.info("Importing utterances...")
-    file_path = os.path.join(KOYZAH_DIR, 'utterances.csv')
-    if not os.path.exists(file_path): return
-    df = pd.read_csv(file_path)
     query = """UNWIND $rows AS row MERGE (u:Utterance {utt_id: row.utt_id}) SET u.session_id = row.session_id, u.ts = datetime(row.ts), u.speaker = row.speaker, u.text = row.text, u.intent = row.intent WITH u, row MATCH (s:Session {session_id: row.session_id}) MERGE (u)-[:IN]->(s)"""
-    await graph_db_client.run_query(query, {'rows': df.to_dict('records')})
-    logger.info(f"Imported {len(df)} utterances.")
+    await _import_csv('utterances.csv', "utterances", query)
 
 async def import_follows():
-    logger.info("Importing FOLLOWS relationships...")
-    file_path = os.path.join(KOYZAH_DIR, 'edges_follows.csv')
-    if not os.path.exists(file_path): return
-    df = pd.read_csv(file_path)
     query = """UNWIND $rows AS row MATCH (u1:Utterance {utt_id: row.source}), (u2:Utterance {utt_id: row.target}) MERGE (u1)-[r:FOLLOWS]->(u2) SET r.ts_edge = datetime(row.ts_edge)"""
-    await graph_db_client.run_query(query, {'rows': df.to_dict('records')})
-    logger.info(f"Imported {len(df)} FOLLOWS relationships.")
+    await _import_csv('edges_follows.csv', "FOLLOWS relationships", query)
 
 async def import_topics():
-    logger.info("Importing topics...")
-    file_path = os.path.join(KOYZAH_DIR, 'topics_final.csv')
-    if not os.path.exists(file_path): return
-    df = pd.read_csv(file_path)
-    df.dropna(subset=['topic_id_norm'], inplace=True)
     query = """UNWIND $rows AS row MERGE (t:Topic {topic_id: row.topic_id_norm}) SET t.label = row.label, t.df = row.df"""
-    await graph_db_client.run_query(query, {'rows': df.to_dict('records')})
-    logger.info(f"Imported {len(df)} topics.")
+    await _import_csv('topics_final.csv', "topics", query, prepare=lambda df: df.dropna(subset=['topic_id_norm']))
 
 async def import_mentions():
-    logger.info("Importing MENTIONS relationships...")
-    file_path = os.path.join(KOYZAH_DIR, 'edges_mentions.csv')
-    if not os.path.exists(file_path): return
-    df = pd.read_csv(file_path)
     query = """UNWIND $rows AS row MATCH (u:Utterance {utt_id: row.source}), (t:Topic {topic_id: row.target}) MERGE (u)-[r:MENTIONS]->(t) SET r.ts_edge = datetime(row.ts_edge), r.w0 = 0.7"""
-    await graph_db_client.run_query(query, {'rows': df.to_dict('records')})
-    logger.info(f"Imported {len(df)} MENTIONS relationships.")
+    await _import_csv('edges_mentions.csv', "MENTIONS relationships", query)
+
+async def build_topic_scores():
+    """Builds the per-session TOPIC_SCORE edges that get_context reads from the imported MENTIONS."""
+    started = time.perf_counter()
+    sessions = await graph_db_client.build_topic_scores()
+    logger.info(f"Built topic scores for {sessions} sessions in {time.perf_counter() - started:.1f}s.")
 
 async def import_intents():
-    logger.info("Importing intents and transitions...")
-    file_path = os.path.join(KOYZAH_DIR, 'intents_transitions.csv')
-    if not os.path.exists(file_path): return
-    df = pd.read_csv(file_path)
-    df.dropna(subset=['prev_intent', 'curr_intent'], inplace=True)
     query = """UNWIND $rows AS row MERGE (i1:Intent {name: row.prev_intent}) MERGE (i2:Intent {name: row.curr_intent}) MERGE (i1)-[r:NEXT]->(i2) SET r.count = row.count, r.p = row.p"""
-    await graph_db_client.run_query(query, {'rows': df.to_dict('records')})
-    logger.info(f"Imported {len(df)} intent transitions.")
+    await _import_csv('intents_transitions.csv', "intent transitions", query, prepare=lambda df: df.dropna(subset=['prev_intent', 'curr_intent']))
 
 async def import_concepts_to_qdrant():
     """Reads topics and concepts, vectorizes them, and uploads to Qdrant."""
@@ -170,10 +316,18 @@ async def create_topic_aliases():
     except Exception as e:
         logger.error(f"An error occurred during topic alias creation: {e}", exc_info=True)
 
-async def run_backfill():
-    """Main function to run the entire backfill process."""
+async def run_backfill(reset: bool = False):
+    """Main function to run the entire backfill process; resumes from checkpoints unless reset."""
+    if backfill_progress.running:
+        logger.warning("Backfill is already running; ignoring start request.")
+        return
+    backfill_progress.reset()
+    backfill_progress.status = "running"
+    backfill_progress.started_at = time.time()
     logger.info("Starting full backfill process...")
     try:
+        if reset:
+            reset_checkpoints()
         await graph_db_client.create_constraints_and_indices()
         await import_sessions()
         await import_utterances()
@@ -181,13 +335,20 @@ async def run_backfill():
         await import_intents()
         await import_follows()
         await import_mentions()
+        backfill_progress.step = "topic scores"
+        await build_topic_scores()
+        backfill_progress.step = "qdrant concepts"
         await import_concepts_to_qdrant()
+        backfill_progress.step = "topic aliases"
         await create_topic_aliases()
+        backfill_progress.status = "completed"
         logger.info("Full backfill process completed successfully.")
     except Exception as e:
+        backfill_progress.status = "failed"
+        backfill_progress.error = str(e)[:500]
         logger.error(f"An error occurred during the backfill process: {e}", exc_info=True)
     finally:
-        pass
+        backfill_progress.finished_at = time.time()
 
 if __name__ == '__main__':
     asyncio.run(run_backfill())
@@ -29,6 +29,11 @@ class Settings(BaseSettings):
 
     redis_url: str = "redis://localhost:6379/0"
     qdrant_url: str = "http://localhost:6333"
+    qdrant_prefer_grpc: bool = True
+    qdrant_grpc_port: int = 6334
+    qdrant_max_in_flight: int = 32
+    qdrant_timeout_seconds: Optional[int] = None
+    qdrant_location: Optional[str] = None  # ":memory:" for an embedded local Qdrant (tests)
     openai_api_key: Optional[str] = None
     openrouter_api_key: Optional[str] = None
     openrouter_api_base: str = "https://openrouter.ai/api/v1"
@@ -41,7 +46,9 @@ class Settings(BaseSettings):
     embedding_model_provider: str = "openai"
     embedding_model_name: str = "text-embedding-3-small"
     embedding_dim: int = 0  # Placeholder, will be set by validator
+    embedding_cache_enabled: bool = True
     embedding_cache_ttl_seconds: int = 604800
+    embedding_cache_max_items: int = 4096
     ollama_api_url: str = "http://localhost:11434"
 
     recall_cache_enabled: bool = True
@@ -53,6 +60,12 @@ class Settings(BaseSettings):
     ingest_queue_name: str = "astra_ltm_ingest_queue"
     ingest_batch_size: int = 100
     ingest_batch_timeout_ms: int = 500
+    ingest_worker_concurrency: int = 2
+    ingest_worker_slots: int = 16
+    ingest_lease_ttl_seconds: int = 60
+    ingest_max_attempts: int = 5
+    ingest_retry_backoff_seconds: float = 1.0  # first pause after a batch that ingested nothing
+    ingest_retry_backoff_max_seconds: float = 30.0
 
     memory_mask_pii: bool = True
 
@@ -65,7 +78,17 @@ class Settings(BaseSettings):
     context_horizon_utterances: int = 20
     context_horizon_minutes: int = 60
     context_decay_tau_sec: int = 1800
+    context_top_topics: int = 3
+    context_topic_scores_redis_enabled: bool = False # Mirror per-session topic scores in Redis for the context read path
+    context_topic_scores_ttl_seconds: int = 86400
     pointer_max_chars: int = 1000
+    context_graph_deadline_ms: int = 300 # Deadline for the dialog-graph topic/recents lookup
+    context_branch_deadline_ms: int = 600 # Deadline for each retrieval branch, from request start
+
+    # Graph backfill settings
+    backfill_batch_size: int = 5000 # Rows per UNWIND transaction
+    backfill_concurrency: int = 4 # UNWIND batches in flight per file
+    backfill_checkpoint_path: Optional[str] = None # Defaults to koyzah/.backfill_checkpoint.json
 
     # Proactive Cooldown settings
     proactive_cooldown_turns: int = 1 # Suggest every other turn
@@ -0,0 +1,214 @@
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+import redis.asyncio as redis
+
+from .config import settings
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Content-addressed cache for text embeddings.
+
+    Entries are keyed by (provider, model, sha256(text)) and kept in two tiers:
+    an in-process LRU of float32 vectors for hot recall queries, and Redis holding
+    float16 vectors (half the size, cosine error far below retrieval noise) shared
+    by the API and ingest worker. Concurrent misses for the same text share one
+    provider call, run as a task owned by the cache: a caller that is cancelled
+    (e.g. its request timed out) stops waiting without cancelling the others.
+
+    The provider/model pair is part of every key, so switching
+    ``embedding_model_name`` never serves stale vectors; ``use_model`` also drops
+    the in-process tier when the pair changes.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        model: str,
+        redis_url: Optional[str] = None,
+        max_items: int = 4096,
+        ttl_sec: int = 604800,
+        enabled: bool = True,
+    ):
+        self.provider = provider
+        self.model = model
+        self.max_items = max(int(max_items), 0)
+        self.ttl_sec = ttl_sec
+        self.enabled = enabled
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.redis = redis.from_url(redis_url) if (enabled and redis_url) else None
+
+    def use_model(self, provider: str, model: str) -> None:
+        """Switch the namespace to a new provider/model, invalidating the hot tier."""
+        if provider == self.provider and model == self.model:
+            return
+        logger.info(f"[EmbeddingCache] Embedding model changed {self.provider}/{self.model} -> {provider}/{model}; cache invalidated")
+        self.provider = provider
+        self.model = model
+        self._lru.clear()
+
+    def key_for(self, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"emb:{self.provider}:{self.model}:{digest}"
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        if not self.max_items:
+            return
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_items:
+            self._lru.popitem(last=False)
+
+    async def _redis_get(self, key: str) -> Optional[np.ndarray]:
+        if self.redis is None:
+            return None
+        try:
+            raw = await self.redis.get(key)
+        except Exception as e:
+            logger.warning(f"[EmbeddingCache] Redis GET failed: {e}")
+            return None
+        if not raw:
+            return None
+        return np.frombuffer(raw, dtype=np.float16).astype(np.float32)
+
+    async def _redis_set(self, key: str, vector: np.ndarray) -> None:
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(key, vector.astype(np.float16).tobytes(), ex=self.ttl_sec)
+        except Exception as e:
+            logger.warning(f"[EmbeddingCache] Redis SET failed: {e}")
+
+    async def get_or_compute(self, text: str, compute: Callable[[str], Awaitable[List[float]]]) -> List[float]:
+        """
+        Return the cached embedding for ``text`` or compute and store it.
+
+        Args:
+            text: Text to embed
+            compute: Coroutine function calling the embedding provider
+
+        Returns:
+            Embedding vector as a list of floats
+        """
+        if not self.enabled:
+            return await compute(text)
+
+        key = self.key_for(text)
+        vector = self._lru.get(key)
+        if vector is not None:
+            self._lru.move_to_end(key)
+            metrics.record_embedding_cache("memory")
+            return vector.tolist()
+
+        task = self._inflight.get(key)
+        if task is not None:
+            metrics.record_embedding_cache("coalesced")
+        else:
+            task = asyncio.create_task(self._load(key, text, compute))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+        return (await asyncio.shield(task)).tolist()
+
+    async def _load(self, key: str, text: str, compute: Callable[[str], Awaitable[List[float]]]) -> np.ndarray:
+        vector = await self._redis_get(key)
+        if vector is not None:
+            metrics.record_embedding_cache("redis")
+        else:
+            metrics.record_embedding_cache("miss")
+            embedding = await compute(text)
+            vector = np.asarray(embedding, dtype=np.float32)
+            await self._redis_set(key, vector)
+        self._remember(key, vector)
+        return vector
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception retrieved in case every caller went away.
+        if not task.cancelled():
+            task.exception()
+
+    async def get_or_compute_many(
+        self,
+        texts: List[str],
+        compute_many: Callable[[List[str]], Awaitable[List[List[float]]]],
+    ) -> List[List[float]]:
+        """
+        Batched variant of ``get_or_compute``: misses are embedded in one provider call.
+
+        Args:
+            texts: Texts to embed
+            compute_many: Coroutine function embedding a list of texts, in order
+
+        Returns:
+            Embedding vectors in the order of ``texts``
+        """
+        if not texts:
+            return []
+        if not self.enabled:
+            return await compute_many(texts)
+
+        keys = [self.key_for(text) for text in texts]
+        vectors: Dict[str, np.ndarray] = {}
+        for key in keys:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                vectors[key] = vector
+                metrics.record_embedding_cache("memory")
+
+        remote = list(dict.fromkeys(key for key in keys if key not in vectors))
+        if remote and self.redis is not None:
+            try:
+                raw_values = await self.redis.mget(remote)
+            except Exception as e:
+                logger.warning(f"[EmbeddingCache] Redis MGET failed: {e}")
+                raw_values = [None] * len(remote)
+            for key, raw in zip(remote, raw_values):
+                if raw:
+                    vector = np.frombuffer(raw, dtype=np.float16).astype(np.float32)
+                    vectors[key] = vector
+                    self._remember(key, vector)
+                    metrics.record_embedding_cache("redis")
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+        if missing:
+            for _ in missing:
+                metrics.record_embedding_cache("miss")
+            embeddings = await compute_many(list(missing.values()))
+            for key, embedding in zip(missing, embeddings):
+                vector = np.asarray(embedding, dtype=np.float32)
+                vectors[key] = vector
+                self._remember(key, vector)
+            if self.redis is not None:
+                try:
+                    pipe = self.redis.pipeline(transaction=False)
+                    for key in missing:
+                        pipe.set(key, vectors[key].astype(np.float16).tobytes(), ex=self.ttl_sec)
+                    await pipe.execute()
+                except Exception as e:
+                    logger.warning(f"[EmbeddingCache] Redis pipeline SET failed: {e}")
+
+        return [vectors[key].tolist() for key in keys]
+
+
+embedding_cache = EmbeddingCache(
+    provider=settings.embedding_model_provider,
+    model=settings.embedding_model_name,
+    redis_url=settings.redis_url,
+    max_items=settings.embedding_cache_max_items,
+    ttl_sec=settings.embedding_cache_ttl_seconds,
+    enabled=settings.embedding_cache_enabled,
+)
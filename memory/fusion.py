@@ -1,16 +1,29 @@
 import math
+import re
 import time
 from collections import defaultdict
-from typing import List, Dict, Any, Set
+from functools import lru_cache
+from typing import List, Dict, Any, FrozenSet, Set
+
+import numpy as np
 
 from .config import settings
 
+FLUFF_WORDS = ("привет", "пока", "устал", "ушёл", "ок", "ладно")
+META_FACT_TYPES = {"greeting", "mood", "meta"}
+_FLUFF_RE = re.compile("|".join(re.escape(word) for word in FLUFF_WORDS))
+
 # --- HELPER FUNCTIONS ---
 
 def _get_tokens(text: str) -> Set[str]:
     """A simple tokenizer to split text into a set of lowercased words."""
     return set(text.lower().split())
 
+@lru_cache(maxsize=16384)
+def _cached_tokens(lowered_text: str) -> FrozenSet[str]:
+    """Token set of an already lowercased fact text; the same facts recur across recalls."""
+    return frozenset(lowered_text.split())
+
 def _calculate_jaccard(set1: Set[str], set2: Set[str]) -> float:
     """Calculates the Jaccard similarity between two sets of tokens."""
     if not set1 and not set2:
@@ -30,17 +43,40 @@ def _calculate_noise_penalty(fact: Dict[str, Any]) -> float:
         penalty += 0.15
         
     # Penalty for conversational fluff
-    fluff_words = {"привет", "пока", "устал", "ушёл", "ок", "ладно"}
-    if any(word in text for word in fluff_words):
+    if any(word in text for word in FLUFF_WORDS):
         penalty += 0.2
         
     # Penalty for meta-facts
-    meta_fact_types = {"greeting", "mood", "meta"}
-    if fact_type in meta_fact_types:
+    if fact_type in META_FACT_TYPES:
         penalty += 0.3
         
     return penalty
 
+# --- MINHASH ---
+
+MINHASH_PERMUTATIONS = 64
+MINHASH_MARGIN = 0.15 # Pairs estimated within this margin of the threshold are verified exactly
+_MINHASH_PRIME = (1 << 31) - 1
+_minhash_rng = np.random.default_rng(0x5EED)
+_MINHASH_A = _minhash_rng.integers(1, _MINHASH_PRIME, size=(MINHASH_PERMUTATIONS, 1), dtype=np.int64)
+_MINHASH_B = _minhash_rng.integers(0, _MINHASH_PRIME, size=(MINHASH_PERMUTATIONS, 1), dtype=np.int64)
+
+def _token_hashes(tokens: FrozenSet[str]) -> np.ndarray:
+    """31-bit token hashes (process-local; signatures are never persisted)."""
+    return np.fromiter((hash(token) & _MINHASH_PRIME for token in tokens), dtype=np.int64, count=len(tokens))
+
+def _minhash_signatures(token_hashes: List[np.ndarray]) -> np.ndarray:
+    """MinHash signatures (one row per token-id set) under universal hashes (a*x + b) mod p."""
+    signatures = np.full((len(token_hashes), MINHASH_PERMUTATIONS), _MINHASH_PRIME, dtype=np.int64)
+    non_empty = [i for i, ids in enumerate(token_hashes) if len(ids)]
+    if not non_empty:
+        return signatures
+    lengths = np.fromiter((len(token_hashes[i]) for i in non_empty), dtype=np.int64, count=len(non_empty))
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    hashed = (_MINHASH_A * np.concatenate([token_hashes[i] for i in non_empty])[None, :] + _MINHASH_B) % _MINHASH_PRIME
+    signatures[non_empty] = np.minimum.reduceat(hashed, starts, axis=1).T
+    return signatures
+
 # --- MAIN FUSION LOGIC ---
 
 def fuse_and_rerank(
@@ -52,6 +88,11 @@ def fuse_and_rerank(
 ) -> List[Dict[str, Any]]:
     """
     Performs hybrid fusion and re-ranking of candidate facts.
+
+    Each fact is tokenized once; the semantic, keyword, topic, context and noise
+    components are built as NumPy vectors and combined with the fusion weights
+    in one pass. Near-duplicates are removed with MinHash signatures, confirming
+    borderline pairs with exact Jaccard.
     """
     
     # 1. Deduplicate and gather all unique facts
@@ -63,65 +104,89 @@ def fuse_and_rerank(
                 fact['source'] = source
                 all_facts[fact_id] = fact
 
+    facts = list(all_facts.values())
+    n = len(facts)
+    if n == 0:
+        return []
+
+    # 2. Tokenize each fact once
+    texts = [(fact.get("text") or "").lower() for fact in facts]
+    fact_tokens = [_cached_tokens(text) for text in texts]
     query_tokens = _get_tokens(query)
-    final_results = []
 
-    # 2. Calculate hybrid score for each unique fact
-    for fact_id, fact in all_facts.items():
-        # Base scores from different search branches
-        sem_score = fact.get("confidence", 0.0) if fact['source'] == 'qdrant_semantic' else 0.0
-        kw_score = _calculate_jaccard(query_tokens, _get_tokens(fact.get("text", "")))
-        
-        # Topic & Entity Score (simple binary for now)
-        topic_score = 0.0
-        fact_topics = fact.get("topic_slugs", [])
-        if any(t in recent_topics for t in fact_topics):
-            topic_score = 1.0
-
-        # Context Bonus
-        ctx_bonus = 0.0
-        if fact.get("speaker") == user_speaker_name:
-            ctx_bonus += 0.05
-        if any(t in recent_topics for t in fact_topics):
-            ctx_bonus += 0.15
-        if any(e in recent_entities for e in fact.get("entity_slugs", [])):
-            ctx_bonus += 0.15
-
-        # Noise Penalty
-        noise_penalty = _calculate_noise_penalty(fact)
-
-        # Hybrid Formula
-        final_score = (
-            settings.fusion_weight_dense * sem_score +
-            settings.fusion_weight_keyword * kw_score +
-            settings.fusion_weight_neo4j_topic * topic_score + # Re-using neo4j topic weight for general topic score
-            0.10 * ctx_bonus - # Weight for context bonus as per user plan
-            noise_penalty
-        )
-        
-        fact['final_score'] = final_score
-        final_results.append(fact)
+    # 3. Component vectors
+    sizes = np.fromiter(map(len, fact_tokens), dtype=np.float64, count=n)
+    intersections = np.fromiter(map(len, map(query_tokens.intersection, fact_tokens)), dtype=np.float64, count=n)
+    unions = len(query_tokens) + sizes - intersections
+    kw_score = np.divide(intersections, unions, out=np.zeros(n), where=unions > 0)
 
-    # 3. Filter out low-scoring and deduplicate results
-    final_results.sort(key=lambda x: x['final_score'], reverse=True)
-    
-    # Simple deduplication based on Jaccard similarity
-    deduped_results = []
-    seen_fact_tokens: List[Set[str]] = []
-    for fact in final_results:
-        if fact['final_score'] < 0.42: # Threshold from user plan
-            continue
-            
-        is_duplicate = False
-        current_fact_tokens = _get_tokens(fact.get("text", ""))
-        for seen_tokens in seen_fact_tokens:
-            if _calculate_jaccard(current_fact_tokens, seen_tokens) >= 0.8:
-                is_duplicate = True
-                break
-        
-        if not is_duplicate:
-            deduped_results.append(fact)
-            seen_fact_tokens.append(current_fact_tokens)
+    sem_score = np.fromiter(
+        ((fact.get("confidence") or 0.0) if fact['source'] == 'qdrant_semantic' else 0.0 for fact in facts),
+        dtype=np.float64, count=n
+    )
+    recent_topic_set = set(recent_topics)
+    recent_entity_set = set(recent_entities)
+    has_topic = np.fromiter(
+        (not recent_topic_set.isdisjoint(fact.get("topic_slugs", [])) for fact in facts), dtype=bool, count=n
+    )
+    has_entity = np.fromiter(
+        (not recent_entity_set.isdisjoint(fact.get("entity_slugs", [])) for fact in facts), dtype=bool, count=n
+    )
+    is_user = np.fromiter((fact.get("speaker") == user_speaker_name for fact in facts), dtype=bool, count=n)
+    topic_score = has_topic.astype(np.float64)
+
+    # Context Bonus
+    ctx_bonus = np.zeros(n)
+    ctx_bonus += np.where(is_user, 0.05, 0.0)
+    ctx_bonus += np.where(has_topic, 0.15, 0.0)
+    ctx_bonus += np.where(has_entity, 0.15, 0.0)
+
+    # Noise Penalty
+    lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=n)
+    noise_penalty = np.zeros(n)
+    noise_penalty += np.where(lengths < 25, 0.15, 0.0)
+    noise_penalty += np.where(np.fromiter((_FLUFF_RE.search(text) is not None for text in texts), dtype=bool, count=n), 0.2, 0.0)
+    noise_penalty += np.where(np.fromiter((fact.get("fact_type", "") in META_FACT_TYPES for fact in facts), dtype=bool, count=n), 0.3, 0.0)
+
+    # Hybrid Formula
+    final_scores = (
+        settings.fusion_weight_dense * sem_score +
+        settings.fusion_weight_keyword * kw_score +
+        settings.fusion_weight_neo4j_topic * topic_score + # Re-using neo4j topic weight for general topic score
+        0.10 * ctx_bonus - # Weight for context bonus as per user plan
+        noise_penalty
+    )
+    for fact, score in zip(facts, final_scores.tolist()):
+        fact['final_score'] = score
+
+    # 4. Filter out low-scoring results, then drop near-duplicates (stable, best first)
+    order = np.argsort(-final_scores, kind="stable")
+    order = order[final_scores[order] >= 0.42] # Threshold from user plan
+
+    limit = settings.recall_limit
+    if limit <= 0:
+        return []
+    deduped_results: List[Dict[str, Any]] = []
+    kept: List[int] = []
+    kept_signatures = np.empty((0, MINHASH_PERMUTATIONS), dtype=np.int64)
+    chunk = max(4 * limit, 32)
+    for chunk_start in range(0, len(order), chunk):
+        chunk_indices = order[chunk_start:chunk_start + chunk].tolist()
+        signatures = _minhash_signatures([_token_hashes(fact_tokens[i]) for i in chunk_indices])
+        for idx, signature in zip(chunk_indices, signatures):
+            is_duplicate = False
+            if kept:
+                estimates = (kept_signatures == signature).mean(axis=1)
+                for j in np.flatnonzero(estimates >= 0.8 - MINHASH_MARGIN).tolist():
+                    if _calculate_jaccard(fact_tokens[idx], fact_tokens[kept[j]]) >= 0.8:
+                        is_duplicate = True
+                        break
+            if not is_duplicate:
+                deduped_results.append(facts[idx])
+                kept.append(idx)
+                kept_signatures = np.vstack((kept_signatures, signature))
+                # 5. Only the top N results (as defined in settings) are returned
+                if len(deduped_results) >= limit:
+                    return deduped_results
 
-    # 4. Return the top N results as defined in settings
-    return deduped_results[:settings.recall_limit]
+    return deduped_results
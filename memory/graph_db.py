@@ -6,10 +6,27 @@ from typing import Optional, Dict, Any, List, Tuple
 
 from .config import settings
 from . import models
+from .topic_scores import topic_score_mirror
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Weight of one mention, and the decayed sum of a topic's mentions at its newest one.
+# Expects `mentions` (a list of MENTIONS) and `latest` (their max ts_edge) in scope.
+# Backfilled MENTIONS may have no w0.
+_MENTION_W0 = 0.7
+_DECAYED_MENTIONS_SCORE = "reduce(acc = 0.0, m IN mentions | acc + coalesce(m.w0, $w0) * exp(-((latest.epochMillis - m.ts_edge.epochMillis) / 1000.0) / $tau_sec))"
+
+# Builds the TOPIC_SCORE edges of session `s` from its MENTIONS, for sessions that
+# predate TOPIC_SCORE or were imported by the backfill. Unit subquery body.
+_TOPIC_SCORES_FROM_MENTIONS = f"""
+    WITH s WHERE NOT EXISTS {{ (s)-[:TOPIC_SCORE]->() }}
+    MATCH (:Utterance {{session_id: s.session_id}})-[m:MENTIONS]->(t:Topic)
+    WITH s, t, collect(m) AS mentions, max(m.ts_edge) AS latest
+    MERGE (s)-[sc:TOPIC_SCORE]->(t)
+    SET sc.score = {_DECAYED_MENTIONS_SCORE}, sc.updated_ts = latest
+"""
+
 class GraphDB:
     def __init__(self, uri: str, user: str, password: str):
         self._uri = uri
@@ -142,60 +159,160 @@ class GraphDB:
         return [record["fact"] for record in result.records]
 
     async def update_dialog(self, req: models.DialogUpdateRequest):
+        """
+        Append an utterance to its session's FOLLOWS chain in constant time.
+
+        The Session node keeps a LAST relationship to its newest utterance, so the
+        predecessor is one hop away instead of a scan over the session. Writing the
+        session first takes its lock, which serializes concurrent appends to the
+        same session on the tail. Utterances arriving out of order (ts not after the
+        tail) and sessions created before LAST existed fall back to an indexed
+        (session_id, ts) lookup of the predecessor.
+
+        Sessions without TOPIC_SCORE edges get them built from their existing
+        MENTIONS before this utterance's mentions are scored.
+        """
         utt_id = f"{req.session_id}-{req.ts}"
         query = """
+        MERGE (s:Session {session_id: $session_id}) ON CREATE SET s.start_ts = datetime($ts)
+        SET s.end_ts = CASE WHEN s.end_ts IS NULL OR s.end_ts < datetime($ts) THEN datetime($ts) ELSE s.end_ts END
         MERGE (u:Utterance {utt_id: $utt_id})
         SET u.session_id = $session_id, u.ts = datetime($ts), u.speaker = $speaker, u.text = $text
-        MERGE (s:Session {session_id: $session_id}) ON CREATE SET s.start_ts = u.ts SET s.end_ts = u.ts
         MERGE (u)-[:IN]->(s)
-        WITH u
-        MATCH (prev:Utterance {session_id: $session_id}) WHERE prev.ts < u.ts
-        WITH u, prev ORDER BY prev.ts DESC LIMIT 1
-        MERGE (prev)-[:FOLLOWS {ts_edge: u.ts}]->(u)
-        WITH u
+        WITH s, u
+        OPTIONAL MATCH (s)-[tail:LAST]->(last:Utterance)
+        WITH s, u, tail, last, (last IS NULL OR (last <> u AND last.ts < u.ts)) AS is_tail
+        FOREACH (_ IN CASE WHEN is_tail AND last IS NOT NULL THEN [1] ELSE [] END |
+            MERGE (last)-[:FOLLOWS {ts_edge: u.ts}]->(u)
+            DELETE tail
+        )
+        FOREACH (_ IN CASE WHEN is_tail THEN [1] ELSE [] END |
+            MERGE (s)-[:LAST]->(u)
+        )
+        WITH s, u, last, is_tail
+        CALL {
+            WITH u, last, is_tail
+            WITH u WHERE last IS NULL OR (NOT is_tail AND last <> u)
+            MATCH (prev:Utterance {session_id: $session_id}) WHERE prev.ts < u.ts
+            WITH u, prev ORDER BY prev.ts DESC LIMIT 1
+            MERGE (prev)-[:FOLLOWS {ts_edge: u.ts}]->(u)
+        }
+        WITH s, u
+        CALL {
+            WITH s
+            """ + _TOPIC_SCORES_FROM_MENTIONS + """
+        }
+        WITH s, u
         UNWIND $topics AS topic_slug
         MERGE (t:Topic {slug: topic_slug})
-        MERGE (u)-[:MENTIONS {ts_edge: u.ts, w0: 0.7}]->(t)
+        WITH s, u, t, EXISTS { (u)-[:MENTIONS]->(t) } AS already_mentioned
+        MERGE (u)-[:MENTIONS {ts_edge: u.ts, w0: $w0}]->(t)
+        WITH s, u, t WHERE NOT already_mentioned
+        MERGE (s)-[sc:TOPIC_SCORE]->(t) ON CREATE SET sc.score = 0.0, sc.updated_ts = u.ts
+        WITH u, t, sc, (u.ts.epochMillis - sc.updated_ts.epochMillis) / 1000.0 AS dt
+        SET sc.score = CASE WHEN dt >= 0 THEN sc.score * exp(-dt / $tau_sec) + $w0 ELSE sc.score + $w0 * exp(dt / $tau_sec) END,
+            sc.updated_ts = CASE WHEN dt >= 0 THEN u.ts ELSE sc.updated_ts END
+        RETURN t.slug AS topic_slug, sc.score AS score, sc.updated_ts.epochMillis / 1000.0 AS updated_at
         """
-        params = { "utt_id": utt_id, "session_id": req.session_id, "ts": req.ts, "speaker": req.speaker, "text": req.text, "topics": req.topics }
-        await self.run_query(query, params)
+        params = {
+            "utt_id": utt_id, "session_id": req.session_id, "ts": req.ts, "speaker": req.speaker, "text": req.text, "topics": req.topics,
+            "w0": _MENTION_W0, "tau_sec": settings.context_decay_tau_sec,
+        }
+        result = await self.run_query(query, params)
+        await topic_score_mirror.update(req.session_id, [dict(record) for record in result.records])
         logger.info(f"Added utterance {utt_id} to the graph.")
 
-    async def get_context(self, session_id: str, horizon_utterances: int, horizon_minutes: int, tau_sec: int) -> Tuple[List[Dict], List[Dict]]:
-        # This query is reverted to a simpler, stable version.
-        # The more optimized UNION-based query requires further refinement.
+    async def get_context(self, session_id: str, horizon_utterances: int, horizon_minutes: int, tau_sec: int, top_k: Optional[int] = None) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Top decayed topics and recent utterances of a session.
+
+        Topic scores are maintained incrementally by update_dialog with the same
+        tau (context_decay_tau_sec) and are only decayed to "now" here. That makes
+        this a read of the session's TOPIC_SCORE edges, or of the Redis mirror when
+        it is enabled, and not a re-aggregation of MENTIONS over the horizon.
+        Old mentions fade through the decay instead of being cut off at the horizon.
+
+        Sessions without TOPIC_SCORE edges (not written to since the edges were
+        introduced, and not migrated by the backfill) are scored from their MENTIONS
+        with the same decay. On a mirror miss, the session's scores read from Neo4j
+        seed the mirror.
+        """
+        top_k = top_k or settings.context_top_topics
+        # The mirror is seeded with every topic of the session, so only limit when it is off.
+        limit = "" if topic_score_mirror.enabled else "LIMIT $top_k"
         topics_query = """
-        MATCH (u1:Utterance {session_id: $session_id})
-        WITH u1 ORDER BY u1.ts DESC LIMIT $horizon_utterances
-        MATCH (u2:Utterance {session_id: $session_id})
-        WHERE u2.ts > datetime() - duration({minutes: $horizon_minutes})
-        WITH collect(u1) + collect(u2) AS combined_utterances
-        UNWIND combined_utterances AS u
-        WITH DISTINCT u
-        MATCH (u)-[r:MENTIONS]->(t:Topic)
-        WITH t, r, (datetime().epochSeconds - r.ts_edge.epochSeconds) AS age_seconds
-        WITH t, age_seconds, r.w0 * exp(-toFloat(age_seconds) / $tau_sec) AS score
-        RETURN t.slug AS topic_slug, t.name AS topic_name, sum(score) AS total_score
+        MATCH (:Session {session_id: $session_id})-[sc:TOPIC_SCORE]->(t:Topic)
+        WITH t, sc.score AS score, sc.updated_ts AS latest
+        RETURN coalesce(t.slug, t.topic_id) AS topic_slug, t.name AS topic_name, score, latest.epochMillis / 1000.0 AS updated_at,
+               score * exp(-((datetime().epochMillis - latest.epochMillis) / 1000.0) / $tau_sec) AS total_score
         ORDER BY total_score DESC
-        LIMIT 3
-        """
+        """ + limit
+        mentions_query = f"""
+        MATCH (:Utterance {{session_id: $session_id}})-[m:MENTIONS]->(t:Topic)
+        WITH t, collect(m) AS mentions, max(m.ts_edge) AS latest
+        WITH t, latest, {_DECAYED_MENTIONS_SCORE} AS score
+        RETURN coalesce(t.slug, t.topic_id) AS topic_slug, t.name AS topic_name, score, latest.epochMillis / 1000.0 AS updated_at,
+               score * exp(-((datetime().epochMillis - latest.epochMillis) / 1000.0) / $tau_sec) AS total_score
+        ORDER BY total_score DESC
+        """ + limit
         recents_query = """
         MATCH (u:Utterance {session_id: $session_id})
         RETURN u.speaker AS speaker, u.text AS text, u.ts AS ts
         ORDER BY u.ts DESC
         LIMIT $horizon_utterances
         """
-        params = {"session_id": session_id, "horizon_utterances": horizon_utterances, "horizon_minutes": horizon_minutes, "tau_sec": tau_sec}
+        params = {"session_id": session_id, "horizon_utterances": horizon_utterances, "tau_sec": tau_sec, "top_k": top_k, "w0": _MENTION_W0}
+        # A task, so the Neo4j recents query runs while the topic mirror is read.
+        recents_res_task = asyncio.create_task(self.run_query(recents_query, params, read_only=True))
         try:
-            topics_res_task = self.run_query(topics_query, params, read_only=True)
-            recents_res_task = self.run_query(recents_query, params, read_only=True)
-            topics_res, recents_res = await asyncio.gather(topics_res_task, recents_res_task)
-            top_topics = [dict(record) for record in topics_res.records]
+            top_topics = await topic_score_mirror.top(session_id, top_k)
+            if top_topics is None:
+                topics_res, recents_res = await asyncio.gather(self.run_query(topics_query, params, read_only=True), recents_res_task)
+                if not topics_res.records:
+                    topics_res = await self.run_query(mentions_query, params, read_only=True)
+                scores = [dict(record) for record in topics_res.records]
+                await topic_score_mirror.seed(session_id, scores)
+                top_topics = [
+                    {"topic_slug": s["topic_slug"], "topic_name": s["topic_name"], "total_score": s["total_score"]}
+                    for s in scores[:top_k]
+                ]
+            else:
+                recents_res = await recents_res_task
             recent_utterances = [dict(record) for record in recents_res.records]
             return top_topics, recent_utterances
         except Exception as e:
             logger.error(f"Failed to get context for session {session_id}: {e}")
             return [], []
+        finally:
+            if not recents_res_task.done():
+                recents_res_task.cancel()
+
+    async def build_topic_scores(self, batch_size: int = 500) -> int:
+        """
+        Build TOPIC_SCORE edges from MENTIONS for every session that has none.
+
+        Run by the backfill after MENTIONS are imported. Pages through sessions by
+        session_id and skips sessions that already have scores, so it can be re-run.
+        Returns the number of sessions visited.
+        """
+        query = """
+        MATCH (s:Session) WHERE $after IS NULL OR s.session_id > $after
+        WITH s ORDER BY s.session_id LIMIT $batch_size
+        CALL {
+            WITH s
+            """ + _TOPIC_SCORES_FROM_MENTIONS + """
+        }
+        RETURN count(s) AS sessions, max(s.session_id) AS last
+        """
+        after, visited = None, 0
+        while True:
+            params = {"after": after, "batch_size": batch_size, "w0": _MENTION_W0, "tau_sec": settings.context_decay_tau_sec}
+            result = await self.run_query(query, params)
+            record = result.records[0]
+            if not record["sessions"]:
+                return visited
+            visited += record["sessions"]
+            after = record["last"]
 
     
 
@@ -6,18 +6,19 @@ try:
     import ollama
 except ImportError:
     ollama = None
-from qdrant_client import QdrantClient, models
+from qdrant_client import models
 from openai import OpenAI
 from typing import List, Optional, Dict, Any
 
 from .config import settings
-from . import metrics
+from .embedding_cache import embedding_cache
+from .qdrant_utils import qdrant_pool
 
 logger = logging.getLogger(__name__)
 
 class KGraphQdrant:
     def __init__(self):
-        self.qdrant_cli = QdrantClient(url=settings.qdrant_url)
+        self.qdrant = qdrant_pool
         self.collection_name = settings.KGRAPH_QDRANT_COLLECTION
         
         self.embed_mode = settings.embedding_model_provider
@@ -49,6 +50,11 @@ class KGraphQdrant:
         logger.info(f"K-Graph initialized. Collection: {self.collection_name}, Embed Mode: {self.embed_mode}")
 
     async def _get_embedding(self, text: str) -> List[float]:
+        """Returns the embedding for a text, served from the embedding cache when possible."""
+        embedding_cache.use_model(self.embed_mode, self.embedding_model_name)
+        return await embedding_cache.get_or_compute(text, self._create_embedding)
+
+    async def _create_embedding(self, text: str) -> List[float]:
         """Creates an embedding for a given text using the configured provider."""
         try:
             res = await asyncio.to_thread(
@@ -61,6 +67,24 @@ class KGraphQdrant:
             logger.error(f"Failed to get embedding for provider {self.embed_mode}: {e}", exc_info=True)
             raise
 
+    async def _get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Returns embeddings for several texts; cache misses are embedded in one provider call."""
+        embedding_cache.use_model(self.embed_mode, self.embedding_model_name)
+        return await embedding_cache.get_or_compute_many(texts, self._create_embeddings)
+
+    async def _create_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Creates embeddings for a batch of texts in a single provider request."""
+        try:
+            res = await asyncio.to_thread(
+                self.openai_cli.embeddings.create,
+                input=texts,
+                model=self.embedding_model_name
+            )
+            return [item.embedding for item in sorted(res.data, key=lambda item: item.index)]
+        except Exception as e:
+            logger.error(f"Failed to get batch embeddings for provider {self.embed_mode}: {e}", exc_info=True)
+            raise
+
     def _build_qdrant_filter(
         self,
         participants: Optional[List[str]] = None,
@@ -113,8 +137,8 @@ class KGraphQdrant:
         - If query_text is provided, it's a semantic vector search.
         - If keywords are provided, it's a full-text search (using scroll).
         - Filters from kwargs are applied in all cases.
+        Qdrant and embedding errors propagate to the caller.
         """
-        start_time = time.time()
         try:
             collection_to_use = collection or self.collection_name
             qdrant_filter = self._build_qdrant_filter(**kwargs)
@@ -127,7 +151,7 @@ class KGraphQdrant:
                     "query_vector": await self._get_embedding(query_text),
                     "query_filter": qdrant_filter
                 }
-                search_res = await asyncio.to_thread(self.qdrant_cli.search, **search_args)
+                search_res = await self.qdrant.search(**search_args)
                 results = [
                     {
                         "fact_id": hit.payload.get("fact_id", hit.id), # FIX
@@ -145,8 +169,7 @@ class KGraphQdrant:
                 qdrant_filter.must.append(
                     models.FieldCondition(key="text", match=models.MatchText(text=keywords))
                 )
-                search_res, _ = await asyncio.to_thread(
-                    self.qdrant_cli.scroll,
+                search_res, _ = await self.qdrant.scroll(
                     collection_name=collection_to_use,
                     scroll_filter=qdrant_filter,
                     limit=limit,
@@ -166,8 +189,7 @@ class KGraphQdrant:
                 ]
 
             else: # Fallback to scroll if no query or keywords are provided
-                search_res, _ = await asyncio.to_thread(
-                    self.qdrant_cli.scroll,
+                search_res, _ = await self.qdrant.scroll(
                     collection_name=collection_to_use,
                     scroll_filter=qdrant_filter,
                     limit=limit,
@@ -186,10 +208,9 @@ class KGraphQdrant:
                 ]
 
         except Exception as e:
+            # Raised, not swallowed: /graph/context counts the failure against its branch.
             logger.error(f"K-Graph search failed: {e}", exc_info=True)
-            return []
-        finally:
-            metrics.record_qdrant_query((time.time() - start_time) * 1000)
+            raise
 
 # --- Global Instance ---
 k_graph_client = KGraphQdrant()
\ No newline at end of file
@@ -5,26 +5,22 @@ import asyncio
 import hashlib
 import json
 import re
-from collections import defaultdict
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 import datetime
 
 from . import models, mem0_client, cache, rate_limit, task_queue, metrics, fusion
-from .qdrant_utils import ensure_collection_exists
+from .qdrant_utils import ensure_collection_exists, qdrant_pool
 from .config import settings
-from .worker import run_worker
+from .worker import run_worker, requeue_dead_letters
 from .graph_db import graph_db_client
 from .k_graph import k_graph_client
 from .cooldown import cooldown_manager
-from .backfill import run_backfill
+from .backfill import run_backfill, backfill_progress
+from .single_flight import recall_flight, research_recall_flight
 import time
 
 from qdrant_client import models as qmodels
 
-# Global lock dictionary for single-flight requests
-request_locks = defaultdict(asyncio.Lock)
-
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # On startup, create a background task for the worker
@@ -42,6 +38,7 @@ async def lifespan(app: FastAPI):
         logger.info("Worker task was successfully cancelled.")
     
     await graph_db_client.close()
+    await qdrant_pool.close()
 
 
 logger = logging_utils.get_logger("memory.main", service="memory")
@@ -57,60 +54,65 @@ def _get_cache_key(req: models.RecallRequest) -> str:
 
 @app.post("/ltm/recall", response_model=models.RecallResponse)
 async def recall(req: models.RecallRequest, background_tasks: BackgroundTasks):
-    ensure_collection_exists(req.collection)
+    await ensure_collection_exists(req.collection)
     # 1. Rate Limiting & Cooldown
     is_allowed, retry_after = await rate_limit.rate_limiter.is_allowed(req.user_id, req.session_id)
     if not is_allowed:
         raise HTTPException(status_code=429, detail=f"Rate limit exceeded. Try again in {retry_after} seconds.")
 
-    # 2. Cache Key & Single-flight Lock
+    # 2. Cache Key & Single-flight
     # Note: Cache key does not include collection, as it's assumed to be part of the user/query context
     cache_key = _get_cache_key(req)
-    lock = request_locks[cache_key]
-
-    async with lock:
-        # 3. Cache Lookup (inside the lock)
-        if settings.recall_cache_enabled:
-            cached_result = await cache.recall_cache.get(cache_key)
-            if cached_result:
-                metrics.record_cache_hit()
-                logger.info(f"[CACHE HIT] for query: {req.query}")
-                return models.RecallResponse(memories=cached_result, cached=True)
-        
-        metrics.record_cache_miss()
-        logger.info(f"[CACHE MISS] for query: {req.query}")
-
-        # 4. Recall from Mem0
-        start_time = time.time()
-        try:
-            memories = await mem0_client.m_client.recall(
-                query=req.query, 
-                k=req.k, 
-                user_id=req.user_id, 
-                collection=req.collection
-            )
-        except asyncio.TimeoutError:
-            metrics.record_error("timeout")
-            logger.error("Mem0 recall timed out after all retries.")
-            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="LTM service timed out.")
-        except Exception as e:
-            metrics.record_error("recall_failed")
-            logger.error(f"Mem0 recall failed: {e}")
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to recall memories from LTM.")
-        finally:
-            duration = time.time() - start_time
-            metrics.record_recall_latency(duration)
-            logger.info(f"Recall processed in {duration:.4f} seconds.")
-
-        # 5. Cache the result in the background
-        if settings.recall_cache_enabled:
-            background_tasks.add_task(cache.recall_cache.set, cache_key, memories, ttl=settings.recall_cache_ttl_seconds)
-
-        return models.RecallResponse(memories=memories, cached=False)
+    (memories, cached), shared = await recall_flight.do(cache_key, lambda: _recall_once(req, cache_key))
+    if shared:
+        logger.info(f"[SINGLE-FLIGHT] joined in-flight recall for query: {req.query}")
+
+    # 5. Cache the result in the background (once, by the caller that ran the recall)
+    if settings.recall_cache_enabled and not cached and not shared:
+        background_tasks.add_task(cache.recall_cache.set, cache_key, memories, ttl=settings.recall_cache_ttl_seconds)
+
+    return models.RecallResponse(memories=memories, cached=cached)
+
+async def _recall_once(req: models.RecallRequest, cache_key: str) -> Tuple[List[Any], bool]:
+    """Cache lookup and Mem0 recall for one request; returns (memories, cached)."""
+    # 3. Cache Lookup
+    if settings.recall_cache_enabled:
+        cached_result = await cache.recall_cache.get(cache_key)
+        if cached_result:
+            metrics.record_cache_hit()
+            logger.info(f"[CACHE HIT] for query: {req.query}")
+            return cached_result, True
+
+    metrics.record_cache_miss()
+    logger.info(f"[CACHE MISS] for query: {req.query}")
+
+    # 4. Recall from Mem0
+    start_time = time.time()
+    try:
+        memories = await mem0_client.m_client.recall(
+            query=req.query, 
+            k=req.k, 
+            user_id=req.user_id, 
+            collection=req.collection
+        )
+    except asyncio.TimeoutError:
+        metrics.record_error("timeout")
+        logger.error("Mem0 recall timed out after all retries.")
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="LTM service timed out.")
+    except Exception as e:
+        metrics.record_error("recall_failed")
+        logger.error(f"Mem0 recall failed: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to recall memories from LTM.")
+    finally:
+        duration = time.time() - start_time
+        metrics.record_recall_latency(duration)
+        logger.info(f"Recall processed in {duration:.4f} seconds.")
+
+    return memories, False
 
 @app.post("/ltm/store", response_model=models.StoreResponse)
 async def store(req: models.StoreRequest):
-    ensure_collection_exists(req.collection)
+    await ensure_collection_exists(req.collection)
     try:
         queued_count = await task_queue.ingest_queue.enqueue_batch(req.items, collection=req.collection)
         return models.StoreResponse(status="queued", queued_items=queued_count)
@@ -119,10 +121,26 @@ async def store(req: models.StoreRequest):
         raise HTTPException(status_code=500, detail="Failed to queue items for storage.")
 
 
+def _get_research_key(req: models.ResearchRecallRequest) -> str:
+    payload = {
+        "collection": req.collection,
+        "session_id": req.session_id,
+        "query": req.query,
+        "ref": req.ref,
+        "origin_ref": req.origin_ref,
+        "limit": req.limit,
+    }
+    payload_str = json.dumps(payload, sort_keys=True, default=str)
+    return f"research:{hashlib.sha256(payload_str.encode('utf-8')).hexdigest()}"
+
+
 @app.post("/research/recall", response_model=models.ResearchRecallResponse)
 async def research_recall(req: models.ResearchRecallRequest):
-    ensure_collection_exists(req.collection)
+    await ensure_collection_exists(req.collection)
+    response, _ = await research_recall_flight.do(_get_research_key(req), lambda: _research_recall_once(req))
+    return response
 
+async def _research_recall_once(req: models.ResearchRecallRequest) -> models.ResearchRecallResponse:
     must_conditions = [
         qmodels.FieldCondition(key="collection", match=qmodels.MatchValue(value=req.collection)),
         qmodels.FieldCondition(key="session_id", match=qmodels.MatchValue(value=req.session_id)),
@@ -148,8 +166,7 @@ async def research_recall(req: models.ResearchRecallRequest):
 
         if req.query:
             query_vector = await k_graph_client._get_embedding(req.query)
-            hits = await asyncio.to_thread(
-                k_graph_client.qdrant_cli.search,
+            hits = await k_graph_client.qdrant.search(
                 collection_name=req.collection,
                 query_vector=query_vector,
                 query_filter=qdrant_filter,
@@ -157,8 +174,7 @@ async def research_recall(req: models.ResearchRecallRequest):
                 with_payload=True,
             )
         else:
-            hits, _ = await asyncio.to_thread(
-                k_graph_client.qdrant_cli.scroll,
+            hits, _ = await k_graph_client.qdrant.scroll(
                 collection_name=req.collection,
                 scroll_filter=qdrant_filter,
                 with_payload=True,
@@ -220,12 +236,29 @@ async def research_recall(req: models.ResearchRecallRequest):
         logger.error(f"Research recall failed: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to recall research memory.")
 
+@app.post("/ltm/dead_letters/requeue")
+async def dead_letters_requeue(limit: int = 0):
+    """Puts dead-lettered ingest items (all, or the oldest `limit`) back on the queue with fresh attempts."""
+    try:
+        requeued = await requeue_dead_letters(task_queue.ingest_queue.client, limit)
+    except Exception as e:
+        logger.error(f"Failed to requeue dead letters: {e}")
+        raise HTTPException(status_code=500, detail="Failed to requeue dead letters.")
+    logger.info(f"Requeued {requeued} dead-lettered ingest items")
+    return {"status": "ok", "requeued": requeued}
+
 @app.post("/graph/backfill")
-async def backfill_data(background_tasks: BackgroundTasks):
+async def backfill_data(background_tasks: BackgroundTasks, reset: bool = False):
+    if backfill_progress.running:
+        return {"status": "running", "message": "Backfill is already running.", "progress": backfill_progress.snapshot()}
     logger.info("Received request to start backfill process.")
-    background_tasks.add_task(run_backfill)
+    background_tasks.add_task(run_backfill, reset=reset)
     return {"status": "ok", "message": "Backfill process started in the background."}
 
+@app.get("/graph/backfill")
+async def backfill_status():
+    return backfill_progress.snapshot()
+
 # @app.post("/graph/recalculate_intents")
 # async def recalculate_intents(background_tasks: BackgroundTasks):
 #     logger.info("Received request to start intent graph recalculation.")
@@ -242,63 +275,95 @@ async def dialog_update(req: models.DialogUpdateRequest, background_tasks: Backg
         logger.error(f"Failed to enqueue dialog update: {e}")
         return models.DialogUpdateResponse(ok=False)
 
+_STOP_WORDS = {'а', 'в', 'и', 'на', 'с', 'что', 'как', 'это', 'не', 'но', 'кто', 'такой', 'бы', 'же'}
+
+def _extract_keywords(query: str) -> List[str]:
+    cleaned_text = re.sub(r'[^a-zа-я0-9\s]', '', query.lower()).strip()
+    return [word for word in cleaned_text.split() if word not in _STOP_WORDS and len(word) > 2]
+
+async def _run_branch(name: str, coro, deadline_ms: float, default: Any):
+    """Runs one retrieval branch under its deadline; late or failed branches yield `default`."""
+    start_time = time.time()
+    timed_out = failed = False
+    try:
+        return await asyncio.wait_for(coro, timeout=deadline_ms / 1000)
+    except asyncio.TimeoutError:
+        timed_out = True
+        logger.warning(f"Context branch '{name}' missed its {deadline_ms}ms deadline")
+        return default
+    except Exception as e:
+        failed = True
+        logger.error(f"Context branch '{name}' failed: {e}")
+        return default
+    finally:
+        metrics.record_context_branch(name, (time.time() - start_time) * 1000, timed_out=timed_out, failed=failed)
+
 @app.get("/graph/context", response_model=models.ContextResponse)
 async def get_graph_context(session_id: str, query: str, collection: str):
     start_time = time.time()
     try:
-        # 1. Get recent context from Dialog Graph (Neo4j)
-        top_topics, recent_utterances = await graph_db_client.get_context(
-            session_id,
-            horizon_utterances=settings.context_horizon_utterances,
-            horizon_minutes=settings.context_horizon_minutes,
-            tau_sec=settings.context_decay_tau_sec
-        )
+        # 1. Start every retrieval branch at once. The dialog-graph lookup (topics and
+        # recent utterances) has its own deadline; topic-based searches chain onto it
+        # while semantic, keyword and fulltext searches run independently of it.
+        graph_task = asyncio.create_task(_run_branch(
+            "graph_context",
+            graph_db_client.get_context(
+                session_id,
+                horizon_utterances=settings.context_horizon_utterances,
+                horizon_minutes=settings.context_horizon_minutes,
+                tau_sec=settings.context_decay_tau_sec
+            ),
+            settings.context_graph_deadline_ms,
+            ([], []),
+        ))
+
+        async def active_topics_ready() -> List[str]:
+            top_topics, _ = await asyncio.shield(graph_task)
+            return [t['topic_slug'] for t in top_topics]
+
+        async def qdrant_topic_search():
+            topics = await active_topics_ready()
+            return await k_graph_client.search(topics=topics, limit=3, collection=collection) if topics else [] # Limit 3
+
+        async def neo4j_topic_search():
+            topics = await active_topics_ready()
+            return await graph_db_client.get_facts_by_topics(topics=topics, limit=2) if topics else [] # Limit 2
+
+        branches = {
+            "qdrant_topic": qdrant_topic_search(),
+            "neo4j_topic": neo4j_topic_search(),
+        }
+
+        # Use the user's query for semantic, keyword and fulltext search
+        if query:
+            branches["qdrant_semantic"] = k_graph_client.search(query_text=query, limit=4, collection=collection) # Limit 4
+            keywords = _extract_keywords(query)
+            if keywords:
+                keyword_query = " ".join(keywords)
+                # Using a higher limit for keyword search as it's less precise
+                branches["qdrant_keyword"] = k_graph_client.search(keywords=keyword_query, limit=7, collection=collection)
+                branches["neo4j_fulltext"] = graph_db_client.get_facts_by_fulltext(q=keyword_query, limit=3)
+
+        task_names = list(branches)
+        search_results = await asyncio.gather(*(
+            _run_branch(name, coro, settings.context_branch_deadline_ms, [])
+            for name, coro in branches.items()
+        ))
+        top_topics, recent_utterances = await graph_task
         active_topics = [t['topic_slug'] for t in top_topics]
         logger.info(f"Topics extracted for context search: {active_topics}")
-        
+
         # Simple entity extraction from recent utterances for context bonus
         active_entities = []
         for utt in recent_utterances:
             # This is a placeholder for real entity extraction
             active_entities.extend(utt['text'].lower().split()) 
 
-        # 2. Prepare and execute all search tasks in parallel with new limits
-        tasks = []
-        task_names = []
-
-        # Task: Topic-based search in Qdrant
-        if active_topics:
-            tasks.append(asyncio.create_task(k_graph_client.search(topics=active_topics, limit=3, collection=collection))) # Limit 3
-            task_names.append("qdrant_topic")
-
-        # Task: Topic-based search in Neo4j
-        if active_topics:
-            tasks.append(asyncio.create_task(graph_db_client.get_facts_by_topics(topics=active_topics, limit=2))) # Limit 2
-            task_names.append("neo4j_topic")
-        
-        # Use the user's query for semantic and keyword search
-        if query:
-            tasks.append(asyncio.create_task(k_graph_client.search(query_text=query, limit=4, collection=collection))) # Limit 4
-            task_names.append("qdrant_semantic")
-
-            cleaned_text = re.sub(r'[^a-zа-я0-9\s]', '', query.lower()).strip()
-            all_words = cleaned_text.split()
-            stop_words = {'а', 'в', 'и', 'на', 'с', 'что', 'как', 'это', 'не', 'но', 'кто', 'такой', 'бы', 'же'}
-            keywords = [word for word in all_words if word not in stop_words and len(word) > 2]
-            
-            if keywords:
-                keyword_query = " ".join(keywords)
-                # Using a higher limit for keyword search as it's less precise
-                tasks.append(asyncio.create_task(k_graph_client.search(keywords=keyword_query, limit=7, collection=collection)))
-                task_names.append("qdrant_keyword")
-
-        # 3. Execute tasks and fuse results
-        if not tasks:
+        # 2. Fuse whatever arrived before the deadlines
+        candidate_sets = {name: result for name, result in zip(task_names, search_results) if result}
+        if not candidate_sets:
             top_facts = []
         else:
-            search_results = await asyncio.gather(*tasks)
-            candidate_sets = {name: result for name, result in zip(task_names, search_results)}
-
             logger.info("--- Search Branch Results ---")
             for source, facts in candidate_sets.items():
                 logger.info(f"Source: {source}, Found: {len(facts)} facts")
@@ -316,7 +381,7 @@ async def get_graph_context(session_id: str, query: str, collection: str):
                 recent_entities=active_entities
             )
 
-        # 4. Format context strings
+        # 3. Format context strings
         quotes_str = "[Recent Conversation History]\n" + "\n".join(f"- {q['speaker']}: {q['text']}" for q in recent_utterances) if recent_utterances else ""
         
         knowledge_str = ""
@@ -335,7 +400,7 @@ async def get_graph_context(session_id: str, query: str, collection: str):
                 knowledge_items.append(f"- {f.get('speaker', 'Unknown')}: {f.get('text')} (score: {confidence_str}, date: {ts_str})")
             knowledge_str = "[Possibly Relevant Information from Long-Term Memory]\n" + "\n".join(knowledge_items)
 
-        # 5. Build final context
+        # 4. Build final context
         context_parts = [knowledge_str, quotes_str]
         final_context = "\n\n".join(p for p in context_parts if p).strip()
 
@@ -343,6 +408,7 @@ async def get_graph_context(session_id: str, query: str, collection: str):
             final_context = final_context[:settings.pointer_max_chars]
 
         duration_ms = (time.time() - start_time) * 1000
+        metrics.record_context_build(duration_ms / 1000, len(final_context))
         logger.info(f"Context built in {duration_ms:.2f}ms, length {len(final_context)} chars.")
         logger.info(f"Final Context Sent to Brain:\n{final_context}")
 
@@ -403,6 +469,10 @@ async def health_check(response: Response):
 def get_metrics():
     return metrics.metrics_collector.get_report()
 
+@app.get("/metrics/prometheus")
+def get_metrics_prometheus():
+    return Response(content=metrics.metrics_collector.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 
 if __name__ == "__main__":
     import uvicorn
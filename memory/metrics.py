@@ -1,33 +1,195 @@
+import math
+import threading
 import time
 from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
 import numpy as np
 
+WINDOW_SECONDS = 300
+WINDOW_SLOTS = 10
+
+
+class _SlidingWindow:
+    """Ring of time slots covering the last `window_sec` seconds; stale slots are reset lazily."""
+
+    def __init__(self, window_sec: float, slots: int):
+        self.window_sec = float(window_sec)
+        self.slots = max(int(slots), 1)
+        self.slot_sec = self.window_sec / self.slots
+        self._epoch = [-1] * self.slots
+
+    def current_slot(self, now: float) -> Tuple[int, bool]:
+        """Returns (slot index, whether the slot was just recycled)."""
+        epoch = int(now // self.slot_sec)
+        slot = epoch % self.slots
+        if self._epoch[slot] != epoch:
+            self._epoch[slot] = epoch
+            return slot, True
+        return slot, False
+
+    def live_slots(self, now: float) -> List[int]:
+        current = int(now // self.slot_sec)
+        return [i for i, epoch in enumerate(self._epoch) if epoch >= 0 and current - epoch < self.slots]
+
+    def covered_seconds(self, now: float, started: float) -> float:
+        """Seconds actually covered by the window (shorter right after startup)."""
+        return max(min(self.window_sec, now - started), 1.0)
+
+
+class StreamingHistogram:
+    """
+    Fixed-memory histogram with log-spaced buckets (HDR-style bounded relative error).
+
+    Values are bucketed with `precision` relative width between `min_value` and
+    `max_value` (values outside are clamped), so quantiles are accurate to about
+    `precision / 2` regardless of how many samples were recorded. Lifetime counts
+    sit next to a sliding window of per-slot counts for recent quantiles and rates.
+    """
+
+    def __init__(
+        self,
+        min_value: float = 1e-4,
+        max_value: float = 1e6,
+        precision: float = 0.02,
+        window_sec: float = WINDOW_SECONDS,
+        slots: int = WINDOW_SLOTS,
+    ):
+        self.min_value = min_value
+        self.max_value = max_value
+        self._log_min = math.log(min_value)
+        self._log_growth = math.log1p(precision)
+        self.n_buckets = int(math.ceil((math.log(max_value) - self._log_min) / self._log_growth)) + 2
+        # Bucket 0 holds values <= min_value (including zero); bucket i > 0 covers
+        # (min * g^(i-1), min * g^i].
+        upper = min_value * np.exp(self._log_growth * np.arange(self.n_buckets))
+        lower = np.concatenate(([0.0], upper[:-1]))
+        self._representative = np.where(lower > 0, np.sqrt(lower * upper), upper)
+
+        self.counts = np.zeros(self.n_buckets, dtype=np.int64)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._window = _SlidingWindow(window_sec, slots)
+        self._slot_counts = np.zeros((self._window.slots, self.n_buckets), dtype=np.int32)
+        self._slot_sums = np.zeros(self._window.slots, dtype=np.float64)
+        self._started = time.time()
+
+    def _bucket(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        index = int(math.ceil((math.log(min(value, self.max_value)) - self._log_min) / self._log_growth))
+        return min(max(index, 1), self.n_buckets - 1)
+
+    def record(self, value: float, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        bucket = self._bucket(value)
+        slot, recycled = self._window.current_slot(now)
+        if recycled:
+            self._slot_counts[slot].fill(0)
+            self._slot_sums[slot] = 0.0
+        self._slot_counts[slot, bucket] += 1
+        self._slot_sums[slot] += value
+        self.counts[bucket] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def _window_counts(self, now: float) -> np.ndarray:
+        live = self._window.live_slots(now)
+        if not live:
+            return np.zeros(self.n_buckets, dtype=np.int64)
+        return self._slot_counts[live].sum(axis=0, dtype=np.int64)
+
+    def quantiles(self, qs: List[float], window: bool = False, now: Optional[float] = None) -> List[float]:
+        counts = self._window_counts(time.time() if now is None else now) if window else self.counts
+        total = int(counts.sum())
+        if total == 0:
+            return [0.0 for _ in qs]
+        cumulative = np.cumsum(counts)
+        ranks = np.maximum(np.ceil(np.asarray(qs) * total), 1)
+        buckets = np.searchsorted(cumulative, ranks, side="left")
+        return [float(v) for v in self._representative[np.minimum(buckets, self.n_buckets - 1)]]
+
+    def quantile(self, q: float, window: bool = False) -> float:
+        return self.quantiles([q], window=window)[0]
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def window_count(self, now: Optional[float] = None) -> int:
+        return int(self._window_counts(time.time() if now is None else now).sum())
+
+    def rate(self, now: Optional[float] = None) -> float:
+        """Events per second over the sliding window."""
+        now = time.time() if now is None else now
+        return self.window_count(now) / self._window.covered_seconds(now, self._started)
+
+
+class WindowedCounter:
+    """Lifetime counter plus events-per-second over a sliding window."""
+
+    def __init__(self, window_sec: float = WINDOW_SECONDS, slots: int = WINDOW_SLOTS):
+        self.total = 0
+        self._window = _SlidingWindow(window_sec, slots)
+        self._slot_counts = [0] * self._window.slots
+        self._started = time.time()
+
+    def inc(self, amount: int = 1, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        slot, recycled = self._window.current_slot(now)
+        if recycled:
+            self._slot_counts[slot] = 0
+        self._slot_counts[slot] += amount
+        self.total += amount
+
+    def rate(self, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        recent = sum(self._slot_counts[i] for i in self._window.live_slots(now))
+        return recent / self._window.covered_seconds(now, self._started)
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
 class MetricsCollector:
     def __init__(self):
-        self.recall_latencies = []
-        self.cache_hits = 0
-        self.cache_misses = 0
-        self.errors = defaultdict(int)
+        # Latency units follow the callers: recall and context build in seconds, Qdrant and branches in ms.
+        self.recall_latencies = StreamingHistogram()
+        self.cache_hits = WindowedCounter()
+        self.cache_misses = WindowedCounter()
+        self.errors = defaultdict(WindowedCounter)
         self.proactive_suggestions_offered = 0
         self.proactive_tactics_suggested = defaultdict(int)
-        self.context_build_latencies = []
-        self.pointer_lengths = []
-        self.qdrant_query_latencies = []
+        self.context_build_latencies = StreamingHistogram()
+        self.pointer_lengths = StreamingHistogram(min_value=1, max_value=1e7)
+        self.qdrant_query_latencies = StreamingHistogram()
+        self.embedding_cache_lookups = defaultdict(WindowedCounter)
+        self.single_flight = defaultdict(lambda: defaultdict(int))
+        self.context_branch_latencies: Dict[str, StreamingHistogram] = defaultdict(StreamingHistogram)
+        self.context_branch_timeouts = defaultdict(int)
+        self.context_branch_errors = defaultdict(int)
         self.start_time = time.time()
+        # Records may come from worker threads (asyncio.to_thread callers)
+        self._lock = threading.Lock()
 
     def record_recall_latency(self, duration: float):
-        self.recall_latencies.append(duration)
-        if len(self.recall_latencies) > 1000:
-            self.recall_latencies.pop(0)
+        with self._lock:
+            self.recall_latencies.record(duration)
 
     def record_cache_hit(self):
-        self.cache_hits += 1
+        with self._lock:
+            self.cache_hits.inc()
 
     def record_cache_miss(self):
-        self.cache_misses += 1
+        with self._lock:
+            self.cache_misses.inc()
 
     def record_error(self, error_type: str):
-        self.errors[error_type] += 1
+        with self._lock:
+            self.errors[error_type].inc()
 
     def record_proactive_suggestion(self):
         self.proactive_suggestions_offered += 1
@@ -36,44 +198,146 @@ class MetricsCollector:
         self.proactive_tactics_suggested[tactic] += 1
 
     def record_context_build(self, duration: float, length: int):
-        self.context_build_latencies.append(duration)
-        self.pointer_lengths.append(length)
-        if len(self.context_build_latencies) > 1000:
-            self.context_build_latencies.pop(0)
-            self.pointer_lengths.pop(0)
+        with self._lock:
+            self.context_build_latencies.record(duration)
+            self.pointer_lengths.record(length)
 
     def record_qdrant_query(self, duration: float):
-        self.qdrant_query_latencies.append(duration)
-        if len(self.qdrant_query_latencies) > 1000:
-            self.qdrant_query_latencies.pop(0)
+        with self._lock:
+            self.qdrant_query_latencies.record(duration)
+
+    def record_context_branch(self, branch: str, duration: float, timed_out: bool = False, failed: bool = False):
+        with self._lock:
+            self.context_branch_latencies[branch].record(duration)
+            if timed_out:
+                self.context_branch_timeouts[branch] += 1
+            if failed:
+                self.context_branch_errors[branch] += 1
+
+    def record_embedding_cache(self, outcome: str):
+        with self._lock:
+            self.embedding_cache_lookups[outcome].inc()
+
+    def record_single_flight(self, name: str, outcome: str):
+        with self._lock:
+            self.single_flight[name][outcome] += 1
 
     def get_report(self):
-        uptime_seconds = time.time() - self.start_time
-        latencies_np = np.array(self.recall_latencies)
-        context_build_latencies_np = np.array(self.context_build_latencies)
-        pointer_lengths_np = np.array(self.pointer_lengths)
-        qdrant_latencies_np = np.array(self.qdrant_query_latencies)
-
-        proactive_report = {
-            "suggestions_offered_total": self.proactive_suggestions_offered,
-            "tactics_suggested_counts": dict(self.proactive_tactics_suggested)
-        }
-        
-        return {
-            "uptime_seconds": uptime_seconds,
-            "recall_requests_total": len(self.recall_latencies),
-            "cache_hits": self.cache_hits,
-            "cache_misses": self.cache_misses,
-            "cache_hit_ratio": self.cache_hits / (self.cache_hits + self.cache_misses) if (self.cache_hits + self.cache_misses) > 0 else 0,
-            "errors": dict(self.errors),
-            "proactive_suggestions": proactive_report,
-            "context_build_latency_p99_ms": np.percentile(context_build_latencies_np, 99) * 1000 if len(context_build_latencies_np) > 0 else 0,
-            "qdrant_query_latency_p99_ms": np.percentile(qdrant_latencies_np, 99) * 1000 if len(qdrant_latencies_np) > 0 else 0,
-            "pointer_length_avg_chars": np.mean(pointer_lengths_np) if len(pointer_lengths_np) > 0 else 0,
-            "recall_latency_p50_ms": np.percentile(latencies_np, 50) * 1000 if len(latencies_np) > 0 else 0,
-            "recall_latency_p90_ms": np.percentile(latencies_np, 90) * 1000 if len(latencies_np) > 0 else 0,
-            "recall_latency_p99_ms": np.percentile(latencies_np, 99) * 1000 if len(latencies_np) > 0 else 0,
-        }
+        with self._lock:
+            uptime_seconds = time.time() - self.start_time
+            recall_p50, recall_p90, recall_p99 = self.recall_latencies.quantiles([0.5, 0.9, 0.99])
+            recall_window_p50, recall_window_p99 = self.recall_latencies.quantiles([0.5, 0.99], window=True)
+
+            proactive_report = {
+                "suggestions_offered_total": self.proactive_suggestions_offered,
+                "tactics_suggested_counts": dict(self.proactive_tactics_suggested)
+            }
+
+            context_branches = {}
+            for branch, histogram in self.context_branch_latencies.items():
+                p50, p99 = histogram.quantiles([0.5, 0.99])
+                context_branches[branch] = {
+                    "latency_p50_ms": p50,
+                    "latency_p99_ms": p99,
+                    "timeouts_total": self.context_branch_timeouts[branch],
+                    "errors_total": self.context_branch_errors[branch],
+                    "requests_per_sec": histogram.rate(),
+                }
+            embedding_lookups = sum(c.total for c in self.embedding_cache_lookups.values())
+            embedding_misses = self.embedding_cache_lookups["miss"].total if "miss" in self.embedding_cache_lookups else 0
+            cache_hits, cache_misses = self.cache_hits.total, self.cache_misses.total
+
+            return {
+                "uptime_seconds": uptime_seconds,
+                "window_seconds": WINDOW_SECONDS,
+                "recall_requests_total": self.recall_latencies.count,
+                "recall_requests_per_sec": self.recall_latencies.rate(),
+                "cache_hits": cache_hits,
+                "cache_misses": cache_misses,
+                "cache_hit_ratio": cache_hits / (cache_hits + cache_misses) if (cache_hits + cache_misses) > 0 else 0,
+                "embedding_cache": {outcome: c.total for outcome, c in self.embedding_cache_lookups.items()},
+                "single_flight": {
+                    name: {
+                        "leader": counts.get("leader", 0),
+                        "coalesced": counts.get("coalesced", 0),
+                        "coalesced_ratio": counts.get("coalesced", 0) / sum(counts.values()) if counts else 0,
+                    }
+                    for name, counts in self.single_flight.items()
+                },
+                "embedding_cache_hit_ratio": (embedding_lookups - embedding_misses) / embedding_lookups if embedding_lookups > 0 else 0,
+                "errors": {error_type: c.total for error_type, c in self.errors.items()},
+                "errors_per_sec": {error_type: c.rate() for error_type, c in self.errors.items()},
+                "proactive_suggestions": proactive_report,
+                "context_build_latency_p99_ms": self.context_build_latencies.quantile(0.99) * 1000,
+                "qdrant_query_latency_p99_ms": self.qdrant_query_latencies.quantile(0.99),
+                "qdrant_queries_per_sec": self.qdrant_query_latencies.rate(),
+                "context_branches": context_branches,
+                "pointer_length_avg_chars": self.pointer_lengths.mean(),
+                "recall_latency_p50_ms": recall_p50 * 1000,
+                "recall_latency_p90_ms": recall_p90 * 1000,
+                "recall_latency_p99_ms": recall_p99 * 1000,
+                "recall_latency_window_p50_ms": recall_window_p50 * 1000,
+                "recall_latency_window_p99_ms": recall_window_p99 * 1000,
+            }
+
+    def render_prometheus(self, prefix: str = "astra_memory") -> str:
+        """Prometheus text exposition (version 0.0.4) of the collected metrics."""
+        lines: List[str] = []
+        quantiles = [0.5, 0.9, 0.99]
+
+        def summary(name: str, help_text: str, histogram: StreamingHistogram, scale: float = 1.0, labels: Optional[Dict[str, str]] = None):
+            label_str = ",".join(f'{k}="{_escape_label(v)}"' for k, v in (labels or {}).items())
+            joiner = "," if label_str else ""
+            if not any(line.startswith(f"# TYPE {prefix}_{name} ") for line in lines):
+                lines.append(f"# HELP {prefix}_{name} {help_text}")
+                lines.append(f"# TYPE {prefix}_{name} summary")
+            for q, value in zip(quantiles, histogram.quantiles(quantiles)):
+                lines.append(f'{prefix}_{name}{{{label_str}{joiner}quantile="{q}"}} {value * scale}')
+            suffix = f"{{{label_str}}}" if label_str else ""
+            lines.append(f"{prefix}_{name}_sum{suffix} {histogram.sum * scale}")
+            lines.append(f"{prefix}_{name}_count{suffix} {histogram.count}")
+
+        def metric(name: str, kind: str, help_text: str, samples: List[Tuple[Dict[str, str], float]]):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                label_str = ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_str}}} {value}" if label_str else f"{prefix}_{name} {value}")
+
+        with self._lock:
+            metric("uptime_seconds", "gauge", "Seconds since the collector started.", [({}, time.time() - self.start_time)])
+            summary("recall_latency_seconds", "LTM recall latency.", self.recall_latencies)
+            metric("recall_requests_per_second", "gauge", f"Recall rate over the last {WINDOW_SECONDS}s.", [({}, self.recall_latencies.rate())])
+            metric("recall_cache_total", "counter", "Recall cache lookups by outcome.", [
+                ({"outcome": "hit"}, self.cache_hits.total),
+                ({"outcome": "miss"}, self.cache_misses.total),
+            ])
+            metric("embedding_cache_total", "counter", "Embedding cache lookups by outcome.", [
+                ({"outcome": outcome}, c.total) for outcome, c in sorted(self.embedding_cache_lookups.items())
+            ])
+            metric("single_flight_total", "counter", "Single-flight calls by outcome (leader executed, coalesced joined).", [
+                ({"name": name, "outcome": outcome}, count)
+                for name, counts in sorted(self.single_flight.items())
+                for outcome, count in sorted(counts.items())
+            ])
+            metric("errors_total", "counter", "Errors by type.", [
+                ({"type": error_type}, c.total) for error_type, c in sorted(self.errors.items())
+            ])
+            summary("context_build_seconds", "Graph context build latency.", self.context_build_latencies)
+            summary("context_pointer_chars", "Graph context length in characters.", self.pointer_lengths)
+            summary("qdrant_query_seconds", "Qdrant request latency.", self.qdrant_query_latencies, scale=0.001)
+            metric("qdrant_queries_per_second", "gauge", f"Qdrant request rate over the last {WINDOW_SECONDS}s.", [({}, self.qdrant_query_latencies.rate())])
+            for branch, histogram in sorted(self.context_branch_latencies.items()):
+                summary("context_branch_seconds", "Graph context retrieval branch latency.", histogram, scale=0.001, labels={"branch": branch})
+            metric("context_branch_timeouts_total", "counter", "Graph context branches that missed their deadline.", [
+                ({"branch": branch}, count) for branch, count in sorted(self.context_branch_timeouts.items())
+            ])
+            metric("context_branch_errors_total", "counter", "Graph context branches that failed.", [
+                ({"branch": branch}, count) for branch, count in sorted(self.context_branch_errors.items())
+            ])
+            metric("proactive_suggestions_total", "counter", "Proactive suggestions offered.", [({}, self.proactive_suggestions_offered)])
+
+        return "\n".join(lines) + "\n"
 
 # Global instance
 metrics_collector = MetricsCollector()
@@ -102,4 +366,13 @@ def record_context_build(duration: float, length: int):
     metrics_collector.record_context_build(duration, length)
 
 def record_qdrant_query(duration: float):
-    metrics_collector.record_qdrant_query(duration)
\ No newline at end of file
+    metrics_collector.record_qdrant_query(duration)
+
+def record_context_branch(branch: str, duration: float, timed_out: bool = False, failed: bool = False):
+    metrics_collector.record_context_branch(branch, duration, timed_out=timed_out, failed=failed)
+
+def record_embedding_cache(outcome: str):
+    metrics_collector.record_embedding_cache(outcome)
+
+def record_single_flight(name: str, outcome: str):
+    metrics_collector.record_single_flight(name, outcome)
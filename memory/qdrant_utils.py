@@ -1,23 +1,118 @@
-from qdrant_client import QdrantClient, models
+import asyncio
+import time
+from typing import Any, Optional, Set
+
+from qdrant_client import AsyncQdrantClient, models
 from .config import settings
+from . import metrics
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-def ensure_collection_exists(collection_name: str):
+class AsyncQdrantPool:
+    """
+    Shared ``AsyncQdrantClient`` for the memory service.
+
+    All Qdrant access goes through one client (gRPC when ``qdrant_prefer_grpc``
+    is set) instead of sync clients wrapped in ``asyncio.to_thread``, so queries
+    no longer occupy default-executor threads. A semaphore bounds in-flight
+    requests and every call's latency is recorded via
+    ``metrics.record_qdrant_query``. Setting ``qdrant_location=":memory:"`` runs
+    an embedded local Qdrant, which tests use instead of a server.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        prefer_grpc: bool = True,
+        grpc_port: int = 6334,
+        max_in_flight: int = 32,
+        timeout: Optional[int] = None,
+        location: Optional[str] = None,
+    ):
+        self.url = url
+        self.prefer_grpc = prefer_grpc
+        self.grpc_port = grpc_port
+        self.max_in_flight = max(int(max_in_flight), 1)
+        self.timeout = timeout
+        self.location = location
+        self._client: Optional[AsyncQdrantClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def client(self) -> AsyncQdrantClient:
+        if self._client is None:
+            if self.location:
+                self._client = AsyncQdrantClient(location=self.location)
+            else:
+                self._client = AsyncQdrantClient(
+                    url=self.url,
+                    prefer_grpc=self.prefer_grpc,
+                    grpc_port=self.grpc_port,
+                    timeout=self.timeout,
+                )
+            logger.info(f"[Qdrant] Async client ready: {self.location or self.url} (grpc={self.prefer_grpc and not self.location}, max_in_flight={self.max_in_flight})")
+        return self._client
+
+    async def _call(self, method: str, **kwargs) -> Any:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        async with self._semaphore:
+            start_time = time.time()
+            try:
+                return await getattr(self.client, method)(**kwargs)
+            finally:
+                metrics.record_qdrant_query((time.time() - start_time) * 1000)
+
+    async def search(self, **kwargs) -> Any:
+        return await self._call("search", **kwargs)
+
+    async def scroll(self, **kwargs) -> Any:
+        return await self._call("scroll", **kwargs)
+
+    async def upsert(self, **kwargs) -> Any:
+        return await self._call("upsert", **kwargs)
+
+    async def get_collection(self, **kwargs) -> Any:
+        return await self._call("get_collection", **kwargs)
+
+    async def create_collection(self, **kwargs) -> Any:
+        return await self._call("create_collection", **kwargs)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+qdrant_pool = AsyncQdrantPool(
+    url=settings.qdrant_url,
+    prefer_grpc=settings.qdrant_prefer_grpc,
+    grpc_port=settings.qdrant_grpc_port,
+    max_in_flight=settings.qdrant_max_in_flight,
+    timeout=settings.qdrant_timeout_seconds,
+    location=settings.qdrant_location,
+)
+
+_known_collections: Set[str] = set()
+
+
+async def ensure_collection_exists(collection_name: str):
     """Checks if a collection exists in Qdrant and creates it if it doesn't."""
+    if collection_name in _known_collections:
+        return
     try:
-        client = QdrantClient(url=settings.qdrant_url)
         try:
-            client.get_collection(collection_name=collection_name)
+            await qdrant_pool.get_collection(collection_name=collection_name)
             logger.info(f"Collection '{collection_name}' already exists.")
         except Exception: # The client throws a generic Exception if the collection is not found
             logger.info(f"Collection '{collection_name}' not found. Creating it.")
-            client.create_collection(
+            await qdrant_pool.create_collection(
                 collection_name=collection_name,
                 vectors_config=models.VectorParams(size=settings.embedding_dim, distance=models.Distance.COSINE),
             )
             logger.info(f"Collection '{collection_name}' created successfully.")
+        _known_collections.add(collection_name)
     except Exception as e:
         logger.error(f"Failed to ensure collection '{collection_name}' exists: {e}")
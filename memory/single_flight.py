@@ -0,0 +1,60 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent identical calls.
+
+    The first caller for a key (the leader) starts the work as a task; callers
+    arriving while it runs await the same task instead of re-executing it. The
+    entry is removed as soon as the task finishes, so the registry only ever
+    holds in-flight keys. Waiters are shielded from each other: a disconnecting
+    client cancels its own wait, not the shared work.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception retrieved in case every waiter went away.
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run ``fn`` once per key among concurrent callers.
+
+        Args:
+            key: Identity of the request
+            fn: Coroutine function doing the work
+
+        Returns:
+            (result, shared) where ``shared`` is True for callers that joined
+            another caller's in-flight work
+        """
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            metrics.record_single_flight(self.name, "coalesced")
+        else:
+            metrics.record_single_flight(self.name, "leader")
+            task = asyncio.create_task(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+        return await asyncio.shield(task), shared
+
+
+recall_flight = SingleFlight("ltm_recall")
+research_recall_flight = SingleFlight("research_recall")
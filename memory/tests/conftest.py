@@ -0,0 +1,21 @@
+"""
+Shared setup for memory service tests.
+
+The memory modules build their clients from settings at import time, so the
+test configuration goes into the environment before any of them is imported:
+an embedded in-process Qdrant (``qdrant_location=":memory:"``) and no shared
+embedding cache.
+"""
+import os
+
+os.environ.setdefault("QDRANT_LOCATION", ":memory:")
+os.environ.setdefault("EMBEDDING_CACHE_ENABLED", "false")
+os.environ.setdefault("OPENAI_API_KEY", "test-key")  # client construction only; tests never call the API
+
+import pytest
+
+
+@pytest.fixture
+def redis_client():
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeAsyncRedis(decode_responses=True)
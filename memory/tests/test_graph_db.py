@@ -0,0 +1,90 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("neo4j")
+
+from memory import graph_db  # noqa: E402
+
+
+@pytest.mark.asyncio
+async def test_get_context_reads_recents_while_topic_mirror_answers(monkeypatch):
+    client = graph_db.GraphDB("bolt://localhost:7687", "neo4j", "test")
+    recents_started = asyncio.Event()
+
+    async def run_query(query, params=None, read_only=False):
+        recents_started.set()
+        return SimpleNamespace(records=[{"speaker": "user", "text": "Shalom", "ts": 1}])
+
+    async def top(session_id, top_k):
+        # Only returns once the recents query is already in flight.
+        await asyncio.wait_for(recents_started.wait(), timeout=1)
+        return [{"topic_slug": "shabbat", "topic_name": "Shabbat", "total_score": 1.0}]
+
+    monkeypatch.setattr(client, "run_query", run_query)
+    monkeypatch.setattr(graph_db.topic_score_mirror, "top", top)
+
+    top_topics, recent_utterances = await client.get_context("s1", horizon_utterances=5, horizon_minutes=10, tau_sec=60)
+
+    assert [t["topic_slug"] for t in top_topics] == ["shabbat"]
+    assert recent_utterances == [{"speaker": "user", "text": "Shalom", "ts": 1}]
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_get_context_scores_unmigrated_sessions_from_mentions_and_seeds_the_mirror(monkeypatch, redis_client):
+    client = graph_db.GraphDB("bolt://localhost:7687", "neo4j", "test")
+    mirror = graph_db.topic_score_mirror
+    now = time.time()
+    queries = []
+
+    async def run_query(query, params=None, read_only=False):
+        queries.append(query)
+        if "TOPIC_SCORE" in query:
+            return SimpleNamespace(records=[])
+        if "MENTIONS" in query:
+            return SimpleNamespace(records=[
+                {"topic_slug": "shabbat", "topic_name": "Shabbat", "score": 1.4, "updated_at": now, "total_score": 1.4},
+                {"topic_slug": "kashrut", "topic_name": "Kashrut", "score": 0.7, "updated_at": now - 60, "total_score": 0.5},
+            ])
+        return SimpleNamespace(records=[])
+
+    monkeypatch.setattr(client, "run_query", run_query)
+    monkeypatch.setattr(mirror, "enabled", True)
+    monkeypatch.setattr(mirror, "client", redis_client)
+
+    top_topics, _ = await client.get_context("s1", horizon_utterances=5, horizon_minutes=10, tau_sec=60, top_k=1)
+
+    assert top_topics == [{"topic_slug": "shabbat", "topic_name": "Shabbat", "total_score": 1.4}]
+    assert sum("MENTIONS" in q for q in queries) == 1
+    # The mirror holds every topic of the session, not just the top-k that was returned.
+    mirrored = await mirror.top("s1", 5)
+    assert [t["topic_slug"] for t in mirrored] == ["shabbat", "kashrut"]
+
+    queries.clear()
+    top_topics, _ = await client.get_context("s1", horizon_utterances=5, horizon_minutes=10, tau_sec=60, top_k=1)
+    assert [t["topic_slug"] for t in top_topics] == ["shabbat"]
+    assert not any("TOPIC_SCORE" in q or "MENTIONS" in q for q in queries)
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_topic_mirror_only_applies_increments_to_seeded_sessions(monkeypatch, redis_client):
+    mirror = graph_db.topic_score_mirror
+    monkeypatch.setattr(mirror, "enabled", True)
+    monkeypatch.setattr(mirror, "client", redis_client)
+    now = time.time()
+
+    # A partial update must not make an unmirrored session look mirrored.
+    await mirror.update("s1", [{"topic_slug": "shabbat", "score": 0.7, "updated_at": now}])
+    assert await mirror.top("s1", 3) is None
+
+    await mirror.seed("s1", [{"topic_slug": "kashrut", "score": 2.0, "updated_at": now}])
+    await mirror.update("s1", [{"topic_slug": "shabbat", "score": 0.7, "updated_at": now}])
+    assert [t["topic_slug"] for t in await mirror.top("s1", 3)] == ["kashrut", "shabbat"]
+
+    # Sessions without topics are mirrored as empty, so they do not go back to Neo4j.
+    await mirror.seed("s2", [])
+    assert await mirror.top("s2", 3) == []
@@ -0,0 +1,12 @@
+import pytest
+
+pytest.importorskip("qdrant_client")
+
+from memory.k_graph import k_graph_client  # noqa: E402
+
+
+@pytest.mark.asyncio
+async def test_search_errors_reach_the_caller():
+    # /graph/context records a failed branch only if the search raises instead of returning [].
+    with pytest.raises(Exception):
+        await k_graph_client.search(keywords="shabbat candles", collection="no_such_collection")
@@ -0,0 +1,189 @@
+import json
+
+import pytest
+
+pytest.importorskip("qdrant_client")
+
+from qdrant_client import models  # noqa: E402
+
+from memory import worker  # noqa: E402
+from memory.config import settings  # noqa: E402
+from memory.k_graph import k_graph_client  # noqa: E402
+
+
+def _raw(text: str, collection: str = "facts", attempts: int = 0) -> str:
+    item = {"text": text, "session_id": "s1", "metadata": {"chunk_index": text}}
+    payload = {"item_json": json.dumps(item), "collection": collection}
+    if attempts:
+        payload["attempts"] = attempts
+    return json.dumps(payload)
+
+
+async def _claim_batch(redis_client, items, token="worker-a"):
+    slot = await worker._claim_slot(redis_client, token)
+    await redis_client.rpush(settings.ingest_queue_name, *items)
+    batch = await worker._fetch_batch(redis_client, worker._processing_key(slot))
+    assert batch == items
+    return slot, token, batch
+
+
+class TestBatchFailureIsolation:
+    @pytest.mark.asyncio
+    async def test_poison_item_does_not_fail_its_batch(self, redis_client, monkeypatch):
+        ingested, calls = [], []
+
+        async def fake_ingest_batch(items, collection):
+            calls.append(len(items))
+            if any(item["text"] == "poison" for item in items):
+                raise ValueError("cannot embed")
+            ingested.extend(item["text"] for item in items)
+            return len(items)
+
+        monkeypatch.setattr(worker, "ingest_batch", fake_ingest_batch)
+        texts = [f"fact {i}" for i in range(7)]
+        texts.insert(5, "poison")
+        slot, token, batch = await _claim_batch(redis_client, [_raw(t) for t in texts])
+        stats = {"processed": 0, "errors": 0, "dead_lettered": 0, "deferred": 0}
+
+        await worker._process_batch(redis_client, slot, token, batch, stats)
+
+        assert sorted(ingested) == sorted(t for t in texts if t != "poison")
+        assert stats == {"processed": 7, "errors": 1, "dead_lettered": 0, "deferred": 0}
+        retried = [json.loads(raw) for raw in await redis_client.lrange(settings.ingest_queue_name, 0, -1)]
+        assert [json.loads(r["item_json"])["text"] for r in retried] == ["poison"]
+        assert retried[0]["attempts"] == 1
+        assert await redis_client.llen(worker._processing_key(slot)) == 0
+        assert len(calls) < 2 * len(texts)
+
+    @pytest.mark.asyncio
+    async def test_systemic_failure_retries_batch_without_per_item_calls(self, redis_client, monkeypatch):
+        calls = []
+
+        async def failing_ingest_batch(items, collection):
+            calls.append(len(items))
+            raise ConnectionError("qdrant unavailable")
+
+        monkeypatch.setattr(worker, "ingest_batch", failing_ingest_batch)
+        items = [_raw(f"fact {i}") for i in range(8)]
+        items.append(_raw("last try", attempts=settings.ingest_max_attempts - 1))
+        slot, token, batch = await _claim_batch(redis_client, items)
+        stats = {"processed": 0, "errors": 0, "dead_lettered": 0, "deferred": 0}
+
+        stalled = await worker._process_batch(redis_client, slot, token, batch, stats)
+
+        assert stalled
+        assert calls == [9, 4, 5]
+        assert stats == {"processed": 0, "errors": 9, "dead_lettered": 0, "deferred": 9}
+        # An outage is not the items' fault: they go back unchanged, nothing is dead-lettered.
+        assert await redis_client.lrange(settings.ingest_queue_name, 0, -1) == items
+        assert await redis_client.llen(worker._dead_letter_key()) == 0
+
+    @pytest.mark.asyncio
+    async def test_transient_outage_loses_nothing(self, redis_client, monkeypatch):
+        outage = {"batches_left": 3 * settings.ingest_max_attempts}
+        ingested = []
+
+        async def flaky_ingest_batch(items, collection):
+            if outage["batches_left"] > 0:
+                outage["batches_left"] -= 1
+                raise ConnectionError("embedding provider unavailable")
+            ingested.extend(item["text"] for item in items)
+            return len(items)
+
+        monkeypatch.setattr(worker, "ingest_batch", flaky_ingest_batch)
+        monkeypatch.setattr(settings, "ingest_batch_size", 10)
+        items = [_raw(f"fact {i}") for i in range(30)]
+        slot = await worker._claim_slot(redis_client, "worker-a")
+        await redis_client.rpush(settings.ingest_queue_name, *items)
+        stats = {"processed": 0, "errors": 0, "dead_lettered": 0, "deferred": 0}
+
+        while await redis_client.llen(settings.ingest_queue_name):
+            batch = await worker._fetch_batch(redis_client, worker._processing_key(slot))
+            await worker._process_batch(redis_client, slot, "worker-a", batch, stats)
+
+        assert sorted(ingested) == sorted(f"fact {i}" for i in range(30))
+        assert stats["dead_lettered"] == 0
+        assert await redis_client.llen(worker._dead_letter_key()) == 0
+
+    def test_backoff_grows_to_a_ceiling_below_the_lease_ttl(self):
+        backoff, pauses = 0.0, []
+        for _ in range(10):
+            backoff = worker._next_backoff(backoff)
+            pauses.append(backoff)
+
+        assert pauses[:3] == [settings.ingest_retry_backoff_seconds * 2 ** i for i in range(3)]
+        assert max(pauses) == min(settings.ingest_retry_backoff_max_seconds, settings.ingest_lease_ttl_seconds / 2)
+
+    @pytest.mark.asyncio
+    async def test_dead_letters_can_be_requeued_with_fresh_attempts(self, redis_client):
+        dead = [_raw("poison", attempts=settings.ingest_max_attempts), _raw("other", attempts=2)]
+        await redis_client.rpush(worker._dead_letter_key(), *dead)
+
+        assert await worker.requeue_dead_letters(redis_client, limit=1) == 1
+        assert await worker.requeue_dead_letters(redis_client) == 1
+
+        requeued = [json.loads(raw) for raw in await redis_client.lrange(settings.ingest_queue_name, 0, -1)]
+        assert [json.loads(r["item_json"])["text"] for r in requeued] == ["poison", "other"]
+        assert all("attempts" not in r for r in requeued)
+        assert await redis_client.llen(worker._dead_letter_key()) == 0
+
+
+class TestSlotLease:
+    @pytest.mark.asyncio
+    async def test_worker_that_lost_its_lease_leaves_the_slot_alone(self, redis_client, monkeypatch):
+        async def fake_ingest_batch(items, collection):
+            return len(items)
+
+        monkeypatch.setattr(worker, "ingest_batch", fake_ingest_batch)
+        slot, token, batch = await _claim_batch(redis_client, [_raw("a"), _raw("b")])
+        # The lease expired mid-batch and another worker claimed the slot.
+        await redis_client.set(worker._lease_key(slot), "worker-b")
+        stats = {"processed": 0, "errors": 0, "dead_lettered": 0, "deferred": 0}
+
+        with pytest.raises(worker._LeaseLost):
+            await worker._process_batch(redis_client, slot, token, batch, stats)
+
+        assert await redis_client.lrange(worker._processing_key(slot), 0, -1) == batch
+        assert not await worker._renew_lease(redis_client, slot, token)
+        assert await worker._requeue_processing(redis_client, slot, token) == -1
+        assert not await worker._release_lease(redis_client, slot, token)
+        assert await redis_client.get(worker._lease_key(slot)) == "worker-b"
+        # The new owner recovers the items the old one never acknowledged.
+        assert await worker._requeue_processing(redis_client, slot, "worker-b") == 2
+        assert await redis_client.lrange(settings.ingest_queue_name, 0, -1) == batch
+
+
+class TestIngestIntoQdrant:
+    """End to end through the worker's batch path into the embedded Qdrant (qdrant_location=":memory:")."""
+
+    COLLECTION = "test_ingest_facts"
+
+    @pytest.fixture
+    def fake_embeddings(self, monkeypatch):
+        async def embed(texts):
+            return [[float(len(text)), 1.0, 0.0, 0.5] for text in texts]
+
+        monkeypatch.setattr(k_graph_client, "_get_embeddings", embed)
+
+    @pytest.mark.asyncio
+    async def test_worker_batch_upserts_points(self, redis_client, fake_embeddings):
+        assert settings.qdrant_location == ":memory:"
+        qdrant = k_graph_client.qdrant
+        await qdrant.create_collection(
+            collection_name=self.COLLECTION,
+            vectors_config=models.VectorParams(size=4, distance=models.Distance.COSINE),
+        )
+        texts = ["Shabbat candles are lit before sunset", "Rashi on Genesis 1:1", "Rashi on Genesis 1:1"]
+        items = [_raw(text, collection=self.COLLECTION) for text in texts]
+        slot, token, batch = await _claim_batch(redis_client, items)
+        stats = {"processed": 0, "errors": 0, "dead_lettered": 0, "deferred": 0}
+
+        await worker._process_batch(redis_client, slot, token, batch, stats)
+
+        assert stats == {"processed": 3, "errors": 0, "dead_lettered": 0, "deferred": 0}
+        assert await redis_client.llen(settings.ingest_queue_name) == 0
+        assert await redis_client.llen(worker._processing_key(slot)) == 0
+        points, _ = await qdrant.scroll(collection_name=self.COLLECTION, with_payload=True, with_vectors=True)
+        # Identical facts get the same deterministic point id, so they land once.
+        assert sorted(point.payload["text"] for point in points) == sorted(set(texts))
+        assert all(len(point.vector) == 4 for point in points)
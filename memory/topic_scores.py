@@ -0,0 +1,112 @@
+import math
+import time
+import logging
+from typing import Dict, List, Optional
+
+import redis.asyncio as redis
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Rebase the forward-decay anchor before exp() grows past float precision comfort.
+_MAX_EXPONENT = 50.0
+
+
+class TopicScoreMirror:
+    """
+    Redis mirror of the per-session decayed topic scores kept on Session-[:TOPIC_SCORE]->Topic.
+
+    Scores use forward decay: each topic is stored as
+    ``score * exp((updated_at - anchor) / tau)`` relative to a per-session anchor,
+    so the ranking does not change as time passes and the top-k topics are one
+    ZREVRANGE. The caller multiplies by ``exp((anchor - now) / tau)`` to get the
+    current score. When the exponent grows too large, the anchor moves forward
+    and the whole set is rescaled in one ZUNIONSTORE.
+    """
+
+    def __init__(self, redis_url: str, tau_sec: float, ttl_sec: int, enabled: bool = False):
+        self.tau_sec = float(tau_sec)
+        self.ttl_sec = ttl_sec
+        self.enabled = enabled
+        self.client = redis.from_url(redis_url, decode_responses=True) if enabled else None
+
+    @staticmethod
+    def _keys(session_id: str):
+        base = f"topic_scores:{session_id}"
+        return base, f"{base}:anchor"
+
+    async def update(self, session_id: str, scores: List[Dict]):
+        """
+        Apply topic scores returned by GraphDB.update_dialog ({topic_slug, score, updated_at}).
+
+        They only cover the topics of one utterance, so a session that is not mirrored
+        is left alone here. GraphDB.get_context seeds it with every topic on the next miss.
+        """
+        if not self.enabled or not scores:
+            return
+        key, anchor_key = self._keys(session_id)
+        try:
+            anchor_raw = await self.client.get(anchor_key)
+            if anchor_raw is None:
+                return
+            newest = max(s["updated_at"] for s in scores)
+            anchor = float(anchor_raw)
+            pipe = self.client.pipeline(transaction=True)
+            if (newest - anchor) / self.tau_sec > _MAX_EXPONENT:
+                factor = math.exp((anchor - newest) / self.tau_sec)
+                anchor = newest
+                pipe.zunionstore(key, {key: factor})
+                pipe.set(anchor_key, anchor)
+            pipe.zadd(key, self._forward(scores, anchor))
+            pipe.expire(key, self.ttl_sec)
+            pipe.expire(anchor_key, self.ttl_sec)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"[TopicScores] Redis update failed for session {session_id}: {e}")
+
+    async def seed(self, session_id: str, scores: List[Dict]):
+        """Replace the session's mirror with all of its topic scores as read from Neo4j."""
+        if not self.enabled:
+            return
+        key, anchor_key = self._keys(session_id)
+        anchor = max((s["updated_at"] for s in scores), default=time.time())
+        try:
+            pipe = self.client.pipeline(transaction=True)
+            pipe.delete(key)
+            if scores:
+                pipe.zadd(key, self._forward(scores, anchor))
+                pipe.expire(key, self.ttl_sec)
+            pipe.set(anchor_key, anchor, ex=self.ttl_sec)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"[TopicScores] Redis seed failed for session {session_id}: {e}")
+
+    def _forward(self, scores: List[Dict], anchor: float) -> Dict[str, float]:
+        return {s["topic_slug"]: s["score"] * math.exp((s["updated_at"] - anchor) / self.tau_sec) for s in scores}
+
+    async def top(self, session_id: str, k: int) -> Optional[List[Dict]]:
+        """Top-k topics with their current decayed score, or None if the session is not mirrored."""
+        if not self.enabled:
+            return None
+        key, anchor_key = self._keys(session_id)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.get(anchor_key)
+            pipe.zrevrange(key, 0, k - 1, withscores=True)
+            anchor_raw, rows = await pipe.execute()
+        except Exception as e:
+            logger.warning(f"[TopicScores] Redis read failed for session {session_id}: {e}")
+            return None
+        if anchor_raw is None:
+            return None
+        scale = math.exp((float(anchor_raw) - time.time()) / self.tau_sec)
+        return [{"topic_slug": slug, "topic_name": None, "total_score": value * scale} for slug, value in rows]
+
+
+topic_score_mirror = TopicScoreMirror(
+    redis_url=settings.redis_url,
+    tau_sec=settings.context_decay_tau_sec,
+    ttl_sec=settings.context_topic_scores_ttl_seconds,
+    enabled=settings.context_topic_scores_redis_enabled,
+)
@@ -5,7 +5,10 @@ import logging
 import hashlib
 import uuid
 import time
-from typing import Dict, Any
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+
+from qdrant_client import models
 
 from .config import settings
 from .models import MemoryItem
@@ -19,89 +22,395 @@ logger = get_logger("memory.worker", service="memory")
 def generate_slug(name: str) -> str:
     return name.lower().replace(' ', '-').strip()
 
-async def ingest_fact(fact_item: Dict[str, Any], collection: str):
+def _processing_key(slot: int) -> str:
+    return f"{settings.ingest_queue_name}:processing:{slot}"
+
+def _lease_key(slot: int) -> str:
+    return f"{settings.ingest_queue_name}:processing:{slot}:lease"
+
+def _dead_letter_key() -> str:
+    return f"{settings.ingest_queue_name}:dead"
+
+# Lease-guarded slot operations. A worker whose lease expired and was claimed by
+# another worker must not renew, ack or release the slot it no longer owns.
+_RENEW_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then return 0 end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return 1
+"""
+
+_RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then return 0 end
+return redis.call('DEL', KEYS[1])
+"""
+
+# Moves the slot's unacknowledged items back to the head of the queue; -1 if the lease is not ours.
+_REQUEUE_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then return -1 end
+local moved = 0
+while redis.call('LMOVE', KEYS[2], KEYS[3], 'RIGHT', 'LEFT') do
+    moved = moved + 1
+end
+return moved
+"""
+
+# ARGV: token, #batch, #retry, batch items..., retry items..., dead items...
+# Only the batch's own items leave the processing list; anything else stays for recovery.
+_ACK_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then return 0 end
+local n_batch = tonumber(ARGV[2])
+local n_retry = tonumber(ARGV[3])
+local first_retry = 4 + n_batch
+local first_dead = first_retry + n_retry
+for i = 4, first_retry - 1 do
+    redis.call('LREM', KEYS[2], 1, ARGV[i])
+end
+for i = first_retry, first_dead - 1 do
+    redis.call('RPUSH', KEYS[3], ARGV[i])
+end
+for i = first_dead, #ARGV do
+    redis.call('RPUSH', KEYS[4], ARGV[i])
+end
+return 1
+"""
+
+# Moves dead letters back to the ingest queue with their attempt count reset.
+# ARGV[1] is the maximum number of items to move (0 = all).
+_REQUEUE_DEAD_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local moved = 0
+while limit <= 0 or moved < limit do
+    local raw = redis.call('LPOP', KEYS[1])
+    if not raw then break end
+    local ok, item = pcall(cjson.decode, raw)
+    if ok and type(item) == 'table' then
+        item.attempts = nil
+        raw = cjson.encode(item)
+    end
+    redis.call('RPUSH', KEYS[2], raw)
+    moved = moved + 1
+end
+return moved
+"""
+
+class _LeaseLost(Exception):
+    """The slot lease expired and another worker claimed the slot."""
+
+def _build_point(fact_item: Dict[str, Any], collection: str) -> Optional[Tuple[str, str, Dict[str, Any]]]:
+    """Returns (text, point_id, payload) for a fact, or None if it has nothing to embed."""
+    metadata = fact_item.get("metadata") or {}
+    text = fact_item.get("text", "")
+    if not text:
+        logger.warning("Skipping ingestion of empty text chunk", extra={"event": "ingest_skip", "reason": "empty_text"})
+        return None
+
+    session_id = fact_item.get("session_id", "unknown")
+    fact_id_basis = "|".join(str(p) for p in (session_id, collection, metadata.get("origin_ref"), metadata.get("commentator"), metadata.get("chunk_index")))
+    fact_id = hashlib.sha256(f"{fact_id_basis}|{text}".encode("utf-8")).hexdigest()
+    point_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, fact_id))
+    return text, point_id, {"fact_id": fact_id, "text": text, **metadata}
+
+async def ingest_batch(fact_items: List[Dict[str, Any]], collection: str) -> int:
     """
-    Idempotent fact ingestion pipeline. Logging is handled by the calling worker.
+    Idempotent batch ingestion: one embeddings request and one Qdrant upsert per call.
+    Logging of outcomes is handled by the calling worker.
     """
     try:
-        metadata = fact_item.get("metadata") or {}
-        text = fact_item.get("text", "")
-        if not text:
-            logger.warning("Skipping ingestion of empty text chunk", extra={"event": "ingest_skip", "reason": "empty_text"})
-            return
-
-        session_id = fact_item.get("session_id", "unknown")
-        fact_id_basis = "|".join(str(p) for p in (session_id, collection, metadata.get("origin_ref"), metadata.get("commentator"), metadata.get("chunk_index")))
-        fact_id = hashlib.sha256(f"{fact_id_basis}|{text}".encode("utf-8")).hexdigest()
-
-        embedding = await k_graph_client._get_embedding(text)
-
-        # Simplified Neo4j and Qdrant upsert logic from the original file
-        # ... (neo4j_query and graph_db_client.run_query call) ...
-        # ... (qdrant_cli.upsert call) ...
-        point_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, fact_id))
-        await asyncio.to_thread(
-            k_graph_client.qdrant_cli.upsert,
+        prepared = [p for p in (_build_point(item, collection) for item in fact_items) if p is not None]
+        if not prepared:
+            return 0
+
+        embeddings = await k_graph_client._get_embeddings([text for text, _, _ in prepared])
+        # PointStruct, not dicts: the gRPC client only converts PointStruct and rejects plain dicts.
+        points = [
+            models.PointStruct(id=point_id, vector=embedding, payload=payload)
+            for (_, point_id, payload), embedding in zip(prepared, embeddings)
+        ]
+        await k_graph_client.qdrant.upsert(
             collection_name=collection,
-            points=[{"id": point_id, "vector": embedding, "payload": {"fact_id": fact_id, "text": text, **metadata}}]
+            points=points
         )
+        return len(points)
 
     except Exception as e:
-        logger.error(f"Failed to ingest fact: {e}", exc_info=True, extra={"event": "ingest_fact_failed"})
+        logger.error(f"Failed to ingest batch: {e}", exc_info=True, extra={"event": "ingest_batch_failed", "collection": collection, "batch_size": len(fact_items)})
         raise # Re-raise the exception to be caught by the worker loop
 
-async def run_worker():
+async def ingest_fact(fact_item: Dict[str, Any], collection: str):
     """
-    Worker that fetches items from Redis and ingests them, with summary logging.
+    Idempotent fact ingestion pipeline. Logging is handled by the calling worker.
     """
-    redis_client = aredis.from_url(settings.redis_url, decode_responses=True)
-    logger.info("Ingest worker started and connected to Redis", extra={"event": "worker_started"})
+    await ingest_batch([fact_item], collection)
 
-    processed_count = 0
-    error_count = 0
-    last_log_time = time.time()
-    log_interval = 10  # Log summary every 10 seconds
+async def _claim_slot(redis_client: aredis.Redis, token: str) -> Optional[int]:
+    """Leases a processing slot; a slot whose lease expired belongs to a crashed worker."""
+    for slot in range(settings.ingest_worker_slots):
+        if await redis_client.set(_lease_key(slot), token, nx=True, ex=settings.ingest_lease_ttl_seconds):
+            return slot
+    return None
+
+async def _renew_lease(redis_client: aredis.Redis, slot: int, token: str) -> bool:
+    return bool(await redis_client.eval(_RENEW_LEASE_SCRIPT, 1, _lease_key(slot), token, settings.ingest_lease_ttl_seconds))
+
+async def _release_lease(redis_client: aredis.Redis, slot: int, token: str) -> bool:
+    return bool(await redis_client.eval(_RELEASE_LEASE_SCRIPT, 1, _lease_key(slot), token))
+
+async def _requeue_processing(redis_client: aredis.Redis, slot: int, token: str) -> int:
+    """Moves unacknowledged items of a slot back to the head of the ingest queue; -1 if the slot is not ours."""
+    return int(await redis_client.eval(
+        _REQUEUE_SCRIPT, 3, _lease_key(slot), _processing_key(slot), settings.ingest_queue_name, token
+    ))
+
+async def _fetch_batch(redis_client: aredis.Redis, processing_key: str) -> List[str]:
+    """Moves up to ingest_batch_size items into the processing list, waiting at most ingest_batch_timeout_ms after the first."""
+    queue = settings.ingest_queue_name
+    first = await redis_client.blmove(queue, processing_key, 5, "LEFT", "RIGHT")
+    if first is None:
+        return []
+
+    batch = [first]
+    deadline = time.monotonic() + settings.ingest_batch_timeout_ms / 1000
+    while len(batch) < settings.ingest_batch_size:
+        item = await redis_client.lmove(queue, processing_key, "LEFT", "RIGHT")
+        if item is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # BLMOVE treats 0 as "block forever"
+            item = await redis_client.blmove(queue, processing_key, max(remaining, 0.01), "LEFT", "RIGHT")
+            if item is None:
+                break
+        batch.append(item)
+    return batch
+
+Entry = Tuple[str, Dict[str, Any], Dict[str, Any]]  # (raw queue item, queue payload, fact item)
+
+async def _ingest_entries(entries: List[Entry], collection: str) -> None:
+    await ingest_batch([item_data for _, _, item_data in entries], collection)
+
+async def _bisect(entries: List[Entry], collection: str) -> Tuple[int, List[Entry]]:
+    """
+    Splits a failing batch to find the items that fail on their own.
+
+    When both halves fail the error is not tied to one item (Qdrant or the embedding
+    provider is down, or several bad items), so the whole half is reported failed
+    instead of degrading into one call per item.
+    """
+    mid = len(entries) // 2
+    halves = (entries[:mid], entries[mid:])
+    errors = []
+    for half in halves:
+        try:
+            await _ingest_entries(half, collection)
+            errors.append(None)
+        except Exception as e:
+            errors.append(e)
+    if all(errors):
+        return 0, list(entries)
+
+    ingested, failed = 0, []
+    for half, error in zip(halves, errors):
+        if error is None:
+            ingested += len(half)
+        elif len(half) == 1:
+            failed.extend(half)
+        else:
+            half_ingested, half_failed = await _bisect(half, collection)
+            ingested += half_ingested
+            failed.extend(half_failed)
+    return ingested, failed
+
+async def _ingest_isolating(entries: List[Entry], collection: str) -> Tuple[int, List[Entry], bool]:
+    """
+    Ingests entries as one batch; if it fails, bisects so a poison item does not fail its neighbours.
+
+    Returns (ingested, failed, systemic). A failure is systemic when a batch of several
+    items failed as a whole (both halves too), i.e. it is not tied to any one item.
+    """
+    try:
+        await _ingest_entries(entries, collection)
+        return len(entries), [], False
+    except Exception:
+        if len(entries) == 1:
+            return 0, list(entries), False
+    ingested, failed = await _bisect(entries, collection)
+    if ingested:
+        logger.warning(
+            f"Isolated {len(failed)} failing item(s) in a batch of {len(entries)}",
+            extra={"event": "ingest_batch_bisected", "collection": collection, "failed": len(failed), "ingested": ingested},
+        )
+    return ingested, failed, not ingested
+
+async def _process_batch(redis_client: aredis.Redis, slot: int, token: str, batch: List[str], stats: Dict[str, int]) -> bool:
+    """
+    Ingests a fetched batch, then acknowledges it: failures are re-queued or dead-lettered.
+
+    Only failures tied to an item count against ingest_max_attempts; items of a batch
+    that failed as a whole (Qdrant or the embedding provider down) are re-queued as
+    they were. Returns True if nothing was ingested and something failed, so the
+    caller backs off instead of spinning through the queue during an outage.
+    """
+    groups: Dict[str, List[Entry]] = defaultdict(list)
+    dead: List[str] = []
+    for raw in batch:
+        try:
+            payload = json.loads(raw)
+            item_data = json.loads(payload["item_json"])
+            groups[payload["collection"]].append((raw, payload, item_data))
+        except Exception as e:
+            logger.error(f"Dropping malformed ingest item: {e}", extra={"event": "ingest_malformed"})
+            dead.append(raw)
+
+    retry: List[str] = []
+    total_ingested = total_failed = 0
+    for collection, entries in groups.items():
+        ingested, failed, systemic = await _ingest_isolating(entries, collection)
+        stats["processed"] += ingested
+        stats["errors"] += len(failed)
+        total_ingested += ingested
+        total_failed += len(failed)
+        if systemic:
+            stats["deferred"] += len(failed)
+            retry.extend(raw for raw, _, _ in failed)
+            continue
+        for raw, payload, _ in failed:
+            attempts = int(payload.get("attempts", 0)) + 1
+            if attempts >= settings.ingest_max_attempts:
+                dead.append(raw)
+            else:
+                retry.append(json.dumps({**payload, "attempts": attempts}))
+
+    # Ack: remove the batch from the processing list and push retries/dead letters atomically,
+    # but only while this worker still holds the slot.
+    acked = await redis_client.eval(
+        _ACK_SCRIPT, 4,
+        _lease_key(slot), _processing_key(slot), settings.ingest_queue_name, _dead_letter_key(),
+        token, len(batch), len(retry), *batch, *retry, *dead,
+    )
+    if not acked:
+        raise _LeaseLost(slot)
+    stats["dead_lettered"] += len(dead)
+    return total_failed > 0 and total_ingested == 0
+
+def _next_backoff(backoff: float) -> float:
+    # Capped below the lease TTL, so the lease is renewed in time after the pause.
+    ceiling = min(settings.ingest_retry_backoff_max_seconds, settings.ingest_lease_ttl_seconds / 2)
+    return min(max(backoff * 2, settings.ingest_retry_backoff_seconds), ceiling)
+
+async def requeue_dead_letters(redis_client: aredis.Redis, limit: int = 0) -> int:
+    """Moves up to `limit` (0 = all) dead-lettered items back to the ingest queue with fresh attempts."""
+    return int(await redis_client.eval(_REQUEUE_DEAD_SCRIPT, 2, _dead_letter_key(), settings.ingest_queue_name, limit))
+
+async def _acquire_slot(redis_client: aredis.Redis, token: str, worker_id: int) -> int:
+    while True:
+        try:
+            slot = await _claim_slot(redis_client, token)
+            if slot is None:
+                logger.warning("No free ingest worker slot, retrying", extra={"event": "worker_slot_wait", "worker_id": worker_id})
+                await asyncio.sleep(settings.ingest_lease_ttl_seconds / 2)
+                continue
+            recovered = await _requeue_processing(redis_client, slot, token)
+            if recovered > 0:
+                logger.info(f"Re-queued {recovered} unacknowledged items from slot {slot}", extra={"event": "worker_recovered", "slot": slot, "count": recovered})
+            return slot
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to claim ingest worker slot: {e}", extra={"event": "worker_slot_failed", "worker_id": worker_id})
+            await asyncio.sleep(1)
 
+async def _run_slot(redis_client: aredis.Redis, slot: int, token: str, worker_id: int, stats: Dict[str, int]) -> None:
+    backoff = 0.0
     try:
         while True:
             try:
-                items_json = await redis_client.blpop(settings.ingest_queue_name, timeout=5)
-                if not items_json:
-                    # Log summary if interval has passed and there's something to log
-                    if time.time() - last_log_time > log_interval and (processed_count > 0 or error_count > 0):
-                        logger.info(f"Ingestion summary: {processed_count} success, {error_count} errors.", extra={
-                            "event": "ingestion_summary",
-                            "processed_count": processed_count,
-                            "error_count": error_count,
-                            "period_seconds": int(time.time() - last_log_time)
-                        })
-                        processed_count = 0
-                        error_count = 0
-                        last_log_time = time.time()
-                    continue
-
-                payload = json.loads(items_json[1])
-                item_data = json.loads(payload["item_json"])
-                collection = payload["collection"]
-
-                await ingest_fact(item_data, collection)
-                processed_count += 1
-
-            except asyncio.CancelledError:
-                logger.info("Ingest worker received cancellation request.", extra={"event": "worker_cancelled"})
-                break
+                if not await _renew_lease(redis_client, slot, token):
+                    raise _LeaseLost(slot)
+                batch = await _fetch_batch(redis_client, _processing_key(slot))
+                if batch:
+                    stats["batches"] += 1
+                    if await _process_batch(redis_client, slot, token, batch, stats):
+                        backoff = _next_backoff(backoff)
+                        logger.warning(f"Ingest batch failed as a whole, pausing {backoff:.1f}s", extra={"event": "ingest_backoff", "worker_id": worker_id, "backoff_seconds": backoff})
+                        await asyncio.sleep(backoff)
+                    else:
+                        backoff = 0.0
+            except (asyncio.CancelledError, _LeaseLost):
+                raise
             except Exception as e:
-                error_count += 1
-                logger.error(f"An error occurred in ingest worker loop: {e}", exc_info=True, extra={"event": "worker_loop_error"})
+                stats["errors"] += 1
+                logger.error(f"An error occurred in ingest worker loop: {e}", exc_info=True, extra={"event": "worker_loop_error", "worker_id": worker_id})
                 await asyncio.sleep(1) # Avoid rapid-fire errors
+                try:
+                    # Unacknowledged items go back to the queue rather than waiting for recovery.
+                    await _requeue_processing(redis_client, slot, token)
+                except Exception:
+                    pass
+    finally:
+        try:
+            # Both are no-ops once the slot belongs to another worker.
+            await _requeue_processing(redis_client, slot, token)
+            await _release_lease(redis_client, slot, token)
+        except Exception as e:
+            logger.warning(f"Failed to release ingest worker slot {slot}: {e}", extra={"event": "worker_release_failed"})
+
+async def _worker_loop(redis_client: aredis.Redis, worker_id: int, stats: Dict[str, int]) -> None:
+    token = uuid.uuid4().hex
+    while True:
+        slot = await _acquire_slot(redis_client, token, worker_id)
+        try:
+            await _run_slot(redis_client, slot, token, worker_id, stats)
+        except _LeaseLost:
+            # The new owner re-queues whatever this worker left in the slot.
+            stats["leases_lost"] += 1
+            logger.warning(f"Lost the lease on ingest slot {slot}; claiming a new one", extra={"event": "worker_lease_lost", "worker_id": worker_id, "slot": slot})
+
+async def run_worker():
+    """
+    Runs ingest_worker_concurrency batch workers over the Redis queue, with summary logging.
+
+    Each worker moves items into its own processing list (BLMOVE), so items are only
+    removed once ingested; a crashed worker's list is re-queued by whoever leases its slot next.
+    Renewing, acknowledging and releasing check the lease token, so a worker that lost
+    its lease cannot touch the slot's new owner's items. A failing batch is bisected, so
+    only the items that fail on their own are charged an attempt and eventually dead-lettered;
+    when a whole batch fails the worker backs off exponentially. ``requeue_dead_letters``
+    (POST /ltm/dead_letters/requeue) puts dead letters back on the queue.
+    """
+    redis_client = aredis.from_url(settings.redis_url, decode_responses=True)
+    concurrency = max(settings.ingest_worker_concurrency, 1)
+    logger.info("Ingest worker started and connected to Redis", extra={"event": "worker_started", "concurrency": concurrency})
+
+    stats: Dict[str, int] = defaultdict(int)
+    log_interval = 10  # Log summary every 10 seconds
+    workers = [asyncio.create_task(_worker_loop(redis_client, i, stats)) for i in range(concurrency)]
+    last_log_time = time.time()
+
+    def log_summary(message: str):
+        logger.info(message.format_map(stats), extra={
+            "event": "ingestion_summary",
+            "processed_count": stats["processed"],
+            "error_count": stats["errors"],
+            "batch_count": stats["batches"],
+            "dead_lettered_count": stats["dead_lettered"],
+            "period_seconds": int(time.time() - last_log_time)
+        })
+
+    try:
+        while True:
+            await asyncio.sleep(log_interval)
+            if stats["processed"] > 0 or stats["errors"] > 0:
+                log_summary("Ingestion summary: {processed} success in {batches} batches, {errors} errors.")
+                stats.clear()
+                last_log_time = time.time()
+    except asyncio.CancelledError:
+        logger.info("Ingest worker received cancellation request.", extra={"event": "worker_cancelled"})
     finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
         # Final log before shutting down
-        if processed_count > 0 or error_count > 0:
-            logger.info(f"Final ingestion summary: {processed_count} success, {error_count} errors.", extra={
-                "event": "ingestion_summary",
-                "processed_count": processed_count,
-                "error_count": error_count,
-                "period_seconds": int(time.time() - last_log_time)
-            })
+        if stats["processed"] > 0 or stats["errors"] > 0:
+            log_summary("Final ingestion summary: {processed} success in {batches} batches, {errors} errors.")
         await redis_client.close()
-        logger.info("Ingest worker shut down gracefully.", extra={"event": "worker_shutdown"})
\ No newline at end of file
+        logger.info("Ingest worker shut down gracefully.", extra={"event": "worker_shutdown"})
@@ -0,0 +1,121 @@
+"""
+Benchmark: memory.graph_db.GraphDB.update_dialog against a live Neo4j.
+
+Appends N utterances to a fresh session twice: once with the previous query
+(predecessor found by scanning the session's utterances for the newest
+earlier ts) and once with the current Session-LAST tail pointer. It prints
+the mean per-insert latency for every block of utterances. With the legacy
+query this grows with session length. With the tail pointer it stays flat.
+Benchmark sessions are deleted afterwards. It also checks that both runs
+produce a single unbroken FOLLOWS chain.
+
+Usage:
+    python scripts/bench_dialog_append.py [--count 10000] [--block 1000] [--topics 2]
+        [--uri bolt://localhost:7687] [--user neo4j] [--password ...]
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from memory import models  # noqa: E402
+from memory.config import settings  # noqa: E402
+from memory.graph_db import GraphDB  # noqa: E402
+
+LEGACY_QUERY = """
+MERGE (u:Utterance {utt_id: $utt_id})
+SET u.session_id = $session_id, u.ts = datetime($ts), u.speaker = $speaker, u.text = $text
+MERGE (s:Session {session_id: $session_id}) ON CREATE SET s.start_ts = u.ts SET s.end_ts = u.ts
+MERGE (u)-[:IN]->(s)
+WITH u
+MATCH (prev:Utterance {session_id: $session_id}) WHERE prev.ts < u.ts
+WITH u, prev ORDER BY prev.ts DESC LIMIT 1
+MERGE (prev)-[:FOLLOWS {ts_edge: u.ts}]->(u)
+WITH u
+UNWIND $topics AS topic_slug
+MERGE (t:Topic {slug: topic_slug})
+MERGE (u)-[:MENTIONS {ts_edge: u.ts, w0: 0.7}]->(t)
+"""
+
+TOPICS = ["bench-shabbat", "bench-talmud", "bench-halacha", "bench-family"]
+
+
+def make_request(session_id: str, start: datetime.datetime, i: int, topics: int) -> models.DialogUpdateRequest:
+    return models.DialogUpdateRequest(
+        session_id=session_id,
+        speaker="user" if i % 2 == 0 else "assistant",
+        ts=(start + datetime.timedelta(milliseconds=i)).isoformat(),
+        text=f"utterance {i}",
+        topics=[TOPICS[(i + k) % len(TOPICS)] for k in range(topics)],
+    )
+
+
+async def legacy_update(db: GraphDB, req: models.DialogUpdateRequest):
+    params = {"utt_id": f"{req.session_id}-{req.ts}", "session_id": req.session_id, "ts": req.ts,
+              "speaker": req.speaker, "text": req.text, "topics": req.topics}
+    await db.run_query(LEGACY_QUERY, params)
+
+
+async def run(db: GraphDB, name: str, update, count: int, block: int, topics: int):
+    session_id = f"bench-{name}-{uuid.uuid4().hex[:8]}"
+    start = datetime.datetime.now(datetime.timezone.utc)
+    block_ms = []
+    block_start = time.perf_counter()
+    for i in range(count):
+        await update(db, make_request(session_id, start, i, topics))
+        if (i + 1) % block == 0:
+            block_ms.append((time.perf_counter() - block_start) * 1000 / block)
+            block_start = time.perf_counter()
+
+    chain = await db.run_query(
+        "MATCH (u:Utterance {session_id: $session_id}) "
+        "OPTIONAL MATCH (u)-[f:FOLLOWS]->() "
+        "RETURN count(DISTINCT u) AS utterances, count(f) AS follows",
+        {"session_id": session_id}, read_only=True,
+    )
+    record = chain.records[0]
+    assert record["utterances"] == count and record["follows"] == count - 1, f"{name}: broken FOLLOWS chain {dict(record)}"
+
+    await db.run_query(
+        "MATCH (s:Session {session_id: $session_id}) OPTIONAL MATCH (u:Utterance {session_id: $session_id}) DETACH DELETE s, u",
+        {"session_id": session_id},
+    )
+    return block_ms
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--block", type=int, default=1000)
+    parser.add_argument("--topics", type=int, default=2, help="Topics mentioned per utterance")
+    parser.add_argument("--uri", default=settings.neo4j_url)
+    parser.add_argument("--user", default=settings.neo4j_user)
+    parser.add_argument("--password", default=settings.neo4j_password)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    # run_query logs every statement at INFO
+    logging.getLogger("memory.graph_db").setLevel(logging.WARNING)
+
+    db = GraphDB(args.uri, args.user, args.password)
+    try:
+        await db.create_constraints_and_indices()
+        tail = await run(db, "tail", GraphDB.update_dialog, args.count, args.block, args.topics)
+        legacy = None if args.skip_legacy else await run(db, "legacy", legacy_update, args.count, args.block, args.topics)
+    finally:
+        await db.close()
+
+    print(f"{'utterances':>11} {'legacy ms/insert':>17} {'tail ms/insert':>15}")
+    for n, tail_ms in enumerate(tail, start=1):
+        legacy_ms = f"{legacy[n - 1]:>17.2f}" if legacy else f"{'-':>17}"
+        print(f"{n * args.block:>11} {legacy_ms} {tail_ms:>15.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,160 @@
+"""
+Microbenchmark: memory.fusion.fuse_and_rerank.
+
+Compares the previous pure-Python implementation (per-fact set Jaccard and an
+O(n^2) pairwise dedup over every scored fact) with the current vectorized
+scoring + MinHash dedup on synthetic candidate sets, and checks that both
+return the same facts with the same scores. "cold" clears the token cache
+before every run; "warm" re-ranks facts that were seen before, as happens
+across turns of one conversation.
+
+Usage:
+    python scripts/bench_fusion.py [--sizes 100 1000 5000] [--dup-ratio 0.3] [--relevant-ratio 0.5] [--limit 10]
+"""
+import argparse
+import copy
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from memory import fusion  # noqa: E402
+from memory.config import settings  # noqa: E402
+
+WORDS = (
+    "шаббат талмуд мишна гемара раши тосафот галаха берахот тора мидраш "
+    "комментарий сугия спор гилель шамай рабби иегуда меир акива "
+    "обсуждали решили вспомнил объяснил вопрос ответ урок дома вчера сегодня "
+    "привет ладно ок"
+).split()
+SOURCES = ["qdrant_semantic", "qdrant_keyword", "qdrant_topic", "neo4j_topic", "neo4j_fulltext"]
+TOPICS = ["shabbat", "talmud", "halacha", "family", "work", "study"]
+
+
+def legacy_fuse_and_rerank(candidate_sets, user_speaker_name, query, recent_topics, recent_entities):
+    """fuse_and_rerank as it was before vectorization."""
+    all_facts = {}
+    for source, facts in candidate_sets.items():
+        for fact in facts:
+            fact_id = fact.get("fact_id")
+            if fact_id and fact_id not in all_facts:
+                fact['source'] = source
+                all_facts[fact_id] = fact
+
+    query_tokens = fusion._get_tokens(query)
+    final_results = []
+    for fact_id, fact in all_facts.items():
+        sem_score = fact.get("confidence", 0.0) if fact['source'] == 'qdrant_semantic' else 0.0
+        kw_score = fusion._calculate_jaccard(query_tokens, fusion._get_tokens(fact.get("text", "")))
+        topic_score = 0.0
+        fact_topics = fact.get("topic_slugs", [])
+        if any(t in recent_topics for t in fact_topics):
+            topic_score = 1.0
+        ctx_bonus = 0.0
+        if fact.get("speaker") == user_speaker_name:
+            ctx_bonus += 0.05
+        if any(t in recent_topics for t in fact_topics):
+            ctx_bonus += 0.15
+        if any(e in recent_entities for e in fact.get("entity_slugs", [])):
+            ctx_bonus += 0.15
+        noise_penalty = fusion._calculate_noise_penalty(fact)
+        final_score = (
+            settings.fusion_weight_dense * sem_score +
+            settings.fusion_weight_keyword * kw_score +
+            settings.fusion_weight_neo4j_topic * topic_score +
+            0.10 * ctx_bonus -
+            noise_penalty
+        )
+        fact['final_score'] = final_score
+        final_results.append(fact)
+
+    final_results.sort(key=lambda x: x['final_score'], reverse=True)
+    deduped_results = []
+    seen_fact_tokens = []
+    for fact in final_results:
+        if fact['final_score'] < 0.42:
+            continue
+        current_fact_tokens = fusion._get_tokens(fact.get("text", ""))
+        if not any(fusion._calculate_jaccard(current_fact_tokens, seen) >= 0.8 for seen in seen_fact_tokens):
+            deduped_results.append(fact)
+            seen_fact_tokens.append(current_fact_tokens)
+    return deduped_results[:settings.recall_limit]
+
+
+QUERY = "что говорит талмуд про шаббат и галаха"
+
+
+def make_candidates(size: int, dup_ratio: float, relevant_ratio: float, rng: random.Random):
+    """Candidate sets where `dup_ratio` of facts are light rewrites of earlier ones
+    and `relevant_ratio` of new facts reuse most of the query's words."""
+    facts = []
+    for i in range(size):
+        if facts and rng.random() < dup_ratio:
+            words = rng.choice(facts)["text"].split()
+            if rng.random() < 0.5:
+                words.append(rng.choice(WORDS))
+            text = " ".join(words)
+        elif rng.random() < relevant_ratio:
+            words = QUERY.split()
+            text = " ".join(rng.sample(words, len(words) - 1) + [rng.choice(WORDS) for _ in range(rng.randint(1, 3))])
+        else:
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 18)))
+        facts.append({
+            "fact_id": f"f{i}",
+            "text": text,
+            "speaker": rng.choice(["Шимон", "Казах"]),
+            "confidence": rng.uniform(0.5, 1.0),
+            "topic_slugs": rng.sample(TOPICS, 2),
+            "entity_slugs": rng.sample(WORDS, 2),
+            "fact_type": rng.choice(["", "", "", "meta"]),
+        })
+    candidate_sets = {source: [] for source in SOURCES}
+    for fact in facts:
+        candidate_sets[rng.choice(SOURCES)].append(fact)
+    return candidate_sets
+
+
+def run(fn, candidate_sets, repeats: int, cold: bool = False):
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        sets = copy.deepcopy(candidate_sets)
+        if cold:
+            fusion._cached_tokens.cache_clear()
+        start = time.perf_counter()
+        result = fn(sets, "Шимон", QUERY, ["shabbat", "halacha"], ["тора", "урок"])
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--dup-ratio", type=float, default=0.3)
+    parser.add_argument("--relevant-ratio", type=float, default=0.5)
+    parser.add_argument("--limit", type=int, default=None, help="Override settings.recall_limit")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.limit is not None:
+        settings.recall_limit = args.limit
+
+    print(f"{'facts':>7} {'legacy ms':>10} {'cold ms':>9} {'warm ms':>9} {'speedup cold/warm':>18} {'results':>8}")
+    for size in args.sizes:
+        candidate_sets = make_candidates(size, args.dup_ratio, args.relevant_ratio, random.Random(args.seed + size))
+        legacy_ms, legacy = run(legacy_fuse_and_rerank, candidate_sets, args.repeats)
+        cold_ms, cold = run(fusion.fuse_and_rerank, candidate_sets, args.repeats, cold=True)
+        warm_ms, warm = run(fusion.fuse_and_rerank, candidate_sets, args.repeats)
+
+        expected = [(f["fact_id"], f["final_score"]) for f in legacy]
+        assert expected == [(f["fact_id"], f["final_score"]) for f in cold], f"results differ for {size} facts"
+        assert expected == [(f["fact_id"], f["final_score"]) for f in warm], f"results differ for {size} facts"
+        speedup = f"{legacy_ms / cold_ms:.1f}x / {legacy_ms / warm_ms:.1f}x"
+        print(f"{size:>7} {legacy_ms:>10.2f} {cold_ms:>9.2f} {warm_ms:>9.2f} {speedup:>18} {len(cold):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Microbenchmark: STM fact deduplication in brain_service MemoryService.
+
+Compares the previous pure-Python SimHash + pairwise Hamming merge with the
+current merge (vectorized NumPy scan, and the banded LSH buckets used when
+NumPy is missing) on synthetic fact sets, and checks that all of them produce
+the same merged facts.
+
+Usage:
+    python scripts/bench_stm_merge.py [--sizes 1000 10000] [--new-ratio 0.2]
+"""
+import argparse
+import copy
+import hashlib
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from brain_service.services import memory_service as memory_module  # noqa: E402
+from brain_service.services.memory_service import MemoryService  # noqa: E402
+
+WORDS = (
+    "talmud mishnah gemara rashi tosafot halacha shabbat berakhot torah midrash "
+    "commentary sugya kal vachomer machloket beit hillel shammai rabbi yehuda "
+    "meir akiva ketubot bava metzia sanhedrin yevamot kiddushin eruvin pesachim "
+    "is are was were has have means refers to defines indicates the of and in"
+).split()
+
+
+def legacy_simhash64(text: str) -> int:
+    text = text.lower()
+    grams = [text[i:i+2] for i in range(len(text)-1)]
+    bit_counts = [0] * 64
+    for g in grams:
+        h = int(hashlib.blake2b(g.encode('utf-8'), digest_size=8).hexdigest(), 16)
+        for b in range(64):
+            bit_counts[b] += (1 if (h >> b) & 1 else -1)
+    sig = 0
+    for b, c in enumerate(bit_counts):
+        if c >= 0:
+            sig |= (1 << b)
+    return sig
+
+
+def legacy_merge(existing, new, threshold):
+    result = []
+    for item in existing:
+        if "sig" not in item:
+            item["sig"] = legacy_simhash64(item.get("text", ""))
+        result.append(item)
+    for new_item in new:
+        if "sig" not in new_item:
+            new_item["sig"] = legacy_simhash64(new_item.get("text", ""))
+        is_duplicate = False
+        for existing_item in result:
+            if (new_item["sig"] ^ existing_item["sig"]).bit_count() <= threshold:
+                if new_item.get("score", 0) > existing_item.get("score", 0):
+                    existing_item.update(new_item)
+                is_duplicate = True
+                break
+        if not is_duplicate:
+            result.append(new_item)
+    result.sort(key=lambda x: (-x.get("score", 0), -x.get("ts", 0)))
+    return result
+
+
+def make_facts(n: int, rng: random.Random):
+    facts = []
+    for i in range(n):
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 18)))
+        facts.append({"text": text[:200], "score": rng.uniform(0.5, 1.5), "ts": 1_700_000_000 + i})
+    return facts
+
+
+def with_near_duplicates(facts, count, rng: random.Random):
+    out = []
+    for i in range(count):
+        if facts and i % 2 == 0:
+            base = rng.choice(facts)
+            out.append({"text": base["text"] + rng.choice(" .!"), "score": rng.uniform(0.5, 1.5), "ts": 1_800_000_000 + i})
+        else:
+            out.extend(make_facts(1, rng))
+    return out
+
+
+def bench(label, fn, repeat=3, setup=None):
+    best = float("inf")
+    out = None
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        out = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:<34} {best * 1000:10.1f} ms")
+    return out, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--new-ratio", type=float, default=0.2)
+    parser.add_argument("--threshold", type=int, default=MemoryService.HAMMING_THRESHOLD)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    service = MemoryService(redis_client=None)
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        existing = make_facts(size, rng)
+        new = with_near_duplicates(existing, max(int(size * args.new_ratio), 1), rng)
+        texts = [f["text"] for f in existing]
+        print(f"\n{size} existing facts, {len(new)} new facts, threshold={args.threshold}")
+
+        legacy_sigs, _ = bench("simhash (legacy)", lambda: [legacy_simhash64(t) for t in texts], repeat=1)
+        new_sigs, _ = bench("simhash (numpy)", lambda: [service._simhash64(t) for t in texts], repeat=1)
+        assert legacy_sigs == new_sigs, "SimHash signatures differ"
+
+        for f, sig in zip(existing, legacy_sigs):
+            f["sig"] = sig
+        new_sigs = [legacy_simhash64(f["text"]) for f in new]
+        for f, sig in zip(new, new_sigs):
+            f["sig"] = sig
+
+        copies = lambda: (copy.deepcopy(existing), copy.deepcopy(new))  # noqa: E731
+        legacy_out, t_old = bench(
+            "merge (pairwise)",
+            lambda e, n: legacy_merge(e, n, args.threshold),
+            setup=copies,
+        )
+        scan_out, t_new = bench(
+            "merge (numpy scan)",
+            lambda e, n: service._merge_structured_items(e, n, args.threshold),
+            setup=copies,
+        )
+        numpy_module, memory_module.np = memory_module.np, None
+        try:
+            lsh_out, t_lsh = bench(
+                "merge (LSH buckets, no numpy)",
+                lambda e, n: service._merge_structured_items(e, n, args.threshold),
+                setup=copies,
+            )
+        finally:
+            memory_module.np = numpy_module
+        assert legacy_out == scan_out == lsh_out, "Merged facts differ"
+        print(
+            f"  -> {len(scan_out)} merged facts, identical output, "
+            f"speedup x{t_old / max(t_new, 1e-9):.1f} (numpy) / x{t_old / max(t_lsh, 1e-9):.1f} (LSH)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Load benchmark: Whisper inference in the STT service, unbatched vs micro-batched.
+
+Simulates N concurrent streams (default 1/4/16). Each stream transcribes
+recorded WAV clips back to back. It compares two setups:
+  unbatched  each request calls WhisperModel.transcribe on the inference pool
+             (the path before micro-batching)
+  batched    requests go through stt.batching.InferenceBatcher +
+             WhisperBatchRunner on the same model
+For each setup and concurrency it reports:
+  - mean real-time factor (RTF, latency / clip duration)
+  - p50/p95 latency
+  - throughput in audio seconds per wall second
+  - mean batch size
+Clips longer than 30 s are trimmed to one Whisper window.
+
+Usage:
+    python scripts/bench_stt_batching.py --fixtures path/to/wavs --model models/whisper-small
+        [--streams 1 4 16] [--requests 4] [--device cpu] [--compute-type int8]
+        [--workers 2] [--max-batch 8] [--max-wait-ms 10] [--language ru]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from faster_whisper import WhisperModel  # noqa: E402
+from faster_whisper.audio import decode_audio  # noqa: E402
+
+from stt.batching import MAX_CLIP_SEC, SAMPLE_RATE, InferenceBatcher, TranscriptionJob, WhisperBatchRunner  # noqa: E402
+
+
+def load_fixtures(directory: str):
+    clips = []
+    for path in sorted(Path(directory).glob("*.wav")):
+        audio = decode_audio(str(path), sampling_rate=SAMPLE_RATE)[: int(MAX_CLIP_SEC * SAMPLE_RATE)]
+        if len(audio):
+            clips.append((path.name, audio))
+    if not clips:
+        raise SystemExit(f"No .wav fixtures found in {directory}")
+    return clips
+
+
+async def run_load(transcribe, clips, streams: int, requests: int):
+    latencies, rtfs = [], []
+    audio_seconds = 0.0
+
+    async def stream(index: int):
+        nonlocal audio_seconds
+        for r in range(requests):
+            _, audio = clips[(index + r) % len(clips)]
+            duration = len(audio) / SAMPLE_RATE
+            started = time.perf_counter()
+            await transcribe(audio)
+            latency = time.perf_counter() - started
+            latencies.append(latency)
+            rtfs.append(latency / duration)
+            audio_seconds += duration
+
+    started = time.perf_counter()
+    await asyncio.gather(*(stream(i) for i in range(streams)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "rtf": statistics.mean(rtfs),
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        "throughput": audio_seconds / wall,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", required=True, help="Directory with recorded .wav clips")
+    parser.add_argument("--model", required=True, help="faster-whisper model path or size name")
+    parser.add_argument("--streams", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=4, help="Clips transcribed per stream")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--compute-type", default="int8")
+    parser.add_argument("--workers", type=int, default=2, help="Inference pool size (STT_INFERENCE_WORKERS)")
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=10.0)
+    parser.add_argument("--language", default="ru")
+    args = parser.parse_args()
+
+    clips = load_fixtures(args.fixtures)
+    print(f"{len(clips)} fixtures, {sum(len(a) for _, a in clips) / SAMPLE_RATE:.1f}s of audio; model {args.model} on {args.device}/{args.compute_type}")
+    model = WhisperModel(args.model, device=args.device, compute_type=args.compute_type, num_workers=args.workers)
+    pool = ThreadPoolExecutor(max_workers=args.workers)
+    loop = asyncio.get_running_loop()
+
+    def transcribe_direct(audio):
+        segments, _ = model.transcribe(audio, beam_size=1, vad_filter=False, temperature=0.0, language=args.language)
+        return " ".join(s.text for s in segments).strip()
+
+    async def unbatched(audio):
+        return await loop.run_in_executor(pool, transcribe_direct, audio)
+
+    batcher = InferenceBatcher(
+        WhisperBatchRunner(model, args.language), pool,
+        max_batch=args.max_batch, max_wait_ms=args.max_wait_ms,
+        max_pending=max(args.streams) * 2, max_concurrent_batches=args.workers,
+    )
+
+    async def batched(audio):
+        return (await batcher.submit(TranscriptionJob(audio), key="text")).text
+
+    # Warm-up so model initialization does not land in the first measurement.
+    await unbatched(clips[0][1])
+    await batched(clips[0][1])
+
+    print(f"{'streams':>7} {'mode':>10} {'RTF':>7} {'p50 ms':>9} {'p95 ms':>9} {'audio s/s':>10} {'batch':>6}")
+    for streams in args.streams:
+        for mode, fn in (("unbatched", unbatched), ("batched", batched)):
+            before = dict(batcher.stats)
+            result = await run_load(fn, clips, streams, args.requests)
+            batches = batcher.stats["batches"] - before["batches"]
+            mean_batch = (batcher.stats["jobs"] - before["jobs"]) / batches if batches else 1.0
+            print(f"{streams:>7} {mode:>10} {result['rtf']:>7.3f} {result['p50_ms']:>9.0f} {result['p95_ms']:>9.0f} {result['throughput']:>10.2f} {mean_batch:>6.1f}")
+
+    await batcher.stop()
+    pool.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
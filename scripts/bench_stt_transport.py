@@ -0,0 +1,144 @@
+"""
+Benchmark: time to final transcript, POST /stt vs framed /ws/stt, against a running STT service.
+
+Every recorded WAV clip (16 kHz mono int16) is played as if it came from the
+microphone in 32 ms frames, paced in real time. Two transports are compared:
+  post  the clip is uploaded as one base64 WAV once it has been played
+        (voice-in with VOICE_STT_TRANSPORT=post)
+  ws    frames go out over /ws/stt?protocol=segments as they are played,
+        between segment start and end markers (VOICE_STT_TRANSPORT=ws)
+For each transport it reports p50/p95/mean latency from the end of the clip
+to its final transcript. Use --no-pace to send clips as fast as possible.
+
+Both paths forward transcripts to the brain service like real speech does.
+Point STT at a test brain, or use a dedicated --agent-id.
+
+Usage:
+    python scripts/bench_stt_transport.py --fixtures path/to/wavs
+        [--url http://localhost:7020] [--rounds 3] [--agent-id bench] [--no-pace]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+import wave
+from pathlib import Path
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx  # noqa: E402
+import websockets  # noqa: E402
+
+from stt import ws_protocol  # noqa: E402
+
+SAMPLE_RATE = 16000
+FRAME_SAMPLES = 512  # voice-in capture frame
+
+
+def load_fixtures(directory: str):
+    clips = []
+    for path in sorted(Path(directory).glob("*.wav")):
+        with wave.open(str(path), "rb") as wav:
+            if (wav.getframerate(), wav.getnchannels(), wav.getsampwidth()) != (SAMPLE_RATE, 1, 2):
+                print(f"skipping {path.name}: not 16 kHz mono int16")
+                continue
+            pcm = wav.readframes(wav.getnframes())
+        if pcm:
+            clips.append((path.name, pcm, path.read_bytes()))
+    if not clips:
+        raise SystemExit(f"No usable .wav fixtures found in {directory}")
+    return clips
+
+
+async def play(pcm: bytes, pace: bool, on_frame=None):
+    """Walk the clip frame by frame at capture speed; on_frame gets each frame as it is 'captured'."""
+    frame_bytes = FRAME_SAMPLES * 2
+    started = time.perf_counter()
+    for i, offset in enumerate(range(0, len(pcm), frame_bytes)):
+        if pace:
+            delay = started + (i + 1) * FRAME_SAMPLES / SAMPLE_RATE - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        if on_frame is not None:
+            await on_frame(pcm[offset:offset + frame_bytes])
+
+
+async def bench_post(client: httpx.AsyncClient, url: str, clips, rounds: int, agent_id: str, pace: bool):
+    latencies = []
+    for _ in range(rounds):
+        for name, pcm, wav_bytes in clips:
+            await play(pcm, pace)
+            ended = time.perf_counter()
+            response = await client.post(
+                f"{url}/stt",
+                json={"audio_data": base64.b64encode(wav_bytes).decode("ascii"), "agent_id": agent_id, "session_id": str(uuid.uuid4())},
+            )
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - ended)
+            print(f"  post {name}: {latencies[-1] * 1000:.0f} ms  {response.json().get('text', '')[:60]!r}")
+    return latencies
+
+
+async def bench_ws(url: str, clips, rounds: int, agent_id: str, pace: bool):
+    ws_url = url.replace("http", "ws", 1) + "/ws/stt?" + urlencode({"protocol": ws_protocol.PROTOCOL, "agent_id": agent_id})
+    latencies = []
+    async with websockets.connect(ws_url, max_size=None) as websocket:
+        async def send_frame(frame: bytes):
+            await websocket.send(ws_protocol.encode_audio(frame))
+
+        for _ in range(rounds):
+            for name, pcm, _ in clips:
+                segment_id = str(uuid.uuid4())
+                await websocket.send(ws_protocol.encode_start(segment_id))
+                await play(pcm, pace, send_frame)
+                ended = time.perf_counter()
+                await websocket.send(ws_protocol.encode_end(segment_id))
+                while True:  # partials arrive in between
+                    event = json.loads(await websocket.recv())
+                    if event.get("type") == "final" and event.get("segment_id") == segment_id:
+                        break
+                latencies.append(time.perf_counter() - ended)
+                print(f"  ws   {name}: {latencies[-1] * 1000:.0f} ms  {event.get('text', '')[:60]!r}")
+    return latencies
+
+
+def report(name: str, latencies):
+    latencies = sorted(latencies)
+    print(
+        f"{name:<5} n={len(latencies):<4} "
+        f"p50={latencies[len(latencies) // 2] * 1000:7.0f} ms  "
+        f"p95={latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000:7.0f} ms  "
+        f"mean={statistics.mean(latencies) * 1000:7.0f} ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", required=True, help="Directory with 16 kHz mono int16 .wav clips")
+    parser.add_argument("--url", default="http://localhost:7020", help="STT service base URL")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--agent-id", default="bench")
+    parser.add_argument("--no-pace", action="store_true", help="Do not play clips in real time")
+    args = parser.parse_args()
+
+    clips = load_fixtures(args.fixtures)
+    pace = not args.no_pace
+    print(f"{len(clips)} clips, {args.rounds} rounds, {'real-time' if pace else 'unpaced'} playback")
+
+    async with httpx.AsyncClient(timeout=60.0) as client:
+        post = await bench_post(client, args.url, clips, args.rounds, args.agent_id, pace)
+    ws = await bench_ws(args.url, clips, args.rounds, args.agent_id, pace)
+
+    print("\nend of audio -> final transcript")
+    report("post", post)
+    report("ws", ws)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
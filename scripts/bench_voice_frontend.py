@@ -0,0 +1,124 @@
+"""
+Microbenchmark: voice-in audio front-end, CPU time per second of audio.
+
+Runs a synthetic microphone stream (speech-like bursts over background noise,
+512-sample frames at 16 kHz) through two versions of the per-frame VAD input
+path, without the Silero call itself:
+  legacy   np.frombuffer -> noisereduce / pydub normalize+compress (when
+           installed) -> copy + float conversion, voiced frames collected in a
+           list and b"".join-ed per segment
+  current  Int16FrameRing + AudioFrontEnd (reused float buffer, streaming NumPy
+           denoiser / normalizer), segments as memoryview slices
+Each configuration is timed with time.process_time. Legacy rows are skipped
+when noisereduce or pydub is not installed.
+
+Usage:
+    python scripts/bench_voice_frontend.py [--seconds 60] [--frame 512]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "voice-in")))
+
+from audio_frontend import AudioFrontEnd, Int16FrameRing  # noqa: E402
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+try:
+    import noisereduce as nr
+except ImportError:
+    nr = None
+
+try:
+    from pydub import AudioSegment
+    from pydub.effects import compress_dynamic_range, normalize
+except ImportError:
+    AudioSegment = None
+
+RATE = 16000
+SEGMENT_FRAMES = 60  # ~2 s utterances
+
+
+def synth_stream(seconds: float, seed: int = 7) -> bytes:
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * RATE)) / RATE
+    voiced = (np.sin(2 * np.pi * 0.25 * t) > 0).astype(np.float32)
+    speech = sum(np.sin(2 * np.pi * f * t) / k for k, f in enumerate((180, 360, 540, 720), 1))
+    speech *= 0.15 * (1 + 0.5 * np.sin(2 * np.pi * 4 * t)) * voiced
+    noise = 0.02 * rng.standard_normal(len(t))
+    return (np.clip(speech + noise, -1, 1) * 32767).astype(np.int16).tobytes()
+
+
+def to_float(np_chunk):
+    if torch is not None:
+        return torch.from_numpy(np_chunk.copy()).float() / 32768.0
+    return np_chunk.copy().astype(np.float32) / 32768.0
+
+
+def run_legacy(pcm: bytes, frame: int, denoise: bool, normalize_audio: bool) -> float:
+    step = frame * 2
+    voiced_frames = []
+    started = time.process_time()
+    for n, offset in enumerate(range(0, len(pcm) - step + 1, step)):
+        chunk_bytes = pcm[offset:offset + step]
+        np_chunk = np.frombuffer(chunk_bytes, dtype=np.int16)
+        if denoise:
+            reduced = nr.reduce_noise(y=np_chunk.astype(np.float32) / 32768.0, sr=RATE)
+            np_chunk = (reduced * 32768.0).astype(np.int16)
+        if normalize_audio:
+            seg = AudioSegment(np_chunk.tobytes(), frame_rate=RATE, sample_width=2, channels=1)
+            np_chunk = np.array(compress_dynamic_range(normalize(seg)).get_array_of_samples())
+        to_float(np_chunk)
+        voiced_frames.append(chunk_bytes)
+        if len(voiced_frames) == SEGMENT_FRAMES:
+            b"".join(voiced_frames)
+            voiced_frames.clear()
+    return time.process_time() - started
+
+
+def run_current(pcm: bytes, frame: int, denoise: bool, normalize_audio: bool) -> float:
+    step = frame * 2
+    ring = Int16FrameRing(4 * SEGMENT_FRAMES, frame)
+    frontend = AudioFrontEnd(frame, RATE, denoise=denoise, normalize=normalize_audio)
+    view = memoryview(pcm)
+    segment_start = 0
+    started = time.process_time()
+    for offset in range(0, len(pcm) - step + 1, step):
+        index = ring.append(view[offset:offset + step])
+        frontend.process(ring.frame(index))
+        if index + 1 - segment_start == SEGMENT_FRAMES:
+            ring.segment(segment_start, index + 1)
+            segment_start = index + 1
+    return time.process_time() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--frame", type=int, default=512, help="Samples per VAD frame (CHUNK_SAMPLES)")
+    args = parser.parse_args()
+
+    pcm = synth_stream(args.seconds)
+    audio_sec = len(pcm) / 2 / RATE
+    print(f"{audio_sec:.0f}s synthetic audio, {args.frame}-sample frames, float conversion via {'torch' if torch else 'numpy'}")
+    print(f"{'config':>20} {'legacy ms/s':>12} {'current ms/s':>13} {'speedup':>8}")
+    for denoise, normalize_audio in ((False, False), (True, False), (False, True), (True, True)):
+        name = "+".join(n for n, on in (("denoise", denoise), ("normalize", normalize_audio)) if on) or "plain"
+        current = run_current(pcm, args.frame, denoise, normalize_audio) / audio_sec * 1000
+        available = (nr is not None or not denoise) and (AudioSegment is not None or not normalize_audio)
+        if available:
+            legacy = run_legacy(pcm, args.frame, denoise, normalize_audio) / audio_sec * 1000
+            print(f"{name:>20} {legacy:>12.2f} {current:>13.2f} {legacy / current:>7.1f}x")
+        else:
+            print(f"{name:>20} {'n/a':>12} {current:>13.2f} {'':>8}")
+
+
+if __name__ == "__main__":
+    main()
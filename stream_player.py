@@ -84,66 +84,305 @@ class AudioStream:
         return self.stream and self.stream.is_active()
 
 
+class AudioRingBuffer:
+    """
+    Bounded byte ring buffer that also acts as an adaptive jitter buffer between a synthesis engine and the player.
+
+    Engines write into it with the same put() they used on queue.Queue. When the ring is full, put() blocks, which applies backpressure to synthesis instead of buffering without bound.
+    The player reads with read(). It blocks on a condition variable until audio arrives, and there is no polling.
+    MPEG chunks are decoded to PCM on put(), so buffered seconds are exact for every format.
+
+    The buffer also measures how fast the engine synthesizes compared to real-time playback. It keeps an EWMA of first-chunk latency, synthesis speed and sentence length, and grows a safety margin after every underrun.
+    target_seconds() turns these into the amount of audio that should be buffered before synthesis can afford to wait for more text.
+    """
+
+    def __init__(self, config: "AudioConfiguration", max_seconds: float = 30.0, jitter_margin_seconds: float = 0.5, min_target_seconds: float = 0.25):
+        """
+        Args:
+            config (AudioConfiguration): Format of the audio stream, used to convert bytes to seconds.
+            max_seconds (float): Capacity of the ring in seconds of audio. Producers block when it is full. Defaults to 30.
+            jitter_margin_seconds (float): Base safety margin added to the adaptive target. Defaults to 0.5.
+            min_target_seconds (float): Lower bound of the adaptive target. Defaults to 0.25.
+        """
+        self.decode_mpeg = config.format == pyaudio.paCustomFormat
+        sample_width = 2 if self.decode_mpeg else pyaudio.get_sample_size(config.format)
+        channels = config.channels if config.channels > 0 else 1
+        rate = config.rate if config.rate > 0 else 24000  # MPEG engines report -1; nominal rate for the estimates
+        self.frame_bytes = sample_width * channels
+        self.bytes_per_second = self.frame_bytes * rate
+        capacity = int(max_seconds * self.bytes_per_second)
+        self.capacity = max(capacity - capacity % self.frame_bytes, self.frame_bytes)
+        self._data = bytearray(self.capacity)
+        self._view = memoryview(self._data)
+        self._read_pos = 0
+        self._size = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._finishing = False
+
+        self.base_margin = jitter_margin_seconds
+        self.min_target = min_target_seconds
+        self.max_target = max_seconds / 2
+        self._margin = jitter_margin_seconds
+        self._playing = False
+        self._starved_since = None
+        self._synthesis_start = None
+        self._synthesis_first_chunk = None
+        self._synthesis_bytes = 0
+        self._latency = None  # EWMA, seconds from synthesize() to the first chunk
+        self._slowness = None  # EWMA, wall seconds per second of audio (1/speed)
+        self._sentence_seconds = None  # EWMA, audio seconds per synthesized sentence
+        self.stats = {"underruns": 0, "underrun_seconds": 0.0, "backpressure_waits": 0, "backpressure_seconds": 0.0, "dropped_bytes": 0}
+
+    @staticmethod
+    def _ewma(previous, value, alpha=0.3):
+        return value if previous is None else previous + alpha * (value - previous)
+
+    def put(self, chunk, block: bool = True, timeout: float = None):
+        """
+        Adds audio data, waiting for free space while the ring is full.
+
+        Args:
+            chunk: Audio data to be added.
+            block (bool): If False, raises queue.Full instead of waiting when the chunk does not fit.
+            timeout (float): Maximum time to wait for free space before raising queue.Full.
+        """
+        if self.decode_mpeg:
+            chunk = AudioSegment.from_file(io.BytesIO(chunk), format="mp3").raw_data
+        data = memoryview(chunk).cast("B")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if not block and len(data) > self.capacity - self._size:
+                raise queue.Full
+            if self._synthesis_start is not None and self._synthesis_first_chunk is None and len(data):
+                self._synthesis_first_chunk = time.monotonic()
+            offset = 0
+            while offset < len(data):
+                if self._closed:
+                    self.stats["dropped_bytes"] += len(data) - offset
+                    return
+                free = self.capacity - self._size
+                if free == 0:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise queue.Full
+                    waited = time.monotonic()
+                    self.stats["backpressure_waits"] += 1
+                    self._cond.wait(remaining)
+                    self.stats["backpressure_seconds"] += time.monotonic() - waited
+                    continue
+                n = min(free, len(data) - offset)
+                write_pos = (self._read_pos + self._size) % self.capacity
+                first = min(n, self.capacity - write_pos)
+                self._view[write_pos:write_pos + first] = data[offset:offset + first]
+                self._view[:n - first] = data[offset + first:offset + n]
+                self._size += n
+                self._synthesis_bytes += n
+                offset += n
+                self._cond.notify_all()
+
+    def put_nowait(self, chunk):
+        self.put(chunk, block=False)
+
+    def _take(self, max_bytes: int) -> bytes:
+        n = min(max_bytes, self._size)
+        if n >= self.frame_bytes or not self._finishing:
+            n -= n % self.frame_bytes
+        first = min(n, self.capacity - self._read_pos)
+        data = bytes(self._view[self._read_pos:self._read_pos + first]) + bytes(self._view[:n - first])
+        self._read_pos = (self._read_pos + n) % self.capacity
+        self._size -= n
+        self._cond.notify_all()
+        return data
+
+    def read(self, max_bytes: int, timeout: float = None) -> bytes:
+        """
+        Waits for audio and returns up to max_bytes of whole frames.
+
+        Returns b"" once finish() or close() was called and the buffer is drained, or when the timeout expires.
+        Waiting on an empty buffer while a synthesis is in progress, after playback has started, counts as an underrun.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._size < self.frame_bytes and not (self._closed or (self._finishing and self._size)):
+                if self._finishing:
+                    return b""
+                if self._playing and self._starved_since is None and self._synthesis_start is not None:
+                    # Starved while the engine is still producing; gaps waiting for text are not underruns
+                    self._starved_since = time.monotonic()
+                    self.stats["underruns"] += 1
+                    self._margin = min(self._margin + 0.25, self.max_target)
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return b""
+                self._cond.wait(remaining)
+            if self._closed:
+                return b""
+            if self._starved_since is not None:
+                self.stats["underrun_seconds"] += time.monotonic() - self._starved_since
+                self._starved_since = None
+            self._playing = True
+            return self._take(max_bytes)
+
+    def get(self, block: bool = True, timeout: float = None) -> bytes:
+        """queue.Queue-compatible read of everything buffered; raises queue.Empty when there is nothing."""
+        with self._cond:
+            if not block or self._size:
+                if not self._size:
+                    raise queue.Empty
+                return self._take(self._size)
+        data = self.read(self.capacity, timeout)
+        if not data:
+            raise queue.Empty
+        return data
+
+    def get_nowait(self) -> bytes:
+        return self.get(block=False)
+
+    def empty(self) -> bool:
+        return self._size == 0
+
+    def qsize(self) -> int:
+        """Number of buffered bytes."""
+        return self._size
+
+    def buffered_seconds(self) -> float:
+        return self._size / self.bytes_per_second
+
+    def begin_synthesis(self):
+        """Marks the start of one engine.synthesize() call, for latency and speed tracking."""
+        with self._cond:
+            self._synthesis_start = time.monotonic()
+            self._synthesis_first_chunk = None
+            self._synthesis_bytes = 0
+
+    def end_synthesis(self):
+        """Marks the end of the synthesize() call started with begin_synthesis() and updates the estimates."""
+        with self._cond:
+            if self._synthesis_start is None:
+                return
+            now = time.monotonic()
+            audio_seconds = self._synthesis_bytes / self.bytes_per_second
+            if self._synthesis_first_chunk is not None and audio_seconds > 0:
+                self._latency = self._ewma(self._latency, self._synthesis_first_chunk - self._synthesis_start)
+                self._slowness = self._ewma(self._slowness, (now - self._synthesis_start) / audio_seconds)
+                self._sentence_seconds = self._ewma(self._sentence_seconds, audio_seconds)
+            if self._starved_since is None:
+                self._margin = max(self.base_margin, self._margin * 0.9)  # relax slowly after clean sentences
+            self._synthesis_start = None
+
+    def target_seconds(self) -> float:
+        """
+        Audio that should be buffered before synthesis may wait for more text.
+
+        It covers the engine's first-chunk latency. When synthesis is slower than real time, it also covers the deficit that builds up over a typical sentence. The adaptive jitter margin is added on top.
+        """
+        with self._cond:
+            target = self._margin
+            if self._latency is not None:
+                target += self._latency + max(0.0, self._slowness - 1.0) * self._sentence_seconds
+        return min(max(target, self.min_target), self.max_target)
+
+    def metrics(self) -> dict:
+        """Buffer depth, adaptive target, synthesis speed versus real time, underrun and backpressure counters."""
+        target = self.target_seconds()
+        with self._cond:
+            return {
+                **self.stats,
+                "buffered_seconds": self._size / self.bytes_per_second,
+                "capacity_seconds": self.capacity / self.bytes_per_second,
+                "target_seconds": target,
+                "jitter_margin_seconds": self._margin,
+                "first_chunk_latency": self._latency,
+                "synthesis_speed": 1.0 / self._slowness if self._slowness else None,  # x real time; playback runs at 1.0
+            }
+
+    def clear(self):
+        """Drops all buffered audio and wakes producers waiting for space."""
+        with self._cond:
+            self._read_pos = 0
+            self._size = 0
+            self._cond.notify_all()
+
+    def finish(self):
+        """No more audio is coming: read() drains what is left, then returns b""."""
+        with self._cond:
+            self._finishing = True
+            self._cond.notify_all()
+
+    def close(self):
+        """Stops immediately: read() returns b"" and put() drops its data instead of blocking."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def reopen(self):
+        """Empties the buffer and makes it accept audio again for a new playback."""
+        with self._cond:
+            self._read_pos = 0
+            self._size = 0
+            self._closed = False
+            self._finishing = False
+            self._playing = False
+            self._starved_since = None
+            self._cond.notify_all()
+
+
 class AudioBufferManager:
     """
     Manages an audio buffer, allowing addition and retrieval of audio data.
     """
 
-    def __init__(self, audio_buffer: queue.Queue):
+    def __init__(self, audio_buffer: AudioRingBuffer):
         """
         Args:
-            audio_buffer (queue.Queue): Queue to be used as the audio buffer.
+            audio_buffer (AudioRingBuffer): Ring buffer to be used as the audio buffer.
         """
         self.audio_buffer = audio_buffer
-        self.total_samples = 0
+
+    @property
+    def total_samples(self) -> int:
+        return self.audio_buffer.qsize() // self.audio_buffer.frame_bytes
 
     def add_to_buffer(self, audio_data):
         """
-        Adds audio data to the buffer.
+        Adds audio data to the buffer, blocking while it is full.
 
         Args:
             audio_data: Audio data to be added.
         """
         self.audio_buffer.put(audio_data)
-        self.total_samples += len(audio_data) // 2
 
     def clear_buffer(self):
         """Clears all audio data from the buffer."""
-        while not self.audio_buffer.empty():
-            try:
-                self.audio_buffer.get_nowait()
-            except queue.Empty:
-                continue
-        self.total_samples = 0
+        self.audio_buffer.clear()
 
     def get_from_buffer(self, timeout: float = 0.05):
         """
         Retrieves audio data from the buffer.
 
         Args:
-            timeout (float): Time (in seconds) to wait before raising a queue.Empty exception.
+            timeout (float): Time (in seconds) to wait for data.
 
         Returns:
             The audio data chunk or None if the buffer is empty.
         """
         try:
-            chunk = self.audio_buffer.get(timeout=timeout)
-            self.total_samples -= len(chunk) // 2
-            return chunk
+            return self.audio_buffer.get(timeout=timeout)
         except queue.Empty:
             return None
 
-    def get_buffered_seconds(self, rate: int) -> float:
+    def get_buffered_seconds(self, rate: int = None) -> float:
         """
         Calculates the duration (in seconds) of the buffered audio data.
 
         Args:
-            rate (int): Sample rate of the audio data.
+            rate (int): Unused; the ring buffer knows its own format.
 
         Returns:
             float: Duration of buffered audio in seconds.
         """
-        return self.total_samples / rate
+        return self.audio_buffer.buffered_seconds()
 
 
 class StreamPlayer:
@@ -151,19 +390,21 @@ class StreamPlayer:
     Manages audio playback operations such as start, stop, pause, and resume.
     """
 
-    def __init__(self, audio_buffer: queue.Queue, config: AudioConfiguration, on_playback_start=None, on_playback_stop=None, on_audio_chunk=None, muted = False):
+    def __init__(self, audio_buffer: AudioRingBuffer, config: AudioConfiguration, on_playback_start=None, on_playback_stop=None, on_audio_chunk=None, muted = False):
         """
         Args:
-            audio_buffer (queue.Queue): Queue to be used as the audio buffer.
+            audio_buffer (AudioRingBuffer): Ring buffer the engine writes synthesized audio into.
             config (AudioConfiguration): Object containing audio settings.
             on_playback_start (Callable, optional): Callback function to be called at the start of playback. Defaults to None.
             on_playback_stop (Callable, optional): Callback function to be called at the stop of playback. Defaults to None.
         """
+        self.audio_buffer = audio_buffer
         self.buffer_manager = AudioBufferManager(audio_buffer)
         self.audio_stream = AudioStream(config)
         self.playback_active = False
         self.immediate_stop = threading.Event()
-        self.pause_event = threading.Event()
+        self.resume_event = threading.Event()
+        self.resume_event.set()
         self.playback_thread = None
         self.on_playback_start = on_playback_start
         self.on_playback_stop = on_playback_stop
@@ -173,54 +414,36 @@ class StreamPlayer:
 
     def _play_chunk(self, chunk):
         """
-        Plays a chunk of audio data.
+        Plays a chunk of PCM audio data.
 
         Args:
             chunk: Chunk of audio data to be played.
         """
+        if not self.muted:
+            self.audio_stream.stream.write(chunk)
 
-        # handle mpeg
-        if self.audio_stream.config.format == pyaudio.paCustomFormat:
-
-            # convert to pcm using pydub
-            segment = AudioSegment.from_file(io.BytesIO(chunk), format="mp3")
-            chunk = segment.raw_data
-
-        sub_chunk_size = 1024
-        
-        for i in range(0, len(chunk), sub_chunk_size):
-            sub_chunk = chunk[i:i + sub_chunk_size]
-
-            if not self.muted:
-                self.audio_stream.stream.write(sub_chunk)
-
-            if self.on_audio_chunk:
-                self.on_audio_chunk(sub_chunk)
-
-            if not self.first_chunk_played and self.on_playback_start:
-                self.on_playback_start()
-                self.first_chunk_played = True            
+        if self.on_audio_chunk:
+            self.on_audio_chunk(chunk)
 
-            # Pause playback if the event is set
-            while self.pause_event.is_set():
-                time.sleep(0.01)
-
-            if self.immediate_stop.is_set():
-                break
+        if not self.first_chunk_played and self.on_playback_start:
+            self.on_playback_start()
+            self.first_chunk_played = True
 
     def _process_buffer(self):
-        """Processes and plays audio data from the buffer until it's empty or playback is stopped."""
-        while self.playback_active or not self.buffer_manager.audio_buffer.empty():
-            chunk = self.buffer_manager.get_from_buffer()
-            if chunk:
-                self._play_chunk(chunk)
-
+        """Plays audio from the ring buffer as it arrives until it is drained after stop() or playback is aborted."""
+        sub_chunk_size = 1024 - 1024 % self.audio_buffer.frame_bytes
+        while True:
+            self.resume_event.wait()
             if self.immediate_stop.is_set():
                 logging.info("Immediate stop requested, aborting playback")
                 break
+            chunk = self.audio_buffer.read(sub_chunk_size)
+            if not chunk:
+                break
+            self._play_chunk(chunk)
         if self.on_playback_stop:
             self.on_playback_stop()
-            
+
     def get_buffered_seconds(self) -> float:
         """
         Calculates the duration (in seconds) of the buffered audio data.
@@ -228,13 +451,27 @@ class StreamPlayer:
         Returns:
             float: Duration of buffered audio in seconds.
         """
-        total_samples = sum(len(chunk) // 2 for chunk in list(self.buffer_manager.audio_buffer.queue))
-        return total_samples / self.audio_stream.config.rate
+        return self.audio_buffer.buffered_seconds()
+
+    def get_target_buffer_seconds(self) -> float:
+        """
+        Returns:
+            float: Adaptive amount of audio to keep buffered ahead of playback, see AudioRingBuffer.target_seconds().
+        """
+        return self.audio_buffer.target_seconds()
+
+    def get_metrics(self) -> dict:
+        """
+        Returns:
+            dict: Buffered seconds, adaptive target, synthesis speed, underrun and backpressure counters.
+        """
+        return self.audio_buffer.metrics()
 
     def start(self):
         """Starts audio playback."""
         self.first_chunk_played = False
         self.playback_active = True
+        self.audio_buffer.reopen()
         self.audio_stream.open_stream()
         self.audio_stream.start_stream()
         self.playback_thread = threading.Thread(target=self._process_buffer)
@@ -253,11 +490,15 @@ class StreamPlayer:
 
         if immediate:
             self.immediate_stop.set()
+            self.resume_event.set()
+            # Wakes the playback thread and releases an engine blocked on a full buffer
+            self.audio_buffer.close()
             while self.playback_active:
                 time.sleep(0.1)
             return
 
         self.playback_active = False
+        self.audio_buffer.finish()
 
         if self.playback_thread and self.playback_thread.is_alive():
             self.playback_thread.join()
@@ -271,12 +512,12 @@ class StreamPlayer:
 
     def pause(self):
         """Pauses audio playback."""
-        self.pause_event.set()
+        self.resume_event.clear()
 
     def resume(self):
         """Resumes paused audio playback."""
-        self.pause_event.clear()
+        self.resume_event.set()
 
     def mute(self, muted: bool = True):
         """Mutes audio playback."""
-        self.muted = muted
\ No newline at end of file
+        self.muted = muted
@@ -0,0 +1,313 @@
+"""
+Cross-request micro-batching of Whisper inference.
+
+`InferenceBatcher` collects jobs from all connections for up to `max_wait_ms`
+(or until `max_batch` jobs are waiting) and runs them as one batch on a shared
+executor. Each caller awaits its own future. Jobs are batched only with jobs
+that have the same key, because one batch shares its decoding options, and
+higher-priority jobs (finals, POST /stt) are taken first. When `max_pending`
+jobs are queued, `submit` raises `BatcherOverloaded`. That is the backpressure
+signal: callers shed load, for example by skipping a partial or answering 503,
+instead of letting the queue grow.
+
+`WhisperBatchRunner` runs one batch on a faster-whisper model. The clips are
+padded to Whisper's 30 s window, encoded together, and decoded in one
+`generate` call. Each clip gets its own prompt. Decoding runs without
+timestamp tokens, so each clip is one segment, and word timestamps come from
+one batched cross-attention alignment. Only the public CTranslate2 `Whisper`
+methods and faster-whisper's feature extractor and tokenizer are used, not
+WhisperModel internals, which change between faster-whisper releases.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("stt-service.batching")
+
+SAMPLE_RATE = 16000
+MAX_CLIP_SEC = 30.0
+
+_NO_KEY = object()
+
+
+class BatcherOverloaded(RuntimeError):
+    """Raised by InferenceBatcher.submit when max_pending jobs are already queued."""
+
+
+@dataclass
+class _Pending:
+    item: Any
+    key: Hashable
+    priority: int
+    future: asyncio.Future
+    enqueued: float = field(default_factory=time.perf_counter)
+    seq: int = 0
+
+
+class InferenceBatcher:
+    def __init__(
+        self,
+        run_batch: Callable[[List[Any]], List[Any]],
+        executor: Optional[Executor] = None,
+        max_batch: int = 8,
+        max_wait_ms: float = 10.0,
+        max_pending: int = 64,
+        max_concurrent_batches: int = 1,
+    ):
+        self.run_batch = run_batch
+        self.executor = executor
+        self.max_batch = max(int(max_batch), 1)
+        self.max_wait = max(float(max_wait_ms), 0.0) / 1000
+        self.max_pending = max(int(max_pending), 1)
+        self.max_concurrent_batches = max(int(max_concurrent_batches), 1)
+        self._queues: Dict[Hashable, Deque[_Pending]] = {}
+        self._seq = itertools.count()
+        self._arrived: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: set = set()
+        self.stats = {"jobs": 0, "batches": 0, "rejected": 0, "failed_batches": 0, "queue_wait_ms": 0.0}
+
+    @property
+    def pending(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def start(self):
+        if self._task is None:
+            self._arrived = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._task = asyncio.create_task(self._dispatch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, *self._running, return_exceptions=True)
+            self._task = None
+        for queue in self._queues.values():
+            for job in queue:
+                if not job.future.done():
+                    job.future.cancel()
+        self._queues.clear()
+
+    async def submit(self, item: Any, key: Hashable = None, priority: int = 0) -> Any:
+        """Queue one job and wait for its result; raises BatcherOverloaded when the queue is full."""
+        if self._task is None:
+            self.start()
+        if self.pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise BatcherOverloaded(f"{self.pending} inference jobs pending")
+        job = _Pending(item, key, priority, asyncio.get_running_loop().create_future(), seq=next(self._seq))
+        self._queues.setdefault(key, deque()).append(job)
+        self._arrived.set()
+        return await job.future
+
+    def _next_key(self) -> Any:
+        """Key holding the highest-priority job, oldest first (_NO_KEY when idle)."""
+        best = [(min((-j.priority, j.seq) for j in q), key) for key, q in self._queues.items() if q]
+        return min(best, key=lambda b: b[0])[1] if best else _NO_KEY
+
+    def _take(self, key: Hashable) -> List[_Pending]:
+        queue = self._queues[key]
+        ordered = sorted(queue, key=lambda j: (-j.priority, j.seq))[:self.max_batch]
+        taken = {id(j) for j in ordered}
+        self._queues[key] = deque(j for j in queue if id(j) not in taken)
+        # Jobs whose callers went away are not worth a slot in the batch.
+        return [j for j in ordered if not j.future.done()]
+
+    async def _dispatch(self):
+        while True:
+            if not self.pending:
+                self._arrived.clear()
+                await self._arrived.wait()
+            await self._slots.acquire()
+            key = self._next_key()
+            if key is _NO_KEY:
+                self._slots.release()
+                continue
+            # Give concurrent callers a moment to join, unless the batch is already full.
+            deadline = self._queues[key][0].enqueued + self.max_wait
+            while len(self._queues[key]) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._arrived.clear()
+                try:
+                    await asyncio.wait_for(self._arrived.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            batch = self._take(key)
+            if not batch:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: List[_Pending]):
+        try:
+            started = time.perf_counter()
+            self.stats["batches"] += 1
+            self.stats["jobs"] += len(batch)
+            self.stats["queue_wait_ms"] += sum((started - j.enqueued) * 1000 for j in batch)
+            try:
+                results = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self.run_batch, [j.item for j in batch]
+                )
+            except Exception as e:
+                self.stats["failed_batches"] += 1
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                return
+            for job, result in zip(batch, results):
+                if not job.future.done():
+                    job.future.set_result(result)
+        finally:
+            self._slots.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        batches = self.stats["batches"]
+        return {
+            **self.stats,
+            "pending": self.pending,
+            "mean_batch_size": self.stats["jobs"] / batches if batches else 0.0,
+            "mean_queue_wait_ms": self.stats["queue_wait_ms"] / self.stats["jobs"] if self.stats["jobs"] else 0.0,
+        }
+
+
+@dataclass
+class TranscriptionJob:
+    audio: np.ndarray  # float32 mono 16 kHz, at most MAX_CLIP_SEC
+    prompt: Optional[str] = None
+    word_timestamps: bool = False
+
+
+@dataclass
+class TranscriptionResult:
+    text: str
+    language: str
+    no_speech_prob: float
+    words: List[Tuple[float, float, str]]
+
+
+class WhisperBatchRunner:
+    """Transcribes a batch of TranscriptionJobs (same word_timestamps flag) on one WhisperModel."""
+
+    PREPEND_PUNCTUATIONS = "\"'“¿([{-"
+    APPEND_PUNCTUATIONS = "\"'.。,，!！?？:：”)]}、"
+
+    def __init__(self, model, language: Optional[str] = None):
+        from faster_whisper.tokenizer import Tokenizer
+        from faster_whisper.transcribe import get_suppressed_tokens
+
+        self.model = model
+        self.language = language if model.model.is_multilingual else "en"
+        self.tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task="transcribe", language=self.language or "en")
+        self.suppress_tokens = get_suppressed_tokens(self.tokenizer, [-1])
+
+    def __call__(self, jobs: List[TranscriptionJob]) -> List[TranscriptionResult]:
+        model, tokenizer = self.model, self.tokenizer
+        word_timestamps = jobs[0].word_timestamps
+        features = np.stack([self._features(job.audio) for job in jobs])
+        encoder_output = self._encode(features)
+
+        prompts = [
+            model.get_prompt(
+                tokenizer,
+                previous_tokens=tokenizer.encode(" " + job.prompt.strip()) if job.prompt else [],
+                without_timestamps=True,
+            )
+            for job in jobs
+        ]
+        languages = [self.language] * len(jobs)
+        if self.language is None:
+            language_index = prompts[0].index(tokenizer.language) - len(prompts[0])
+            for i, detected in enumerate(model.model.detect_language(encoder_output)):
+                token = detected[0][0]  # "<|ru|>"
+                prompts[i][language_index] = tokenizer.tokenizer.token_to_id(token)
+                languages[i] = token[2:-2]
+
+        results = model.model.generate(
+            encoder_output,
+            prompts,
+            beam_size=1,
+            max_length=model.max_length,
+            suppress_blank=True,
+            suppress_tokens=self.suppress_tokens,
+            return_scores=True,
+            return_no_speech_prob=True,
+            sampling_temperature=0.0,
+        )
+
+        tokens = [[t for t in result.sequences_ids[0] if t < tokenizer.eot] for result in results]
+        words = self._word_timestamps(jobs, features, encoder_output, tokens) if word_timestamps else [[] for _ in jobs]
+        return [
+            TranscriptionResult(
+                text=tokenizer.decode(clip_tokens).strip(),
+                language=language,
+                no_speech_prob=result.no_speech_prob,
+                words=clip_words,
+            )
+            for clip_tokens, clip_words, result, language in zip(tokens, words, results, languages)
+        ]
+
+    def _features(self, audio: np.ndarray) -> np.ndarray:
+        """Log-mel features of one clip, cut or zero-padded to exactly one 30 s window."""
+        extractor = self.model.feature_extractor
+        mel = extractor(audio)[:, :extractor.nb_max_frames]
+        return np.pad(mel, ((0, 0), (0, extractor.nb_max_frames - mel.shape[-1])))
+
+    def _encode(self, features: np.ndarray):
+        import ctranslate2
+
+        whisper = self.model.model
+        to_cpu = whisper.device == "cuda" and len(whisper.device_index) > 1
+        storage = ctranslate2.StorageView.from_array(np.ascontiguousarray(features, dtype=np.float32))
+        return whisper.encode(storage, to_cpu=to_cpu)
+
+    def _word_timestamps(self, jobs, features, encoder_output, tokens) -> List[List[Tuple[float, float, str]]]:
+        extractor = self.model.feature_extractor
+        words: List[List[Tuple[float, float, str]]] = [[] for _ in jobs]
+        voiced = [i for i, clip_tokens in enumerate(tokens) if clip_tokens]
+        if not voiced:
+            return words
+        if len(voiced) < len(jobs):
+            # align() needs text for every clip in the batch; re-encode just the clips that have some.
+            encoder_output = self._encode(features[voiced])
+        num_frames = [min(len(jobs[i].audio) // extractor.hop_length, extractor.nb_max_frames) for i in voiced]
+        alignments = self.model.model.align(
+            encoder_output, self.tokenizer.sot_sequence, [tokens[i] for i in voiced], num_frames,
+        )
+        for i, alignment in zip(voiced, alignments):
+            words[i] = self._words(tokens[i], alignment, len(jobs[i].audio) / SAMPLE_RATE)
+        return words
+
+    def _words(self, text_tokens: List[int], alignment, duration: float) -> List[Tuple[float, float, str]]:
+        """Word (start, end, text) from one clip's token alignment, grouped the way faster-whisper does."""
+        from faster_whisper.transcribe import merge_punctuations
+
+        tokenizer = self.tokenizer
+        words, word_tokens = tokenizer.split_to_word_tokens(text_tokens + [tokenizer.eot])
+        if len(word_tokens) <= 1:
+            return []
+        boundaries = np.pad(np.cumsum([len(t) for t in word_tokens[:-1]]), (1, 0))
+        text_indices = np.array([pair[0] for pair in alignment.alignments])
+        time_indices = np.array([pair[1] for pair in alignment.alignments])
+        jumps = np.pad(np.diff(text_indices), (1, 0), constant_values=1).astype(bool)
+        jump_times = time_indices[jumps] / self.model.tokens_per_second
+        timings = [
+            dict(word=word, tokens=word_tokens_, start=float(start), end=float(end))
+            for word, word_tokens_, start, end in zip(words, word_tokens, jump_times[boundaries[:-1]], jump_times[boundaries[1:]])
+        ]
+        merge_punctuations(timings, self.PREPEND_PUNCTUATIONS, self.APPEND_PUNCTUATIONS)
+        return [
+            (round(t["start"], 2), round(min(t["end"], duration), 2), t["word"])
+            for t in timings if t["word"]
+        ]
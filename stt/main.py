@@ -9,7 +9,8 @@ import requests
 import httpx
 import threading
 import asyncio
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 import numpy as np
 from pathlib import Path
 
@@ -28,7 +29,6 @@ from audio.settings import (
 
 import redis
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
-from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 import asyncio
@@ -39,6 +39,7 @@ try:
     import torch
     from faster_whisper import WhisperModel
 except ImportError:
+    torch = None
     WhisperModel = None
 
 try:
@@ -46,6 +47,15 @@ try:
 except ImportError:
     DeepgramClient = None
 
+try:
+    from stt.streaming import StreamingTranscriber
+    from stt import ws_protocol
+    from stt.batching import MAX_CLIP_SEC, BatcherOverloaded, InferenceBatcher, TranscriptionJob, WhisperBatchRunner
+except ImportError:  # started from inside stt/
+    from streaming import StreamingTranscriber
+    import ws_protocol
+    from batching import MAX_CLIP_SEC, BatcherOverloaded, InferenceBatcher, TranscriptionJob, WhisperBatchRunner
+
 # --- Configuration ---
 logger = logging_utils.get_logger("stt-service", service="stt")
 
@@ -75,12 +85,30 @@ FORCED_LANGUAGE = WHISPER_FORCED_LANGUAGE
 # Deepgram Configuration
 DEEPGRAM_API_KEY = SETTINGS_DEEPGRAM_API_KEY
 
+# Inference runs on a dedicated pool so it never blocks the event loop or starves the default executor
+INFERENCE_WORKERS = int(os.getenv("STT_INFERENCE_WORKERS", "2"))
+
+# Streaming (/ws/stt) configuration
+STREAM_STEP_SEC = float(os.getenv("STT_STREAM_STEP_SEC", "1.0"))  # re-transcribe the open window this often
+STREAM_MAX_WINDOW_SEC = float(os.getenv("STT_STREAM_MAX_WINDOW_SEC", "15"))
+STREAM_SILENCE_SEC = float(os.getenv("STT_STREAM_SILENCE_SEC", "0.6"))  # trailing silence that ends an utterance
+STREAM_SILENCE_RMS = float(os.getenv("STT_STREAM_SILENCE_RMS", "0.01"))
+
+# Cross-connection micro-batching of Whisper inference
+BATCH_ENABLED = os.getenv("STT_BATCH_ENABLED", "false").lower() == "true"  # opt-in until validated on production weights
+BATCH_MAX_SIZE = int(os.getenv("STT_BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("STT_BATCH_MAX_WAIT_MS", "10"))
+BATCH_MAX_PENDING = int(os.getenv("STT_BATCH_MAX_PENDING", "64"))  # beyond this, requests are shed
+
 # --- Global State ---
 class ServiceState:
     def __init__(self):
         self.stt_client = None  # Can be WhisperModel or DeepgramClient
         self.redis_client: redis.Redis | None = None
         self.transcriptions_since_last_clear = 0
+        self.gpu_cache_lock = threading.Lock()
+        self.inference_pool = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="stt-infer")
+        self.batcher: Optional[InferenceBatcher] = None
 
 state = ServiceState()
 
@@ -109,8 +137,25 @@ def initialize_stt_client():
         
         logger.info(f"Loading Whisper model from: {MODEL_PATH} ({DEVICE}, {COMPUTE_TYPE})...")
         try:
-            state.stt_client = WhisperModel(MODEL_PATH, device=DEVICE, compute_type=COMPUTE_TYPE)
+            state.stt_client = WhisperModel(MODEL_PATH, device=DEVICE, compute_type=COMPUTE_TYPE, num_workers=INFERENCE_WORKERS)
             logger.info("Whisper model loaded successfully.")
+            if BATCH_ENABLED:
+                runner = WhisperBatchRunner(state.stt_client, FORCED_LANGUAGE)
+
+                def run_batch(jobs):
+                    results = runner(jobs)
+                    _maybe_clear_gpu_cache()
+                    return results
+
+                state.batcher = InferenceBatcher(
+                    run_batch,
+                    state.inference_pool,
+                    max_batch=BATCH_MAX_SIZE,
+                    max_wait_ms=BATCH_MAX_WAIT_MS,
+                    max_pending=BATCH_MAX_PENDING,
+                    max_concurrent_batches=INFERENCE_WORKERS,
+                )
+                logger.info(f"Whisper micro-batching enabled (max_batch={BATCH_MAX_SIZE}, max_wait={BATCH_MAX_WAIT_MS}ms, max_pending={BATCH_MAX_PENDING}).")
         except Exception as e:
             raise RuntimeError(f"Failed to load Whisper model: {e}") from e
 
@@ -163,16 +208,60 @@ def _transcribe_whisper(audio_buffer: BytesIO) -> tuple[str, str]:
     )
     full_text = " ".join([segment.text for segment in segments]).strip()
     
-    # Periodically clear GPU cache
-    if torch.cuda.is_available():
-        state.transcriptions_since_last_clear += 1
-        if state.transcriptions_since_last_clear >= 10:
-            logger.info("Clearing GPU cache after 10 transcriptions.")
-            torch.cuda.empty_cache()
-            state.transcriptions_since_last_clear = 0
-    
+    _maybe_clear_gpu_cache()
     return full_text, info.language
 
+def _maybe_clear_gpu_cache():
+    """Periodically clear GPU cache; called from inference pool threads."""
+    if torch is None or not torch.cuda.is_available():
+        return
+    with state.gpu_cache_lock:
+        state.transcriptions_since_last_clear += 1
+        if state.transcriptions_since_last_clear < 10:
+            return
+        state.transcriptions_since_last_clear = 0
+    logger.info("Clearing GPU cache after 10 transcriptions.")
+    torch.cuda.empty_cache()
+
+def _transcribe_whisper_words(audio: np.ndarray, prompt: Optional[str]) -> Tuple[List[Tuple[float, float, str]], float]:
+    """Word-timestamped transcription of a float32 16 kHz window, for the streaming engine."""
+    segments, _ = state.stt_client.transcribe(
+        audio,
+        beam_size=1,
+        vad_filter=False,
+        temperature=0.0,
+        language=FORCED_LANGUAGE,
+        word_timestamps=True,
+        initial_prompt=prompt,
+        condition_on_previous_text=False,
+    )
+    words: List[Tuple[float, float, str]] = []
+    no_speech = []
+    for segment in segments:
+        no_speech.append(segment.no_speech_prob)
+        if segment.no_speech_prob >= 0.6:
+            continue
+        words.extend((w.start, w.end, w.word) for w in (segment.words or []))
+    _maybe_clear_gpu_cache()
+    return words, 1.0 - float(np.mean(no_speech)) if no_speech else 0.0
+
+async def _run_inference(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(state.inference_pool, fn, *args)
+
+def _decode_wav(audio_buffer: BytesIO) -> np.ndarray:
+    from faster_whisper.audio import decode_audio
+    return decode_audio(audio_buffer, sampling_rate=16000)
+
+async def _transcribe_whisper_clip(audio_buffer: BytesIO) -> tuple[str, str]:
+    """Transcribe an uploaded clip through the micro-batcher; clips longer than one Whisper window run unbatched."""
+    if state.batcher is None:
+        return await _run_inference(_transcribe_whisper, audio_buffer)
+    audio = await _run_inference(_decode_wav, audio_buffer)
+    if len(audio) > MAX_CLIP_SEC * 16000:
+        return await _run_inference(_transcribe_whisper, audio)
+    result = await state.batcher.submit(TranscriptionJob(audio), key="text", priority=1)
+    return result.text, result.language or FORCED_LANGUAGE
+
 def _transcribe_deepgram(audio_bytes: bytes) -> tuple[str, str]:
     """Helper function to run synchronous Deepgram transcription in a thread pool."""
     payload: BufferSource = {'buffer': audio_bytes}
@@ -208,6 +297,12 @@ def startup_event():
         logger.error(f"Could not connect to Redis: {e}")
         state.redis_client = None
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    if state.batcher is not None:
+        await state.batcher.stop()
+    state.inference_pool.shutdown(wait=False, cancel_futures=True)
+
 @app.post("/stt", response_model=SttResponse)
 async def recognize_speech(request: SttRequest):
     if not state.stt_client:
@@ -228,10 +323,10 @@ async def recognize_speech(request: SttRequest):
         if STT_PROVIDER == "whisper":
             audio_buffer = BytesIO(audio_bytes)
             audio_buffer.name = "audio.wav"
-            full_text, language = await run_in_threadpool(_transcribe_whisper, audio_buffer)
+            full_text, language = await _transcribe_whisper_clip(audio_buffer)
 
         elif STT_PROVIDER == "deepgram":
-            full_text, language = await run_in_threadpool(_transcribe_deepgram, audio_bytes)
+            full_text, language = await _run_inference(_transcribe_deepgram, audio_bytes)
 
         end_time = time.time()
         processing_time_ms = int((end_time - start_time) * 1000)
@@ -250,72 +345,90 @@ async def recognize_speech(request: SttRequest):
 
         return SttResponse(text=full_text, language=language, transcription_time_ms=processing_time_ms)
 
+    except BatcherOverloaded as e:
+        logger.warning(f"Shedding STT request: {e}")
+        raise HTTPException(status_code=503, detail="STT is overloaded, retry shortly.", headers={"Retry-After": "1"})
     except Exception as e:
         logger.error(f"Transcription error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal error during audio processing: {e}")
 
 @app.websocket("/ws/stt")
 async def websocket_stt(websocket: WebSocket):
-    """WebSocket endpoint for streaming STT"""
+    """
+    WebSocket endpoint for streaming STT.
+
+    The client sends 16 kHz mono int16 PCM frames. Partial messages are sent
+    about every STT_STREAM_STEP_SEC. In each one, "stable" is text that will not
+    change and "unstable" is the current guess for the rest. A final message
+    follows every utterance, once STT_STREAM_SILENCE_SEC of silence is seen.
+
+    With ?protocol=segments the client frames its audio (see ws_protocol) and
+    marks utterances with its own VAD. Every segment end gets one final tagged
+    with its segment_id. Non-empty finals are forwarded downstream like POST /stt
+    results, with the agent_id query parameter and the segment_id as session_id,
+    which is what voice-in posts when it falls back to POST /stt.
+    """
     await websocket.accept()
+    if STT_PROVIDER != "whisper" or not state.stt_client:
+        await websocket.close(code=1011, reason="Streaming STT requires the whisper provider.")
+        return
     state.streaming_state.active_websockets.add(websocket)
-    logger.info(f"STT WebSocket connection established. Active: {len(state.streaming_state.active_websockets)}")
-    
-    buffer = b""
+    params = websocket.query_params
+    framed = params.get("protocol") == ws_protocol.PROTOCOL
+    agent_id = params.get("agent_id")
+    logger.info(
+        f"STT WebSocket connection established ({'segments' if framed else 'raw'}). "
+        f"Active: {len(state.streaming_state.active_websockets)}"
+    )
+
+    async def emit(event: dict):
+        if framed and event["type"] == "final" and event["text"]:
+            asyncio.create_task(notify_downstream(event["text"], agent_id, event["segment_id"]))
+        await websocket.send_json(event)
+        logger.debug(f"{event['type'].capitalize()} transcription: {event['text']} (confidence: {event['confidence']:.2f})")
+
+    async def transcribe(audio: np.ndarray, prompt: Optional[str], final: bool):
+        if state.batcher is None:
+            return await _run_inference(_transcribe_whisper_words, audio, prompt)
+        # Overload raises here: the engine skips that partial and retries on newer audio.
+        result = await state.batcher.submit(
+            TranscriptionJob(audio, prompt=prompt, word_timestamps=True), key="words", priority=1 if final else 0
+        )
+        if result.no_speech_prob >= 0.6:
+            return [], 1.0 - result.no_speech_prob
+        return result.words, 1.0 - result.no_speech_prob
+
+    transcriber = StreamingTranscriber(
+        transcribe,
+        emit,
+        step_sec=STREAM_STEP_SEC,
+        max_window_sec=STREAM_MAX_WINDOW_SEC,
+        silence_sec=STREAM_SILENCE_SEC,
+        silence_rms=STREAM_SILENCE_RMS,
+        explicit_segments=framed,
+    )
+    transcriber.start()
     try:
         while True:
-            data = await websocket.receive_bytes()
-            buffer += data
-            
-            # Process partial transcription every 2 seconds or on silence
-            if len(buffer) > 32000:  # ~2s at 16kHz
-                partial_text, confidence = await process_partial_audio(buffer)
-                if partial_text:
-                    await websocket.send_json({
-                        "type": "partial",
-                        "text": partial_text,
-                        "confidence": confidence,
-                        "timestamp": time.time()
-                    })
-                    logger.debug(f"Partial transcription: {partial_text} (confidence: {confidence})")
-                buffer = b""  # Reset buffer after processing
-            
+            message = await websocket.receive_bytes()
+            if not framed:
+                transcriber.feed(message)
+                continue
+            kind, payload = ws_protocol.decode(message)
+            if kind == ws_protocol.AUDIO:
+                transcriber.feed(payload)
+            elif kind == ws_protocol.SEGMENT_START:
+                transcriber.begin_segment(bytes(payload).decode("utf-8"))
+            else:
+                transcriber.end_segment()
     except WebSocketDisconnect:
-        state.streaming_state.active_websockets.remove(websocket)
-        logger.info(f"STT WebSocket closed. Active: {len(state.streaming_state.active_websockets)}")
+        logger.info(f"STT WebSocket closed. Active: {len(state.streaming_state.active_websockets) - 1}")
     except Exception as e:
         logger.error(f"STT WebSocket error: {e}")
-        state.streaming_state.active_websockets.remove(websocket)
-
-async def process_partial_audio(audio_data: bytes) -> tuple[str, float]:
-    """Process partial audio buffer with Whisper"""
-    try:
-        # Convert raw bytes to a float32 numpy array as expected by Whisper
-        np_chunk = np.frombuffer(audio_data, dtype=np.int16)
-        audio_float = np_chunk.astype(np.float32) / 32768.0
-
-        segments, info = state.stt_client.transcribe(
-            audio_float,
-            beam_size=1,
-            vad_filter=False,
-            temperature=0.0,
-            language=FORCED_LANGUAGE
-        )
-        partial_text = " ".join([segment.text for segment in segments if segment.no_speech_prob < 0.6]).strip()
-        confidence = np.mean([segment.no_speech_prob for segment in segments]) if segments else 0.0
-        
-        # Periodically clear GPU cache
-        if torch.cuda.is_available():
-            state.transcriptions_since_last_clear += 1
-            if state.transcriptions_since_last_clear >= 10:
-                logger.info("Clearing GPU cache after 10 transcriptions.")
-                torch.cuda.empty_cache()
-                state.transcriptions_since_last_clear = 0
-        
-        return partial_text, 1.0 - confidence
-    except Exception as e:
-        logger.error(f"Partial transcription error: {e}")
-        return "", 0.0
+    finally:
+        state.streaming_state.active_websockets.discard(websocket)
+        await transcriber.close()
+        logger.info(f"STT stream stats: {transcriber.stats}")
 
 @app.get("/health")
 async def health_check():
@@ -353,7 +466,8 @@ async def health_check():
                 "stt_model_loaded": stt_ready,
                 "redis_connected": state.redis_client is not None,
                 "downstream_brain_service": "healthy" if brain_ready else "unhealthy"
-            }
+            },
+            "inference_batching": state.batcher.metrics() if state.batcher else None,
         }
     )
 
@@ -0,0 +1,339 @@
+"""
+Streaming transcription engine for the /ws/stt endpoint.
+
+Audio for a connection goes into a preallocated float32 ring buffer. A
+per-connection processor task re-transcribes the still-uncommitted tail of the
+audio every `step_sec` (overlapping windows) and commits the longest word prefix
+two consecutive hypotheses agree on (local agreement). Committed words are never
+re-sent as unstable text, and the next window starts right after them, so words
+are not cut at window boundaries. When trailing silence exceeds `silence_sec`
+the rest of the utterance is transcribed once more and emitted as a final.
+
+With `explicit_segments` the client marks utterances itself (its own VAD):
+`begin_segment`/`end_segment` bracket each one, every `end_segment` produces
+exactly one final tagged with the segment id, and the energy detector is only
+used to trim the trailing silence before the final pass.
+
+Inference is injected as an async callable so the engine does not depend on the
+model or on how inference is scheduled.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("stt-service.streaming")
+
+SAMPLE_RATE = 16000
+
+
+@dataclass
+class Word:
+    start: float  # seconds, absolute stream time
+    end: float
+    text: str
+
+    @property
+    def key(self) -> str:
+        return self.text.strip().lower().strip(".,!?;:…\"'«»—-")
+
+
+# (audio float32 mono 16 kHz, prompt, is_final) -> (words with times relative to the audio start, confidence)
+TranscribeFn = Callable[[np.ndarray, Optional[str], bool], Awaitable[Tuple[List[Tuple[float, float, str]], float]]]
+
+
+class PcmRingBuffer:
+    """
+    Fixed-capacity float32 ring over a 16-bit PCM stream, addressed by absolute sample index.
+
+    Samples are written twice (at i and i + capacity), so any window up to
+    `capacity` samples is one contiguous slice without a concatenate.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = int(capacity)
+        self._data = np.zeros(2 * self.capacity, dtype=np.float32)
+        self.total = 0  # samples written since the stream started
+
+    def write_pcm16(self, data: bytes) -> np.ndarray:
+        """Append little-endian int16 PCM; returns the converted samples (a view, valid until the next write)."""
+        usable = len(data) - (len(data) % 2)
+        samples = np.frombuffer(memoryview(data)[:usable], dtype=np.int16)
+        if len(samples) > self.capacity:
+            self.total += len(samples) - self.capacity
+            samples = samples[-self.capacity:]
+        n = len(samples)
+        pos = self.total % self.capacity
+        first = min(n, self.capacity - pos)
+        for offset in (pos, pos + self.capacity):
+            np.multiply(samples[:first], 1.0 / 32768.0, out=self._data[offset:offset + first], casting="unsafe")
+        if n > first:
+            np.multiply(samples[first:], 1.0 / 32768.0, out=self._data[:n - first], casting="unsafe")
+            np.multiply(samples[first:], 1.0 / 32768.0, out=self._data[self.capacity:self.capacity + n - first], casting="unsafe")
+        self.total += n
+        return self._data[pos:pos + n]
+
+    @property
+    def oldest(self) -> int:
+        return max(0, self.total - self.capacity)
+
+    def window(self, start: int, end: Optional[int] = None) -> np.ndarray:
+        """Copy of samples [start, end) in absolute indices, clamped to what is still buffered."""
+        end = self.total if end is None else min(end, self.total)
+        start = min(max(start, self.oldest), end)
+        pos = start % self.capacity
+        return self._data[pos:pos + (end - start)].copy()
+
+
+class StreamingTranscriber:
+    """Turns a live PCM stream into partial and final transcript events."""
+
+    def __init__(
+        self,
+        transcribe: TranscribeFn,
+        emit: Callable[[Dict[str, Any]], Awaitable[None]],
+        step_sec: float = 1.0,
+        max_window_sec: float = 15.0,
+        silence_sec: float = 0.6,
+        silence_rms: float = 0.01,
+        prompt_words: int = 30,
+        explicit_segments: bool = False,
+    ):
+        self.transcribe = transcribe
+        self.emit = emit
+        self.step = int(step_sec * SAMPLE_RATE)
+        self.max_window = int(max_window_sec * SAMPLE_RATE)
+        self.silence_samples = int(silence_sec * SAMPLE_RATE)
+        self.silence_rms = silence_rms
+        self.prompt_words = prompt_words
+        self.explicit_segments = explicit_segments
+        self.frame = SAMPLE_RATE // 50  # 20 ms energy frames
+        self.ring = PcmRingBuffer(self.max_window + 10 * SAMPLE_RATE)
+
+        self.committed_sample = 0  # audio before this index is transcribed and committed
+        self.committed: List[Word] = []  # committed words of the current utterance
+        self.hypothesis: List[Word] = []  # unstable tail of the previous pass
+        self.context: List[str] = []  # recent committed words across utterances, for the prompt
+        self.last_step_at = 0
+        self.trailing_silence = 0
+        self.last_voiced_sample = 0  # end of the newest voiced frame, absolute
+        self.speech_pending = False  # speech seen since the last final
+        self.closed = False
+        self.confidence = 0.0
+        self._flush_on_close = False
+        self.segment_id: Optional[str] = None  # open client segment (explicit mode)
+        self._segment_start = 0
+        self._segment_ends: Deque[Tuple[str, int, int]] = deque()  # (segment id, start, end) awaiting a final
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"passes": 0, "finals": 0, "inference_ms": 0.0}
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self, flush: bool = False):
+        """Stop processing; with flush, emit a final for any pending speech first."""
+        if flush and self.segment_id is not None:
+            self.end_segment()
+        self.closed = True
+        self._flush_on_close = flush
+        self._wakeup.set()
+        if self._task is not None:
+            try:
+                await self._task
+            except Exception as e:
+                logger.error(f"Streaming processor failed: {e}")
+
+    def feed(self, data: bytes):
+        """Append PCM16 audio; never blocks on inference."""
+        samples = self.ring.write_pcm16(data)
+        n_frames = len(samples) // self.frame
+        if n_frames:
+            frames = samples[:n_frames * self.frame].reshape(n_frames, self.frame)
+            voiced = np.sqrt(np.mean(frames * frames, axis=1)) >= self.silence_rms
+            if voiced.any():
+                self.speech_pending = True
+                last_voiced = int(np.flatnonzero(voiced)[-1])
+                self.last_voiced_sample = self.ring.total - len(samples) + (last_voiced + 1) * self.frame
+                self.trailing_silence = (n_frames - 1 - last_voiced) * self.frame + (len(samples) - n_frames * self.frame)
+            else:
+                self.trailing_silence += len(samples)
+        else:
+            self.trailing_silence += len(samples)
+        self._wakeup.set()
+
+    def begin_segment(self, segment_id: str):
+        """Client VAD opened a segment; audio fed from now on belongs to it."""
+        if self.segment_id is not None:
+            self.end_segment()
+        self.segment_id = segment_id
+        self._segment_start = self.ring.total
+        self.trailing_silence = 0
+        if not self._segment_ends:
+            self.committed_sample = self.last_step_at = self.ring.total
+        self.speech_pending = True
+        self._wakeup.set()
+
+    def end_segment(self):
+        """Client VAD closed the open segment; a final for it is emitted even if it is empty."""
+        if self.segment_id is None:
+            return
+        trim = max(self.trailing_silence - SAMPLE_RATE // 5, 0)
+        end = max(self.ring.total - trim, self._segment_start)
+        self._segment_ends.append((self.segment_id, self._segment_start, end))
+        self.segment_id = None
+        self._wakeup.set()
+
+    def _due(self) -> Optional[str]:
+        if self.explicit_segments:
+            if self._segment_ends:
+                return "final"
+            if self.segment_id is not None and self.ring.total - self.last_step_at >= self.step:
+                return "partial"
+            return None
+        if not self.speech_pending:
+            return None
+        if self.trailing_silence >= self.silence_samples:
+            return "final"
+        if self.ring.total - self.last_step_at >= self.step:
+            return "partial"
+        return None
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if self.closed:
+                if self._flush_on_close:
+                    if self.explicit_segments:
+                        while self._segment_ends:
+                            await self._final()
+                    elif self.speech_pending:
+                        await self._final()
+                return
+            # Several steps can be due after a slow pass; one pass over the newest audio covers them.
+            due = self._due()
+            try:
+                if due == "final":
+                    await self._final()
+                elif due == "partial":
+                    await self._partial()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Drop this pass; the next step retries with newer audio.
+                logger.error(f"Streaming {due} transcription failed: {e}")
+
+    async def _pass(self, end: int, final: bool = False) -> List[Word]:
+        """Transcribe [committed_sample, end) and return words in absolute time."""
+        start = max(self.committed_sample, self.ring.oldest)
+        audio = self.ring.window(start, end)
+        if len(audio) < SAMPLE_RATE // 10:
+            return []
+        prompt = " ".join(self.context[-self.prompt_words:]) or None
+        started = time.perf_counter()
+        words, self.confidence = await self.transcribe(audio, prompt, final)
+        self.stats["passes"] += 1
+        self.stats["inference_ms"] += (time.perf_counter() - started) * 1000
+        offset = start / SAMPLE_RATE
+        return [Word(offset + w_start, offset + w_end, text) for w_start, w_end, text in words if text.strip()]
+
+    def _commit(self, words: List[Word]):
+        if not words:
+            return
+        self.committed.extend(words)
+        self.context.extend(w.text.strip() for w in words)
+        del self.context[:-self.prompt_words]
+        self.committed_sample = max(self.committed_sample, int(words[-1].end * SAMPLE_RATE))
+
+    @staticmethod
+    def _text(words: List[Word]) -> str:
+        return "".join(w.text if w.text.startswith(" ") else f" {w.text}" for w in words).strip()
+
+    async def _partial(self):
+        end = self.ring.total
+        self.last_step_at = end
+        segment_id = self.segment_id
+        words = await self._pass(end)
+
+        # Local agreement: words both passes produced, in order, are stable.
+        agreed = 0
+        for previous, current in zip(self.hypothesis, words):
+            if previous.key != current.key:
+                break
+            agreed += 1
+        stable, unstable = words[:agreed], words[agreed:]
+
+        # Keep the window bounded: past max_window force-commit all but the last second.
+        if end - self.committed_sample > self.max_window:
+            limit = (end - SAMPLE_RATE) / SAMPLE_RATE
+            forced = [w for w in unstable if w.end <= limit]
+            stable, unstable = stable + forced, unstable[len(forced):]
+            if not stable:
+                self.committed_sample = end - self.max_window // 2
+
+        self._commit(stable)
+        self.hypothesis = unstable
+        if self.committed or unstable:
+            event = {
+                "type": "partial",
+                "text": self._text(self.committed + unstable),
+                "stable": self._text(self.committed),
+                "unstable": self._text(unstable),
+                "confidence": self.confidence,
+                "timestamp": time.time(),
+            }
+            if self.explicit_segments:
+                event["segment_id"] = segment_id
+            await self.emit(event)
+
+    async def _final(self):
+        if not self.explicit_segments:
+            end = self.ring.total - max(self.trailing_silence - SAMPLE_RATE // 5, 0)
+            await self._finish(None, await self._pass(end, final=True), end)
+            return
+        segment_id, _, end = self._segment_ends.popleft()
+        try:
+            words = await self._pass(end, final=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The client is waiting on this segment id, so it still gets its (empty) final.
+            logger.error(f"Final transcription of segment {segment_id} failed: {e}")
+            words = []
+        await self._finish(segment_id, words, end)
+
+    async def _finish(self, segment_id: Optional[str], words: List[Word], end: int):
+        text = self._text(self.committed + words)
+        self.context.extend(w.text.strip() for w in words)
+        del self.context[:-self.prompt_words]
+        self.committed, self.hypothesis = [], []
+        if segment_id is None:
+            # Audio fed while the final pass ran starts the next utterance; speech in it keeps it pending.
+            self.committed_sample = self.last_step_at = end
+            self.speech_pending = self.last_voiced_sample > end
+        else:
+            # Segments closed or opened while this final was transcribed start where they began.
+            if self._segment_ends:
+                following = self._segment_ends[0][1]
+            elif self.segment_id is not None:
+                following = self._segment_start
+            else:
+                following = self.ring.total
+            self.committed_sample = self.last_step_at = following
+            self.speech_pending = self.segment_id is not None or bool(self._segment_ends)
+        self.stats["finals"] += 1
+        if text or segment_id is not None:
+            event = {
+                "type": "final",
+                "text": text,
+                "confidence": self.confidence,
+                "timestamp": time.time(),
+            }
+            if segment_id is not None:
+                event["segment_id"] = segment_id
+            await self.emit(event)
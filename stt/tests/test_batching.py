@@ -0,0 +1,127 @@
+import asyncio
+import threading
+
+import pytest
+
+from stt.batching import BatcherOverloaded, InferenceBatcher
+
+
+class GatedRunBatch:
+    """Fake run_batch: records every batch; the first one blocks until released, keeping the batcher busy."""
+
+    def __init__(self):
+        self.batches = []
+        self.started = threading.Event()
+        self.gate = threading.Event()
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        self.started.set()
+        self.gate.wait(timeout=5)
+        return [f"text:{item}" for item in items]
+
+
+async def _occupy(batcher, run_batch):
+    """Submit a first job and wait until its batch holds the only batch slot."""
+    first = asyncio.create_task(batcher.submit("first", key="text"))
+    while not run_batch.started.is_set():
+        await asyncio.sleep(0.001)
+    return first
+
+
+async def _queued(batcher, count):
+    while batcher.pending < count:
+        await asyncio.sleep(0.001)
+
+
+@pytest.fixture
+def run_batch():
+    run_batch = GatedRunBatch()
+    yield run_batch
+    run_batch.gate.set()
+
+
+@pytest.mark.asyncio
+async def test_jobs_with_the_same_key_share_a_batch(run_batch):
+    run_batch.gate.set()
+    batcher = InferenceBatcher(run_batch, max_batch=4, max_wait_ms=50)
+
+    results = await asyncio.gather(*(batcher.submit(i, key="words") for i in range(3)))
+
+    assert results == ["text:0", "text:1", "text:2"]
+    assert run_batch.batches == [[0, 1, 2]]
+    assert batcher.metrics()["mean_batch_size"] == 3
+    await batcher.stop()
+
+
+@pytest.mark.asyncio
+async def test_higher_priority_jobs_run_first(run_batch):
+    batcher = InferenceBatcher(run_batch, max_batch=2, max_wait_ms=0)
+    first = await _occupy(batcher, run_batch)
+
+    partials = [asyncio.create_task(batcher.submit(f"partial-{i}", key="words", priority=0)) for i in range(2)]
+    await _queued(batcher, 2)
+    final = asyncio.create_task(batcher.submit("final", key="words", priority=1))
+    upload = asyncio.create_task(batcher.submit("upload", key="text", priority=1))
+    await _queued(batcher, 4)
+    run_batch.gate.set()
+    await asyncio.gather(first, final, upload, *partials)
+
+    assert run_batch.batches[1] == ["final", "partial-0"]  # same key: the final jumps the partials
+    assert run_batch.batches[2:] == [["upload"], ["partial-1"]]
+    await batcher.stop()
+
+
+@pytest.mark.asyncio
+async def test_submit_sheds_load_beyond_max_pending(run_batch):
+    batcher = InferenceBatcher(run_batch, max_batch=8, max_wait_ms=0, max_pending=2)
+    first = await _occupy(batcher, run_batch)
+
+    queued = [asyncio.create_task(batcher.submit(i, key="words")) for i in range(2)]
+    await _queued(batcher, 2)
+    with pytest.raises(BatcherOverloaded):
+        await batcher.submit("one too many", key="words")
+
+    assert batcher.stats["rejected"] == 1
+    run_batch.gate.set()
+    assert await asyncio.gather(*queued) == ["text:0", "text:1"]
+    await first
+    await batcher.stop()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_jobs_are_left_out_of_the_batch(run_batch):
+    batcher = InferenceBatcher(run_batch, max_batch=8, max_wait_ms=0)
+    first = await _occupy(batcher, run_batch)
+
+    abandoned = asyncio.create_task(batcher.submit("abandoned", key="words"))
+    kept = asyncio.create_task(batcher.submit("kept", key="words"))
+    await _queued(batcher, 2)
+    abandoned.cancel()
+    run_batch.gate.set()
+
+    assert await kept == "text:kept"
+    with pytest.raises(asyncio.CancelledError):
+        await abandoned
+    assert run_batch.batches[1:] == [["kept"]]
+    await first
+    await batcher.stop()
+
+
+@pytest.mark.asyncio
+async def test_a_failed_batch_fails_only_its_jobs(run_batch):
+    calls = []
+
+    def flaky(items):
+        calls.append(list(items))
+        if len(calls) == 1:
+            raise RuntimeError("CUDA out of memory")
+        return [f"text:{item}" for item in items]
+
+    batcher = InferenceBatcher(flaky, max_batch=8, max_wait_ms=0)
+
+    with pytest.raises(RuntimeError, match="out of memory"):
+        await batcher.submit("a", key="words")
+    assert await batcher.submit("b", key="words") == "text:b"
+    assert batcher.stats["failed_batches"] == 1
+    await batcher.stop()
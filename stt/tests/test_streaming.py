@@ -0,0 +1,165 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from stt.streaming import SAMPLE_RATE, PcmRingBuffer, StreamingTranscriber
+
+
+def _pcm(seconds: float, amplitude: int = 3000) -> bytes:
+    return np.full(int(seconds * SAMPLE_RATE), amplitude, dtype=np.int16).tobytes()
+
+
+def _silence(seconds: float) -> bytes:
+    return _pcm(seconds, amplitude=0)
+
+
+class ScriptedModel:
+    """Fake inference: returns the queued hypotheses in order, recording every call."""
+
+    def __init__(self, *hypotheses):
+        self.hypotheses = list(hypotheses)
+        self.calls = []
+
+    async def __call__(self, audio, prompt, final):
+        self.calls.append((len(audio), prompt, final))
+        words = self.hypotheses.pop(0)
+        if isinstance(words, Exception):
+            raise words
+        return [(i * 0.3, i * 0.3 + 0.25, text) for i, text in enumerate(words)], 0.9
+
+
+def _transcriber(model, **kwargs):
+    events = []
+
+    async def emit(event):
+        events.append(event)
+
+    return StreamingTranscriber(model, emit, **kwargs), events
+
+
+class TestPcmRingBuffer:
+    def test_window_across_the_wrap_is_contiguous(self):
+        ring = PcmRingBuffer(8)
+        ring.write_pcm16(np.arange(1, 7, dtype=np.int16).tobytes())
+        ring.write_pcm16(np.arange(7, 13, dtype=np.int16).tobytes())
+
+        assert ring.total == 12
+        assert ring.oldest == 4
+        np.testing.assert_array_equal(ring.window(0) * 32768, np.arange(5, 13))
+        np.testing.assert_array_equal(ring.window(6, 10) * 32768, [7, 8, 9, 10])
+
+    def test_oversized_write_keeps_the_newest_samples(self):
+        ring = PcmRingBuffer(4)
+        ring.write_pcm16(np.arange(1, 11, dtype=np.int16).tobytes() + b"\x01")  # odd trailing byte is dropped
+
+        assert ring.total == 10
+        np.testing.assert_array_equal(ring.window(0) * 32768, [7, 8, 9, 10])
+
+
+class TestLocalAgreement:
+    @pytest.mark.asyncio
+    async def test_words_two_passes_agree_on_are_committed(self):
+        model = ScriptedModel(["Shalom", "aleichem"], ["Shalom", "aleichem", "friend"])
+        transcriber, events = _transcriber(model)
+
+        transcriber.feed(_pcm(1.0))
+        await transcriber._partial()
+        transcriber.feed(_pcm(1.0))
+        await transcriber._partial()
+
+        assert events[0]["stable"] == "" and events[0]["unstable"] == "Shalom aleichem"
+        assert events[1]["stable"] == "Shalom aleichem" and events[1]["unstable"] == "friend"
+        assert [w.text for w in transcriber.committed] == ["Shalom", "aleichem"]
+        assert transcriber.committed_sample == int(0.55 * SAMPLE_RATE)
+
+    @pytest.mark.asyncio
+    async def test_committed_words_are_not_transcribed_again(self):
+        model = ScriptedModel(["one", "two"], ["one", "two"], ["three"])
+        transcriber, events = _transcriber(model)
+
+        for _ in range(3):
+            transcriber.feed(_pcm(1.0))
+            await transcriber._partial()
+
+        # The third pass starts after the committed words, so its window is shorter than the stream.
+        assert model.calls[2][0] == 3 * SAMPLE_RATE - int(0.55 * SAMPLE_RATE)
+        assert model.calls[2][1] == "one two"
+        assert events[-1]["text"] == "one two three"
+
+
+class TestFinals:
+    @pytest.mark.asyncio
+    async def test_final_after_trailing_silence(self):
+        model = ScriptedModel(["Good", "Shabbos"])
+        transcriber, events = _transcriber(model)
+
+        transcriber.feed(_pcm(1.0))
+        transcriber.feed(_silence(0.7))
+        assert transcriber._due() == "final"
+        await transcriber._final()
+
+        assert events == [{"type": "final", "text": "Good Shabbos", "confidence": 0.9, "timestamp": events[0]["timestamp"]}]
+        assert model.calls[0][2] is True
+        assert transcriber._due() is None
+
+    @pytest.mark.asyncio
+    async def test_speech_fed_during_the_final_pass_is_kept(self):
+        release = asyncio.Event()
+        transcriber, events = None, []
+
+        async def model(audio, prompt, final):
+            if final:
+                # The next utterance starts while the final is being transcribed.
+                transcriber.feed(_silence(0.3))
+                transcriber.feed(_pcm(0.5))
+                await release.wait()
+            return [(0.0, 0.4, "first")], 0.9
+
+        transcriber, events = _transcriber(model)
+        transcriber.feed(_pcm(1.0))
+        transcriber.feed(_silence(0.7))
+        end = transcriber.ring.total - (transcriber.trailing_silence - SAMPLE_RATE // 5)
+        final = asyncio.create_task(transcriber._final())
+        await asyncio.sleep(0)
+        release.set()
+        await final
+
+        assert events[0]["text"] == "first"
+        assert transcriber.committed_sample == end < transcriber.ring.total
+        assert transcriber.speech_pending
+        assert len(transcriber.ring.window(transcriber.committed_sample)) == transcriber.ring.total - end
+
+    @pytest.mark.asyncio
+    async def test_silence_fed_during_the_final_pass_ends_the_utterance(self):
+        transcriber, events = None, []
+
+        async def model(audio, prompt, final):
+            transcriber.feed(_silence(0.3))
+            return [(0.0, 0.4, "first")], 0.9
+
+        transcriber, events = _transcriber(model)
+        transcriber.feed(_pcm(1.0))
+        transcriber.feed(_silence(0.7))
+        await transcriber._final()
+
+        assert not transcriber.speech_pending
+        assert transcriber._due() is None
+
+    @pytest.mark.asyncio
+    async def test_every_client_segment_gets_a_final(self):
+        model = ScriptedModel(["Baruch", "atah"], RuntimeError("model crashed"))
+        transcriber, events = _transcriber(model, explicit_segments=True)
+
+        transcriber.begin_segment("seg-1")
+        transcriber.feed(_pcm(1.0))
+        transcriber.end_segment()
+        transcriber.begin_segment("seg-2")
+        transcriber.feed(_pcm(0.5))
+        transcriber.end_segment()
+        while transcriber._segment_ends:
+            await transcriber._final()
+
+        assert [(e["segment_id"], e["text"]) for e in events] == [("seg-1", "Baruch atah"), ("seg-2", "")]
+        assert model.calls[0][0] == SAMPLE_RATE
+        assert transcriber.committed_sample == transcriber.ring.total
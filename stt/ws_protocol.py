@@ -0,0 +1,43 @@
+"""
+Binary framing for segment-aware audio on /ws/stt.
+
+A client selects it with the query parameter ``protocol=segments``.
+Without that parameter, binary messages are still bare PCM. Each
+websocket message is one frame: a type byte followed by its payload.
+
+    0x01 SEGMENT_START  UTF-8 segment id; speech started, audio follows
+    0x02 AUDIO          16 kHz mono little-endian int16 PCM
+    0x03 SEGMENT_END    UTF-8 segment id; the client's VAD closed the segment
+
+The server emits a ``final`` event for every SEGMENT_END, even when the
+text is empty, tagged with the segment id. With explicit segments, the
+server's own silence detection does not end utterances.
+"""
+from typing import Tuple
+
+PROTOCOL = "segments"
+
+SEGMENT_START = 0x01
+AUDIO = 0x02
+SEGMENT_END = 0x03
+
+_TYPES = {SEGMENT_START, AUDIO, SEGMENT_END}
+
+
+def encode_start(segment_id: str) -> bytes:
+    return bytes((SEGMENT_START,)) + segment_id.encode("utf-8")
+
+
+def encode_audio(pcm) -> bytes:
+    return bytes((AUDIO,)) + bytes(pcm)
+
+
+def encode_end(segment_id: str) -> bytes:
+    return bytes((SEGMENT_END,)) + segment_id.encode("utf-8")
+
+
+def decode(frame: bytes) -> Tuple[int, memoryview]:
+    """(frame type, payload view); raises ValueError for an empty or unknown frame."""
+    if not frame or frame[0] not in _TYPES:
+        raise ValueError(f"Unknown STT stream frame type: {frame[:1].hex() or 'empty'}")
+    return frame[0], memoryview(frame)[1:]
@@ -1,5 +1,5 @@
 from .threadsafe_generators import CharIterator, AccumulatingThreadSafeGenerator
-from .stream_player import StreamPlayer, AudioConfiguration
+from .stream_player import StreamPlayer, AudioConfiguration, AudioRingBuffer
 from typing import Union, Iterator, List
 from .engines import BaseEngine
 import stream2sentence as s2s
@@ -103,7 +103,10 @@ class TextToAudioStream:
 
         # Check if the engine doesn't support consuming generators directly
         if not self.engine.can_consume_generators:
-            self.player = StreamPlayer(self.engine.queue, AudioConfiguration(format, channels, rate), on_playback_start=self._on_audio_stream_start)
+            config = AudioConfiguration(format, channels, rate)
+            # The engine writes straight into the player's bounded ring buffer (put() blocks when it is full)
+            self.engine.queue = AudioRingBuffer(config)
+            self.player = StreamPlayer(self.engine.queue, config, on_playback_start=self._on_audio_stream_start)
         else:
             self.engine.on_playback_start = self._on_audio_stream_start
             self.player = None
@@ -140,13 +143,14 @@ class TextToAudioStream:
                    language: str = "",
                    context_size: int = 12,
                    muted: bool = False,
+                   adaptive_buffering: bool = True,
                    ):
         """
         Async handling of text to audio synthesis, see play() method.
         """
         self.stream_running = True
 
-        self.play_thread = threading.Thread(target=self.play, args=(fast_sentence_fragment, buffer_threshold_seconds, minimum_sentence_length, minimum_first_fragment_length, log_synthesized_text, reset_generated_text, output_wavfile, on_sentence_synthesized, on_audio_chunk, tokenizer, language, context_size, muted))
+        self.play_thread = threading.Thread(target=self.play, args=(fast_sentence_fragment, buffer_threshold_seconds, minimum_sentence_length, minimum_first_fragment_length, log_synthesized_text, reset_generated_text, output_wavfile, on_sentence_synthesized, on_audio_chunk, tokenizer, language, context_size, muted, adaptive_buffering))
         self.play_thread.daemon = True
         self.play_thread.start()
 
@@ -164,6 +168,7 @@ class TextToAudioStream:
             language: str = "en",
             context_size: int = 12,
             muted: bool = False,
+            adaptive_buffering: bool = True,
             ):
         """
         Handles the synthesis of text to audio.
@@ -172,9 +177,10 @@ class TextToAudioStream:
 
         Args:
         - fast_sentence_fragment: Determines if sentence fragments should be quickly yielded. Useful when a faster response is desired even if a sentence isn't complete.
-        - buffer_threshold_seconds (float): Time in seconds for the buffering threshold, influencing the flow and continuity of audio playback. Set to 0 to deactivate. Default is 0.
+        - buffer_threshold_seconds (float): Time in seconds for the buffering threshold, influencing the flow and continuity of audio playback. Set to 0 to use the player's adaptive target (see adaptive_buffering). Default is 0.
           - How it Works: The system verifies whether there is more audio content in the buffer than the duration defined by buffer_threshold_seconds. If so, it proceeds to synthesize the next sentence, capitalizing on the remaining audio to maintain smooth delivery. A higher value means more audio is pre-buffered, which minimizes pauses during playback. Adjust this upwards if you encounter interruptions.
           - Helps to decide when to generate more audio based on buffered content.
+        - adaptive_buffering (bool): If True and buffer_threshold_seconds is 0, the threshold follows the jitter buffer's target. The target is derived from measured first-chunk latency, synthesis speed versus real time, and recent underruns. If False, a 0 threshold deactivates buffering as before. Default is True.
         - minimum_sentence_length (int): The minimum number of characters a sentence must have. If a sentence is shorter, it will be concatenated with the following one, improving the overall readability. This parameter does not apply to the first sentence fragment, which is governed by `minimum_first_fragment_length`. Default is 10 characters.
         - minimum_first_fragment_length (int): The minimum number of characters required for the first sentence fragment before yielding. Default is 10 characters.
         - log_synthesized_text: If True, logs the synthesized text chunks.
@@ -252,7 +258,7 @@ class TextToAudioStream:
                 generate_sentences = s2s.generate_sentences(self.thread_safe_char_iter, context_size=context_size, minimum_sentence_length=minimum_sentence_length, minimum_first_fragment_length=minimum_first_fragment_length, quick_yield_single_sentence_fragment=fast_sentence_fragment, cleanup_text_links=True, cleanup_text_emojis=True, tokenizer=tokenizer, language=language, log_characters=self.log_characters)
 
                 # Create the synthesis chunk generator with the given sentences
-                chunk_generator = self._synthesis_chunk_generator(generate_sentences, buffer_threshold_seconds, log_synthesized_text)
+                chunk_generator = self._synthesis_chunk_generator(generate_sentences, buffer_threshold_seconds, log_synthesized_text, adaptive_buffering)
 
                 sentence_queue = queue.Queue()
 
@@ -270,7 +276,12 @@ class TextToAudioStream:
                             try:
                                 if abort_event.is_set():
                                     break
-                                success = self.engine.synthesize(sentence)
+                                audio_buffer = self.player.audio_buffer
+                                audio_buffer.begin_synthesis()
+                                try:
+                                    success = self.engine.synthesize(sentence)
+                                finally:
+                                    audio_buffer.end_synthesis()
                                 if success:
                                     if on_sentence_synthesized:
                                         on_sentence_synthesized(sentence)
@@ -529,7 +540,8 @@ class TextToAudioStream:
     def _synthesis_chunk_generator(self,
                                   generator: Iterator[str],
                                   buffer_threshold_seconds: float = 2.0,
-                                  log_synthesis_chunks: bool = False) -> Iterator[str]:
+                                  log_synthesis_chunks: bool = False,
+                                  adaptive_buffering: bool = False) -> Iterator[str]:
         """
         Generates synthesis chunks based on buffered audio length.
 
@@ -540,6 +552,7 @@ class TextToAudioStream:
             generator: Input iterator that provides chunks for synthesis.
             buffer_threshold_seconds: Time in seconds to specify how long audio data should be buffered before yielding the synthesis chunk.
             log_synthesis_chunks: Boolean flag that, if set to True, logs the synthesis chunks to the logging system.
+            adaptive_buffering: If True and buffer_threshold_seconds is 0, the player's adaptive target is used as the threshold and re-read for every chunk.
 
         Returns:
             Iterator of synthesis chunks.
@@ -547,12 +560,16 @@ class TextToAudioStream:
 
         # Initializes an empty string to accumulate chunks of synthesis
         synthesis_chunk = ""
+        threshold_is_adaptive = buffer_threshold_seconds <= 0
         
         # Iterates over each chunk from the provided generator
         for chunk in generator:
 
             # Fetch the total seconds of buffered audio
             buffered_audio_seconds = self.player.get_buffered_seconds()
+
+            if adaptive_buffering and threshold_is_adaptive:
+                buffer_threshold_seconds = self.player.get_target_buffer_seconds()
             
             # Append the current chunk (and a space) to the accumulated synthesis_chunk
             synthesis_chunk += chunk + " "
@@ -8,7 +8,7 @@ import time
 import numpy as np
 import asyncio
 import json
-from typing import Optional
+from typing import Iterator, Optional
 
 from audio.settings import (
     REDIS_URL as SETTINGS_REDIS_URL,
@@ -27,10 +27,19 @@ import sounddevice as sd
 import uvicorn
 import requests
 import httpx
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import StreamingResponse, Response, JSONResponse
 from pydantic import BaseModel
 
+from audio_cache import AudioCache, make_key, media_type_for, range_response
+
+try:
+    from tts.speech_pipeline import SentencePipeline
+    from tts.upstream import UpstreamClients
+except ImportError:
+    from speech_pipeline import SentencePipeline
+    from upstream import UpstreamClients
+
 # --- Provider-specific Imports ---
 try:
     from elevenlabs.client import ElevenLabs
@@ -70,6 +79,16 @@ from audio.settings import (
     YANDEX_USE_V3_REST,
 )
 
+# Queued playback: sentences synthesized ahead of the one playing, and how many at once
+SENTENCE_LOOKAHEAD = int(os.getenv("TTS_SENTENCE_LOOKAHEAD", "2"))
+SYNTHESIS_CONCURRENCY = int(os.getenv("TTS_SYNTHESIS_CONCURRENCY", "2"))
+PLAYBACK_SAMPLE_RATE = 24000
+
+# Content-addressed cache of synthesized audio for /stream and /tts/synthesize
+AUDIO_CACHE_ENABLED = os.getenv("TTS_AUDIO_CACHE_ENABLED", "true").lower() == "true"
+AUDIO_CACHE_DIR = os.getenv("TTS_AUDIO_CACHE_DIR", "audio_cache")
+AUDIO_CACHE_MAX_MB = int(os.getenv("TTS_AUDIO_CACHE_MAX_MB", "512"))
+
 # --- Global State ---
 class ServiceState:
     def __init__(self):
@@ -77,6 +96,11 @@ class ServiceState:
         self.redis_client: redis.Redis | None = None
         self.queue = queue.Queue()
         self.worker_thread: threading.Thread | None = None
+        self.pipeline: SentencePipeline | None = None
+        self.output_stream = None
+        self.audio_cache: AudioCache | None = None
+        self.upstream = UpstreamClients()
+        self.yandex_iam_token: tuple = (None, 0.0)  # (token, expires_at)
 
 state = ServiceState()
 
@@ -106,7 +130,10 @@ def initialize_tts_client():
         if not ELEVENLABS_API_KEY:
             raise RuntimeError("ElevenLabs provider selected, but ELEVENLABS_API_KEY is not set.")
         logger.info("Initializing ElevenLabs client...")
-        state.tts_client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
+        try:
+            state.tts_client = ElevenLabs(api_key=ELEVENLABS_API_KEY, httpx_client=state.upstream.sync_client('elevenlabs'))
+        except TypeError:  # older SDKs without httpx_client manage their own session
+            state.tts_client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
 
     elif TTS_PROVIDER == "orpheus":
         logger.info(f"Configured to use Orpheus TTS service at: {ORPHEUS_PROXY_URL}")
@@ -128,68 +155,152 @@ def initialize_tts_client():
     else:
         raise RuntimeError(f"Invalid TTS_PROVIDER: '{TTS_PROVIDER}'. Choose from [xtts, elevenlabs, orpheus, yandex]")
 
+def _synthesize_sentence(text: str) -> Iterator[bytes]:
+    """Provider audio for one sentence of the /speak pipeline, yielded as it arrives."""
+    if TTS_PROVIDER == 'xtts':
+        if state.tts_client != "xtts_api_proxy":
+            return
+        params = {"text": text, "speaker_wav": XTTS_SPEAKER_WAV_PATH, "language": "ru"}
+        with state.upstream.sync_client('xtts').stream("GET", f"{XTTS_API_URL}/tts_stream", params=params, timeout=30) as response:
+            response.raise_for_status()
+            yield from response.iter_bytes(chunk_size=4096)
+
+    elif TTS_PROVIDER == 'elevenlabs':
+        yield from state.tts_client.text_to_speech.convert(text=text, voice_id=ELEVENLABS_VOICE_ID)
+
+    elif TTS_PROVIDER == 'orpheus':
+        if state.tts_client != "orpheus_api_proxy":
+            return
+        payload = {"text": text} # Add other params from ENV later
+        with state.upstream.sync_client('orpheus').stream("POST", f"{ORPHEUS_PROXY_URL}/v1/tts/synthesize", json=payload, timeout=30) as response:
+            response.raise_for_status()
+            yield from response.iter_bytes(chunk_size=4096)
+
+    else:
+        logger.warning(f"TTS provider '{TTS_PROVIDER}' is not supported for queued playback.")
+
+
+def _pcm_chunks(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Whole 16-bit samples from a provider stream, minus a leading WAV header if there is one."""
+    pending = b""
+    header_checked = False
+    for chunk in chunks:
+        pending += chunk
+        if not header_checked:
+            if len(pending) < 44:
+                continue
+            if pending.startswith(b"RIFF"):
+                data_at = pending.find(b"data", 12)
+                if data_at < 0:
+                    continue
+                pending = pending[data_at + 8:]
+            header_checked = True
+        usable = len(pending) - len(pending) % 2
+        if usable:
+            yield pending[:usable]
+            pending = pending[usable:]
+
+
+def _play_sentence(chunks: Iterator[bytes]):
+    if TTS_PROVIDER == 'elevenlabs':
+        # ElevenLabs sends MP3; elevenlabs.play decodes a complete clip.
+        audio = b"".join(chunks)
+        if audio and not state.pipeline.interrupted.is_set():
+            elevenlabs_play(audio)
+        return
+    for pcm in _pcm_chunks(chunks):
+        state.output_stream.write(pcm)
+
+
+def _publish_tts_state(status: str):
+    if state.redis_client:
+        try:
+            state.redis_client.publish("astra:tts_state", json.dumps({"status": status}))
+        except redis.exceptions.ConnectionError as e:
+            logger.warning(f"Could not publish TTS state to Redis: {e}")
+
+
 def speech_worker():
-    """Worker thread that processes text from the queue and synthesizes speech."""
+    """Worker thread that speaks queued texts through the sentence pipeline."""
     while True:
         try:
             text = state.queue.get()
             if text is None: break
-            
-            logger.info(f"Processing text for TTS: '{text[:50]}...'")
-            audio_np = None
-            samplerate = 24000 # Default sample rate
-
-            if TTS_PROVIDER == 'xtts':
-                if state.tts_client != "xtts_api_proxy": continue
-                try:
-                    params = {"text": text, "speaker_wav": XTTS_SPEAKER_WAV_PATH, "language": "ru"}
-                    response = requests.get(f"{XTTS_API_URL}/tts_stream", params=params, stream=True, timeout=30)
-                    response.raise_for_status()
-                    audio_data = b"".join([chunk for chunk in response.iter_content(chunk_size=1024)])
-                    audio_np = np.frombuffer(audio_data, dtype=np.int16)
-                except requests.RequestException as e:
-                    logger.error(f"Failed to call XTTS API server: {e}")
-
-            elif TTS_PROVIDER == 'elevenlabs':
-                try:
-                    audio_generator = state.tts_client.text_to_speech.convert(text=text, voice_id=ELEVENLABS_VOICE_ID)
-                    audio_data = b"".join([chunk for chunk in audio_generator])
-                    # ElevenLabs uses MP3, need to decode it. This is complex, skipping for now.
-                    # For now, we assume the `play` function handles it.
-                    elevenlabs_play(audio_data)
-                except Exception as e:
-                    logger.error(f"Failed during ElevenLabs synthesis: {e}")
 
-            elif TTS_PROVIDER == 'orpheus':
-                if state.tts_client != "orpheus_api_proxy": continue
-                try:
-                    payload = {"text": text} # Add other params from ENV later
-                    response = requests.post(f"{ORPHEUS_PROXY_URL}/v1/tts/synthesize", json=payload, timeout=30)
-                    response.raise_for_status()
-                    audio_np = np.frombuffer(response.content, dtype=np.int16)
-                except requests.RequestException as e:
-                    logger.error(f"Failed to call Orpheus service: {e}")
-
-            # Generic playback for numpy audio data
-            if audio_np is not None:
-                try:
-                    sd.play(audio_np, samplerate)
-                    time.sleep(len(audio_np) / samplerate * 1.05) # Wait for playback to finish
-                    logger.info("Playback finished.")
-                except Exception as e:
-                    logger.error(f"Error playing audio: {e}")
+            logger.info(f"Processing text for TTS: '{text[:50]}...'")
+            completed = False
+            state.output_stream = sd.RawOutputStream(samplerate=PLAYBACK_SAMPLE_RATE, channels=1, dtype="int16")
+            state.output_stream.start()
+            _publish_tts_state("started")
+            try:
+                completed = state.pipeline.speak(text)
+                logger.info("Playback finished." if completed else "Playback interrupted.")
+            finally:
+                # Let buffered audio play out unless the user interrupted.
+                if completed:
+                    state.output_stream.stop()
+                else:
+                    state.output_stream.abort()
+                state.output_stream.close()
+                _publish_tts_state("stopped")
 
             state.queue.task_done()
         except Exception as e:
             logger.error(f"Error in speech worker: {e}", exc_info=True)
             state.queue.task_done()
 
+
+def interrupt_speech():
+    """Drop queued texts and cancel the one being spoken."""
+    dropped = 0
+    while True:
+        try:
+            text = state.queue.get_nowait()
+        except queue.Empty:
+            break
+        if text is None:
+            state.queue.put(None)  # keep the shutdown signal
+            break
+        state.queue.task_done()
+        dropped += 1
+    if state.pipeline:
+        state.pipeline.interrupt()
+    logger.info(f"Speech interrupted; dropped {dropped} queued text(s).")
+
+
+def tts_interrupt_listener():
+    """Listens to Redis for interrupts published by voice-in."""
+    pubsub = state.redis_client.pubsub(ignore_subscribe_messages=True)
+    try:
+        pubsub.subscribe("astra:tts_interrupt")
+        logger.info("Subscribed to astra:tts_interrupt Redis channel.")
+        for _ in pubsub.listen():
+            interrupt_speech()
+    except redis.exceptions.ConnectionError as e:
+        logger.error(f"Redis connection error in tts_interrupt_listener: {e}. Listener stopped.")
+    except Exception as e:
+        logger.error(f"An unexpected error occurred in tts_interrupt_listener: {e}")
+
 # --- FastAPI App ---
 app = FastAPI(title="TTS Dispatcher Service", version="3.0.0")
 
 @app.on_event("startup")
 def startup_event():
     initialize_tts_client()
+    try:
+        state.redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+        state.redis_client.ping()
+        threading.Thread(target=tts_interrupt_listener, daemon=True).start()
+    except Exception as e:
+        logger.warning(f"Could not connect to Redis: {e}. Interrupts will not work.")
+        state.redis_client = None
+    if AUDIO_CACHE_ENABLED:
+        state.audio_cache = AudioCache(AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_MAX_MB * 1024 * 1024)
+        logger.info(f"Audio cache at {AUDIO_CACHE_DIR}: {state.audio_cache.metrics()['entries']} entries")
+    state.pipeline = SentencePipeline(
+        lambda sentence: state.upstream.track_sync(TTS_PROVIDER, _synthesize_sentence(sentence)), _play_sentence,
+        lookahead=SENTENCE_LOOKAHEAD, concurrency=SYNTHESIS_CONCURRENCY,
+    )
     state.worker_thread = threading.Thread(target=speech_worker, daemon=True)
     state.worker_thread.start()
     logger.info("Speech worker thread started.")
@@ -198,28 +309,33 @@ class TTSStreamRequest(BaseModel):
     text: str
     language: str = "ru"
 
-async def _provider_stream(text: str, language: str):
+async def _provider_stream(text: str, language: str, raise_errors: bool = False):
+    """Provider audio for `text`. Errors are logged and end the stream, or re-raised with raise_errors (so the audio cache can tell a failed synthesis from a complete one)."""
     # Avoid logging full unicode text to prevent Windows console encoding issues
     logger.debug(f"Streaming TTS using {TTS_PROVIDER}; length={len(text)} chars")
     
     if TTS_PROVIDER == 'xtts':
         try:
             params = {"text": text, "speaker_wav": XTTS_SPEAKER_WAV_PATH, "language": language}
-            async with httpx.AsyncClient() as client:
-                async with client.stream("GET", f"{XTTS_API_URL}/tts_stream", params=params, timeout=60) as response:
-                    response.raise_for_status()
-                    async for chunk in response.aiter_bytes():
-                        yield chunk
+            client = state.upstream.async_client('xtts')
+            async with client.stream("GET", f"{XTTS_API_URL}/tts_stream", params=params, timeout=60) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes():
+                    yield chunk
         except Exception as e:
             logger.error(f"Failed to stream from XTTS API server: {e}", exc_info=True)
+            if raise_errors:
+                raise
         return
 
     elif TTS_PROVIDER == 'elevenlabs':
         if not ElevenLabs:
             logger.error("ElevenLabs provider selected, but library not installed.")
+            if raise_errors:
+                raise RuntimeError("elevenlabs library not installed")
             return
         try:
-            client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
+            client = state.tts_client
             # Use keyword arguments via lambda to satisfy SDK signature
             model_id = os.getenv("ELEVENLABS_MODEL_ID", ELEVENLABS_MODEL_ID)
             output_format = os.getenv("ELEVENLABS_OUTPUT_FORMAT", ELEVENLABS_OUTPUT_FORMAT)
@@ -231,22 +347,27 @@ async def _provider_stream(text: str, language: str):
                     output_format=output_format,
                 )
             )
-            for chunk in audio_generator:
+            # The SDK generator reads the response synchronously; keep that off the event loop.
+            while (chunk := await asyncio.to_thread(next, audio_generator, None)) is not None:
                 yield chunk
         except Exception as e:
             logger.error(f"Failed during ElevenLabs synthesis: {e}", exc_info=True)
+            if raise_errors:
+                raise
         return
 
     elif TTS_PROVIDER == 'orpheus':
         try:
             payload = {"text": text}
-            async with httpx.AsyncClient() as client:
-                async with client.stream("POST", f"{ORPHEUS_PROXY_URL}/v1/tts/synthesize", json=payload, timeout=60) as response:
-                    response.raise_for_status()
-                    async for chunk in response.aiter_bytes():
-                        yield chunk
+            client = state.upstream.async_client('orpheus')
+            async with client.stream("POST", f"{ORPHEUS_PROXY_URL}/v1/tts/synthesize", json=payload, timeout=60) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes():
+                    yield chunk
         except Exception as e:
             logger.error(f"Failed to call Orpheus service: {e}", exc_info=True)
+            if raise_errors:
+                raise
         return
 
     elif TTS_PROVIDER == 'yandex':
@@ -319,7 +440,11 @@ async def _provider_stream(text: str, language: str):
                 sa_key = _read_sa_key(sa_path)
                 if sa_key:
                     logger.info("SA key loaded, attempting to issue IAM token")
-                    issued = _issue_yandex_iam_token_from_sa(sa_key)
+                    issued, expires_at = state.yandex_iam_token
+                    if not issued or time.time() >= expires_at:
+                        # IAM tokens live 12 h; reuse one for an hour instead of a round trip per utterance
+                        issued = _issue_yandex_iam_token_from_sa(sa_key)
+                        state.yandex_iam_token = (issued, time.time() + 3600 if issued else 0.0)
                     if issued:
                         headers["Authorization"] = f"Bearer {issued}"
                         logger.info("IAM token issued successfully")
@@ -344,126 +469,158 @@ async def _provider_stream(text: str, language: str):
             # With unsafeMode: true, Yandex handles text splitting automatically
             logger.info(f"Yandex TTS: sending text of {len(text)} chars with unsafeMode enabled")
             
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                if YANDEX_USE_V3_REST:
-                    # Build v3 JSON body
-                    body = {
-                        "text": text,
-                        "hints": [{"voice": YANDEX_VOICE}, {"speed": "1.0"}],
-                        "outputAudioSpec": (
-                            {"containerAudio": {"containerAudioType": "OGG_OPUS"}} if YANDEX_FORMAT == 'oggopus' else
-                            {"containerAudio": {"containerAudioType": "MP3"}} if YANDEX_FORMAT == 'mp3' else
-                            {"rawAudio": {"audioEncoding": "LINEAR16_PCM", "sampleRateHertz": YANDEX_SAMPLE_RATE}}
-                        ),
-                        "loudnessNormalizationType": "LUFS",
-                        "unsafeMode": True,  # Enable automatic text splitting
-                    }
-                    req_headers = {**headers, "Content-Type": "application/json", "Accept": "application/json"}
-                    if YANDEX_FOLDER_ID:
-                        # Some services expect this header name, include both variants for safety
-                        req_headers["x-folder-id"] = YANDEX_FOLDER_ID
-                        req_headers["X-YaCloud-FolderId"] = YANDEX_FOLDER_ID
-                    resp = await client.post(url, headers=req_headers, json=body)
-                    logger.info(f"Yandex v3 response status: {resp.status_code}")
-                    if resp.status_code >= 400:
-                        try:
-                            logger.error({"yandex_v3_error": resp.text})
-                        except Exception:
-                            pass
-                    resp.raise_for_status()
-                    # v3 REST returns JSON with base64 audio bytes in audioChunk.data
+            client = state.upstream.async_client('yandex')
+            if YANDEX_USE_V3_REST:
+                # Build v3 JSON body
+                body = {
+                    "text": text,
+                    "hints": [{"voice": YANDEX_VOICE}, {"speed": "1.0"}],
+                    "outputAudioSpec": (
+                        {"containerAudio": {"containerAudioType": "OGG_OPUS"}} if YANDEX_FORMAT == 'oggopus' else
+                        {"containerAudio": {"containerAudioType": "MP3"}} if YANDEX_FORMAT == 'mp3' else
+                        {"rawAudio": {"audioEncoding": "LINEAR16_PCM", "sampleRateHertz": YANDEX_SAMPLE_RATE}}
+                    ),
+                    "loudnessNormalizationType": "LUFS",
+                    "unsafeMode": True,  # Enable automatic text splitting
+                }
+                req_headers = {**headers, "Content-Type": "application/json", "Accept": "application/json"}
+                if YANDEX_FOLDER_ID:
+                    # Some services expect this header name, include both variants for safety
+                    req_headers["x-folder-id"] = YANDEX_FOLDER_ID
+                    req_headers["X-YaCloud-FolderId"] = YANDEX_FOLDER_ID
+                resp = await client.post(url, headers=req_headers, json=body)
+                logger.info(f"Yandex v3 response status: {resp.status_code}")
+                if resp.status_code >= 400:
                     try:
-                        # Try to parse as single JSON first
-                        payload = resp.json()
-                        logger.info(f"Yandex v3 response keys: {list(payload.keys())}")
-                        data_b64 = payload.get("audioChunk", {}).get("data")
-                        if data_b64:
-                            import base64
-                            chunk_bytes = base64.b64decode(data_b64)
-                            logger.info(f"Yandex v3: decoded {len(chunk_bytes)} bytes of audio")
-                            yield chunk_bytes
-                        else:
-                            logger.warning("Yandex v3: no audioChunk.data found, using raw content")
-                            yield resp.content
-                    except Exception as e:
-                        logger.warning(f"Yandex v3: JSON parsing failed ({e}), trying to parse as streaming JSON")
-                        # Try to parse as streaming JSON (multiple JSON objects)
-                        try:
-                            import json
-                            content = resp.text
-                            logger.info(f"Yandex v3: processing streaming response of {len(content)} chars")
-                            # Split by newlines and parse each JSON object
-                            lines = content.split('\n')
-                            logger.info(f"Yandex v3: found {len(lines)} lines in response")
-                            for i, line in enumerate(lines):
-                                if line.strip():
-                                    try:
-                                        chunk_payload = json.loads(line)
-                                        logger.info(f"Yandex v3: parsed line {i+1}, keys: {list(chunk_payload.keys())}")
-                                        
-                                        # Try different possible structures
-                                        data_b64 = None
-                                        if "audioChunk" in chunk_payload:
-                                            data_b64 = chunk_payload.get("audioChunk", {}).get("data")
-                                        elif "result" in chunk_payload:
-                                            result = chunk_payload.get("result", {})
-                                            if "audioChunk" in result:
-                                                data_b64 = result.get("audioChunk", {}).get("data")
-                                            else:
-                                                # Check if result itself contains audio data
-                                                data_b64 = result.get("data")
+                        logger.error({"yandex_v3_error": resp.text})
+                    except Exception:
+                        pass
+                resp.raise_for_status()
+                # v3 REST returns JSON with base64 audio bytes in audioChunk.data
+                try:
+                    # Try to parse as single JSON first
+                    payload = resp.json()
+                    logger.info(f"Yandex v3 response keys: {list(payload.keys())}")
+                    data_b64 = payload.get("audioChunk", {}).get("data")
+                    if data_b64:
+                        import base64
+                        chunk_bytes = base64.b64decode(data_b64)
+                        logger.info(f"Yandex v3: decoded {len(chunk_bytes)} bytes of audio")
+                        yield chunk_bytes
+                    else:
+                        logger.warning("Yandex v3: no audioChunk.data found, using raw content")
+                        yield resp.content
+                except Exception as e:
+                    logger.warning(f"Yandex v3: JSON parsing failed ({e}), trying to parse as streaming JSON")
+                    # Try to parse as streaming JSON (multiple JSON objects)
+                    try:
+                        import json
+                        content = resp.text
+                        logger.info(f"Yandex v3: processing streaming response of {len(content)} chars")
+                        # Split by newlines and parse each JSON object
+                        lines = content.split('\n')
+                        logger.info(f"Yandex v3: found {len(lines)} lines in response")
+                        for i, line in enumerate(lines):
+                            if line.strip():
+                                try:
+                                    chunk_payload = json.loads(line)
+                                    logger.info(f"Yandex v3: parsed line {i+1}, keys: {list(chunk_payload.keys())}")
                                         
-                                        if data_b64:
-                                            import base64
-                                            chunk_bytes = base64.b64decode(data_b64)
-                                            logger.info(f"Yandex v3: decoded {len(chunk_bytes)} bytes of audio from streaming line {i+1}")
-                                            yield chunk_bytes
+                                    # Try different possible structures
+                                    data_b64 = None
+                                    if "audioChunk" in chunk_payload:
+                                        data_b64 = chunk_payload.get("audioChunk", {}).get("data")
+                                    elif "result" in chunk_payload:
+                                        result = chunk_payload.get("result", {})
+                                        if "audioChunk" in result:
+                                            data_b64 = result.get("audioChunk", {}).get("data")
                                         else:
-                                            logger.warning(f"Yandex v3: no audio data found in line {i+1}, structure: {chunk_payload}")
-                                    except json.JSONDecodeError as je:
-                                        logger.warning(f"Yandex v3: JSON decode error in line {i+1}: {je}")
-                                        continue
-                        except Exception as stream_e:
-                            logger.error(f"Yandex v3: streaming JSON parsing also failed: {stream_e}")
-                            # Fallback to raw content
-                            yield resp.content
-                else:
-                    # Legacy v1 form-data
-                    data = {
-                        'text': text,
-                        'voice': YANDEX_VOICE,
-                        'format': YANDEX_FORMAT,
-                        'sampleRateHertz': YANDEX_SAMPLE_RATE,
-                        'folderId': YANDEX_FOLDER_ID,
-                        'lang': 'ru-RU' if language.startswith('ru') else 'en-US',
-                        'speed': '1.0',
-                    }
-                    # For v1 also ensure folder header variants
-                    v1_headers = dict(headers)
-                    if YANDEX_FOLDER_ID:
-                        v1_headers["x-folder-id"] = YANDEX_FOLDER_ID
-                        v1_headers["X-YaCloud-FolderId"] = YANDEX_FOLDER_ID
-                    resp = await client.post(url, headers=v1_headers, data=data)
-                    resp.raise_for_status()
-                    yield resp.content
+                                            # Check if result itself contains audio data
+                                            data_b64 = result.get("data")
+                                        
+                                    if data_b64:
+                                        import base64
+                                        chunk_bytes = base64.b64decode(data_b64)
+                                        logger.info(f"Yandex v3: decoded {len(chunk_bytes)} bytes of audio from streaming line {i+1}")
+                                        yield chunk_bytes
+                                    else:
+                                        logger.warning(f"Yandex v3: no audio data found in line {i+1}, structure: {chunk_payload}")
+                                except json.JSONDecodeError as je:
+                                    logger.warning(f"Yandex v3: JSON decode error in line {i+1}: {je}")
+                                    continue
+                    except Exception as stream_e:
+                        logger.error(f"Yandex v3: streaming JSON parsing also failed: {stream_e}")
+                        # Fallback to raw content
+                        yield resp.content
+            else:
+                # Legacy v1 form-data
+                data = {
+                    'text': text,
+                    'voice': YANDEX_VOICE,
+                    'format': YANDEX_FORMAT,
+                    'sampleRateHertz': YANDEX_SAMPLE_RATE,
+                    'folderId': YANDEX_FOLDER_ID,
+                    'lang': 'ru-RU' if language.startswith('ru') else 'en-US',
+                    'speed': '1.0',
+                }
+                # For v1 also ensure folder header variants
+                v1_headers = dict(headers)
+                if YANDEX_FOLDER_ID:
+                    v1_headers["x-folder-id"] = YANDEX_FOLDER_ID
+                    v1_headers["X-YaCloud-FolderId"] = YANDEX_FOLDER_ID
+                resp = await client.post(url, headers=v1_headers, data=data)
+                resp.raise_for_status()
+                yield resp.content
         except Exception as e:
             logger.error(f"Failed to call Yandex SpeechKit: {e}", exc_info=True)
+            if raise_errors:
+                raise
             return
     else:
         logger.error(f"TTS provider '{TTS_PROVIDER}' not configured for streaming.")
+        if raise_errors:
+            raise RuntimeError(f"TTS provider '{TTS_PROVIDER}' not configured for streaming")
         return
 
 
-@app.post("/stream")
-async def tts_stream_handler(request: TTSStreamRequest):
-    if not request.text.strip():
-        raise HTTPException(status_code=400, detail="Text cannot be empty.")
-    media_type = (
+def _media_type() -> str:
+    return (
         "audio/mpeg" if TTS_PROVIDER == 'elevenlabs' else (
             "audio/ogg" if TTS_PROVIDER == 'yandex' and YANDEX_FORMAT == 'oggopus' else "audio/wav"
         )
     )
-    return StreamingResponse(_provider_stream(request.text, request.language), media_type=media_type)
+
+
+def _cache_identity() -> tuple[str | None, str | None]:
+    """(voice, model) of the configured provider; together with provider, language and text they key the audio cache."""
+    if TTS_PROVIDER == 'xtts':
+        return XTTS_SPEAKER_WAV_PATH, None
+    if TTS_PROVIDER == 'elevenlabs':
+        model_id = os.getenv("ELEVENLABS_MODEL_ID", ELEVENLABS_MODEL_ID)
+        output_format = os.getenv("ELEVENLABS_OUTPUT_FORMAT", ELEVENLABS_OUTPUT_FORMAT)
+        return ELEVENLABS_VOICE_ID, f"{model_id}:{output_format}"
+    if TTS_PROVIDER == 'yandex':
+        return YANDEX_VOICE, f"{'v3' if YANDEX_USE_V3_REST else 'v1'}:{YANDEX_FORMAT}:{YANDEX_SAMPLE_RATE}"
+    return None, None
+
+
+async def _audio_response(text: str, language: str, range_header: str | None = None):
+    if state.audio_cache is None:
+        return StreamingResponse(state.upstream.track(TTS_PROVIDER, _provider_stream(text, language)), media_type=_media_type())
+
+    async def produce():
+        return _media_type(), state.upstream.track(TTS_PROVIDER, _provider_stream(text, language, raise_errors=True))
+
+    voice, model = _cache_identity()
+    key = make_key(TTS_PROVIDER, voice, language, model, text)
+    return await state.audio_cache.respond(key, produce, range_header)
+
+
+@app.post("/stream")
+async def tts_stream_handler(request: TTSStreamRequest, http_request: Request):
+    if not request.text.strip():
+        raise HTTPException(status_code=400, detail="Text cannot be empty.")
+    return await _audio_response(request.text, request.language, http_request.headers.get("range"))
 
 
 # === Compatibility endpoints expected by brain proxy ===
@@ -476,16 +633,38 @@ class TTSSynthesizeRequest(BaseModel):
 
 
 @app.post("/tts/synthesize")
-async def tts_synthesize(req: TTSSynthesizeRequest):
+async def tts_synthesize(req: TTSSynthesizeRequest, http_request: Request):
     if not req.text.strip():
         raise HTTPException(status_code=400, detail="Text cannot be empty.")
     language = req.language or "ru"
-    media_type = (
-        "audio/mpeg" if TTS_PROVIDER == 'elevenlabs' else (
-            "audio/ogg" if TTS_PROVIDER == 'yandex' and YANDEX_FORMAT == 'oggopus' else "audio/wav"
-        )
-    )
-    return StreamingResponse(_provider_stream(req.text, language), media_type=media_type)
+    return await _audio_response(req.text, language, http_request.headers.get("range"))
+
+
+@app.get("/tts/audio/{key}")
+async def tts_cached_audio(key: str, http_request: Request):
+    """Cached synthesis by the X-Audio-Cache-Key of an earlier response, with Range support for seeking."""
+    path = state.audio_cache.get(key) if state.audio_cache else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="Audio not cached.")
+    return range_response(path, media_type_for(path), http_request.headers.get("range"))
+
+
+@app.get("/tts/metrics")
+async def tts_upstream_metrics():
+    """Per-provider request counts, in-flight streams and time to first audio byte."""
+    return JSONResponse(state.upstream.metrics())
+
+
+@app.on_event("shutdown")
+async def close_upstream_clients():
+    await state.upstream.aclose()
+
+
+@app.get("/tts/cache")
+async def tts_cache_metrics():
+    if state.audio_cache is None:
+        return JSONResponse({"enabled": False})
+    return JSONResponse({"enabled": True, **state.audio_cache.metrics()})
 
 
 @app.get("/tts/voices")
@@ -540,6 +719,8 @@ def shutdown():
         if state.worker_thread and state.worker_thread.is_alive():
             # Signal worker to stop (assume queue.put(None) or event)
             state.queue.put(None)
+            if state.pipeline:
+                state.pipeline.shutdown()
             state.worker_thread.join(timeout=5)
             if state.worker_thread.is_alive():
                 logger.warning("Worker thread did not stop gracefully, forcing.")
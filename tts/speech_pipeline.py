@@ -0,0 +1,162 @@
+"""
+Sentence-pipelined speech for the queued /speak path.
+
+A text is split into sentences. While sentence i plays, sentences i+1..i+N
+are already being synthesized on a small thread pool, so the next sentence
+is ready when playback reaches it. Each sentence is played chunk by chunk as
+it arrives from the provider. `interrupt()` cancels every pending synthesis
+and stops playback at the next chunk boundary.
+"""
+import logging
+import queue
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Iterable, Iterator, List
+
+try:
+    import stream2sentence as s2s
+except ImportError:
+    s2s = None
+
+logger = logging.getLogger("tts-dispatcher-service.pipeline")
+
+_END = object()
+_SENTENCE_RE = re.compile(r"(?<=[.!?…;])\s+")
+
+
+def split_sentences(text: str, language: str = "ru", minimum_sentence_length: int = 10, minimum_first_fragment_length: int = 10) -> List[str]:
+    """Sentences to synthesize, split the way TextToAudioStream.play splits its character stream."""
+    if s2s is not None:
+        try:
+            sentences = s2s.generate_sentences(
+                iter(text),
+                minimum_sentence_length=minimum_sentence_length,
+                minimum_first_fragment_length=minimum_first_fragment_length,
+                quick_yield_single_sentence_fragment=True,
+                cleanup_text_links=True,
+                cleanup_text_emojis=True,
+                tokenizer="nltk",
+                language=language,
+            )
+            return [s.strip() for s in sentences if s.strip()]
+        except Exception as e:
+            logger.warning(f"stream2sentence failed ({e}), using the regex splitter")
+
+    # Regex fallback: split at sentence punctuation, merge fragments shorter than the minimum.
+    sentences: List[str] = []
+    for part in _SENTENCE_RE.split(text.strip()):
+        part = part.strip()
+        if not part:
+            continue
+        limit = minimum_first_fragment_length if not sentences else minimum_sentence_length
+        if sentences and len(sentences[-1]) < limit:
+            sentences[-1] = f"{sentences[-1]} {part}"
+        else:
+            sentences.append(part)
+    return sentences
+
+
+class _SentenceJob:
+    """Synthesis of one sentence; chunks are handed to the player through a queue."""
+
+    def __init__(self, sentence: str):
+        self.sentence = sentence
+        self.chunks: "queue.Queue" = queue.Queue()
+        self.cancelled = threading.Event()
+
+    def run(self, synthesize: Callable[[str], Iterable[bytes]]):
+        if self.cancelled.is_set():
+            self.chunks.put(_END)
+            return
+        stream = None
+        try:
+            stream = iter(synthesize(self.sentence))
+            for chunk in stream:
+                if self.cancelled.is_set():
+                    break
+                if chunk:
+                    self.chunks.put(chunk)
+        except Exception as e:
+            logger.error(f"Synthesis failed for a {len(self.sentence)}-char sentence: {e}")
+        finally:
+            close = getattr(stream, "close", None)
+            if close:
+                close()  # releases the provider connection when cancelled mid-stream
+            self.chunks.put(_END)
+
+    def iter_chunks(self, interrupted: threading.Event) -> Iterator[bytes]:
+        while not interrupted.is_set():
+            try:
+                chunk = self.chunks.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if chunk is _END:
+                return
+            yield chunk
+
+
+class SentencePipeline:
+    def __init__(
+        self,
+        synthesize: Callable[[str], Iterable[bytes]],
+        play: Callable[[Iterator[bytes]], None],
+        lookahead: int = 2,
+        concurrency: int = 2,
+        language: str = "ru",
+    ):
+        self.synthesize = synthesize
+        self.play = play
+        self.lookahead = max(int(lookahead), 0)
+        self.language = language
+        self.executor = ThreadPoolExecutor(max_workers=max(int(concurrency), 1), thread_name_prefix="tts-synth")
+        self.interrupted = threading.Event()
+        self._lock = threading.Lock()
+        self._jobs: Deque[_SentenceJob] = deque()
+
+    def speak(self, text: str) -> bool:
+        """Synthesize and play `text`; returns False if it was interrupted."""
+        self.interrupted.clear()
+        sentences = iter(split_sentences(text, self.language))
+        try:
+            self._fill(sentences)
+            while True:
+                with self._lock:
+                    job = self._jobs[0] if self._jobs else None
+                if job is None or self.interrupted.is_set():
+                    break
+                self.play(job.iter_chunks(self.interrupted))
+                with self._lock:
+                    if self._jobs and self._jobs[0] is job:
+                        self._jobs.popleft()
+                self._fill(sentences)
+            return not self.interrupted.is_set()
+        finally:
+            self._cancel_pending()
+
+    def _fill(self, sentences: Iterator[str]):
+        """Keep the sentence being played plus `lookahead` more in synthesis."""
+        with self._lock:
+            while len(self._jobs) <= self.lookahead and not self.interrupted.is_set():
+                sentence = next(sentences, None)
+                if sentence is None:
+                    return
+                job = _SentenceJob(sentence)
+                self._jobs.append(job)
+                self.executor.submit(job.run, self.synthesize)
+
+    def _cancel_pending(self):
+        with self._lock:
+            for job in self._jobs:
+                job.cancelled.set()
+            self._jobs.clear()
+
+    def interrupt(self):
+        """Stop the current text: cancel look-ahead synthesis and end playback at the next chunk."""
+        self.interrupted.set()
+        self._cancel_pending()
+
+    def shutdown(self):
+        self.interrupt()
+        self.executor.shutdown(wait=False, cancel_futures=True)
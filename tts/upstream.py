@@ -0,0 +1,182 @@
+"""
+Long-lived HTTP clients for the TTS synthesis backends.
+
+Each provider gets pooled clients that are created once at startup, with
+keep-alive and HTTP/2 when `h2` is installed:
+- an httpx.AsyncClient for /stream and /tts/synthesize
+- an httpx.Client for the queued /speak pipeline threads
+So an utterance reuses a warm connection instead of paying for TCP/TLS setup.
+
+Requests to each provider go through a concurrency limit of
+TTS_<PROVIDER>_MAX_CONCURRENCY (default TTS_UPSTREAM_MAX_CONCURRENCY, 4).
+Extra requests queue instead of overloading the backend. Every stream also
+records its time to first audio byte per provider.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Iterator, Optional
+
+import httpx
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger("tts-dispatcher-service.upstream")
+
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("TTS_UPSTREAM_MAX_CONCURRENCY", "4"))
+KEEPALIVE_EXPIRY_SEC = float(os.getenv("TTS_UPSTREAM_KEEPALIVE_SEC", "60"))
+_TTFB_WINDOW = 256
+
+
+def _max_concurrency(provider: str) -> int:
+    return max(int(os.getenv(f"TTS_{provider.upper()}_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)), 1)
+
+
+class _ProviderStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.empty = 0  # streams that ended without audio (provider errors are logged and swallowed)
+        self.active = 0
+        self.ttfb: Deque[float] = deque(maxlen=_TTFB_WINDOW)
+
+    def snapshot(self) -> Dict[str, object]:
+        samples = sorted(self.ttfb)
+
+        def pct(q: float) -> Optional[float]:
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 1) if samples else None
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "empty": self.empty,
+            "active": self.active,
+            "ttfb_ms_p50": pct(0.5),
+            "ttfb_ms_p95": pct(0.95),
+            "ttfb_ms_last": round(self.ttfb[-1] * 1000, 1) if self.ttfb else None,
+        }
+
+
+class UpstreamClients:
+    def __init__(self, timeout: float = 60.0):
+        self.timeout = timeout
+        self._async: Dict[str, httpx.AsyncClient] = {}
+        self._sync: Dict[str, httpx.Client] = {}
+        self._async_limits: Dict[str, asyncio.Semaphore] = {}
+        self._sync_limits: Dict[str, threading.BoundedSemaphore] = {}
+        self._stats: Dict[str, _ProviderStats] = {}
+        self._lock = threading.Lock()
+
+    def _limits(self, provider: str) -> httpx.Limits:
+        size = _max_concurrency(provider)
+        return httpx.Limits(max_connections=size, max_keepalive_connections=size, keepalive_expiry=KEEPALIVE_EXPIRY_SEC)
+
+    def async_client(self, provider: str) -> httpx.AsyncClient:
+        client = self._async.get(provider)
+        if client is None:
+            client = self._async[provider] = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE, limits=self._limits(provider), timeout=self.timeout
+            )
+        return client
+
+    def sync_client(self, provider: str) -> httpx.Client:
+        with self._lock:
+            client = self._sync.get(provider)
+            if client is None:
+                client = self._sync[provider] = httpx.Client(
+                    http2=HTTP2_AVAILABLE, limits=self._limits(provider), timeout=self.timeout
+                )
+            return client
+
+    def stats(self, provider: str) -> _ProviderStats:
+        with self._lock:
+            return self._stats.setdefault(provider, _ProviderStats())
+
+    def _async_limit(self, provider: str) -> asyncio.Semaphore:
+        limit = self._async_limits.get(provider)
+        if limit is None:
+            limit = self._async_limits[provider] = asyncio.Semaphore(_max_concurrency(provider))
+        return limit
+
+    def _sync_limit(self, provider: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            limit = self._sync_limits.get(provider)
+            if limit is None:
+                limit = self._sync_limits[provider] = threading.BoundedSemaphore(_max_concurrency(provider))
+            return limit
+
+    async def track(self, provider: str, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """Run a provider stream under its concurrency limit, recording time to first byte."""
+        stats = self.stats(provider)
+        async with self._async_limit(provider):
+            stats.requests += 1
+            stats.active += 1
+            started = time.perf_counter()
+            first = True
+            try:
+                async for chunk in chunks:
+                    if first and chunk:
+                        stats.ttfb.append(time.perf_counter() - started)
+                        first = False
+                    yield chunk
+            except Exception:
+                stats.errors += 1
+                raise
+            else:
+                if first:
+                    stats.empty += 1
+            finally:
+                stats.active -= 1
+                aclose = getattr(chunks, "aclose", None)
+                if aclose:
+                    await aclose()
+
+    def track_sync(self, provider: str, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """Blocking counterpart of `track` for the /speak pipeline threads."""
+        stats = self.stats(provider)
+        with self._sync_limit(provider):
+            with self._lock:
+                stats.requests += 1
+                stats.active += 1
+            started = time.perf_counter()
+            first = True
+            try:
+                for chunk in chunks:
+                    if first and chunk:
+                        stats.ttfb.append(time.perf_counter() - started)
+                        first = False
+                    yield chunk
+            except Exception:
+                with self._lock:
+                    stats.errors += 1
+                raise
+            else:
+                if first:
+                    with self._lock:
+                        stats.empty += 1
+            finally:
+                with self._lock:
+                    stats.active -= 1
+                close = getattr(chunks, "close", None)
+                if close:
+                    close()
+
+    def metrics(self) -> Dict[str, object]:
+        with self._lock:
+            providers = {name: stats.snapshot() for name, stats in self._stats.items()}
+        return {"http2": HTTP2_AVAILABLE, "providers": providers}
+
+    async def aclose(self):
+        for client in self._async.values():
+            await client.aclose()
+        for client in self._sync.values():
+            client.close()
+        self._async.clear()
+        self._sync.clear()
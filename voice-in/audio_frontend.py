@@ -0,0 +1,236 @@
+"""
+Allocation-free audio front-end for the voice-in VAD loop.
+
+- `Int16FrameRing` keeps the raw microphone frames in a preallocated, mirrored
+  int16 buffer, so a segment or a streaming chunk is a memoryview slice rather
+  than a b"".join over a list of frames.
+- `AudioFrontEnd` converts each frame in place into one reused float32 buffer,
+  which is shared with a torch tensor for the Silero VAD. On the way it can run
+  the streaming `SpectralGateDenoiser` and `StreamingNormalizer`. These
+  replace noisereduce and pydub normalize/compress. Both keep their state
+  (noise profile, overlap tail, gain envelope) across chunks, where the old
+  code processed every 32 ms chunk in isolation.
+
+Only the VAD input is processed. Segments sent to STT are the raw frames, as before.
+"""
+from typing import Optional
+
+import numpy as np
+
+try:
+    import torch
+except ImportError:  # the benchmark runs the front-end without torch
+    torch = None
+
+_INT16_SCALE = 1.0 / 32768.0
+_EPS = 1e-10
+
+
+class Int16FrameRing:
+    """
+    Ring of fixed-size int16 frames addressed by absolute frame index.
+
+    Each frame is written twice (slot i and i + capacity), so every run of up
+    to `capacity` consecutive frames is one contiguous slice. A slice returned
+    by `segment` stays valid until `capacity` more frames have been written.
+    """
+
+    def __init__(self, capacity_frames: int, frame_samples: int):
+        self.capacity = int(capacity_frames)
+        self.frame_samples = int(frame_samples)
+        self._data = np.zeros(2 * self.capacity * self.frame_samples, dtype=np.int16)
+        self._bytes = memoryview(self._data).cast("B")
+        self.total = 0  # frames written since start
+
+    @property
+    def oldest(self) -> int:
+        return max(0, self.total - self.capacity)
+
+    def append(self, chunk: bytes) -> int:
+        """Store one frame (short reads are zero-padded) and return its absolute index."""
+        size = self.frame_samples * 2
+        n = min(len(chunk), size)
+        for slot in (self.total % self.capacity, self.total % self.capacity + self.capacity):
+            offset = slot * size
+            self._bytes[offset:offset + n] = chunk[:n] if n < len(chunk) else chunk
+            if n < size:
+                self._bytes[offset + n:offset + size] = bytes(size - n)
+        self.total += 1
+        return self.total - 1
+
+    def frame(self, index: int) -> np.ndarray:
+        start = (index % self.capacity) * self.frame_samples
+        return self._data[start:start + self.frame_samples]
+
+    def segment(self, start: int, end: int) -> memoryview:
+        """Raw PCM bytes of frames [start, end), clamped to what is still buffered."""
+        end = min(end, self.total)
+        start = min(max(start, self.oldest), end)
+        offset = (start % self.capacity) * self.frame_samples * 2
+        return self._bytes[offset:offset + (end - start) * self.frame_samples * 2]
+
+
+class SpectralGateDenoiser:
+    """
+    Streaming spectral gate: STFT with a sqrt-Hann window and 50% overlap-add.
+    Output is delayed by one hop.
+
+    The per-bin noise magnitude is learned from the first `init_frames` frames.
+    After that it follows the frames that look like noise: it drops quickly to
+    quieter frames and rises slowly, so speech does not leak into the profile.
+    Bins get a soft gain that is smoothed over time, which avoids musical noise.
+    """
+
+    def __init__(
+        self,
+        n_fft: int = 512,
+        n_std: float = 1.5,
+        floor: float = 0.1,
+        smoothing: float = 0.6,
+        init_frames: int = 20,
+        noise_rise: float = 0.002,
+        noise_fall: float = 0.9,
+    ):
+        self.n_fft = n_fft
+        self.hop = n_fft // 2
+        self.n_std = n_std
+        self.floor = floor
+        self.smoothing = smoothing
+        self.init_frames = init_frames
+        self.noise_rise = noise_rise
+        self.noise_fall = noise_fall
+        self.window = np.sqrt(np.hanning(n_fft + 1)[:-1]).astype(np.float32)
+        bins = n_fft // 2 + 1
+        self.noise = np.zeros(bins, dtype=np.float32)
+        self.mask = np.ones(bins, dtype=np.float32)
+        self._gain = np.empty(bins, dtype=np.float32)
+        self._input = np.zeros(n_fft - self.hop, dtype=np.float32)  # last input samples not yet framed
+        self._overlap = np.zeros(self.hop, dtype=np.float32)  # second half of the last output frame
+        self._buf: Optional[np.ndarray] = None
+        self.frames_seen = 0
+
+    def _update_noise(self, mag: np.ndarray):
+        if self.frames_seen < self.init_frames:
+            self.noise += (mag - self.noise) / (self.frames_seen + 1)
+        else:
+            quieter = mag < self.noise
+            self.noise[quieter] = self.noise_fall * self.noise[quieter] + (1 - self.noise_fall) * mag[quieter]
+            self.noise[~quieter] *= 1 + self.noise_rise
+        self.frames_seen += 1
+
+    def process(self, samples: np.ndarray):
+        """Denoise float32 samples in place; len(samples) must be a multiple of the hop."""
+        n = len(samples)
+        keep = len(self._input)
+        if self._buf is None or len(self._buf) != keep + n:
+            self._buf = np.empty(keep + n, dtype=np.float32)
+        buf = self._buf
+        buf[:keep] = self._input
+        buf[keep:] = samples
+        self._input[:] = buf[n:]
+
+        frames = np.lib.stride_tricks.sliding_window_view(buf, self.n_fft)[::self.hop] * self.window
+        spectrum = np.fft.rfft(frames, axis=1)
+        mags = np.abs(spectrum)
+        for i, mag in enumerate(mags):
+            self._update_noise(mag)
+            np.divide(self.noise, mag + _EPS, out=self._gain)
+            self._gain *= -self.n_std
+            self._gain += 1.0
+            np.clip(self._gain, self.floor, 1.0, out=self._gain)
+            self.mask *= self.smoothing
+            self.mask += (1 - self.smoothing) * self._gain
+            spectrum[i] *= self.mask
+        out = np.fft.irfft(spectrum, n=self.n_fft, axis=1).astype(np.float32, copy=False)
+        out *= self.window
+
+        for i, frame in enumerate(out):
+            segment = samples[i * self.hop:(i + 1) * self.hop]
+            np.add(self._overlap, frame[:self.hop], out=segment)
+            self._overlap[:] = frame[self.hop:]
+
+
+class StreamingNormalizer:
+    """
+    Streaming level normalizer and compressor, in place on float32 chunks.
+
+    A smoothed RMS envelope (fast attack, slow release) sets a make-up gain
+    toward `target_dbfs`, up to `max_gain_db`. Levels above `threshold_dbfs`
+    are compressed by `ratio`. The gain ramps linearly from the previous chunk's
+    value across each chunk, so there are no steps at chunk boundaries.
+    """
+
+    def __init__(
+        self,
+        chunk_samples: int,
+        sample_rate: int = 16000,
+        target_dbfs: float = -20.0,
+        max_gain_db: float = 24.0,
+        threshold_dbfs: float = -12.0,
+        ratio: float = 4.0,
+        attack_ms: float = 10.0,
+        release_ms: float = 300.0,
+        gate_dbfs: float = -60.0,
+    ):
+        chunk_sec = chunk_samples / sample_rate
+        self.attack = float(np.exp(-chunk_sec * 1000 / attack_ms))
+        self.release = float(np.exp(-chunk_sec * 1000 / release_ms))
+        self.target_dbfs = target_dbfs
+        self.max_gain_db = max_gain_db
+        self.threshold_dbfs = threshold_dbfs
+        self.ratio = ratio
+        self.gate_dbfs = gate_dbfs
+        self.level_db = gate_dbfs
+        self.gain = 1.0
+        self._ramp = np.arange(chunk_samples, dtype=np.float32) / chunk_samples
+        self._gains = np.empty(chunk_samples, dtype=np.float32)
+
+    def _target_gain_db(self) -> float:
+        if self.level_db <= self.gate_dbfs:
+            return 0.0  # do not pump up silence
+        gain_db = min(self.target_dbfs - self.level_db, self.max_gain_db)
+        out_db = self.level_db + gain_db
+        if out_db > self.threshold_dbfs:
+            gain_db -= (out_db - self.threshold_dbfs) * (1 - 1 / self.ratio)
+        return gain_db
+
+    def process(self, samples: np.ndarray):
+        n = len(samples)
+        rms = float(np.sqrt(np.dot(samples, samples) / n)) if n else 0.0
+        level_db = 20 * np.log10(rms + _EPS)
+        coeff = self.attack if level_db > self.level_db else self.release
+        self.level_db = coeff * self.level_db + (1 - coeff) * level_db
+
+        gain = 10 ** (self._target_gain_db() / 20)
+        if len(self._ramp) != n:
+            self._ramp = np.arange(n, dtype=np.float32) / n
+            self._gains = np.empty(n, dtype=np.float32)
+        np.multiply(self._ramp, gain - self.gain, out=self._gains)
+        self._gains += self.gain
+        samples *= self._gains
+        np.clip(samples, -1.0, 1.0, out=samples)
+        self.gain = gain
+
+
+class AudioFrontEnd:
+    """
+    Per-frame VAD input: int16 frame -> reused float32 buffer (+ optional denoise/normalize).
+
+    `process` returns the same `tensor` every call. It shares memory with `samples`
+    and is overwritten by the next frame.
+    """
+
+    def __init__(self, frame_samples: int, sample_rate: int = 16000, denoise: bool = False, normalize: bool = False):
+        self.frame_samples = frame_samples
+        self.samples = np.zeros(frame_samples, dtype=np.float32)
+        self.tensor = torch.from_numpy(self.samples) if torch is not None else None
+        self.denoiser = SpectralGateDenoiser(n_fft=frame_samples) if denoise and frame_samples % 2 == 0 else None
+        self.normalizer = StreamingNormalizer(frame_samples, sample_rate) if normalize else None
+
+    def process(self, frame: np.ndarray):
+        np.multiply(frame, _INT16_SCALE, out=self.samples, casting="unsafe")
+        if self.denoiser is not None:
+            self.denoiser.process(self.samples)
+        if self.normalizer is not None:
+            self.normalizer.process(self.samples)
+        return self.tensor
@@ -11,8 +11,8 @@ import os
 
 import numpy as np
 import pyaudio
-import requests
 import redis
+import redis.asyncio as aioredis
 import json
 import torch
 import uvicorn
@@ -21,21 +21,14 @@ from urllib.parse import urljoin
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from typing import Optional
 import asyncio
 import psutil
-import websockets
-from websockets.exceptions import ConnectionClosed
 
-# Optional audio processing libraries
-try:
-    import noisereduce as nr
-    from pydub import AudioSegment
-    from pydub.effects import normalize, compress_dynamic_range
-    AUDIO_PROCESSING_AVAILABLE = True
-except ImportError:
-    AUDIO_PROCESSING_AVAILABLE = False
-
-from collections import deque
+from audio_frontend import AudioFrontEnd, Int16FrameRing
+from segment_metrics import LatencyTracker, SegmentTiming
+from stt_stream import SttStream
+
 # --- Configuration ---
 import time
 import os
@@ -44,9 +37,6 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
-# Metrics tracking
-vad_start_time = None
-stt_send_time = None
 logger = logging_utils.get_logger("voice-in-service", service="voice-in")
 
 app = FastAPI(title="Voice-In Service (Silero VAD)", version="2.5.0")
@@ -59,6 +49,7 @@ MIN_SILENCE_MS = int(os.getenv("VOICE_MIN_SILENCE_MS", "800")) # Быстрее
 SPEECH_PAD_MS  = 80       # Меньше padding
 MAX_SEGMENT_MS = 30000    # опционально ограничим длину фразы
 CHUNK_SAMPLES = 512       # Required chunk size for Silero VAD at 16kHz
+CAPTURE_QUEUE_FRAMES = int(os.getenv("VOICE_CAPTURE_QUEUE_FRAMES", "64"))  # ~2 s of audio between capture and VAD
 
 
 # --- Audio Settings ---
@@ -70,9 +61,10 @@ STT_SERVICE_URL = "http://localhost:7020/stt"
 STT_STREAM_URL = "ws://localhost:7020/ws/stt"
 AGENT_ID = os.getenv("ASTRA_AGENT_ID", "default")
 
-# Streaming config
-STREAMING_ENABLED = os.getenv("VOICE_STREAMING_ENABLED", "false").lower() == "true"
-CHUNK_DURATION_MS = int(os.getenv("VOICE_CHUNK_DURATION_MS", "2000"))
+# How segments reach STT: "ws" streams frames over STT_STREAM_URL while the user speaks
+# (falling back to POST when the socket is down), "post" uploads each closed segment.
+STT_TRANSPORT = os.getenv("VOICE_STT_TRANSPORT", "ws").lower()
+STT_FINAL_TIMEOUT_SEC = float(os.getenv("VOICE_STT_FINAL_TIMEOUT_SEC", "10"))
 
 # Audio processing config
 NOISE_REDUCTION_ENABLED = os.getenv("VOICE_NOISE_REDUCTION", "false").lower() == "true"
@@ -96,39 +88,43 @@ class VoiceState(Enum):
     INTERRUPTED = 4
 
 class StateManager:
+    """Voice state machine; only touched from the event loop, so it needs no lock."""
+
     def __init__(self):
         self.current_state = VoiceState.LISTENING
-        self.lock = threading.Lock()
     
     def transition(self, event):
-        with self.lock:
-            if self.current_state == VoiceState.LISTENING and event == "speech_detected":
-                self.current_state = VoiceState.PROCESSING
-                logger.info("State transition: LISTENING -> PROCESSING")
-            elif self.current_state == VoiceState.PROCESSING and event == "processing_complete":
-                self.current_state = VoiceState.SPEAKING
-                logger.info("State transition: PROCESSING -> SPEAKING")
-            elif self.current_state == VoiceState.SPEAKING and event == "interrupt_detected":
-                self.current_state = VoiceState.INTERRUPTED
-                logger.info("State transition: SPEAKING -> INTERRUPTED")
-                # Trigger TTS stop and return to LISTENING
-                self.current_state = VoiceState.LISTENING
-            elif self.current_state == VoiceState.INTERRUPTED and event == "interrupt_handled":
-                self.current_state = VoiceState.LISTENING
-                logger.info("State transition: INTERRUPTED -> LISTENING")
+        if self.current_state == VoiceState.LISTENING and event == "speech_detected":
+            self.current_state = VoiceState.PROCESSING
+            logger.info("State transition: LISTENING -> PROCESSING")
+        elif self.current_state == VoiceState.PROCESSING and event == "processing_complete":
+            self.current_state = VoiceState.SPEAKING
+            logger.info("State transition: PROCESSING -> SPEAKING")
+        elif self.current_state == VoiceState.SPEAKING and event == "interrupt_detected":
+            self.current_state = VoiceState.INTERRUPTED
+            logger.info("State transition: SPEAKING -> INTERRUPTED")
+            # Trigger TTS stop and return to LISTENING
+            self.current_state = VoiceState.LISTENING
+        elif self.current_state == VoiceState.INTERRUPTED and event == "interrupt_handled":
+            self.current_state = VoiceState.LISTENING
+            logger.info("State transition: INTERRUPTED -> LISTENING")
 
 class ServiceState:
     def __init__(self):
         self.is_running = False
-        self.audio_thread = None
+        self.audio_thread = None  # microphone capture
+        self.vad_task = None
+        self.capture_queue: asyncio.Queue | None = None
+        self.frames_dropped = 0
         self.vad_model = None
         self.main_loop = None
-        self.redis_client = None
-        self.audio_queue = None
-        self.websocket_sender_task = None
+        self.redis_client: aioredis.Redis | None = None
+        self.http_client: httpx.AsyncClient | None = None
+        self.tts_listener_task = None
+        self.stt_stream: SttStream | None = None
+        self.latency = LatencyTracker()
+        self.background_tasks = set()  # STT uploads and Redis publishes in flight
         self.active_websockets = set()
-        self.streaming_buffer = b""
-        self.streaming_active = False
         self.state_manager = StateManager()
         self.interrupt_threshold = float(os.getenv("VOICE_INTERRUPT_THRESHOLD", "0.70"))
         self.interrupt_min_duration = int(os.getenv("VOICE_INTERRUPT_MIN_DURATION", "300"))
@@ -142,6 +138,7 @@ state = ServiceState()
 # --- Data Models ---
 class StatusResponse(BaseModel):
     running: bool
+    stt_transport: Optional[str] = None  # "ws" or "post"; set by /start
 
 
 # --- VAD Initialization ---
@@ -149,15 +146,17 @@ class StatusResponse(BaseModel):
 async def load_model():
     logger.info("Loading Silero VAD model...")
     try:
+        # One pooled client for every segment posted to STT
+        state.http_client = httpx.AsyncClient(timeout=10.0)
+
         # Initialize Redis client
         try:
             redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-            state.redis_client = redis.Redis.from_url(redis_url, decode_responses=True)
-            state.redis_client.ping()
+            state.redis_client = aioredis.from_url(redis_url, decode_responses=True)
+            await state.redis_client.ping()
             logger.info("Successfully connected to Redis.")
-            # Start the TTS state listener thread
-            tts_listener_thread = threading.Thread(target=tts_state_listener, daemon=True)
-            tts_listener_thread.start()
+            # TTS state arrives over pub/sub on this event loop
+            state.tts_listener_task = asyncio.create_task(tts_state_listener())
         except Exception as e:
             logger.warning(f"Could not connect to Redis: {e}. Interrupts will not work.")
             state.redis_client = None
@@ -195,23 +194,14 @@ async def load_model():
                 logger.error("VAD model not loaded, cannot auto-start.")
                 return
             
-            state.is_running = True
-            state.streaming_active = STREAMING_ENABLED
-            if state.streaming_active:
-                logger.info("Starting VAD pipeline with streaming enabled.")
-                state.audio_queue = asyncio.Queue()
-                state.websocket_sender_task = asyncio.create_task(websocket_sender())
-            else:
-                logger.info("Starting VAD pipeline with batch mode.")
-            state.audio_thread = threading.Thread(target=vad_pipeline, daemon=True)
-            state.audio_thread.start()
+            start_pipeline()
             logger.info("VAD pipeline started automatically on startup.")
 
     except Exception as e:
         raise RuntimeError(f"Could not load Silero VAD model: {e}")
 
 
-def tts_state_listener():
+async def tts_state_listener():
     """Listens to Redis for TTS state changes."""
     if not state.redis_client:
         logger.info("Redis not connected, TTS state listener will not run.")
@@ -219,9 +209,9 @@ def tts_state_listener():
 
     pubsub = state.redis_client.pubsub(ignore_subscribe_messages=True)
     try:
-        pubsub.subscribe("astra:tts_state")
+        await pubsub.subscribe("astra:tts_state")
         logger.info("Subscribed to astra:tts_state Redis channel.")
-        for message in pubsub.listen():
+        async for message in pubsub.listen():
             try:
                 data = json.loads(message['data'])
                 status = data.get('status')
@@ -235,54 +225,24 @@ def tts_state_listener():
                 logger.warning(f"Received invalid message on astra:tts_state: {message['data']}")
     except redis.exceptions.ConnectionError as e:
         logger.error(f"Redis connection error in tts_state_listener: {e}. Listener stopped.")
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
         logger.error(f"An unexpected error occurred in tts_state_listener: {e}")
+    finally:
+        await pubsub.aclose()
 
 
-def preprocess_audio(np_chunk: np.ndarray) -> np.ndarray:
-    """Applies noise reduction and/or normalization to an audio chunk."""
-    if not AUDIO_PROCESSING_AVAILABLE:
-        return np_chunk
-
-    processed_chunk = np_chunk
-
-    if NOISE_REDUCTION_ENABLED:
-        try:
-            # noisereduce works on float32 data
-            float_chunk = processed_chunk.astype(np.float32) / 32768.0
-            reduced_float = nr.reduce_noise(y=float_chunk, sr=RATE)
-            processed_chunk = (reduced_float * 32768.0).astype(np.int16)
-        except Exception as e:
-            logger.warning(f"Noise reduction failed: {e}")
-
-    if AUDIO_NORMALIZATION_ENABLED:
-        try:
-            # pydub works with AudioSegment objects
-            audio_seg = AudioSegment(
-                processed_chunk.tobytes(),
-                frame_rate=RATE,
-                sample_width=processed_chunk.dtype.itemsize,
-                channels=CHANNELS
-            )
-            normalized_seg = normalize(audio_seg)
-            # As per spec, also apply compression
-            compressed_seg = compress_dynamic_range(normalized_seg)
-            processed_chunk = np.array(compressed_seg.get_array_of_samples())
-        except Exception as e:
-            logger.warning(f"Audio normalization failed: {e}")
-    
-    return processed_chunk
+async def publish_tts_interrupt():
+    try:
+        await state.redis_client.publish("astra:tts_interrupt", "stop")
+    except redis.exceptions.ConnectionError as e:
+        logger.warning(f"Could not publish to Redis: {e}")
 
 
 # --- Core Logic ---
-def send_to_stt(audio_data: bytes):
-    global stt_send_time
-    if stt_send_time:
-        send_duration = (time.time() - stt_send_time) * 1000
-        logger.info(f"STT send preparation duration: {send_duration:.2f} ms")
-        stt_send_time = None
-
-    session_id = str(uuid.uuid4())
+async def send_to_stt(audio_data: memoryview, timing: SegmentTiming):
+    session_id = timing.segment_id
     logger.info(f"[{session_id}] Phrase detected, {len(audio_data) / 1024:.2f} KB. Sending to STT...")
     try:
         # Package as WAV in memory
@@ -294,72 +254,115 @@ def send_to_stt(audio_data: bytes):
                 wf.writeframes(audio_data)
             wav_bytes = wav_io.getvalue()
 
-        # Send as base64 string
-        response = requests.post(
+        # Send as base64 string; the response carries the final transcript
+        timing.sent = time.monotonic()
+        response = await state.http_client.post(
             STT_SERVICE_URL,
             json={"audio_data": base64.b64encode(wav_bytes).decode('ascii'), "agent_id": AGENT_ID, "session_id": session_id},
-            timeout=10.0
         )
         response.raise_for_status()
-        logger.info("Audio successfully sent to STT.")
+        timing.done(response.json().get("text", ""))
+        logger.info(f"[{session_id}] Transcript received {timing.as_dict()['speech_end_to_transcript_ms']} ms after end of speech.")
     except Exception as e:
+        timing.done(error=str(e))
         logger.error(f"Error sending audio to STT service: {e}")
+    finally:
+        state.latency.record(timing)
+
+async def finish_streamed_segment(audio_data: memoryview, timing: SegmentTiming, generation: int):
+    """Wait for the websocket final of a streamed segment; repost it over HTTP if the socket dropped."""
+    session_id = timing.segment_id
+    future = state.stt_stream.end(session_id, generation)
+    timing.sent = time.monotonic()  # only the end marker was still outstanding
+    try:
+        text = await asyncio.wait_for(future, STT_FINAL_TIMEOUT_SEC)
+    except ConnectionError as e:
+        # STT drops a connection's open segments without a final, so nothing reached the brain yet.
+        logger.warning(f"[{session_id}] {e}; posting the segment instead.")
+        timing.transport = "ws-fallback"
+        await send_to_stt(audio_data, timing)
+        return
+    except asyncio.TimeoutError:
+        state.stt_stream.forget(session_id)
+        timing.done(error=f"no final within {STT_FINAL_TIMEOUT_SEC:.0f}s")
+        logger.error(f"[{session_id}] STT stream gave no final within {STT_FINAL_TIMEOUT_SEC:.0f}s.")
+    else:
+        timing.done(text)
+        logger.info(f"[{session_id}] Transcript received {timing.as_dict()['speech_end_to_transcript_ms']} ms after end of speech.")
+    state.latency.record(timing)
+
+
+def spawn(coro):
+    """create_task that keeps a reference until the task finishes."""
+    task = asyncio.create_task(coro)
+    state.background_tasks.add(task)
+    task.add_done_callback(state.background_tasks.discard)
+    return task
 
-async def websocket_sender():
-    """Manages a persistent WebSocket connection to the STT service, sending audio chunks from a queue."""
-    while True:
-        try:
-            logger.info("Connecting to STT WebSocket...")
-            async with websockets.connect(STT_STREAM_URL) as websocket:
-                logger.info("STT WebSocket connection established.")
-                while True:
-                    chunk = await state.audio_queue.get()
-                    await websocket.send(chunk)
-                    state.audio_queue.task_done()
-        except (websockets.exceptions.ConnectionClosedError, asyncio.CancelledError) as e:
-            logger.warning(f"STT WebSocket connection closed: {e}. Reconnecting in 5s...")
-            await asyncio.sleep(5)
-        except Exception as e:
-            logger.error(f"An unexpected error occurred in websocket_sender: {e}")
-            await asyncio.sleep(5) # Avoid rapid-fire reconnection on persistent errors
 
+def _enqueue_frame(frames: asyncio.Queue, item):
+    """Runs on the event loop; drops the oldest frame rather than blocking capture when VAD falls behind."""
+    if frames.full():
+        frames.get_nowait()
+        state.frames_dropped += 1
+    frames.put_nowait(item)
 
-def vad_pipeline():
+
+def capture_audio(loop: asyncio.AbstractEventLoop, frames: asyncio.Queue):
+    """Microphone capture thread: only reads frames and hands them to the event loop."""
     pa = pyaudio.PyAudio()
     stream = pa.open(format=FORMAT, channels=CHANNELS, rate=RATE,
                      input=True, frames_per_buffer=CHUNK_SAMPLES)
     logger.info("Microphone stream opened successfully.")
+    try:
+        while state.is_running:
+            chunk_bytes = stream.read(CHUNK_SAMPLES, exception_on_overflow=False)
+            # stamped when read() returns, i.e. when the frame's last sample was captured
+            loop.call_soon_threadsafe(_enqueue_frame, frames, (chunk_bytes, time.monotonic()))
+    except Exception as e:
+        logger.error(f"Microphone capture failed: {e}")
+    finally:
+        stream.close()
+        pa.terminate()
+        logger.info("Audio stream closed.")
+        try:
+            loop.call_soon_threadsafe(_enqueue_frame, frames, None)
+        except RuntimeError:
+            pass  # event loop already closed
 
+
+async def vad_loop(frames: asyncio.Queue):
     chunk_ms = (CHUNK_SAMPLES / RATE) * 1000.0
     silence_need = int(MIN_SILENCE_MS / chunk_ms)
     pre_pad_need = int(SPEECH_PAD_MS / chunk_ms)
     max_chunks   = int(MAX_SEGMENT_MS / chunk_ms)
-    chunk_duration_chunks = int(CHUNK_DURATION_MS / chunk_ms)
-    last_chunk_time = 0
 
-    pre_pad = deque(maxlen=pre_pad_need)
-    voiced_frames = []
+    # Frames stay in the ring; segments are memoryview slices of it. Two max-length
+    # segments of headroom keep a slice valid while send_to_stt or a POST fallback consume it.
+    ring = Int16FrameRing(2 * max_chunks + pre_pad_need, CHUNK_SAMPLES)
+    frontend = AudioFrontEnd(CHUNK_SAMPLES, RATE, denoise=NOISE_REDUCTION_ENABLED, normalize=AUDIO_NORMALIZATION_ENABLED)
+    segment_start = 0  # first frame of the current segment
+    segment_floor = 0  # pre-pad never reaches back into the previous segment
     is_speaking = False
     silence_chunks = 0
     seg_chunks = 0
-    speech_start_time = None
-    chunk_start_time = None
+    timing = None  # SegmentTiming of the current segment
+    generation = None  # STT stream connection the current segment is being streamed on
     consecutive_errors = 0
     chunks_processed = 0
     speech_detected_count = 0
 
     while state.is_running:
+        item = await frames.get()
+        if item is None:  # capture thread ended
+            break
+        chunk_bytes, captured_at = item
         try:
-            chunk_bytes = stream.read(CHUNK_SAMPLES, exception_on_overflow=False)
-            np_chunk = np.frombuffer(chunk_bytes, dtype=np.int16)
-
-            # Conditionally apply audio preprocessing
-            if AUDIO_PROCESSING_AVAILABLE and (NOISE_REDUCTION_ENABLED or AUDIO_NORMALIZATION_ENABLED):
-                np_chunk = preprocess_audio(np_chunk)
-
-            tensor = torch.from_numpy(np_chunk.copy()).float() / 32768.0
+            index = ring.append(chunk_bytes)
+            tensor = frontend.process(ring.frame(index))
 
             # Быстрый per-chunk score (см. пример "just probabilities" в wiki)
+            # Silero takes well under a millisecond per 32 ms frame, so it runs inline on the loop.
             try:
                 prob = state.vad_model(tensor, RATE).item()
             except ValueError as e:
@@ -372,7 +375,7 @@ def vad_pipeline():
             # Update metrics counters
             chunks_processed += 1
             if chunks_processed % 1000 == 0:  # каждые ~16 секунд
-                logger.info(f"Processed {chunks_processed} chunks, detected {speech_detected_count} speech events")
+                logger.info(f"Processed {chunks_processed} chunks, detected {speech_detected_count} speech events, dropped {state.frames_dropped} frames")
 
             # Use StateManager
             if prob >= THRESH_SPEECH:
@@ -386,62 +389,49 @@ def vad_pipeline():
                     state.state_manager.transition("interrupt_detected")
                     # Stop TTS via Redis
                     if state.redis_client:
-                        try:
-                            state.redis_client.publish("astra:tts_interrupt", "stop")
-                        except redis.exceptions.ConnectionError as e:
-                            logger.warning(f"Could not publish to Redis: {e}")
+                        spawn(publish_tts_interrupt())
                     state.is_speaking = False
                     state.interrupt_active = True
 
             if is_speaking:
-                voiced_frames.append(chunk_bytes)
+                if generation is not None:
+                    state.stt_stream.audio(generation, ring.segment(index, index + 1))
                 seg_chunks += 1
                 if prob >= THRESH_SPEECH:
                     silence_chunks = 0
-                    last_chunk_time = time.time()
+                    timing.speech_end = captured_at
                 else:
                     # тихо
                     silence_chunks += 1
                     if silence_chunks >= silence_need or seg_chunks >= max_chunks:
                         state.state_manager.transition("processing_complete")
                         is_speaking = False
-                        payload = b"".join(voiced_frames)
-                        if speech_start_time:
-                            vad_duration = (time.time() - speech_start_time) * 1000
-                            logger.info(f"VAD processing duration: {vad_duration:.2f} ms for {len(payload)/1024:.2f} KB")
-                            speech_start_time = None
-                        voiced_frames.clear()  # Memory management
+                        payload = ring.segment(segment_start, index + 1)
+                        timing.closed = time.monotonic()
+                        timing.audio_bytes = len(payload)
+                        logger.info(f"VAD processing duration: {(timing.closed - timing.speech_start) * 1000:.2f} ms for {len(payload)/1024:.2f} KB")
                         silence_chunks = 0
                         seg_chunks = 0
-                        stt_send_time = time.time()
-                        threading.Thread(target=send_to_stt, args=(payload,), daemon=True).start()
-                        pre_pad.clear()
+                        if generation is not None:
+                            spawn(finish_streamed_segment(payload, timing, generation))
+                        else:
+                            spawn(send_to_stt(payload, timing))
+                        timing = None
+                        generation = None
+                        segment_floor = index + 1
                         if torch.cuda.is_available():
                             torch.cuda.empty_cache()
-            else:
-                # пока молчим — накапливаем небольшой предбуфер
-                pre_pad.append(chunk_bytes)
-                if prob >= THRESH_SPEECH:
-                    speech_start_time = time.time()
-                    is_speaking = True
-                    voiced_frames = list(pre_pad)
-                    seg_chunks = len(voiced_frames)
-                    silence_chunks = 0
-                    chunk_start_time = time.time()
-
-            # Streaming: Check if we need to send a chunk
-            if state.streaming_active and is_speaking and chunk_start_time:
-                current_time = time.time()
-                time_since_chunk = (current_time - chunk_start_time) * 1000
-                if time_since_chunk >= CHUNK_DURATION_MS:
-                    if len(voiced_frames) > 0:
-                        chunk_payload = b"".join(voiced_frames[-chunk_duration_chunks:])
-                        logger.debug(f"Sending streaming chunk: {len(chunk_payload)/1024:.2f} KB")
-                        # Put the chunk into the queue for the websocket_sender to process
-                        state.main_loop.call_soon_threadsafe(state.audio_queue.put_nowait, chunk_payload)
-                        # Keep recent chunks for continuity
-                        voiced_frames = voiced_frames[-chunk_duration_chunks:]
-                        chunk_start_time = current_time
+            elif prob >= THRESH_SPEECH:
+                # пока молчим — предбуфер это просто последние кадры кольца
+                is_speaking = True
+                segment_start = max(index + 1 - pre_pad_need, segment_floor, ring.oldest)
+                seg_chunks = index + 1 - segment_start
+                silence_chunks = 0
+                segment_id = str(uuid.uuid4())
+                if state.stt_stream:
+                    # pre-pad plus this frame go out now; every later frame follows as it is captured
+                    generation = state.stt_stream.begin(segment_id, ring.segment(segment_start, index + 1))
+                timing = SegmentTiming(segment_id, "ws" if generation is not None else "post", speech_start=captured_at, speech_end=captured_at)
 
             consecutive_errors = 0
 
@@ -450,12 +440,27 @@ def vad_pipeline():
             logger.error(f"Error in VAD loop: {e}")
             if consecutive_errors > 10:
                 logger.error("Too many consecutive errors, stopping pipeline")
+                state.is_running = False  # lets the capture thread exit
                 break
-            time.sleep(0.1)  # небольшая пауза при ошибке
+            await asyncio.sleep(0.1)  # небольшая пауза при ошибке
+
 
-    stream.close()
-    pa.terminate()
-    logger.info("Audio stream closed.")
+def start_pipeline():
+    """Starts microphone capture and the VAD loop (and the STT stream in ws mode)."""
+    state.is_running = True
+    state.main_loop = asyncio.get_running_loop()
+
+    if STT_TRANSPORT == "ws":
+        logger.info("Starting VAD pipeline, streaming segments to STT over websocket.")
+        state.stt_stream = SttStream(STT_STREAM_URL, agent_id=AGENT_ID)
+        state.stt_stream.start()
+    else:
+        logger.info("Starting VAD pipeline, posting segments to STT.")
+
+    state.capture_queue = asyncio.Queue(maxsize=CAPTURE_QUEUE_FRAMES)
+    state.vad_task = asyncio.create_task(vad_loop(state.capture_queue))
+    state.audio_thread = threading.Thread(target=capture_audio, args=(state.main_loop, state.capture_queue), daemon=True)
+    state.audio_thread.start()
 
 
 # --- API Endpoints ---
@@ -466,20 +471,9 @@ async def start_listening():
     if not state.vad_model:
         raise HTTPException(status_code=503, detail="VAD model not loaded yet.")
 
-    state.is_running = True
-    state.streaming_active = STREAMING_ENABLED
-
-    if state.streaming_active:
-        logger.info("Starting VAD pipeline with streaming enabled.")
-        state.audio_queue = asyncio.Queue()
-        state.websocket_sender_task = asyncio.create_task(websocket_sender())
-    else:
-        logger.info("Starting VAD pipeline with batch mode.")
-
-    state.audio_thread = threading.Thread(target=vad_pipeline, daemon=True)
-    state.audio_thread.start()
+    start_pipeline()
     logger.info("VAD pipeline started.")
-    return {"running": True, "streaming": state.streaming_active}
+    return {"running": True, "stt_transport": STT_TRANSPORT}
 
 @app.websocket("/ws/voice")
 async def websocket_voice(websocket: WebSocket):
@@ -507,18 +501,25 @@ async def stop_listening():
         raise HTTPException(status_code=400, detail="Service is not running.")
     
     logger.info("Stopping VAD pipeline...")
+    await stop_pipeline()
+    return {"running": False}
+
+
+async def stop_pipeline():
     state.is_running = False
-    state.streaming_active = False
 
-    # Stop the websocket sender task
-    if state.websocket_sender_task:
-        state.websocket_sender_task.cancel()
+    if state.vad_task:
+        state.vad_task.cancel()
         try:
-            await state.websocket_sender_task
+            await state.vad_task
         except asyncio.CancelledError:
-            logger.info("WebSocket sender task cancelled.")
-        state.websocket_sender_task = None
-        state.audio_queue = None
+            pass
+        state.vad_task = None
+
+    # Segments still waiting on a websocket final fall back to POST when the stream closes
+    if state.stt_stream:
+        await state.stt_stream.close()
+        state.stt_stream = None
 
     # Close all client-facing WebSocket connections
     for ws in list(state.active_websockets):
@@ -529,23 +530,43 @@ async def stop_listening():
     state.active_websockets.clear()
 
     if state.audio_thread:
-        state.audio_thread.join(timeout=2.0)
+        # The capture thread exits after its current read (~32 ms)
+        await asyncio.to_thread(state.audio_thread.join, 2.0)
+        state.audio_thread = None
+    state.capture_queue = None
     
     logger.info("VAD pipeline stopped.")
-    return {"running": False}
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if state.is_running:
+        await stop_pipeline()
+    if state.tts_listener_task:
+        state.tts_listener_task.cancel()
+    if state.http_client:
+        await state.http_client.aclose()
+    if state.redis_client:
+        await state.redis_client.aclose()
 
 @app.get("/status")
 async def get_status():
     """Get current service status including metrics"""
     return {
         "running": state.is_running,
-        "streaming_enabled": STREAMING_ENABLED,
+        "stt_transport": STT_TRANSPORT,
+        "stt_stream_connected": bool(state.stt_stream and state.stt_stream.connected),
         "active_connections": len(state.active_websockets),
         "vad_model_loaded": state.vad_model is not None,
-        "chunk_duration_ms": CHUNK_DURATION_MS,
+        "frames_dropped": state.frames_dropped,
         "current_state": state.state_manager.current_state.value if hasattr(state, 'state_manager') else "unknown"
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Per-segment latency from end of speech to final transcript, summarized per STT transport."""
+    return state.latency.summary()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint for Voice-In service."""
@@ -558,12 +579,11 @@ async def health_check():
         base_stt_url = urljoin(STT_SERVICE_URL, '.')
         health_url = urljoin(base_stt_url, 'health')
         
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(health_url)
-            response.raise_for_status()
-            stt_status = response.json().get("status")
-            if stt_status == "healthy":
-                stt_ready = True
+        response = await state.http_client.get(health_url, timeout=5.0)
+        response.raise_for_status()
+        stt_status = response.json().get("status")
+        if stt_status == "healthy":
+            stt_ready = True
     except Exception as e:
         logger.warning(f"Downstream health check for stt-service failed: {e}")
         stt_ready = False
@@ -600,7 +620,8 @@ async def run_calibration_async(model):
     """Async wrapper for VAD calibration"""
     try:
         await asyncio.sleep(1)  # Brief delay after startup
-        calibrate_vad_thresholds(model)
+        # Opens its own microphone stream for 5 s; keep that off the event loop
+        await asyncio.to_thread(calibrate_vad_thresholds, model)
     except Exception as e:
         logger.error(f"Async calibration failed: {e}")
 
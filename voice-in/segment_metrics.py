@@ -0,0 +1,85 @@
+"""
+Per-segment latency of the voice-in -> STT path.
+
+Every utterance gets a SegmentTiming. It records the capture time of its
+last voiced frame (the real end of speech), when the VAD closed the
+segment, when the audio finished uploading, and when its transcript came
+back. LatencyTracker keeps the most recent segments and summarizes them
+per transport, so the HTTP POST and websocket paths can be compared on
+the same machine.
+"""
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional
+
+
+def _ms(start: float, end: float) -> Optional[float]:
+    return round((end - start) * 1000, 1) if start and end else None
+
+
+@dataclass
+class SegmentTiming:
+    segment_id: str
+    transport: str
+    speech_start: float  # time.monotonic() of the first frame in the segment
+    speech_end: float = 0.0  # capture time of the last voiced frame
+    closed: float = 0.0  # VAD closed the segment (silence or max length)
+    sent: float = 0.0  # audio fully handed to STT
+    transcript_at: float = 0.0  # final transcript received
+    audio_bytes: int = 0
+    text: str = ""
+    error: Optional[str] = None
+
+    def done(self, text: str = "", error: Optional[str] = None):
+        self.transcript_at = time.monotonic()
+        self.text = text
+        self.error = error
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "segment_id": self.segment_id,
+            "transport": self.transport,
+            "audio_ms": round(self.audio_bytes / 32, 1),  # 16 kHz int16 mono
+            "vad_tail_ms": _ms(self.speech_end, self.closed),
+            "upload_ms": _ms(self.closed, self.sent),
+            "close_to_transcript_ms": _ms(self.closed, self.transcript_at),
+            "speech_end_to_transcript_ms": _ms(self.speech_end, self.transcript_at),
+            "chars": len(self.text),
+            "error": self.error,
+        }
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 200):
+        self.segments: Deque[SegmentTiming] = deque(maxlen=window)
+
+    def record(self, timing: SegmentTiming):
+        self.segments.append(timing)
+
+    def summary(self, recent: int = 10) -> Dict[str, object]:
+        by_transport: Dict[str, Dict[str, object]] = {}
+        for transport in sorted({s.transport for s in self.segments}):
+            rows = [s.as_dict() for s in self.segments if s.transport == transport]
+            ok = [r for r in rows if r["error"] is None and r["speech_end_to_transcript_ms"] is not None]
+            end_to_text = [r["speech_end_to_transcript_ms"] for r in ok]
+            close_to_text = [r["close_to_transcript_ms"] for r in ok]
+            by_transport[transport] = {
+                "segments": len(rows),
+                "errors": len(rows) - len(ok),
+                "speech_end_to_transcript_ms_p50": _percentile(end_to_text, 0.5),
+                "speech_end_to_transcript_ms_p95": _percentile(end_to_text, 0.95),
+                "close_to_transcript_ms_p50": _percentile(close_to_text, 0.5),
+                "close_to_transcript_ms_p95": _percentile(close_to_text, 0.95),
+            }
+        return {
+            "transports": by_transport,
+            "recent": [s.as_dict() for s in list(self.segments)[-recent:]],
+        }
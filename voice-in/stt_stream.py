@@ -0,0 +1,143 @@
+"""
+Persistent framed websocket from voice-in to the STT /ws/stt endpoint.
+
+Audio is sent frame by frame while the user is still speaking, bracketed by
+segment start/end markers (stt/ws_protocol.py). STT decodes it incrementally,
+so by the time the VAD closes a segment only the last window still has to be
+transcribed. The final for each segment comes back tagged with its id and
+resolves the future returned by `end()`.
+
+Every connection has a generation number. A segment is bound to the
+generation it started on. If the socket drops mid-segment, `end()` fails
+with ConnectionError and the caller can post the audio (still in its ring)
+over HTTP instead.
+"""
+import asyncio
+import json
+import logging
+from typing import Dict, Optional
+from urllib.parse import urlencode
+
+import websockets
+
+from stt import ws_protocol
+
+logger = logging.getLogger("voice-in-service.stt-stream")
+
+
+class SttStream:
+    def __init__(self, url: str, agent_id: Optional[str] = None, reconnect_delay: float = 2.0):
+        query = {"protocol": ws_protocol.PROTOCOL}
+        if agent_id:
+            query["agent_id"] = agent_id
+        self.url = f"{url}?{urlencode(query)}"
+        self.reconnect_delay = reconnect_delay
+        self.generation = 0  # bumped on every (re)connect; 0 = never connected
+        self._connected = False
+        # Unbounded: a stalled socket is caught by websockets' keepalive ping within seconds,
+        # and a few seconds of 16 kHz PCM is small.
+        self._outgoing: asyncio.Queue = asyncio.Queue()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # --- segment API (called from the VAD loop) ---------------------------------------
+
+    def begin(self, segment_id: str, pre_pad) -> Optional[int]:
+        """Open a segment with its pre-pad audio; returns its generation, or None when not connected."""
+        if not self._connected:
+            return None
+        generation = self.generation
+        self._put(generation, ws_protocol.encode_start(segment_id))
+        self._put(generation, ws_protocol.encode_audio(pre_pad))
+        return generation
+
+    def audio(self, generation: Optional[int], pcm):
+        self._put(generation, ws_protocol.encode_audio(pcm))
+
+    def end(self, segment_id: str, generation: Optional[int]) -> asyncio.Future:
+        """Close a segment; the future resolves to its final text, or fails with ConnectionError."""
+        future = asyncio.get_running_loop().create_future()
+        if not self._put(generation, ws_protocol.encode_end(segment_id)):
+            future.set_exception(ConnectionError("STT stream lost during the segment"))
+        else:
+            self._pending[segment_id] = future
+        return future
+
+    def forget(self, segment_id: str):
+        self._pending.pop(segment_id, None)
+
+    def _put(self, generation: Optional[int], frame: bytes) -> bool:
+        if generation is None or generation != self.generation or not self._connected:
+            return False
+        self._outgoing.put_nowait((generation, frame))
+        return True
+
+    # --- connection ---------------------------------------------------------------------
+
+    def _disconnected(self):
+        if not self._connected:
+            return
+        self._connected = False
+        self.generation += 1  # frames and segments of the old connection are void
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("STT stream closed"))
+        self._pending.clear()
+        while not self._outgoing.empty():
+            self._outgoing.get_nowait()
+
+    async def _run(self):
+        while True:
+            try:
+                async with websockets.connect(self.url, open_timeout=5, max_size=None) as websocket:
+                    self.generation += 1
+                    self._connected = True
+                    logger.info("STT stream connected.")
+                    writer = asyncio.create_task(self._write(websocket, self.generation))
+                    try:
+                        await self._read(websocket)
+                    finally:
+                        writer.cancel()
+                        await asyncio.gather(writer, return_exceptions=True)
+                logger.warning("STT stream closed by the server.")
+            except asyncio.CancelledError:
+                self._disconnected()
+                raise
+            except Exception as e:
+                logger.warning(f"STT stream unavailable: {e}")
+            self._disconnected()
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def _write(self, websocket, generation: int):
+        while True:
+            frame_generation, frame = await self._outgoing.get()
+            if frame_generation == generation:
+                await websocket.send(frame)
+
+    async def _read(self, websocket):
+        async for message in websocket:
+            try:
+                event = json.loads(message)
+            except (TypeError, ValueError):
+                continue
+            if event.get("type") != "final":
+                continue
+            future = self._pending.pop(event.get("segment_id"), None)
+            if future is not None and not future.done():
+                future.set_result(event.get("text", ""))
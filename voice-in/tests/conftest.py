@@ -0,0 +1,14 @@
+"""
+Shared setup for voice-in tests.
+
+voice-in runs with its own directory as the app dir (``from stt_stream import
+SttStream``) and the repository root on the path (``from stt import ws_protocol``),
+so the tests import its modules the same way.
+"""
+import os
+import sys
+
+_VOICE_IN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (_VOICE_IN_DIR, os.path.dirname(_VOICE_IN_DIR)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
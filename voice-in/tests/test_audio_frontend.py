@@ -0,0 +1,109 @@
+import numpy as np
+
+from audio_frontend import Int16FrameRing, SpectralGateDenoiser, StreamingNormalizer
+
+
+def _frame(value: int, samples: int = 2) -> bytes:
+    return np.full(samples, value, dtype=np.int16).tobytes()
+
+
+def _values(pcm) -> list:
+    return np.frombuffer(pcm, dtype=np.int16).tolist()
+
+
+class TestInt16FrameRing:
+    def test_segment_across_the_wrap_is_one_contiguous_slice(self):
+        ring = Int16FrameRing(capacity_frames=4, frame_samples=2)
+        for value in range(1, 7):
+            ring.append(_frame(value))
+
+        assert ring.total == 6
+        assert ring.oldest == 2
+        # Frames 2..5 sit in slots 2, 3, 0, 1; the mirror makes them one run.
+        assert _values(ring.segment(2, 6)) == [3, 3, 4, 4, 5, 5, 6, 6]
+        assert _values(ring.segment(0, 6)) == _values(ring.segment(2, 6))  # clamped to what is buffered
+        assert _values(ring.segment(5, 9)) == [6, 6]
+        assert ring.frame(4).tolist() == [5, 5]
+
+    def test_short_frames_are_zero_padded(self):
+        ring = Int16FrameRing(capacity_frames=2, frame_samples=3)
+        ring.append(_frame(7, samples=3))
+        ring.append(_frame(9, samples=1))
+
+        assert _values(ring.segment(0, 2)) == [7, 7, 7, 9, 0, 0]
+
+    def test_slice_stays_valid_until_capacity_more_frames_are_written(self):
+        ring = Int16FrameRing(capacity_frames=4, frame_samples=2)
+        for value in range(1, 7):
+            ring.append(_frame(value))
+        start = 3
+        segment = ring.segment(start, 5)
+        expected = _values(segment)
+
+        while ring.total < start + ring.capacity:
+            ring.append(_frame(100 + ring.total))
+        assert _values(segment) == expected
+
+        ring.append(_frame(-1))  # frame start + capacity reuses the slot of frame `start`
+        assert _values(segment)[:2] == [-1, -1]
+
+
+class TestStreamingNormalizer:
+    def test_gain_is_continuous_across_chunk_boundaries(self):
+        chunk = 512
+        normalizer = StreamingNormalizer(chunk)
+        level = 0.01  # -40 dBFS, 20 dB below the target
+
+        gains = []
+        for _ in range(8):
+            samples = np.full(chunk, level, dtype=np.float32)
+            normalizer.process(samples)
+            gains.append(samples / level)
+        gains = np.concatenate(gains)
+
+        steps = np.abs(np.diff(gains))
+        within_chunk = max(steps[i * chunk:(i + 1) * chunk - 1].max() for i in range(8))
+        at_boundaries = steps[chunk - 1::chunk]
+        assert gains[-1] > 5  # the make-up gain did rise a lot...
+        assert at_boundaries.max() <= within_chunk + 1e-4  # ...without a step between chunks
+        np.testing.assert_allclose(gains[chunk::chunk], gains[chunk - 1:-1:chunk], atol=0.05)
+
+    def test_silence_is_not_amplified(self):
+        normalizer = StreamingNormalizer(256)
+        samples = np.full(256, 1e-5, dtype=np.float32)  # -100 dBFS, below the gate
+        for _ in range(10):
+            normalizer.process(samples)
+        assert normalizer.gain == 1.0
+
+
+class TestSpectralGateDenoiser:
+    def test_output_keeps_the_input_length_and_lags_by_one_hop(self):
+        denoiser = SpectralGateDenoiser(n_fft=64, n_std=0.0)  # gain 1 everywhere: plain overlap-add
+        rng = np.random.default_rng(0)
+        signal = rng.uniform(-0.5, 0.5, 64 * 10).astype(np.float32)
+
+        out = []
+        offset = 0
+        for size in (64, 32, 96, 64, 32, 128, 64, 160):  # any multiple of the hop
+            chunk = signal[offset:offset + size].copy()
+            denoiser.process(chunk)
+            assert chunk.shape == (size,) and chunk.dtype == np.float32
+            out.append(chunk)
+            offset += size
+        out = np.concatenate(out)
+
+        assert len(out) == len(signal)
+        np.testing.assert_allclose(out[:denoiser.hop], 0.0, atol=1e-6)
+        np.testing.assert_allclose(out[denoiser.hop:], signal[:-denoiser.hop], atol=1e-4)
+
+    def test_stationary_noise_is_attenuated(self):
+        denoiser = SpectralGateDenoiser(n_fft=512, init_frames=10)
+        rng = np.random.default_rng(1)
+        noise = rng.normal(0, 0.05, 512 * 40).astype(np.float32)
+
+        out = noise.copy()
+        for i in range(0, len(out), 512):
+            denoiser.process(out[i:i + 512])
+
+        tail = slice(512 * 20, None)  # after the noise profile has been learned
+        assert np.sqrt(np.mean(out[tail] ** 2)) < 0.5 * np.sqrt(np.mean(noise[tail] ** 2))
@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+websockets_server = pytest.importorskip("websockets.asyncio.server")
+
+from stt import ws_protocol  # noqa: E402
+from stt_stream import SttStream  # noqa: E402
+
+
+class FakeSttServer:
+    """
+    Local /ws/stt stand-in: answers every SEGMENT_END with a final for that segment.
+
+    `drop_on` names segments whose start (or, with `drop_at_end`, whose end)
+    makes the server close the connection without a final, as STT does when
+    its socket goes away mid-segment.
+    """
+
+    def __init__(self, drop_on=(), drop_at_end=False):
+        self.drop_on = set(drop_on)
+        self.drop_kind = ws_protocol.SEGMENT_END if drop_at_end else ws_protocol.SEGMENT_START
+        self.connections = []  # frames received, one list per connection
+        self.connected = asyncio.Event()
+
+    async def handler(self, websocket):
+        frames = []
+        self.connections.append(frames)
+        self.connected.set()
+        async for message in websocket:
+            kind, payload = ws_protocol.decode(message)
+            frames.append((kind, bytes(payload)))
+            if kind == self.drop_kind and bytes(payload).decode() in self.drop_on:
+                await websocket.close()
+                return
+            if kind == ws_protocol.SEGMENT_END:
+                segment_id = bytes(payload).decode()
+                await websocket.send(f'{{"type": "final", "segment_id": "{segment_id}", "text": "text of {segment_id}"}}')
+
+
+async def _wait_for(predicate, timeout=2.0):
+    async def poll():
+        while not predicate():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(poll(), timeout)
+
+
+async def _run(server, test):
+    async with websockets_server.serve(server.handler, "127.0.0.1", 0) as ws_server:
+        port = ws_server.sockets[0].getsockname()[1]
+        stream = SttStream(f"ws://127.0.0.1:{port}/ws/stt", agent_id="chevruta", reconnect_delay=0.05)
+        stream.start()
+        try:
+            await _wait_for(lambda: stream.connected)
+            await test(stream)
+        finally:
+            await stream.close()
+
+
+@pytest.mark.asyncio
+async def test_segment_final_resolves_end():
+    server = FakeSttServer()
+
+    async def test(stream):
+        generation = stream.begin("a", b"\x01\x00" * 4)
+        stream.audio(generation, b"\x02\x00" * 4)
+        assert await asyncio.wait_for(stream.end("a", generation), 2) == "text of a"
+
+    await _run(server, test)
+    assert [kind for kind, _ in server.connections[0]] == [
+        ws_protocol.SEGMENT_START, ws_protocol.AUDIO, ws_protocol.AUDIO, ws_protocol.SEGMENT_END,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_dropped_socket_fails_the_segment_so_it_can_be_posted_and_reconnects():
+    server = FakeSttServer(drop_on={"lost"})
+
+    async def test(stream):
+        first_generation = stream.generation
+        generation = stream.begin("lost", b"\x01\x00" * 4)
+        await _wait_for(lambda: stream.generation != first_generation)
+
+        # The segment belongs to the dropped connection: its end fails with the
+        # ConnectionError that makes voice-in post the segment over HTTP instead.
+        with pytest.raises(ConnectionError):
+            await asyncio.wait_for(stream.end("lost", generation), 2)
+
+        await _wait_for(lambda: stream.connected)
+        assert stream.generation > generation
+
+        # Audio tagged with the old generation is not sent on the new connection.
+        stream.audio(generation, b"\x09\x00" * 4)
+        new_generation = stream.begin("next", b"\x01\x00" * 4)
+        assert new_generation == stream.generation
+        assert await asyncio.wait_for(stream.end("next", new_generation), 2) == "text of next"
+
+    await _run(server, test)
+    assert len(server.connections) == 2
+    assert (ws_protocol.AUDIO, b"\x09\x00" * 4) not in server.connections[1]
+    assert server.connections[1][0] == (ws_protocol.SEGMENT_START, b"next")
+
+
+@pytest.mark.asyncio
+async def test_segment_waiting_for_its_final_fails_when_the_socket_drops():
+    server = FakeSttServer(drop_on={"lost"}, drop_at_end=True)
+
+    async def test(stream):
+        generation = stream.begin("lost", b"\x01\x00" * 4)
+        future = stream.end("lost", generation)
+        with pytest.raises(ConnectionError):
+            await asyncio.wait_for(future, 2)
+
+    await _run(server, test)
+
+
+@pytest.mark.asyncio
+async def test_segments_are_not_opened_while_disconnected():
+    server = FakeSttServer()
+
+    async def test(stream):
+        await stream.close()
+        assert not stream.connected
+        assert stream.begin("offline", b"") is None
+        with pytest.raises(ConnectionError):
+            await stream.end("offline", None)
+
+    await _run(server, test)